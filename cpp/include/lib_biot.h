@@ -63,6 +63,36 @@ void aic3(	map_Mat AIC3,
 			int& M_in,
 			int& N_in);
 
+void aic3_batch(double* p_AIC,
+				const map_Mat ZetaTarget,
+				const map_Mat NormalTarget,
+				Vec_map_Mat ZetaIn,
+				int& M_in,
+				int& N_in,
+				bool& Project);
+
+void ind_vel_batch(double* p_Uind,
+				   const map_Mat ZetaTarget,
+				   Vec_map_Mat ZetaIn,
+				   map_Mat GammaIn,
+				   int& M_in,
+				   int& N_in);
+
+void nc_dvinddzeta_batch(double* p_DerC,
+						 double* p_DerV,
+						 const map_Mat ZetaTarget,
+						 const map_Mat NormalTarget,
+						 Vec_map_Mat ZetaIn,
+						 map_Mat GammaIn,
+						 int& M_in,
+						 int& N_in,
+						 bool& IsBound,
+						 int& M_in_bound);
+
+void set_num_threads(int& num_threads);
+
+int get_num_threads();
+
 void ind_vel(map_RowVec3 velC,
 			const map_RowVec3 zetaC, 
 			Vec_map_Mat ZetaIn,
@@ -132,6 +132,114 @@ extern "C" void call_aic3(	double p_AIC3[],
 
 
 
+extern "C" void call_aic3_batch(double p_AIC[],
+								double p_ZetaTarget[],
+								double p_NormalTarget[],
+								double p_ZetaIn[],
+								int& N_trg,
+								int& M_in,
+								int& N_in,
+								bool& Project)
+{
+	/*
+	Batched version of call_aic3: target points (and, if Project is true, the 
+	normals used for projection) are passed as (N_trg,3) arrays.
+	*/
+
+	int cc;
+
+	const map_Mat ZetaTarget(p_ZetaTarget,N_trg,3);
+	const map_Mat NormalTarget(p_NormalTarget,N_trg,3);
+
+	int Kzeta_in=(M_in+1)*(N_in+1);
+	Vec_map_Mat ZetaIn;
+	for(cc=0;cc<3;cc++){
+		ZetaIn.push_back( map_Mat(p_ZetaIn+cc*Kzeta_in, M_in+1, N_in+1) );
+	}
+
+	aic3_batch(p_AIC, ZetaTarget, NormalTarget, ZetaIn, M_in, N_in, Project);
+}
+
+
+
+extern "C" void call_ind_vel_batch(double p_Uind[],
+								   double p_ZetaTarget[],
+								   double p_ZetaIn[],
+								   double p_GammaIn[],
+								   int& N_trg,
+								   int& M_in,
+								   int& N_in)
+{
+	/*
+	Batched version of call_ind_vel: target points are passed as a (N_trg,3)
+	array and the output has the same shape.
+	*/
+
+	int cc;
+
+	const map_Mat ZetaTarget(p_ZetaTarget,N_trg,3);
+	map_Mat GammaIn(p_GammaIn,M_in,N_in);
+
+	int Kzeta_in=(M_in+1)*(N_in+1);
+	Vec_map_Mat ZetaIn;
+	for(cc=0;cc<3;cc++){
+		ZetaIn.push_back( map_Mat(p_ZetaIn+cc*Kzeta_in, M_in+1, N_in+1) );
+	}
+
+	ind_vel_batch(p_Uind, ZetaTarget, ZetaIn, GammaIn, M_in, N_in);
+}
+
+
+
+extern "C" void call_nc_dvinddzeta_batch(double p_DerC[],
+										 double p_DerV[],
+										 double p_ZetaTarget[],
+										 double p_NormalTarget[],
+										 double p_ZetaIn[],
+										 double p_GammaIn[],
+										 int& N_trg,
+										 int& M_in,
+										 int& N_in,
+										 bool& IsBound,
+										 int& M_in_bound)
+{
+	/*
+	Batched version of call_dvinddzeta, with derivatives projected along the
+	normals at the target points. Targets and normals are (N_trg,3) arrays.
+	*/
+
+	int cc;
+
+	const map_Mat ZetaTarget(p_ZetaTarget,N_trg,3);
+	const map_Mat NormalTarget(p_NormalTarget,N_trg,3);
+	map_Mat GammaIn(p_GammaIn,M_in,N_in);
+
+	int Kzeta_in=(M_in+1)*(N_in+1);
+	Vec_map_Mat ZetaIn;
+	for(cc=0;cc<3;cc++){
+		ZetaIn.push_back( map_Mat(p_ZetaIn+cc*Kzeta_in, M_in+1, N_in+1) );
+	}
+
+	nc_dvinddzeta_batch(p_DerC, p_DerV, ZetaTarget, NormalTarget, 
+						ZetaIn, GammaIn, M_in, N_in, IsBound, M_in_bound);
+}
+
+
+
+extern "C" void call_set_num_threads(int& num_threads)
+{
+	set_num_threads(num_threads);
+}
+
+
+
+extern "C" int call_get_num_threads()
+{
+	return get_num_threads();
+}
+
+
+
 extern "C" void call_ind_vel(
 							double p_vel[3],
 							double p_zetaC[3], 
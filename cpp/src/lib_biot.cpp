@@ -11,11 +11,16 @@ works with dense matrices, eval_panel_map works with Eigen Map objects, which ar
 required to build array based python input/output interface.
 - dvinddzeta_map: computes derivatives w.r.t. grid coordinates of the velocity 
 induced by a surface to a point.
+
+The *_batch routines process a set of target points at once. The loop over 
+the target points is parallelised with OpenMP: each thread writes to separate 
+rows of the output, such that results do not depend on the number of threads.
 */
 
 #include <Eigen/Dense>
 #include <vector>
 #include <iostream>
+#include <omp.h>
 #include <lib_biot.h>
 #include <types.h>
 
@@ -512,3 +517,168 @@ void ind_vel(map_RowVec3 velC,
 }
 
 
+
+
+
+void aic3_batch(double* p_AIC,
+				const map_Mat ZetaTarget,
+				const map_Mat NormalTarget,
+				Vec_map_Mat ZetaIn,
+				int& M_in,
+				int& N_in,
+				bool& Project)
+{
+	/*
+	Computes the influence coefficient matrices of a surface over a set of 
+	N_trg target points (rows of ZetaTarget) in one call. If Project is true, 
+	the induced velocities are projected along the rows of NormalTarget and the 
+	output has shape (N_trg,K_in), otherwise it has shape (3,N_trg,K_in). 
+	Output is stored in row-major order.
+
+	Panel coordinates are gathered only once, before looping through the 
+	targets.
+	*/
+
+	int K_in=M_in*N_in;
+	int N_trg=ZetaTarget.rows();
+
+	// panel coordinates in 4x3 format, stored contiguously
+	vector<double> p_ZetaPanels(12*K_in);
+	for (int mm=0; mm<M_in; mm++){
+		for (int nn=0; nn<N_in; nn++){
+			int pp=mm*N_in+nn;
+			for(int vv=0; vv<Nvert; vv++){
+				for(int cc=0; cc<3; cc++){
+					p_ZetaPanels[12*pp+3*vv+cc]=ZetaIn[cc](mm+dm[vv],nn+dn[vv]);
+				}
+			}
+		}
+	}
+
+	// Loop target points
+	#pragma omp parallel for schedule(static)
+	for (int tt=0; tt<N_trg; tt++){
+
+		double p_vel[3], p_zetaC[3];
+		map_RowVec3 vel(p_vel);
+		const map_RowVec3 zetaC(p_zetaC);
+		for(int cc=0; cc<3; cc++) p_zetaC[cc]=ZetaTarget(tt,cc);
+
+		for (int pp=0; pp<K_in; pp++){
+			const map_Mat4by3 ZetaPanel_in(p_ZetaPanels.data()+12*pp);
+			vel.setZero();
+			biot_panel_map( vel, zetaC, ZetaPanel_in, 1.0);
+
+			if (Project){
+				p_AIC[tt*K_in+pp]=vel.dot(NormalTarget.row(tt));
+			} else {
+				for(int cc=0; cc<3; cc++) p_AIC[(cc*N_trg+tt)*K_in+pp]=vel(cc);
+			}
+		}
+	}
+}
+
+
+
+void ind_vel_batch(double* p_Uind,
+				   const map_Mat ZetaTarget,
+				   Vec_map_Mat ZetaIn,
+				   map_Mat GammaIn,
+				   int& M_in,
+				   int& N_in)
+{
+	/*
+	Computes the velocities induced by a surface over a set of N_trg target 
+	points (rows of ZetaTarget). The output has shape (N_trg,3) and is stored 
+	in row-major order.
+	*/
+
+	int N_trg=ZetaTarget.rows();
+
+	#pragma omp parallel for schedule(static)
+	for (int tt=0; tt<N_trg; tt++){
+
+		double p_zetaC[3];
+		map_RowVec3 velC(p_Uind+3*tt);
+		const map_RowVec3 zetaC(p_zetaC);
+		for(int cc=0; cc<3; cc++) p_zetaC[cc]=ZetaTarget(tt,cc);
+
+		velC.setZero();
+		ind_vel(velC, zetaC, ZetaIn, GammaIn, M_in, N_in);
+	}
+}
+
+
+
+void nc_dvinddzeta_batch(double* p_DerC,
+						 double* p_DerV,
+						 const map_Mat ZetaTarget,
+						 const map_Mat NormalTarget,
+						 Vec_map_Mat ZetaIn,
+						 map_Mat GammaIn,
+						 int& M_in,
+						 int& N_in,
+						 bool& IsBound,
+						 int& M_in_bound)
+{
+	/*
+	Computes the derivatives of the velocity induced by a surface over a set 
+	of N_trg target points (rows of ZetaTarget), projected along the rows of 
+	NormalTarget. The outputs, stored in row-major order, are:
+	- the derivatives w.r.t. the target points, with shape (N_trg,3);
+	- the derivatives w.r.t. the vertices of the (bound) surface, with shape 
+	(N_trg,3*Kzeta_in_bound).
+	See dvinddzeta for details.
+	*/
+
+	int N_trg=ZetaTarget.rows();
+	int Kzeta_in=(M_in+1)*(N_in+1);
+	int M_bound=(IsBound)? M_in : M_in_bound;
+	int Kzeta_in_bound=(M_bound+1)*(N_in+1);
+
+	#pragma omp parallel
+	{
+		// thread-local work arrays
+		int M_in_th=M_in, N_in_th=N_in, M_bound_th=M_bound;
+		int Kzeta_in_th=Kzeta_in, Kzeta_in_bound_th=Kzeta_in_bound;
+		bool IsBound_th=IsBound;
+		double p_DerC_here[9], p_zetaC[3];
+		vector<double> p_DerV_here(9*Kzeta_in_bound);
+		map_Mat3by3 DerC(p_DerC_here);
+		map_Mat DerV(p_DerV_here.data(),3,3*Kzeta_in_bound);
+		const map_RowVec3 zetaC(p_zetaC);
+
+		#pragma omp for schedule(static)
+		for (int tt=0; tt<N_trg; tt++){
+
+			for(int cc=0; cc<3; cc++) p_zetaC[cc]=ZetaTarget(tt,cc);
+			DerC.setZero();
+			DerV.setZero();
+
+			dvinddzeta( DerC,DerV, 
+						zetaC,ZetaIn,GammaIn,
+						M_in_th,N_in_th,Kzeta_in_th,
+						IsBound_th,M_bound_th,Kzeta_in_bound_th);
+
+			// project
+			map_Mat ncDerC(p_DerC+3*tt,1,3);
+			map_Mat ncDerV(p_DerV+(long)tt*3*Kzeta_in_bound,1,3*Kzeta_in_bound);
+			ncDerC=NormalTarget.row(tt)*DerC;
+			ncDerV=NormalTarget.row(tt)*DerV;
+		}
+	}
+}
+
+
+
+void set_num_threads(int& num_threads)
+{
+	omp_set_num_threads(num_threads);
+}
+
+
+
+int get_num_threads()
+{
+	return omp_get_max_threads();
+}
@@ -7,6 +7,8 @@ Includes:
 - Boundary conditions methods:
 	- AICs: allocate aero influence coefficient matrices of multi-surfaces
 	configurations
+	- AIC_hmatrix: global aero influence coefficient matrix of multi-surfaces
+	configurations in hierarchical (compressed) format
 	- nc_dqcdzeta_Sin_to_Sout: derivative matrix of
 		nc*dQ/dzeta
 	where Q is the induced velocity at the bound colllocation points of one
@@ -18,17 +20,20 @@ Includes:
 '''
 
 import numpy as np
+import scipy.sparse as sparse
 import itertools
 import lib_ucdncdzeta
 import lib_dbiot as dbiot
+import lib_vbiot
+import libhmat
+import libsym
+import kernels
 
 # from IPython import embed
 
 
 import ctypes as ct
-import os
-lib_path=os.environ["DIRuvlm3d"]+'/../cpp/cpplibs.so'
-libc = ct.CDLL(lib_path)
+from kernels import libc
 
 
 # local indiced panel/vertices as per self.maps
@@ -51,7 +56,31 @@ def skew(Av):
 
 
 
-def AICs(Surfs,Surfs_star,target='collocation',Project=True):
+def get_block_views(Der,Nrows,Ncols):
+	'''
+	Returns the list of views of the blocks of the 2D array Der, partitioned
+	in blocks of Nrows rows and Ncols columns, such that Der_list[ii][jj] is
+	the block of size (Nrows[ii],Ncols[jj]). This is the inverse of np.block,
+	and allows the assembly routines to fill a preallocated global matrix
+	in-place.
+	'''
+
+	assert Der.shape==(sum(Nrows),sum(Ncols)),\
+										 'Blocks and matrix sizes not matching'
+	Irows=np.concatenate(([0],np.cumsum(Nrows)))
+	Icols=np.concatenate(([0],np.cumsum(Ncols)))
+
+	Der_list=[]
+	for ii in range(len(Nrows)):
+		Der_list.append( [ Der[Irows[ii]:Irows[ii+1],Icols[jj]:Icols[jj+1]]
+											  for jj in range(len(Ncols)) ] )
+
+	return Der_list
+
+
+
+def AICs(Surfs,Surfs_star,target='collocation',Project=True,
+									 AIC=None,AIC_star=None,fold_wake=False):
 	'''
 	Given a list of bound (Surfs) and wake (Surfs_star) instances of
 	surface.AeroGridSurface, returns the list of AIC matrices in the format:
@@ -59,33 +88,85 @@ def AICs(Surfs,Surfs_star,target='collocation',Project=True):
 	 	Surfs[ii].
 	 	- AIC_star_list[ii][jj] contains the AIC from the wake surface Surfs[jj]
 	 	to Surfs[ii].
-	'''
 
-	AIC_list=[]
-	AIC_star_list=[]
+	If the global matrices AIC and/or AIC_star (in the format obtained by
+	np.block) are given, they are filled in-place and the lists contain views
+	of their blocks. This option requires target='collocation' and
+	Project=True.
+
+	If Surfs_star is None, only the bound surfaces AICs are computed and
+	AIC_star_list is None.
+
+	If fold_wake is True, the wake is steady and the wake AICs are returned in
+	folded format, i.e. AIC_star_list[ii][jj] has shape (K_ii,N_star_jj) (see
+	surface.AeroGridSurface.get_aic_over_surface).
+	'''
 
 	n_surf=len(Surfs)
-	assert len(Surfs_star)==n_surf,\
+	assert Surfs_star is None or len(Surfs_star)==n_surf,\
 							   'Number of bound and wake surfaces much be equal'
 
-	for ss_out in range(n_surf):
-		AIC_list_here=[]
-		AIC_star_list_here=[]
-		Surf_out=Surfs[ss_out]
+	Out_list=[]
+	for Aic,Surfs_in in [(AIC,Surfs),(AIC_star,Surfs_star)]:
 
-		for ss_in in range(n_surf):
-			# Bound surface
-			Surf_in=Surfs[ss_in]
-			AIC_list_here.append(Surf_in.get_aic_over_surface(
-										Surf_out,target=target,Project=Project))
-			# Wakes
-			Surf_in=Surfs_star[ss_in]
-			AIC_star_list_here.append(Surf_in.get_aic_over_surface(
-										Surf_out,target=target,Project=Project))
-		AIC_list.append(AIC_list_here)
-		AIC_star_list.append(AIC_star_list_here)
+		if Surfs_in is None:
+			Out_list.append(None)
+			continue
+
+		fold=fold_wake and Surfs_in is Surfs_star
+		if Aic is None:
+			Aic_list=[[] for ss_out in range(n_surf)]
+		else:
+			assert target=='collocation' and Project,\
+				  'In-place assembly requires target=collocation and Project=True'
+			if fold:
+				Ncols=[Surf.maps.N for Surf in Surfs_in]
+			else:
+				Ncols=[Surf.maps.K for Surf in Surfs_in]
+			Aic_list=get_block_views(Aic,[Surf.maps.K for Surf in Surfs],Ncols)
+
+		for ss_out in range(n_surf):
+			Surf_out=Surfs[ss_out]
+			for ss_in in range(n_surf):
+				aic=Surfs_in[ss_in].get_aic_over_surface(
+							Surf_out,target=target,Project=Project,fold=fold)
+				if Aic is None:
+					Aic_list[ss_out].append(aic)
+				else:
+					Aic_list[ss_out][ss_in][:,:]=aic
+		Out_list.append(Aic_list)
+
+	return Out_list[0], Out_list[1]
+
+
+
+def AIC_hmatrix(Surfs,Surfs_in,tol=1e-6,eta=1.,leaf_size=32):
+	'''
+	Returns the global AIC matrix (in the format obtained by np.block) from the
+	surfaces Surfs_in (bound or wake) to the collocation points of Surfs,
+	projected along the normals, as a libhmat.HMatrix instance. Blocks
+	associated to well-separated clusters of panels (e.g. between different
+	surfaces or from the far wake) are stored in low-rank format, obtained via
+	adaptive cross approximation to the relative tolerance tol (see libhmat).
+
+	The entries are always computed with the vectorised NumPy routines.
+	'''
+
+	for Surf in Surfs:
+		if not hasattr(Surf,'zetac'):
+			Surf.generate_collocations()
+		if not hasattr(Surf,'normals'):
+			Surf.generate_normals()
+
+	zeta_target=np.concatenate(
+					[Surf.zetac.reshape((3,-1)) for Surf in Surfs],axis=1)
+	normals=np.concatenate(
+					[Surf.normals.reshape((3,-1)) for Surf in Surfs],axis=1)
+	ZetaPanels=np.concatenate(
+					[Surf_in.get_panel_vertices() for Surf_in in Surfs_in])
 
-	return AIC_list, AIC_star_list
+	return libhmat.HMatrix(zeta_target,normals,ZetaPanels,
+											tol=tol,eta=eta,leaf_size=leaf_size)
 
 
 
@@ -121,7 +202,6 @@ def nc_dqcdzeta_Sin_to_Sout(Surf_in,Surf_out,Der_coll,Der_vert,Surf_in_bound):
 	# extract sizes / check matrices
 	K_out=Surf_out.maps.K
 	Kzeta_out=Surf_out.maps.Kzeta
-	shape_zeta_out=Surf_out.maps.shape_vert_vect # (3,M_out,N_out)
 	K_in=Surf_in.maps.K
 	Kzeta_in=Surf_in.maps.Kzeta
 
@@ -134,49 +214,41 @@ def nc_dqcdzeta_Sin_to_Sout(Surf_in,Surf_out,Der_coll,Der_vert,Surf_in_bound):
 		N_in=Surf_in.maps.N
 		M_bound_in=Kzeta_bound_in//(N_in+1)-1
 
-	# create mapping panels to vertices to loop
-	Surf_out.maps.map_panels_to_vertices_1D_scalar()
-	#Surf_in.maps.map_panels_to_vertices_1D_scalar()
-
-	##### loop collocation points
-	for cc_out in range(K_out):
-
-		# get (m,n) indices of collocation point
-		mm_out=Surf_out.maps.ind_2d_pan_scal[0][cc_out]
-		nn_out=Surf_out.maps.ind_2d_pan_scal[1][cc_out]
-
-		# get coords and normal
-		zetac_here=ZetaColl[:,mm_out,nn_out]#.copy() # non-contiguous array !
-		nc_here=Surf_out.normals[:,mm_out,nn_out]
-
-		# get derivative of induced velocity w.r.t. zetac
-		if Surf_in_bound:
-			dvind_coll,dvind_vert=dvinddzeta_cpp(zetac_here,Surf_in,
-														  IsBound=Surf_in_bound)
-		else:
-			dvind_coll,dvind_vert=dvinddzeta_cpp(zetac_here,Surf_in,
-									IsBound=Surf_in_bound,M_in_bound=M_bound_in)
-
-		### Surf_in vertices contribution
-		Der_vert[cc_out,:]+=np.dot(nc_here,dvind_vert)
-
-		### Surf_out collocation point contribution
-		# project
-		dvindnorm_coll=np.dot(nc_here,dvind_coll)
-
-		# loop panel vertices
-		for vv,dm,dn in zip(range(4),dmver,dnver):
-			mm_v,nn_v=mm_out+dm,nn_out+dn
-			ii_v=[np.ravel_multi_index(
-							 (cc,mm_v,nn_v),shape_zeta_out) for cc in range(3)]
-			Der_coll[cc_out,ii_v]+=wcv_out[vv]*dvindnorm_coll
+	# derivatives of induced velocity at all collocation points, projected
+	Kern=kernels.get(Surf_in.backend)
+	if Surf_in_bound:
+		M_bound_in,N_in=Surf_in.maps.M,Surf_in.maps.N
+	ncDcoll,ncDvert=Kern.nc_dvinddzeta(ZetaColl,Surf_out.normals,
+				Surf_in.zeta,Surf_in.gamma,IsBound=Surf_in_bound,
+												   M_in_bound=M_bound_in)
+	if Surf_in.symmetry is not None:
+		# image of Surf_in (see libsym)
+		zeta_img,gamma_img=libsym.get_image(Surf_in.zeta,Surf_in.gamma)
+		ncDcoll_img,ncDvert_img=Kern.nc_dvinddzeta(ZetaColl,Surf_out.normals,
+						zeta_img,gamma_img,IsBound=Surf_in_bound,
+												   M_in_bound=M_bound_in)
+		ncDcoll=ncDcoll+ncDcoll_img
+		ncDvert=ncDvert+libsym.fold_vertices(
+							  ncDvert_img,M_bound_in,N_in,Surf_in.symmetry)
+
+	### Surf_in vertices contribution
+	Der_vert+=ncDvert
+
+	### Surf_out collocation point contribution: loop panel vertices
+	M_out,N_out=Surf_out.maps.M,Surf_out.maps.N
+	mm_out,nn_out=np.unravel_index(np.arange(K_out),(M_out,N_out))
+	for vv,dm,dn in zip(range(4),dmver,dnver):
+		jjv=(mm_out+dm)*(N_out+1)+nn_out+dn
+		for cc in range(3):
+			Der_coll[np.arange(K_out),cc*Kzeta_out+jjv]+=\
+												  wcv_out[vv]*ncDcoll[:,cc]
 
 	return Der_coll, Der_vert
 
 
 
 
-def nc_dqcdzeta(Surfs,Surfs_star):
+def nc_dqcdzeta(Surfs,Surfs_star,Der=None):
 	'''
 	Produces a list of derivative matrix d(AIC*Gamma)/dzeta, where AIC are the
 	influence coefficient matrices at the bound surfaces collocation point,
@@ -188,12 +260,21 @@ def nc_dqcdzeta(Surfs,Surfs_star):
 		- the j-th element of the sub-list is the dAIC_dzeta matrices w.r.t. the
 		zeta d.o.f. of the j-th bound surface.
 	Hence, DAIC*[ii][jj] will have size K_ii x Kzeta_jj
+
+	If the global matrix Der, of size (sum(K_ii),3*sum(Kzeta_jj)), is given,
+	the derivatives are summed in-place into its blocks. Both the collocation
+	points (DAICcoll[ii]) and vertices (DAICvert[ii][ii]) contributions are
+	then summed into the same diagonal blocks, and the output lists contain
+	views of Der.
 	'''
 
 	n_surf=len(Surfs)
 	assert len(Surfs_star)==n_surf,\
 							   'Number of bound and wake surfaces much be equal'
 
+	if Der is not None:
+		Der_list=get_block_views(Der,[Surf.maps.K for Surf in Surfs],
+									 [3*Surf.maps.Kzeta for Surf in Surfs])
 	DAICcoll=[]
 	DAICvert=[]
 
@@ -207,7 +288,10 @@ def nc_dqcdzeta(Surfs,Surfs_star):
 
 		# derivatives w.r.t collocation points: all the in surface scanned will
 		# manipulate this matrix, as the collocation points are on Surf_out
-		Dcoll=np.zeros((K_out,3*Kzeta_out))
+		if Der is None:
+			Dcoll=np.zeros((K_out,3*Kzeta_out))
+		else:
+			Dcoll=Der_list[ss_out][ss_out]
 		# derivatives w.r.t. panel coordinates will affect dof on bound Surf_in
 		# (not wakes)
 		DAICvert_sub=[]
@@ -220,7 +304,10 @@ def nc_dqcdzeta(Surfs,Surfs_star):
 			Kzeta_in=Surf_in.maps.Kzeta
 
 			# compute terms
-			Dvert=np.zeros((K_out,3*Kzeta_in))
+			if Der is None:
+				Dvert=np.zeros((K_out,3*Kzeta_in))
+			else:
+				Dvert=Der_list[ss_out][ss_in]
 			Dcoll,Dvert=nc_dqcdzeta_Sin_to_Sout(
 							    Surf_in,Surf_out,Dcoll,Dvert,Surf_in_bound=True)
 
@@ -236,27 +323,103 @@ def nc_dqcdzeta(Surfs,Surfs_star):
 	return 	DAICcoll, DAICvert
 
 
+def get_segments_vertices(Surf):
+	'''
+	Returns the 1D indices, in the (M+1,N+1) grid of vertices of Surf, of the
+	first (Ia) and second (Ib) vertex of each panel segment, with shape (K,4),
+	and of each trailing edge segment, with shape (N,). The orientation of the
+	TE segments is that of the wake panels (i.e. from (M,n+1) to (M,n)).
+
+	call: Ia,Ib,Ia_te,Ib_te=get_segments_vertices(Surf)
+	'''
+
+	M,N=Surf.maps.M,Surf.maps.N
+	Ind=Surf.maps.map_panels_to_vertices_1D_vector()[:,:,0]
+	Ib_te=M*(N+1)+np.arange(N)
+
+	return Ind[:,avec],Ind[:,bvec],Ib_te+1,Ib_te
+
+
+def segments_blocks_to_matrix(Df,Ia,Ib,Kzeta,sign_a=1.,sign_b=1.,
+															sparse_format=False):
+	'''
+	Assembles the (3*Kzeta,3*Kzeta) matrix of the derivatives of vertex
+	quantities w.r.t. vertex quantities (e.g. forces w.r.t. coordinates)
+	produced by a set of segments. For each segment ss, of first vertex Ia[ss]
+	and second vertex Ib[ss], the (3,3) block Df[:,:,ss] is added, in the rows
+	of both vertices, to the columns of vertex Ia[ss] (times sign_a) and of
+	vertex Ib[ss] (times sign_b).
+
+	If sparse_format is True, the matrix is returned in scipy.sparse csr
+	format, otherwise as a full array.
+	'''
+
+	Ia,Ib=Ia.reshape(-1),Ib.reshape(-1)
+	Df=Df.reshape((3,3,-1))
+	Ncomp=Kzeta*np.arange(3)
+
+	Rows,Cols,Vals=[],[],[]
+	for Ir in [Ia,Ib]:
+		for Ic,sign in [(Ia,sign_a),(Ib,sign_b)]:
+			Rows.append( np.broadcast_to((Ncomp[:,None]+Ir)[:,None,:],Df.shape) )
+			Cols.append( np.broadcast_to((Ncomp[:,None]+Ic)[None,:,:],Df.shape) )
+			Vals.append( sign*Df )
+
+	Der=sparse.csr_matrix(
+		(np.concatenate(Vals,axis=None),
+		 (np.concatenate(Rows,axis=None),np.concatenate(Cols,axis=None))),
+		 shape=(3*Kzeta,3*Kzeta))
+
+	if sparse_format:
+		return Der
+	return Der.toarray()
+
+
+
+def add_block_diag(Der,Blocks):
+	'''
+	Adds in-place to the full matrix Der the block-diagonal matrix of the list
+	Blocks (see scipy.linalg.block_diag), whose elements can be full or
+	scipy.sparse matrices. Sparse blocks are never converted to full format.
+	'''
+
+	ii,jj=0,0
+	for Block in Blocks:
+		nr,nc=Block.shape
+		if sparse.issparse(Block):
+			Block=Block.tocoo()
+			Block.sum_duplicates()
+			Der[ii+Block.row,jj+Block.col]+=Block.data
+		else:
+			Der[ii:ii+nr,jj:jj+nc]+=Block
+		ii+=nr
+		jj+=nc
+	assert (ii,jj)==Der.shape, 'Blocks and matrix sizes not matching'
+
+	return Der
+
+
 ################################################################################
 
-def nc_domegazetadzeta(Surfs,Surfs_star):
+def nc_domegazetadzeta(Surfs,Surfs_star,sparse_format=False):
 	'''
 	Produces a list of derivative matrix d(omaga x zeta)/dzeta, where omega is
-    the rotation speed of the A FoR,
+	the rotation speed of the A FoR,
 	ASSUMING constant panel norm.
 
-	Each list is such that:
-	- the ii-th element is associated to the ii-th bound surface collocation
-	point, and will contain a sub-list such that:
-		- the j-th element of the sub-list is the dAIC_dzeta matrices w.r.t. the
-		zeta d.o.f. of the j-th bound surface.
-	Hence, DAIC*[ii][jj] will have size K_ii x Kzeta_jj
+	The ii-th element of the list is the derivative of nc*(-omega x zetac) at
+	the collocation points of the ii-th bound surface w.r.t. the zeta d.o.f. of
+	the same surface, and has size K_ii x 3*Kzeta_ii. The derivatives w.r.t.
+	the d.o.f. of other surfaces are zero.
 
-	call: ncDOmegaZetacoll, ncDOmegaZetavert = nc_domegazetadzeta(Surfs,Surfs_star)
+	call: ncDOmegaZeta = nc_domegazetadzeta(Surfs,Surfs_star)
+
+	If sparse_format is True, the matrices are returned in scipy.sparse csr
+	format.
 	'''
 	n_surf=len(Surfs)
 
-	ncDOmegaZetacoll=[]
-	ncDOmegaZetavert=[]
+	ncDOmegaZeta=[]
 
 	### loop output (bound) surfaces
 	for ss in range(n_surf):
@@ -264,43 +427,26 @@ def nc_domegazetadzeta(Surfs,Surfs_star):
 		# define output bound surface size
 		Surf=Surfs[ss]
 		skew_omega = skew(Surf.omega)
+		M,N=Surf.maps.M,Surf.maps.N
 		K=Surf.maps.K # K_out = M*N (number of panels)
 		Kzeta=Surf.maps.Kzeta # Kzeta_out = (M+1)*(N+1) (number of vertices/edges)
 		wcv=Surf.get_panel_wcv()
-		shape_zeta=Surf.maps.shape_vert_vect # (3,M,N)
-
-		# The derivatives only depend on the studied surface (Surf_out)
-		ncDcoll=np.zeros((K,3))
-		ncDvert=np.zeros((Kzeta,3))
-
-        # create mapping panels to vertices to loop
-        # Surf_out.maps.map_panels_to_vertices_1D_scalar()
-
-        ##### loop collocation points
-		for cc in range(K):
 
-            # get (m,n) indices of collocation point
-			mm=Surf.maps.ind_2d_pan_scal[0][cc]
-			nn=Surf.maps.ind_2d_pan_scal[1][cc]
+		# derivative w.r.t. collocation points: -nc^T skew(omega), shape (3,K)
+		ncDcoll=-np.dot(skew_omega.T,Surf.normals.reshape((3,K)))
 
-			zetac_here=Surf.zetac[:,mm,nn]
+		# chain rule through the panel vertices, shape (4,3,K)
+		Ind=Surf.maps.map_panels_to_vertices_1D_vector()
+		Rows=np.broadcast_to(np.arange(K),(4,3,K))
+		Cols=Ind.transpose((1,2,0))
+		ncDvert=sparse.csr_matrix(
+					((wcv[:,None,None]*ncDcoll).reshape(-1),
+					 (Rows.reshape(-1),Cols.reshape(-1))),
+					shape=(K,3*Kzeta))
 
-            # get normal
-			nc_here=Surf.normals[:,mm,nn]
+		ncDOmegaZeta.append(ncDvert if sparse_format else ncDvert.toarray())
 
-			ncDcoll[cc,:] -= np.dot(nc_here,skew_omega)
-
-			# loop panel vertices
-			for vv,dm,dn in zip(range(4),dmver,dnver):
-				mm_v,nn_v=mm+dm,nn+dn
-				ii_v=[np.ravel_multi_index(
-								 (cc,mm_v,nn_v),shape_zeta) for cc in range(3)]
-				ncDvert[cc,ii_v]+=wcv[vv]*ncDcoll
-
-		ncDOmegaZetacoll.append(ncDcoll)
-		ncDOmegaZetavert.append(ncDvert)
-
-	return 	ncDOmegaZetacoll, ncDOmegaZetavert
+	return 	ncDOmegaZeta
 
 def uc_dncdzeta(Surf):
 	'''
@@ -373,12 +519,15 @@ def uc_dncdzeta(Surf):
 
 
 
-def dfqsdgamma_vrel0(Surfs,Surfs_star):
+def dfqsdgamma_vrel0(Surfs,Surfs_star,sparse_format=False):
 	'''
 	Assemble derivative of quasi-steady force w.r.t. gamma with fixed relative
 	velocity - the changes in induced velocities due to gamma are not accounted
 	for. The routine exploits the get_joukovski_qs method insude the
 	AeroGridSurface class
+
+	If sparse_format is True, the matrices are returned in scipy.sparse csr
+	format.
 	'''
 
 	Der_list=[]
@@ -401,86 +550,54 @@ def dfqsdgamma_vrel0(Surfs,Surfs_star):
 		M,N=Surf.maps.M,Surf.maps.N
 		K=Surf.maps.K
 		Kzeta=Surf.maps.Kzeta
-		shape_fqs=Surf.maps.shape_vert_vect # (3,M+1,N+1)
+		Ia,Ib,Ia_te,Ib_te=get_segments_vertices(Surf)
+		Ncomp=Kzeta*np.arange(3)
 
 		##### unit gamma contribution of BOUND panels
-		Der=np.zeros((3*Kzeta,K))
-
-		# loop panels (input, i.e. matrix columns)
-		for pp_in in range(K):
-			# get (m,n) indices of panel
-			mm_in=Surf.maps.ind_2d_pan_scal[0][pp_in]
-			nn_in=Surf.maps.ind_2d_pan_scal[1][pp_in]
-
-			# zetav_here=Surf.get_panel_vertices_coords(mm_in,nn_in)
-			for ll,aa,bb in zip(svec,avec,bvec):
-				# import libuvlm
-				# dfhere=libuvlm.joukovski_qs_segment(
-				# 	zetaA=zetav_here[aa,:],zetaB=zetav_here[bb,:],
-				# 	v_mid=Surf.u_ind_seg[:,ll,mm_in,nn_in]+\
-				# 		  Surf.u_input_seg[:,ll,mm_in,nn_in],
-				# 	gamma=1.0,fact=0.5*Surf.rho)
-				df=0.5*Surf.fqs_seg_unit[:,ll,mm_in,nn_in]
-				# assert np.abs(np.max(dfhere-df))<1e-13,'something is wrong'
-
-				# get vertices m,n indices
-				mm_a,nn_a=mm_in+dmver[aa],nn_in+dnver[aa]
-				mm_b,nn_b=mm_in+dmver[bb],nn_in+dnver[bb]
-
-				# get vertices 1d index
-				ii_a=[ np.ravel_multi_index(
-								  (cc,mm_a,nn_a),shape_fqs ) for cc in range(3)]
-				ii_b=[ np.ravel_multi_index(
-								  (cc,mm_b,nn_b),shape_fqs ) for cc in range(3)]
-				Der[ii_a,pp_in]+=df
-				Der[ii_b,pp_in]+=df
-
-		Der_list.append(Der)
+		# the force over each segment is shared by its vertices
+		df=0.5*Surf.fqs_seg_unit.reshape((3,4,K))
+		Rows=[Ncomp[:,None,None]+Ia.T,Ncomp[:,None,None]+Ib.T]
+		Cols=np.broadcast_to(np.arange(K),(2,3,4,K))
+		Der=sparse.csr_matrix(
+				(np.concatenate([df,df],axis=None),
+				 (np.concatenate(Rows,axis=None),Cols.reshape(-1))),
+				 shape=(3*Kzeta,K))
+		Der_list.append(Der if sparse_format else Der.toarray())
 
 
 		##### unit gamma contribution of WAKE TE segments
 		# Note: the force due to the wake is attached to Surf when
 		# get_joukovski_qs is acalled
-		M_star,N_star=Surfs_star[ss].maps.M,Surfs_star[ss].maps.N
+		N_star=Surfs_star[ss].maps.N
 		K_star=Surfs_star[ss].maps.K
-		shape_in=Surfs_star[ss].maps.shape_pan_scal # (M_star,N_star)
-
-		Der_star=np.zeros((3*Kzeta,K_star))
 
 		assert N==N_star,\
 					  'trying to associate wrong wake to current bound surface!'
 
-		# loop bound panels
-		for nn_in in range(N):
-			pp_in=np.ravel_multi_index( (0,nn_in),shape_in)
-
-			df=0.5*Surf.fqs_wTE_unit[:,nn_in]
-
-			# get TE bound vertices m,n indices
-			mm_a,nn_a=M,nn_in+dnver[aa]
-			mm_b,nn_b=M,nn_in+dnver[bb]
-
-			# get vertices 1d index
-			ii_a=[ np.ravel_multi_index(
-								  (cc,mm_a,nn_a),shape_fqs ) for cc in range(3)]
-			ii_b=[ np.ravel_multi_index(
-								  (cc,mm_b,nn_b),shape_fqs ) for cc in range(3)]
-			Der_star[ii_a,pp_in]+=df
-			Der_star[ii_b,pp_in]+=df
-
-		Der_star_list.append(Der_star)
+		# the TE segments belong to the 1st row of wake panels
+		df=0.5*Surf.fqs_wTE_unit
+		Rows=[Ncomp[:,None]+Ia_te,Ncomp[:,None]+Ib_te]
+		Cols=np.broadcast_to(np.arange(N),(2,3,N))
+		Der_star=sparse.csr_matrix(
+				(np.concatenate([df,df],axis=None),
+				 (np.concatenate(Rows,axis=None),Cols.reshape(-1))),
+				 shape=(3*Kzeta,K_star))
+		Der_star_list.append(Der_star if sparse_format else Der_star.toarray())
 
 	return Der_list, Der_star_list
 
 
 
 
-def dfqsdzeta_vrel0(Surfs,Surfs_star):
+def dfqsdzeta_vrel0(Surfs,Surfs_star,sparse_format=False):
 	'''
 	Assemble derivative of quasi-steady force w.r.t. zeta with fixed relative
 	velocity - the changes in induced velocities due to zeta over the surface
 	inducing the velocity are not accounted for. The routine exploits the
 	available relative velocities at the mid-segment points
+
+	If sparse_format is True, the matrices are returned in scipy.sparse csr
+	format.
 	'''
 
 	Der_list=[]
@@ -499,73 +616,41 @@ def dfqsdzeta_vrel0(Surfs,Surfs_star):
 		M,N=Surf.maps.M,Surf.maps.N
 		K=Surf.maps.K
 		Kzeta=Surf.maps.Kzeta
-		shape_fqs=Surf.maps.shape_vert_vect # (3,M+1,N+1)
+		Ia,Ib,Ia_te,Ib_te=get_segments_vertices(Surf)
 
 		##### unit gamma contribution of BOUND panels
-		Der=np.zeros((3*Kzeta,3*Kzeta))
-
-		# loop panels (input, i.e. matrix columns)
-		for pp_in in range(K):
-			# get (m,n) indices of panel
-			mm_in=Surf.maps.ind_2d_pan_scal[0][pp_in]
-			nn_in=Surf.maps.ind_2d_pan_scal[1][pp_in]
-
-			for ll,aa,bb in zip(svec,avec,bvec):
-
-				vrel_seg=(Surf.u_input_seg[:,ll,mm_in,nn_in]+
-					          				   Surf.u_ind_seg[:,ll,mm_in,nn_in])
-				Df=skew( (0.5*Surf.rho*Surf.gamma[mm_in,nn_in])*vrel_seg )
-
-				# get vertices m,n indices
-				mm_a,nn_a=mm_in+dmver[aa],nn_in+dnver[aa]
-				mm_b,nn_b=mm_in+dmver[bb],nn_in+dnver[bb]
-
-				# get vertices 1d index
-				ii_a=[ np.ravel_multi_index(
-								  (cc,mm_a,nn_a),shape_fqs ) for cc in range(3)]
-				ii_b=[ np.ravel_multi_index(
-								  (cc,mm_b,nn_b),shape_fqs ) for cc in range(3)]
-				Der[np.ix_(ii_a,ii_a)]+=-Df
-				Der[np.ix_(ii_b,ii_a)]+=-Df
-				Der[np.ix_(ii_a,ii_b)]+=Df
-				Der[np.ix_(ii_b,ii_b)]+=Df
+		# relative velocities at segments, shape (3,K,4)
+		Vrel=(Surf.u_input_seg+Surf.u_ind_seg).reshape((3,4,K)).transpose((0,2,1))
+		Df=dbiot.skew3d_vec( (0.5*Surf.rho*Surf.gamma.reshape((K,1)))*Vrel )
 
 		##### contribution of WAKE TE segments.
 		# This is added to Der, as only the bound vertices are included in the
 		# input
 
-		# loop TE bound segment but:
+		# TE bound segments but:
 		# - using wake gamma
 		# - using orientation of wake panel
-		for nn_in in range(N):
-			# get velocity at seg.3 of wake TE
-			vrel_seg=(Surf.u_input_seg[:,1,M-1,nn_in]+Surf.u_ind_seg[:,1,M-1,nn_in])
-			Df=Df=skew(
-				(0.5*Surfs_star[ss].rho*Surfs_star[ss].gamma[0,nn_in])*vrel_seg)
+		Vrel_te=Surf.u_input_seg[:,1,M-1,:]+Surf.u_ind_seg[:,1,M-1,:]
+		Df_te=dbiot.skew3d_vec(
+				(0.5*Surfs_star[ss].rho*Surfs_star[ss].gamma[0,:])*Vrel_te )
 
-			# get TE bound vertices m,n indices
-			nn_a=nn_in+dnver[2]
-			nn_b=nn_in+dnver[1]
-			# get vertices 1d index on bound
-			ii_a=[ np.ravel_multi_index(
-									 (cc,M,nn_a),shape_fqs ) for cc in range(3)]
-			ii_b=[ np.ravel_multi_index(
-									 (cc,M,nn_b),shape_fqs ) for cc in range(3)]
-
-			Der[np.ix_(ii_a,ii_a)]+=-Df
-			Der[np.ix_(ii_b,ii_a)]+=-Df
-			Der[np.ix_(ii_a,ii_b)]+=Df
-			Der[np.ix_(ii_b,ii_b)]+=Df
-		Der_list.append(Der)
+		Der_list.append( segments_blocks_to_matrix(
+							np.concatenate((Df.reshape((3,3,-1)),Df_te),axis=2),
+							np.concatenate((Ia.reshape(-1),Ia_te)),
+							np.concatenate((Ib.reshape(-1),Ib_te)),
+							Kzeta,sign_a=-1.,sign_b=1.,sparse_format=sparse_format) )
 
 	return Der_list
 
 
 
 
-def dfqsduinput(Surfs,Surfs_star):
+def dfqsduinput(Surfs,Surfs_star,sparse_format=False):
 	'''
 	Assemble derivative of quasi-steady force w.r.t. external input velocity.
+
+	If sparse_format is True, the matrices are returned in scipy.sparse csr
+	format.
 	'''
 
 	Der_list=[]
@@ -582,80 +667,42 @@ def dfqsduinput(Surfs,Surfs_star):
 		M,N=Surf.maps.M,Surf.maps.N
 		K=Surf.maps.K
 		Kzeta=Surf.maps.Kzeta
-		shape_fqs=Surf.maps.shape_vert_vect # (3,M+1,N+1)
+		Ia,Ib,Ia_te,Ib_te=get_segments_vertices(Surf)
 
 		##### unit gamma contribution of BOUND panels
-		Der=np.zeros((3*Kzeta,3*Kzeta))
-
-		# loop panels (input, i.e. matrix columns)
-		for pp_in in range(K):
-			# get (m,n) indices of panel
-			mm_in=Surf.maps.ind_2d_pan_scal[0][pp_in]
-			nn_in=Surf.maps.ind_2d_pan_scal[1][pp_in]
-
-			# get panel vertices
-			#zetav_here=Surf.get_panel_vertices_coords(mm_in,nn_in)
-			zetav_here=Surf.zeta[:, [mm_in+0,mm_in+1,mm_in+1,mm_in+0],
-											[nn_in+0,nn_in+0,nn_in+1,nn_in+1]].T
-
-			for ll,aa,bb in zip(svec,avec,bvec):
-
-				# get segment
-				lv=zetav_here[bb,:]-zetav_here[aa,:]
-				Df=skew( (-0.25*Surf.rho*Surf.gamma[mm_in,nn_in])*lv )
-
-				# get vertices m,n indices
-				mm_a,nn_a=mm_in+dmver[aa],nn_in+dnver[aa]
-				mm_b,nn_b=mm_in+dmver[bb],nn_in+dnver[bb]
-
-				# get vertices 1d index
-				ii_a=[ np.ravel_multi_index(
-								  (cc,mm_a,nn_a),shape_fqs ) for cc in range(3)]
-				ii_b=[ np.ravel_multi_index(
-								  (cc,mm_b,nn_b),shape_fqs ) for cc in range(3)]
-				Der[np.ix_(ii_a,ii_a)]+=Df
-				Der[np.ix_(ii_b,ii_a)]+=Df
-				Der[np.ix_(ii_a,ii_b)]+=Df
-				Der[np.ix_(ii_b,ii_b)]+=Df
+		# segments, shape (3,K,4)
+		ZetaPanels=Surf.get_panel_vertices()
+		Lv=(ZetaPanels[:,bvec,:]-ZetaPanels[:,avec,:]).transpose((2,0,1))
+		Df=dbiot.skew3d_vec( (-0.25*Surf.rho*Surf.gamma.reshape((K,1)))*Lv )
 
 		##### contribution of WAKE TE segments.
 		# This is added to Der, as only velocities at the bound vertices are
 		# included in the input of the state-space model
 
-		# loop TE bound segment but:
-		# - using wake gamma
+		# TE bound segments but:
 		# - using orientation of wake panel
-		for nn_in in range(N):
-
-			# get TE bound vertices m,n indices
-			nn_a=nn_in+dnver[2]
-			nn_b=nn_in+dnver[1]
+		# - using the gamma of the last row of bound panels
+		Lv_te=Surf.zeta[:,M,:-1]-Surf.zeta[:,M,1:]
+		Df_te=dbiot.skew3d_vec( (-0.25*Surf.rho*Surf.gamma[M-1,:])*Lv_te )
 
-			# get segment
-			lv=Surf.zeta[:,M,nn_b]-Surf.zeta[:,M,nn_a]
-			Df=skew( (-0.25*Surf.rho*Surf.gamma[mm_in,nn_in])*lv )
-
-			# get vertices 1d index on bound
-			ii_a=[ np.ravel_multi_index(
-									 (cc,M,nn_a),shape_fqs ) for cc in range(3)]
-			ii_b=[ np.ravel_multi_index(
-									 (cc,M,nn_b),shape_fqs ) for cc in range(3)]
-
-			Der[np.ix_(ii_a,ii_a)]+=Df
-			Der[np.ix_(ii_b,ii_a)]+=Df
-			Der[np.ix_(ii_a,ii_b)]+=Df
-			Der[np.ix_(ii_b,ii_b)]+=Df
-		Der_list.append(Der)
+		Der_list.append( segments_blocks_to_matrix(
+							np.concatenate((Df.reshape((3,3,-1)),Df_te),axis=2),
+							np.concatenate((Ia.reshape(-1),Ia_te)),
+							np.concatenate((Ib.reshape(-1),Ib_te)),
+							Kzeta,sparse_format=sparse_format) )
 
 	return Der_list
 
 #########################  ams start ##################################
 
-def dfqsdzeta_omega(Surfs,Surfs_star):
+def dfqsdzeta_omega(Surfs,Surfs_star,sparse_format=False):
 	'''
 	Assemble derivative of quasi-steady force w.r.t. to zeta
     The contribution implemented is related with the omega x zeta term
 	call: Der_list = dfqsdzeta_omega(Surfs,Surfs_star)
+
+	If sparse_format is True, the matrices are returned in scipy.sparse csr
+	format.
 	'''
 
 	Der_list=[]
@@ -668,191 +715,109 @@ def dfqsdzeta_omega(Surfs,Surfs_star):
 		M,N=Surf.maps.M,Surf.maps.N
 		K=Surf.maps.K
 		Kzeta=Surf.maps.Kzeta
-		shape_fqs=Surf.maps.shape_vert_vect # (3,M+1,N+1)
+		Ia,Ib,Ia_te,Ib_te=get_segments_vertices(Surf)
 
         ##### omega x zeta contribution
-		Der=np.zeros((3*Kzeta,3*Kzeta))
-
-		# loop panels (input, i.e. matrix columns)
-		for pp_in in range(K):
-			# get (m,n) indices of panel
-			mm_in=Surf.maps.ind_2d_pan_scal[0][pp_in]
-			nn_in=Surf.maps.ind_2d_pan_scal[1][pp_in]
-
-			# get panel vertices
-			zetav_here=Surf.zeta[:, [mm_in+0,mm_in+1,mm_in+1,mm_in+0],
-											[nn_in+0,nn_in+0,nn_in+1,nn_in+1]].T
-
-			for ll,aa,bb in zip(svec,avec,bvec):
-
-				# get segment
-				lv=zetav_here[bb,:]-zetav_here[aa,:]
-				Df= (0.25*Surf.rho*Surf.gamma[mm_in,nn_in])*skew(lv).dot(skew_omega)
-
-				# get vertices m,n indices
-				mm_a,nn_a=mm_in+dmver[aa],nn_in+dnver[aa]
-				mm_b,nn_b=mm_in+dmver[bb],nn_in+dnver[bb]
-
-				# get vertices 1d index
-				ii_a=[ np.ravel_multi_index(
-								  (cc,mm_a,nn_a),shape_fqs ) for cc in range(3)]
-				ii_b=[ np.ravel_multi_index(
-								  (cc,mm_b,nn_b),shape_fqs ) for cc in range(3)]
-				Der[np.ix_(ii_a,ii_a)]+=Df
-				Der[np.ix_(ii_b,ii_a)]+=Df
-				Der[np.ix_(ii_a,ii_b)]+=Df
-				Der[np.ix_(ii_b,ii_b)]+=Df
+		# segments, shape (3,K,4)
+		ZetaPanels=Surf.get_panel_vertices()
+		Lv=(ZetaPanels[:,bvec,:]-ZetaPanels[:,avec,:]).transpose((2,0,1))
+		Df=(0.25*Surf.rho*Surf.gamma.reshape((K,1)))*\
+					  np.einsum('ij...,jk->ik...',dbiot.skew3d_vec(Lv),skew_omega)
 
 		##### contribution of WAKE TE segments.
 		# This is added to Der, as only velocities at the bound vertices are
 		# included in the input of the state-space model
 
-		# loop TE bound segment but:
-		# - using wake gamma
+		# TE bound segments but:
 		# - using orientation of wake panel
-		for nn_in in range(N):
-
-			# get TE bound vertices m,n indices
-			nn_a=nn_in+dnver[2]
-			nn_b=nn_in+dnver[1]
-
-			# get segment
-			lv=Surf.zeta[:,M,nn_b]-Surf.zeta[:,M,nn_a]
-			Df=(0.25*Surf.rho*Surf.gamma[mm_in,nn_in])*skew(lv).dot(skew_omega)
-
-			# get vertices 1d index on bound
-			ii_a=[ np.ravel_multi_index(
-									 (cc,M,nn_a),shape_fqs ) for cc in range(3)]
-			ii_b=[ np.ravel_multi_index(
-									 (cc,M,nn_b),shape_fqs ) for cc in range(3)]
+		# - using the gamma of the last row of bound panels
+		Lv_te=Surf.zeta[:,M,:-1]-Surf.zeta[:,M,1:]
+		Df_te=(0.25*Surf.rho*Surf.gamma[M-1,:])*\
+				   np.einsum('ij...,jk->ik...',dbiot.skew3d_vec(Lv_te),skew_omega)
 
-			Der[np.ix_(ii_a,ii_a)]+=Df
-			Der[np.ix_(ii_b,ii_a)]+=Df
-			Der[np.ix_(ii_a,ii_b)]+=Df
-			Der[np.ix_(ii_b,ii_b)]+=Df
-
-		Der_list.append(Der)
+		Der_list.append( segments_blocks_to_matrix(
+							np.concatenate((Df.reshape((3,3,-1)),Df_te),axis=2),
+							np.concatenate((Ia.reshape(-1),Ia_te)),
+							np.concatenate((Ib.reshape(-1),Ib_te)),
+							Kzeta,sparse_format=sparse_format) )
 
 	return Der_list
 
 #########################  ams end ##################################
 
-def dfqsdvind_gamma(Surfs,Surfs_star):
+def dfqsdvind_gamma(Surfs,Surfs_star,Der=None,Der_star=None):
 	'''
 	Assemble derivative of quasi-steady force w.r.t. induced velocities changes
 	due to gamma.
-	Note: the routine is memory consuming but avoids unnecessary computations.
+
+	The influence coefficient matrices are computed at the unique edges of
+	each bound surface (see gridmapping.AeroGridMap.map_edges) one input
+	surface at a time. The force on each edge depends only on its net
+	circulation, including the wake circulation over the TE, and is split
+	equally between the edge vertices.
+
+	If the global matrices Der and/or Der_star (in the format obtained by
+	np.block) are given, the derivatives are summed in-place into their blocks
+	and the output lists contain views of them.
 	'''
 
 	n_surf=len(Surfs)
 	assert len(Surfs_star)==n_surf,\
 							   'Number of bound and wake surfaces much be equal'
 
-	### compute all influence coeff matrices (high RAM, low CPU)
-	#AIC_list,AIC_star_list=AICs(Surfs,Surfs_star,target='segments',Project=False)
+	Nrows=[3*Surf.maps.Kzeta for Surf in Surfs]
+	Der_list=[[] for ss_out in range(n_surf)]
+	Der_star_list=[[] for ss_out in range(n_surf)]
+	if Der is not None:
+		Der_list=get_block_views(Der,Nrows,[Surf.maps.K for Surf in Surfs])
+	if Der_star is not None:
+		Der_star_list=get_block_views(Der_star,Nrows,
+									  [Surf.maps.K for Surf in Surfs_star])
 
-	Der_list=[]
-	Der_star_list=[]
 	for ss_out in range(n_surf):
 
 		Surf_out=Surfs[ss_out]
 		M_out,N_out=Surf_out.maps.M,Surf_out.maps.N
-		K_out=Surf_out.maps.K
 		Kzeta_out=Surf_out.maps.Kzeta
-		shape_fqs=Surf_out.maps.shape_vert_vect # (3,M+1,N+1)
-
-		# get AICs over Surf_out
-		AICs=[]
-		AICs_star=[]
-		for ss_in in range(n_surf):
-			AICs.append(Surfs[ss_in].get_aic_over_surface(
-									  Surf_out,target='segments',Project=False))
-			AICs_star.append(Surfs_star[ss_in].get_aic_over_surface(
-									  Surf_out,target='segments',Project=False))
-
-		# allocate all derivative matrices
-		Der_list_sub=[]
-		Der_star_list_sub=[]
-		for ss_in in range(n_surf):
-			# bound
-			K_in=Surfs[ss_in].maps.K
-			Der_list_sub.append( np.zeros((3*Kzeta_out,K_in)) )
-			# wake
-			K_in=Surfs_star[ss_in].maps.K
-			Der_star_list_sub.append( np.zeros((3*Kzeta_out,K_in)) )
-
-		### loop bound panels
-		for pp_out in range(K_out):
-			# get (m,n) indices of panel
-			mm_out=Surf_out.maps.ind_2d_pan_scal[0][pp_out]
-			nn_out=Surf_out.maps.ind_2d_pan_scal[1][pp_out]
-			# get panel vertices
-			#zetav_here=Surf_out.get_panel_vertices_coords(mm_out,nn_out)
-			zetav_here=Surf_out.zeta[:,[mm_out+0,mm_out+1,mm_out+1,mm_out+0],
-									   [nn_out+0,nn_out+0,nn_out+1,nn_out+1]].T
-
-			for ll,aa,bb in zip(svec,avec,bvec):
-
-				# get segment
-				lv=zetav_here[bb,:]-zetav_here[aa,:]
-				Lskew=skew((-0.5*Surf_out.rho*Surf_out.gamma[mm_out,nn_out])*lv)
-
-				# get vertices m,n indices
-				mm_a,nn_a=mm_out+dmver[aa],nn_out+dnver[aa]
-				mm_b,nn_b=mm_out+dmver[bb],nn_out+dnver[bb]
-
-				# get vertices 1d index
-				ii_a=[ np.ravel_multi_index(
-								  (cc,mm_a,nn_a),shape_fqs ) for cc in range(3)]
-				ii_b=[ np.ravel_multi_index(
-								  (cc,mm_b,nn_b),shape_fqs ) for cc in range(3)]
+		Surf_out.maps.map_edges()
+		Mev=Surf_out.maps.Mev
+		Nedges=Surf_out.maps.Nedges
 
-				# update all derivatives
-				for ss_in in range(n_surf):
-					# derivatives: size (3,K_in)
-					Dfs=np.dot(Lskew,AICs[ss_in][:,:,ll,mm_out,nn_out])
-					Dfs_star=np.dot(Lskew,AICs_star[ss_in][:,:,ll,mm_out,nn_out])
-					# allocate
-					Der_list_sub[ss_in][ii_a,:]+=Dfs
-					Der_list_sub[ss_in][ii_b,:]+=Dfs
-					Der_star_list_sub[ss_in][ii_a,:]+=Dfs_star
-					Der_star_list_sub[ss_in][ii_b,:]+=Dfs_star
-
-		### loop again trailing edge
-		# here we add the Gammaw_0*rho*skew(lv)*dvind/dgamma contribution hence:
-		# - we use Gammaw_0 over the TE
-		# - we run along the positive direction as defined in the first row of
+		# net circulation at edges. Over the TE, we add the Gammaw_0 contribution
+		# running along the positive direction as defined in the first row of
 		# wake panels
-		for nn_out in range(N_out):
+		Gedges=lib_vbiot.get_edges_gamma(Surf_out.gamma)
+		Gedges[Surf_out.maps.from_span_edge_to_1D(M_out,np.arange(N_out))]-=\
+											   Surfs_star[ss_out].gamma[0,:]
 
-			# get TE bound vertices m,n indices
-			nn_a=nn_out+dnver[2]
-			nn_b=nn_out+dnver[1]
-
-			# get segment
-			lv=Surf_out.zeta[:,M_out,nn_b]-Surf_out.zeta[:,M_out,nn_a]
-			Lskew=skew((-0.5*Surf_out.rho*Surfs_star[ss_out].gamma[0,nn_out])*lv)
+		# force per unit induced velocity: -0.5*rho*gamma*(lv x u_ind)
+		Zeta1d=Surf_out.zeta.reshape((3,Kzeta_out))
+		Wedges=(-0.5*Surf_out.rho*Gedges)*(Zeta1d[:,Mev[:,1]]-Zeta1d[:,Mev[:,0]])
 
+		# edges to vertices (both ends)
+		Inc=sparse.csr_matrix(
+				  (np.ones((2*Nedges,)),(Mev.T.reshape(-1),np.tile(range(Nedges),2))),
+													   shape=(Kzeta_out,Nedges))
 
-			# get vertices 1d index on bound
-			ii_a=[ np.ravel_multi_index(
-								 (cc,M_out,nn_a),shape_fqs ) for cc in range(3)]
-			ii_b=[ np.ravel_multi_index(
-								 (cc,M_out,nn_b),shape_fqs ) for cc in range(3)]
-
-			# update all derivatives
-			for ss_in in range(n_surf):
-				# derivatives: size (3,K_in)
-				Dfs=np.dot(Lskew,AICs[ss_in][:,:,1,M_out-1,nn_out])
-				Dfs_star=np.dot(Lskew,AICs_star[ss_in][:,:,1,M_out-1,nn_out])
-				# allocate
-				Der_list_sub[ss_in][ii_a,:]+=Dfs
-				Der_list_sub[ss_in][ii_b,:]+=Dfs
-				Der_star_list_sub[ss_in][ii_a,:]+=Dfs_star
-				Der_star_list_sub[ss_in][ii_b,:]+=Dfs_star
-
-		Der_list.append(Der_list_sub)
-		Der_star_list.append(Der_star_list_sub)
+		for ss_in in range(n_surf):
+			for Surf_in,Dglobal,Dlist in [(Surfs[ss_in],Der,Der_list),
+										  (Surfs_star[ss_in],Der_star,Der_star_list)]:
+				AIC=Surf_in.get_aic_over_surface(
+										  Surf_out,target='edges',Project=False)
+				# (Wedges x AIC), one component at a time
+				if Dglobal is None:
+					Dblock=np.empty((3*Kzeta_out,AIC.shape[2]))
+				else:
+					Dblock=Dlist[ss_out][ss_in]
+				for cc,c1,c2 in [(0,1,2),(1,2,0),(2,0,1)]:
+					dblock=Inc.dot(
+							Wedges[c1,:,None]*AIC[c2]-Wedges[c2,:,None]*AIC[c1])
+					if Dglobal is None:
+						Dblock[cc*Kzeta_out:(cc+1)*Kzeta_out]=dblock
+					else:
+						Dblock[cc*Kzeta_out:(cc+1)*Kzeta_out]+=dblock
+				if Dglobal is None:
+					Dlist[ss_out].append(Dblock)
 
 	return Der_list, Der_star_list
 
@@ -876,96 +841,13 @@ def dvinddzeta(zetac,Surf_in,IsBound,M_in_bound=None):
 	- Dercoll: 3 x 3 matrix
 	- Dervert: 3 x 3*Kzeta (if Surf_in is a wake, Kzeta is that of the bound)
 
-	Warning:
-	zetac must be contiguously stored!
+	The derivatives of all the panels of Surf_in are computed at once and
+	summed into Dervert using the index tables of Surf_in.maps (see
+	kernels.dvinddzeta_vec).
 	'''
 
-
-	M_in,N_in=Surf_in.maps.M,Surf_in.maps.N
-	Kzeta_in=Surf_in.maps.Kzeta
-	shape_zeta_in=(3,M_in+1,N_in+1)
-
-	# allocate matrices
-	Dercoll=np.zeros((3,3))
-
-
-	if IsBound:
-		''' Bound: scan everthing, and include every derivative. The TE is not
-		scanned twice'''
-
-		Dervert=np.zeros((3,3*Kzeta_in))
-
-		for pp_in in itertools.product(range(0,M_in),range(0,N_in)):
-			mm_in,nn_in=pp_in
-			#zeta_panel_in=Surf_in.get_panel_vertices_coords(mm_in,nn_in)
-			zeta_panel_in=Surf_in.zeta[:, [mm_in+0,mm_in+1,mm_in+1,mm_in+0],
-											[nn_in+0,nn_in+0,nn_in+1,nn_in+1]].T
-			# get local derivatives
-			der_zetac,der_zeta_panel=dbiot.eval_panel_cpp(
-					zetac,zeta_panel_in,gamma_pan=Surf_in.gamma[mm_in,nn_in])
-			### Mid-segment point contribution
-			Dercoll+=der_zetac
-			### Panel vertices contribution
-			for vv_in in range(4):
-				# get vertices m,n indices
-				mm_v,nn_v=mm_in+dmver[vv_in],nn_in+dnver[vv_in]
-				# get vertices 1d index
-				jj_v=[ np.ravel_multi_index(
-				   			   (cc,mm_v,nn_v),shape_zeta_in) for cc in range(3)]
-				Dervert[:,jj_v]+=der_zeta_panel[vv_in,:,:]
-
-	else:
-		'''
-		All segments are scanned when computing the contrib. Dercoll. The
-		TE is scanned a second time to include the contrib. due to the TE
-		elements moviment. The Dervert shape is computed using the chordwse
-		paneling of the associated bound surface (M_in_bound).
-		'''
-
-		Kzeta_in_bound=(M_in_bound+1)*(N_in+1)
-		Dervert=np.zeros((3,3*Kzeta_in_bound))
-
-		### loop all panels (coll. contrib)
-		for pp_in in itertools.product(range(0,M_in),range(0,N_in)):
-			mm_in,nn_in=pp_in
-			#zeta_panel_in=Surf_in.get_panel_vertices_coords(mm_in,nn_in)
-			zeta_panel_in=Surf_in.zeta[:, [mm_in+0,mm_in+1,mm_in+1,mm_in+0],
-											[nn_in+0,nn_in+0,nn_in+1,nn_in+1]].T
-			# get local derivatives
-			der_zetac=dbiot.eval_panel_cpp_coll(
-					zetac,zeta_panel_in,gamma_pan=Surf_in.gamma[mm_in,nn_in])
-			# der_zetac_fast=dbiot.eval_panel_fast_coll(
-			# 		zetac,zeta_panel_in,gamma_pan=Surf_in.gamma[mm_in,nn_in])
-			# if np.max(np.abs(der_zetac-der_zetac_fast))>1e-10:
-			# 	embed()
-
-			### Mid-segment point contribution
-			Dercoll+=der_zetac
-
-		### Re-scan the TE to include vertex contrib.
-		# vertex 0 of wake is vertex 1 of bound (local no.)
-		# vertex 3 of wake is vertex 2 of bound (local no.)
-		vvec =[0,3] # vertices to include
-		dn=[0,1] # delta to go from (m,n) panel to (m,n) vertices (on bound)
-
-		shape_zeta_in_bound=(3,M_in_bound+1,N_in+1)
-		for nn_in in range(N_in):
-			#zeta_panel_in=Surf_in.get_panel_vertices_coords(0,nn_in)
-			zeta_panel_in=Surf_in.zeta[:, [0,1,1,0],
-											[nn_in+0,nn_in+0,nn_in+1,nn_in+1]].T
-			# get local derivatives
-			_,der_zeta_panel=dbiot.eval_panel_cpp(
-						   zetac,zeta_panel_in,gamma_pan=Surf_in.gamma[0,nn_in])
-
-			for vv in range(2):
-				nn_v=nn_in+dn[vv]
-				jj_v=[]
-				for cc in range(3):
-					jj_v.append(np.ravel_multi_index(
-						 			  (cc,M_in_bound,nn_v),shape_zeta_in_bound))
-				Dervert[:,jj_v]+=der_zeta_panel[vvec[vv],:,:]
-
-	return Dercoll, Dervert
+	return kernels.dvinddzeta_vec(zetac,Surf_in.zeta,Surf_in.gamma,IsBound,
+				M_in_bound,Maps=Surf_in.maps,ZetaPanels=Surf_in.get_panel_vertices())
 
 
 
@@ -1021,10 +903,41 @@ def dvinddzeta_cpp(zetac,Surf_in,IsBound,M_in_bound=None):
 
 
 
-def dfqsdvind_zeta(Surfs,Surfs_star):
+def dvinddzeta_backend(zetac,Surf_in,IsBound,M_in_bound=None):
+	'''
+	Same as dvinddzeta_cpp, but derivatives are computed with the kernels
+	backend of Surf_in (see kernels module). If Surf_in has an image (see
+	libsym), its contribution is included.
+	'''
+
+	Kern=kernels.get(Surf_in.backend)
+	Dercoll,Dervert=Kern.dvinddzeta(
+						 zetac,Surf_in.zeta,Surf_in.gamma,IsBound,M_in_bound)
+
+	if Surf_in.symmetry is not None:
+		M_in,N_in=Surf_in.maps.M,Surf_in.maps.N
+		if IsBound: M_in_bound=M_in
+		Dercoll_img,Dervert_img=Kern.dvinddzeta(zetac,
+			*libsym.get_image(Surf_in.zeta,Surf_in.gamma),IsBound,M_in_bound)
+		Dercoll=Dercoll+Dercoll_img
+		Dervert=Dervert+libsym.fold_vertices(
+								 Dervert_img,M_in_bound,N_in,Surf_in.symmetry)
+
+	return Dercoll,Dervert
+
+
+
+
+def dfqsdvind_zeta(Surfs,Surfs_star,Der=None):
 	'''
 	Assemble derivative of quasi-steady force w.r.t. induced velocities changes
 	due to zeta.
+
+	If the global matrix Der, of size (3*sum(Kzeta),3*sum(Kzeta)), is given,
+	the derivatives are summed in-place into its blocks. Both the collocation
+	(Dercoll_list[ii]) and vertices (Dervert_list[ii][ii]) contributions are
+	then summed into the same diagonal blocks, and the output lists contain
+	views of Der.
 	'''
 
 	n_surf=len(Surfs)
@@ -1032,16 +945,21 @@ def dfqsdvind_zeta(Surfs,Surfs_star):
 							   'Number of bound and wake surfaces much be equal'
 
 	# allocate
-	Dercoll_list=[]
-	Dervert_list=[]
-	for ss_out in range(n_surf):
-		Kzeta_out=Surfs[ss_out].maps.Kzeta
-		Dercoll_list.append( np.zeros((3*Kzeta_out,3*Kzeta_out)) )
-		Dervert_list_sub=[]
-		for ss_in in range(n_surf):
-			Kzeta_in=Surfs[ss_in].maps.Kzeta
-			Dervert_list_sub.append( np.zeros((3*Kzeta_out,3*Kzeta_in)) )
-		Dervert_list.append(Dervert_list_sub)
+	if Der is None:
+		Dercoll_list=[]
+		Dervert_list=[]
+		for ss_out in range(n_surf):
+			Kzeta_out=Surfs[ss_out].maps.Kzeta
+			Dercoll_list.append( np.zeros((3*Kzeta_out,3*Kzeta_out)) )
+			Dervert_list_sub=[]
+			for ss_in in range(n_surf):
+				Kzeta_in=Surfs[ss_in].maps.Kzeta
+				Dervert_list_sub.append( np.zeros((3*Kzeta_out,3*Kzeta_in)) )
+			Dervert_list.append(Dervert_list_sub)
+	else:
+		Nsizes=[3*Surf.maps.Kzeta for Surf in Surfs]
+		Dervert_list=get_block_views(Der,Nsizes,Nsizes)
+		Dercoll_list=[Dervert_list[ss][ss] for ss in range(n_surf)]
 
 
 	for ss_out in range(n_surf):
@@ -1052,14 +970,13 @@ def dfqsdvind_zeta(Surfs,Surfs_star):
 		Kzeta_out=Surf_out.maps.Kzeta
 		shape_fqs=Surf_out.maps.shape_vert_vect # (3,M+1,N+1)
 		Dercoll=Dercoll_list[ss_out] # <--link
+		ZetaPanels_out=Surf_out.get_panel_vertices()
 
 
 		### Loop out (bound) surface panels
 		for pp_out in itertools.product(range(0,M_out),range(0,N_out)):
 			mm_out,nn_out=pp_out
-			#zeta_panel_out=Surf_out.get_panel_vertices_coords(mm_out,nn_out)
-			zeta_panel_out=Surf_out.zeta[:,[mm_out+0,mm_out+1,mm_out+1,mm_out+0],
-										[nn_out+0,nn_out+0,nn_out+1,nn_out+1]].T
+			zeta_panel_out=ZetaPanels_out[mm_out*N_out+nn_out]
 
 			# Loop segments
 			for ll,aa,bb in zip(svec,avec,bvec):
@@ -1087,7 +1004,7 @@ def dfqsdvind_zeta(Surfs,Surfs_star):
 					shape_zeta_in_bound=(3,M_in_bound+1,N_in_bound+1)
 					Dervert=Dervert_list[ss_out][ss_in] #<- link
 					# deriv wrt induced velocity
-					dvind_mid,dvind_vert=dvinddzeta_cpp(
+					dvind_mid,dvind_vert=dvinddzeta_backend(
 												  zeta_mid,Surf_in,IsBound=True)
 					# allocate coll
 					Df=np.dot(0.25*Lskew,dvind_mid)
@@ -1102,7 +1019,7 @@ def dfqsdvind_zeta(Surfs,Surfs_star):
 
 					### wake
 					# deriv wrt induced velocity
-					dvind_mid,dvind_vert=dvinddzeta_cpp(
+					dvind_mid,dvind_vert=dvinddzeta_backend(
 								zeta_mid,Surfs_star[ss_in],
 										IsBound=False,M_in_bound=Surf_in.maps.M)
 					# allocate coll
@@ -1147,7 +1064,8 @@ def dfqsdvind_zeta(Surfs,Surfs_star):
 				shape_zeta_in_bound=(3,M_in_bound+1,N_in_bound+1)
 				Dervert=Dervert_list[ss_out][ss_in] #<- link
 				# deriv wrt induced velocity
-				dvind_mid,dvind_vert=dvinddzeta_cpp(zeta_mid,Surf_in,IsBound=True)
+				dvind_mid,dvind_vert=dvinddzeta_backend(
+												  zeta_mid,Surf_in,IsBound=True)
 				# allocate coll
 				Df=np.dot(0.25*Lskew,dvind_mid)
 				Dercoll[np.ix_(ii_a,ii_a)]+=Df
@@ -1161,7 +1079,7 @@ def dfqsdvind_zeta(Surfs,Surfs_star):
 
 				### wake
 				# deriv wrt induced velocity
-				dvind_mid,dvind_vert=dvinddzeta_cpp(
+				dvind_mid,dvind_vert=dvinddzeta_backend(
 							zeta_mid,Surfs_star[ss_in],
 									    IsBound=False,M_in_bound=Surf_in.maps.M)
 				# allocate coll
@@ -1234,9 +1152,10 @@ def dfunstdgamma_dot(Surfs):
 
 
 
-def wake_prop(Surfs,Surfs_star):
+def wake_prop(Surfs,Surfs_star,sparse_format=False):
 	'''
-	Assembly of wake propagation matrices
+	Assembly of wake propagation matrices. If sparse_format is True, the
+	matrices are returned in scipy.sparse csc format.
 	'''
 
 	C_list=[]
@@ -1257,6 +1176,14 @@ def wake_prop(Surfs,Surfs_star):
 
 		iivec=np.array( range(N), dtype=int )
 
+		if sparse_format:
+			C_list.append( sparse.csc_matrix( (np.ones((N,)),
+							(iivec,N*(M-1)+iivec)), shape=(K_star,K) ) )
+			jjvec=np.arange(K_star-N)
+			Cstar_list.append( sparse.csc_matrix( (np.ones((K_star-N,)),
+							(N+jjvec,jjvec)), shape=(K_star,K_star) ) )
+			continue
+
 		### Propagation from trailing edge
 		C_list.append( np.zeros((K_star,K)) )
 		C=C_list[-1]
@@ -136,6 +136,53 @@ class AeroGridMap():
 											dims=self.shape_vert_scal,order='C')
 
 
+	def map_panels_to_vertices_1D_vector(self):
+		'''
+		Mapping:
+		- FROM: the index of a panel stored in 1D array.
+		- TO: index of a vector quantity defined at vertices and stored in 1D,
+		i.e. in the format of a (3,M+1,N+1) array reshaped in C order.
+
+		The Mpv1d_vector has size (K,4,3) where:
+			[1d index of panel, vertex 0,1,2 or 3, component x,y or z]
+		The table is built only once.
+		'''
+
+		if hasattr(self,'Mpv1d_vector'):
+			return self.Mpv1d_vector
+
+		mm,nn=np.unravel_index(np.arange(self.K),self.shape_pan_scal)
+		jjv=(mm[:,None]+self.dmver)*(self.N+1)+nn[:,None]+self.dnver
+		self.Mpv1d_vector=jjv[:,:,None]+self.Kzeta*np.arange(3)
+
+		return self.Mpv1d_vector
+
+
+	def map_te_panels_to_bound_vertices_1D_vector(self,M_bound):
+		'''
+		For a wake grid, maps the panels along the trailing edge (m=0) to the
+		vertices of the associated bound surface, with M_bound chord-wise
+		panels. Wake panel vertices 0 and 3 are the bound surface vertices
+		(M_bound,n) and (M_bound,n+1).
+
+		The Mtv1d_vector has size (N,2,3) where:
+			[span-wise index of panel, vertex 0 or 3, component x,y or z]
+		and its elements are the indices of a vector quantity defined at the
+		bound surface vertices and stored in 1D. The table is built only once
+		for each M_bound.
+		'''
+
+		if getattr(self,'M_bound',None)==M_bound:
+			return self.Mtv1d_vector
+
+		Kzeta_bound=(M_bound+1)*(self.N+1)
+		jjv=M_bound*(self.N+1)+np.arange(self.N)[:,None]+np.array([0,1])
+		self.Mtv1d_vector=jjv[:,:,None]+Kzeta_bound*np.arange(3)
+		self.M_bound=M_bound
+
+		return self.Mtv1d_vector
+
+
 	def map_panels_to_vertices(self):
 		'''
 		Mapping from panel of vertices. self.Mpv is a (M,N,4,2) array such that
@@ -283,6 +330,60 @@ class AeroGridMap():
 
 
 
+	# ---------------------------------------------------------- unique edges
+
+	def map_edges(self):
+		'''
+		Unique edges (segments) of the grid. These are numbered as:
+		- chord-wise edges, from vertex (m,n) to (m+1,n), with m<M and n<=N;
+		- span-wise edges, from vertex (m,n) to (m,n+1), with m<=M and n<N;
+		in this order and in C order over (m,n). Produces:
+		- Mev: (Nedges,2) array with the 1D (scalar) indices of the 1st and 2nd
+		vertex of each edge.
+		- Mpe: (K,4) array with the edge of each segment of each panel (1D
+		index). The segments of panel (m,n) are:
+			- seg. 0: chord-wise edge (m,n)
+			- seg. 1: span-wise edge (m+1,n)
+			- seg. 2: chord-wise edge (m,n+1), reversed
+			- seg. 3: span-wise edge (m,n), reversed
+		- Spe: (4,) array with the orientation (+1/-1) of each panel segment
+		w.r.t. its edge.
+		The mapping is built only once.
+		'''
+
+		if hasattr(self,'Mev'):
+			return
+
+		M,N=self.M,self.N
+		self.Nedges_chord=M*(N+1)
+		self.Nedges_span=(M+1)*N
+		self.Nedges=self.Nedges_chord+self.Nedges_span
+
+		# vertices of edges
+		Jv=np.arange(self.Kzeta).reshape(self.shape_vert_scal)
+		self.Mev=np.concatenate((
+					np.array([Jv[:-1,:].reshape(-1),Jv[1:,:].reshape(-1)]),
+					np.array([Jv[:,:-1].reshape(-1),Jv[:,1:].reshape(-1)])),
+																	 axis=1).T
+
+		# edges of panels
+		Ec=np.arange(self.Nedges_chord).reshape((M,N+1))
+		Es=self.Nedges_chord+np.arange(self.Nedges_span).reshape((M+1,N))
+		self.Mpe=np.array([ Ec[:,:-1].reshape(-1),
+							Es[1:,:].reshape(-1),
+							Ec[:,1:].reshape(-1),
+							Es[:-1,:].reshape(-1) ]).T
+		self.Spe=np.array([1,1,-1,-1])
+
+
+	def from_span_edge_to_1D(self,m:'chordwise index',n:'spanwise index'):
+		'''
+		Returns the 1D index of the span-wise edge (m,n) (see map_edges).
+		'''
+		return self.M*(self.N+1)+m*self.N+n
+
+
+
 	# # ---------------------------------------------- panels to segments extrema
 
 	# def map_panels_to_segments(self):
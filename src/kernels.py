@@ -0,0 +1,362 @@
+'''
+Registry of induced velocity kernels
+
+A backend is a set of routines computing the velocity induced by a surface
+of vertices zeta, zeta.shape=(3,M+1,N+1), and circulation gamma,
+gamma.shape=(M,N), and its derivatives:
+- aic3(zeta_target,zeta,normals=None): influence coefficient matrices over the
+target points zeta_target (shape (3,...)), with shape (3,K_trg,K) or, if
+normals are given, (K_trg,K).
+- ind_vel(zeta_target,zeta,gamma): induced velocities over zeta_target, with
+the same shape as zeta_target.
+- dvinddzeta(zetac,zeta,gamma,IsBound,M_in_bound=None): derivatives of the
+induced velocity at zetac w.r.t. zetac (3 x 3) and the vertices (3 x 3*Kzeta).
+See assembly.dvinddzeta_cpp for details.
+- eval_panel(zetaP,ZetaPanel,gamma_pan=1.0): derivatives of the velocity
+induced by one panel. See lib_dbiot.eval_panel_cpp for details.
+- nc_dvinddzeta(zeta_target,normals,zeta,gamma,IsBound,M_in_bound=None):
+derivatives of the induced velocity over a set of target points, projected
+along normals. If not provided at registration, this is obtained by calling
+dvinddzeta at each target point (see nc_dvinddzeta_loop).
+
+Available backends:
+- 'cpp': C++ library (cpp/cpplibs.so).
+- 'numpy': vectorised numpy routines (lib_vbiot and lib_dbiot.eval_panels_vec)
+and pure python panel derivatives (lib_dbiot.eval_panel_fast).
+- 'numba': routines in lib_nbiot. Requires numba.
+- 'treecode': as 'numpy', but the induced velocities (ind_vel) are evaluated
+with a Barnes-Hut treecode (libtree). This is approximated, with accuracy set
+by the opening angle libtree.THETA, and is meant for large wakes.
+
+A default backend is selected for the whole process via set_backend. Each
+surface.AeroGridSurface instance can override this through its backend
+attribute (see also linuvlm.Static).
+
+The cpp backend routines processing a set of target points are parallelised
+with OpenMP. The number of threads is set via set_num_threads.
+'''
+
+import numpy as np
+import gridmapping
+import lib_vbiot
+import libtree
+import lib_dbiot as dbiot
+
+import ctypes as ct
+import os
+import warnings
+
+# C++ library, loaded once and shared by all modules (if not available, the
+# numpy backend is used and the modules calling the library directly fail)
+lib_path=os.path.join(os.environ.get("DIRuvlm3d",
+					os.path.dirname(os.path.abspath(__file__))),'../cpp/cpplibs.so')
+try:
+	libc = ct.CDLL(lib_path)
+except OSError as err:
+	warnings.warn('C++ library not available (%s): falling back to the '
+													'numpy backend'%err)
+	libc = None
+
+try:
+	import lib_nbiot
+except ImportError:
+	lib_nbiot = None
+
+
+class Backend():
+	'''
+	Container of kernels
+	'''
+
+	def __init__(self,name,aic3,ind_vel,dvinddzeta,eval_panel,
+														 nc_dvinddzeta=None):
+		self.name=name
+		self.aic3=aic3
+		self.ind_vel=ind_vel
+		self.dvinddzeta=dvinddzeta
+		self.eval_panel=eval_panel
+		if nc_dvinddzeta is None:
+			nc_dvinddzeta=nc_dvinddzeta_loop(dvinddzeta)
+		self.nc_dvinddzeta=nc_dvinddzeta
+
+
+Backends={}
+DEFAULT=None
+
+
+def register(name,aic3,ind_vel,dvinddzeta,eval_panel,nc_dvinddzeta=None):
+	''' Adds a backend to the registry '''
+	Backends[name]=Backend(name,aic3,ind_vel,dvinddzeta,eval_panel,
+															   nc_dvinddzeta)
+
+
+def available():
+	''' List of available backends '''
+	return list(Backends.keys())
+
+
+def set_backend(name):
+	''' Sets the default backend of the process '''
+	global DEFAULT
+	if name not in Backends:
+		raise NameError('Backend %s not available. Choose among %s'\
+														  %(name,available()))
+	DEFAULT=name
+
+
+def get(name=None):
+	'''
+	Returns the backend name. If name is None, the default is returned.
+	'''
+	if name is None:
+		name=DEFAULT
+	if name not in Backends:
+		raise NameError('Backend %s not available. Choose among %s'\
+														  %(name,available()))
+	return Backends[name]
+
+
+def set_num_threads(num_threads):
+	'''
+	Sets the number of OpenMP threads used by the cpp backend.
+	'''
+	if libc is None:
+		raise NameError('C++ library not available')
+	libc.call_set_num_threads(ct.byref(ct.c_int(num_threads)))
+
+
+def get_num_threads():
+	'''
+	Returns the number of OpenMP threads used by the cpp backend.
+	'''
+	if libc is None:
+		raise NameError('C++ library not available')
+	return libc.call_get_num_threads()
+
+
+def nc_dvinddzeta_loop(dvinddzeta):
+	'''
+	Builds the nc_dvinddzeta routine of a backend from its dvinddzeta routine,
+	which is called at each target point.
+	'''
+
+	def nc_dvinddzeta(zeta_target,normals,zeta,gamma,IsBound,M_in_bound=None):
+		'''
+		Returns the derivatives of the velocity induced by the surface of
+		vertices zeta and circulation gamma at the target points, projected
+		along normals (same shape as zeta_target, e.g. (3,M_trg,N_trg)). The
+		outputs have shape (K_trg,3) (derivatives w.r.t. the target points)
+		and (K_trg,3*Kzeta_in_bound) (derivatives w.r.t. the vertices).
+		'''
+
+		zetaP=zeta_target.reshape((3,-1))
+		Normals=normals.reshape((3,-1))
+		K_trg=zetaP.shape[1]
+		M_in,N_in=gamma.shape
+		if IsBound: M_in_bound=M_in
+
+		ncDerC=np.empty((K_trg,3))
+		ncDerV=np.empty((K_trg,3*(M_in_bound+1)*(N_in+1)))
+		for tt in range(K_trg):
+			Dercoll,Dervert=dvinddzeta(np.ascontiguousarray(zetaP[:,tt]),
+									   zeta,gamma,IsBound,M_in_bound)
+			ncDerC[tt]=np.dot(Normals[:,tt],Dercoll)
+			ncDerV[tt]=np.dot(Normals[:,tt],Dervert)
+
+		return ncDerC,ncDerV
+
+	return nc_dvinddzeta
+
+
+
+# ------------------------------------------------------------- cpp backend
+
+def aic3_cpp(zeta_target,zeta,normals=None):
+	'''
+	Influence coefficient matrices over a set of target points computed in one
+	call to the C++ library. See surface.AeroGridSurface.get_aic_batch_cpp.
+	'''
+
+	_,Mv,Nv=zeta.shape
+	ZetaTarget=np.ascontiguousarray(zeta_target.reshape((3,-1)).T)
+	K_trg=ZetaTarget.shape[0]
+	K=(Mv-1)*(Nv-1)
+
+	Project=normals is not None
+	if Project:
+		NormalTarget=np.ascontiguousarray(normals.reshape((3,-1)).T)
+		assert NormalTarget.shape==ZetaTarget.shape,\
+									'normals and zeta_target shapes mismatch'
+		AIC=np.empty((K_trg,K),order='C')
+	else:
+		NormalTarget=ZetaTarget
+		AIC=np.empty((3,K_trg,K),order='C')
+
+	libc.call_aic3_batch(
+		AIC.ctypes.data_as(ct.POINTER(ct.c_double)),
+		ZetaTarget.ctypes.data_as(ct.POINTER(ct.c_double)),
+		NormalTarget.ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(zeta).ctypes.data_as(ct.POINTER(ct.c_double)),
+		ct.byref(ct.c_int(K_trg)),
+		ct.byref(ct.c_int(Mv-1)),
+		ct.byref(ct.c_int(Nv-1)),
+		ct.byref(ct.c_bool(Project)))
+
+	return AIC
+
+
+def ind_vel_cpp(zeta_target,zeta,gamma):
+	'''
+	Induced velocities over a set of target points computed in one call to
+	the C++ library.
+	'''
+
+	M,N=gamma.shape
+	zetaP=np.ascontiguousarray(zeta_target.reshape((3,-1)).T)
+	K_trg=zetaP.shape[0]
+	Uind=np.empty(zetaP.shape,order='C')
+
+	libc.call_ind_vel_batch(
+		Uind.ctypes.data_as(ct.POINTER(ct.c_double)),
+		zetaP.ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(zeta).ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(gamma).ctypes.data_as(ct.POINTER(ct.c_double)),
+		ct.byref(ct.c_int(K_trg)),
+		ct.byref(ct.c_int(M)),
+		ct.byref(ct.c_int(N)))
+
+	return Uind.T.reshape(zeta_target.shape)
+
+
+def dvinddzeta_cpp(zetac,zeta,gamma,IsBound,M_in_bound=None):
+	'''
+	See assembly.dvinddzeta_cpp.
+	'''
+
+	M_in,N_in=gamma.shape
+	if IsBound: M_in_bound=M_in
+	Dercoll=np.zeros((3,3),order='C')
+	Dervert=np.zeros((3,3*(M_in_bound+1)*(N_in+1)))
+
+	libc.call_dvinddzeta(
+		Dercoll.ctypes.data_as(ct.POINTER(ct.c_double)),
+		Dervert.ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(zetac).ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(zeta).ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(gamma).ctypes.data_as(ct.POINTER(ct.c_double)),
+		ct.byref(ct.c_int(M_in)),
+		ct.byref(ct.c_int(N_in)),
+		ct.byref(ct.c_bool(IsBound)),
+		ct.byref(ct.c_int(M_in_bound)))
+
+	return Dercoll, Dervert
+
+
+
+def nc_dvinddzeta_cpp(zeta_target,normals,zeta,gamma,IsBound,M_in_bound=None):
+	'''
+	See nc_dvinddzeta_loop. All target points are processed in one call to the
+	C++ library.
+	'''
+
+	M_in,N_in=gamma.shape
+	if IsBound: M_in_bound=M_in
+	ZetaTarget=np.ascontiguousarray(zeta_target.reshape((3,-1)).T)
+	NormalTarget=np.ascontiguousarray(normals.reshape((3,-1)).T)
+	assert NormalTarget.shape==ZetaTarget.shape,\
+									'normals and zeta_target shapes mismatch'
+	K_trg=ZetaTarget.shape[0]
+
+	ncDerC=np.empty((K_trg,3),order='C')
+	ncDerV=np.empty((K_trg,3*(M_in_bound+1)*(N_in+1)),order='C')
+
+	libc.call_nc_dvinddzeta_batch(
+		ncDerC.ctypes.data_as(ct.POINTER(ct.c_double)),
+		ncDerV.ctypes.data_as(ct.POINTER(ct.c_double)),
+		ZetaTarget.ctypes.data_as(ct.POINTER(ct.c_double)),
+		NormalTarget.ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(zeta).ctypes.data_as(ct.POINTER(ct.c_double)),
+		np.ascontiguousarray(gamma).ctypes.data_as(ct.POINTER(ct.c_double)),
+		ct.byref(ct.c_int(K_trg)),
+		ct.byref(ct.c_int(M_in)),
+		ct.byref(ct.c_int(N_in)),
+		ct.byref(ct.c_bool(IsBound)),
+		ct.byref(ct.c_int(M_in_bound)))
+
+	return ncDerC,ncDerV
+
+
+
+# ----------------------------------------------------------- numpy backend
+
+def dvinddzeta_vec(zetac,zeta,gamma,IsBound,M_in_bound=None,Maps=None,
+															ZetaPanels=None):
+	'''
+	Same as dvinddzeta_cpp, but the derivatives of all panels are computed at
+	once (lib_dbiot.eval_panels_vec) and summed into the output through the
+	index tables of the gridmapping.AeroGridMap instance Maps. If not given,
+	this is built from the shape of gamma.
+
+	The (K,4,3) array of panel vertices, ZetaPanels, can be passed in input
+	(see surface.AeroGridGeo.get_panel_vertices), otherwise it is gathered
+	from zeta.
+	'''
+
+	M_in,N_in=gamma.shape
+	if Maps is None:
+		Maps=gridmapping.AeroGridMap(M_in,N_in)
+	Ind=Maps.map_panels_to_vertices_1D_vector()
+
+	if ZetaPanels is None:
+		ZetaPanels=zeta.reshape((3,-1))[:,Ind[:,:,0]].transpose((1,2,0))
+	Dercoll,DerVertices=dbiot.eval_panels_vec(zetac,ZetaPanels,gamma.reshape(-1))
+
+	if IsBound:
+		Dervert=dbiot.accumulate_vertices(DerVertices,Ind,3*Maps.Kzeta)
+	else:
+		# wake vertices 0 and 3 of TE panels are on the TE of the bound surface
+		IndTE=Maps.map_te_panels_to_bound_vertices_1D_vector(M_in_bound)
+		Dervert=dbiot.accumulate_vertices(DerVertices[:N_in,[0,3]],IndTE,
+												3*(M_in_bound+1)*(N_in+1))
+
+	return Dercoll, Dervert
+
+
+def nc_dvinddzeta_vec(zeta_target,normals,zeta,gamma,IsBound,M_in_bound=None):
+	'''
+	See nc_dvinddzeta_loop. The index tables and the panel vertices used by
+	dvinddzeta_vec are built only once.
+	'''
+
+	Maps=gridmapping.AeroGridMap(*gamma.shape)
+	Ind=Maps.map_panels_to_vertices_1D_vector()
+	ZetaPanels=zeta.reshape((3,-1))[:,Ind[:,:,0]].transpose((1,2,0))
+	dvinddzeta=lambda zetac,zeta,gamma,IsBound,M_in_bound:\
+		 dvinddzeta_vec(zetac,zeta,gamma,IsBound,M_in_bound,Maps,ZetaPanels)
+
+	return nc_dvinddzeta_loop(dvinddzeta)(zeta_target,normals,zeta,gamma,
+														  IsBound,M_in_bound)
+
+
+
+# ---------------------------------------------------------------- registry
+
+if libc is not None:
+	libc.call_get_num_threads.restype=ct.c_int
+	register('cpp',aic3=aic3_cpp,ind_vel=ind_vel_cpp,
+						dvinddzeta=dvinddzeta_cpp,eval_panel=dbiot.eval_panel_cpp,
+											 nc_dvinddzeta=nc_dvinddzeta_cpp)
+
+register('numpy',aic3=lib_vbiot.aic3,ind_vel=lib_vbiot.ind_vel,
+						dvinddzeta=dvinddzeta_vec,eval_panel=dbiot.eval_panel_fast,
+											 nc_dvinddzeta=nc_dvinddzeta_vec)
+
+register('treecode',aic3=lib_vbiot.aic3,ind_vel=libtree.ind_vel,
+						dvinddzeta=dvinddzeta_vec,eval_panel=dbiot.eval_panel_fast,
+											 nc_dvinddzeta=nc_dvinddzeta_vec)
+
+if lib_nbiot is not None:
+	register('numba',aic3=lib_nbiot.aic3,ind_vel=lib_nbiot.ind_vel,
+				  dvinddzeta=lib_nbiot.dvinddzeta,eval_panel=lib_nbiot.eval_panel)
+
+set_backend('cpp' if libc is not None else 'numpy')
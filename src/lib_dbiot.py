@@ -20,9 +20,6 @@ import numpy as np
 import libalg
 
 import ctypes as ct
-import os
-lib_path=os.environ["DIRuvlm3d"]+'/../cpp/cpplibs.so'
-libc = ct.CDLL(lib_path)
 
 ### constants
 cfact_biot=0.25/np.pi
@@ -53,6 +50,9 @@ def eval_panel_cpp(zetaP,ZetaPanel,gamma_pan=1.0):
 	assert zetaP.flags['C_CONTIGUOUS'] and ZetaPanel.flags['C_CONTIGUOUS'],\
 														 'Input not C contiguous'
 
+	# C++ library from kernels (imported here, as kernels imports this module)
+	from kernels import libc
+
 	DerP=np.zeros((3,3),order='C')
 	DerVertices=np.zeros((4,3,3),order='C')
 
@@ -521,6 +521,110 @@ def eval_panel_fast_coll(zetaP,ZetaPanel,gamma_pan=1.0):
 
 
 
+
+# ------------------------------------------------------------------------------
+#	Vectorised over panels
+# ------------------------------------------------------------------------------
+
+
+def skew3d_vec(V):
+	''' Skew matrices, with shape (3,3,K), of the (3,K) array V '''
+	Z=np.zeros(V.shape[1:])
+	return np.array([[   Z, -V[2],  V[1]],
+					 [ V[2],    Z, -V[0]],
+					 [-V[1],  V[0],    Z]])
+
+
+def outer3d_vec(U,V):
+	''' Outer products, with shape (3,3,K), of the (3,K) arrays U and V '''
+	return U[:,None,:]*V[None,:,:]
+
+
+def eval_panels_vec(zetaP,ZetaPanels,Gamma):
+	'''
+	Computes the derivatives of the velocity induced over zetaP by a set of K
+	panels of vertices ZetaPanels, with shape (K,4,3), and circulation Gamma,
+	with shape (K,). The compact formula of eval_seg_comp_loop is applied at
+	once to the segments of all panels. Returns:
+		- DerP: derivative of the total induced velocity w.r.t. zetaP, with
+		DerP.shape=(3,3) : DerP[ Uind_{x,y,z}, ZetaP_{x,y,z} ]
+		- DerVertices: derivative of the velocity induced by each panel w.r.t.
+		its vertices, with DerVertices.shape=(K,4,3,3) : DerVertices[ panel,
+		vertex number {0,1,2,3}, Uind_{x,y,z}, Zeta_{x,y,z} ]
+	'''
+
+	K=ZetaPanels.shape[0]
+	Zeta=ZetaPanels.transpose((2,0,1)) # (3,K,4)
+	Cfact=cfact_biot*Gamma
+
+	DerP=np.zeros((3,3,K))
+	DerVertices=np.zeros((4,3,3,K))
+
+	for aa,bb in LoopPanel:
+		RA=zetaP[:,None]-Zeta[:,:,aa]
+		RB=zetaP[:,None]-Zeta[:,:,bb]
+		RAB=Zeta[:,:,bb]-Zeta[:,:,aa]
+		Vcr=libalg.cross3d(RA,RB)
+		vcr2=libalg.normsq3d(Vcr)
+
+		# numerical radious
+		Iskip=vcr2<(VORTEX_RADIUS_SQ*libalg.normsq3d(RAB))
+		vcr2[Iskip]=1.
+		Cseg=np.where(Iskip,0.,Cfact)
+
+		# skipped segments may have a vertex on zetaP
+		rainv=1./np.where(Iskip,1.,libalg.norm3d(RA))
+		rbinv=1./np.where(Iskip,1.,libalg.norm3d(RB))
+		Tv=RA*rainv-RB*rbinv
+		dotprod=RAB[0]*Tv[0]+RAB[1]*Tv[1]+RAB[2]*Tv[2]
+
+		# cross-product derivatives: Dvcross=diag_fact*I+off_fact*Vcr*Vcr^T
+		vcr2inv=1./vcr2
+		diag_fact=    Cseg*vcr2inv*dotprod
+		off_fact =-2.*Cseg*vcr2inv*vcr2inv*dotprod
+
+		# difference terms derivatives
+		Vsc=Vcr*vcr2inv*Cseg
+		dQ_dRAB=outer3d_vec(Vsc,Tv)
+
+		# Dvcross*skew(rv)=diag_fact*skew(rv)+off_fact*Vcr*(Vcr x rv)^T and
+		# Ddiff*der_runit(r)=Vsc*(rinv*RAB-rinv^3*(RAB.r)*r)^T
+		WA=rainv*RAB-rainv**3*(RAB[0]*RA[0]+RAB[1]*RA[1]+RAB[2]*RA[2])*RA
+		WB=rbinv*RAB-rbinv**3*(RAB[0]*RB[0]+RAB[1]*RB[1]+RAB[2]*RB[2])*RB
+		dQ_dRA=-diag_fact*skew3d_vec(RB)\
+			   -off_fact*outer3d_vec(Vcr,libalg.cross3d(Vcr,RB))\
+			   +outer3d_vec(Vsc,WA)
+		dQ_dRB= diag_fact*skew3d_vec(RA)\
+			   +off_fact*outer3d_vec(Vcr,libalg.cross3d(Vcr,RA))\
+			   -outer3d_vec(Vsc,WB)
+
+		DerP+=dQ_dRA+dQ_dRB
+		DerVertices[aa]-=dQ_dRAB+dQ_dRA
+		DerVertices[bb]+=dQ_dRAB-dQ_dRB
+
+	return DerP.sum(axis=2),DerVertices.transpose((3,0,1,2))
+
+
+def accumulate_vertices(DerVertices,Ind,Kvert):
+	'''
+	Sums the derivatives w.r.t. panel vertices, DerVertices.shape=(...,3,3),
+	in the format [..., Uind_{x,y,z}, Zeta_{x,y,z}], into a (3,Kvert) matrix.
+	The array Ind, with shape (...,3), contains the 1D index of each vertex
+	component in the output (see e.g. gridmapping.AeroGridMap.
+	map_panels_to_vertices_1D_vector).
+	'''
+
+	Ind=Ind.reshape(-1)
+	DerVertices=DerVertices.reshape((-1,3,3))
+	Der=np.empty((3,Kvert))
+	for cc in range(3):
+		Der[cc]=np.bincount(Ind,weights=DerVertices[:,cc,:].reshape(-1),
+															  minlength=Kvert)
+
+	return Der
+
+
+
 if __name__=='__main__':
 
 	import cProfile	
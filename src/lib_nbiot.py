@@ -0,0 +1,284 @@
+'''
+Biot-Savart law and derivatives compiled with numba
+
+The routines replicate those in cpp/src/lib_biot.cpp (biot_panel_map,
+der_biot_panel_map, aic3, ind_vel and dvinddzeta) and offer an alternative to
+the C++ library when this can not be compiled. The module requires numba.
+'''
+
+import numpy as np
+import numba
+
+cfact_biot=0.25/np.pi
+VORTEX_RADIUS=1e-2 # numerical radious of vortex
+VORTEX_RADIUS_SQ=VORTEX_RADIUS**2
+
+# local mapping segment/vertices of a panel
+avec=np.array([0,1,2,3]) # 1st vertex of seg.
+bvec=np.array([1,2,3,0]) # 2nd vertex of seg.
+dmver=np.array([0,1,1,0]) # delta to go from (m,n) panel to (m,n) vertices
+dnver=np.array([0,0,1,1])
+
+
+
+@numba.njit
+def get_panel(ZetaPanel,zeta,mm,nn):
+	''' Fills the (4,3) array ZetaPanel with the vertices of panel (mm,nn) '''
+	for vv in range(4):
+		for cc in range(3):
+			ZetaPanel[vv,cc]=zeta[cc,mm+dmver[vv],nn+dnver[vv]]
+
+
+@numba.njit
+def biot_panel(vel,zetaP,ZetaPanel,gamma):
+	'''
+	Adds to vel the velocity induced over zetaP by the panel of vertices
+	ZetaPanel (shape (4,3)) and circulation gamma.
+	'''
+
+	Cbiot=cfact_biot*gamma
+	R=np.empty((4,3))
+	Runit=np.empty((4,3))
+	for ii in range(4):
+		for cc in range(3):
+			R[ii,cc]=zetaP[cc]-ZetaPanel[ii,cc]
+		rnorm=np.sqrt(R[ii,0]**2+R[ii,1]**2+R[ii,2]**2)
+		for cc in range(3):
+			Runit[ii,cc]=R[ii,cc]/rnorm
+
+	for ii in range(4):
+		aa,bb=avec[ii],bvec[ii]
+		RAB0=ZetaPanel[bb,0]-ZetaPanel[aa,0]
+		RAB1=ZetaPanel[bb,1]-ZetaPanel[aa,1]
+		RAB2=ZetaPanel[bb,2]-ZetaPanel[aa,2]
+		Vcr0=R[aa,1]*R[bb,2]-R[aa,2]*R[bb,1]
+		Vcr1=R[aa,2]*R[bb,0]-R[aa,0]*R[bb,2]
+		Vcr2=R[aa,0]*R[bb,1]-R[aa,1]*R[bb,0]
+		vcr2=Vcr0**2+Vcr1**2+Vcr2**2
+		if vcr2<VORTEX_RADIUS_SQ*(RAB0**2+RAB1**2+RAB2**2):
+			continue
+		fact=Cbiot/vcr2*( RAB0*(Runit[aa,0]-Runit[bb,0])+
+						  RAB1*(Runit[aa,1]-Runit[bb,1])+
+						  RAB2*(Runit[aa,2]-Runit[bb,2]) )
+		vel[0]+=fact*Vcr0
+		vel[1]+=fact*Vcr1
+		vel[2]+=fact*Vcr2
+
+
+@numba.njit
+def der_runit(Der,r,rinv,minus_rinv3):
+	for ii in range(3):
+		for jj in range(3):
+			Der[ii,jj]=minus_rinv3*r[ii]*r[jj]
+		Der[ii,ii]+=rinv
+
+
+@numba.njit
+def dvcross_by_skew3d(P,Dvcross,rv):
+	''' Computes P=Dvcross*skew(rv), where Dvcross is symmetric '''
+	for ii in range(3):
+		P[ii,0]=Dvcross[ii,1]*rv[2]-Dvcross[ii,2]*rv[1]
+		P[ii,1]=Dvcross[ii,2]*rv[0]-Dvcross[ii,0]*rv[2]
+		P[ii,2]=Dvcross[ii,0]*rv[1]-Dvcross[ii,1]*rv[0]
+
+
+@numba.njit
+def der_biot_panel(DerP,DerVertices,zetaP,ZetaPanel,gamma):
+	'''
+	Adds to DerP (shape (3,3)) and DerVertices (shape (4,3,3)) the derivatives
+	of the velocity induced by a panel w.r.t. the target point zetaP and the
+	panel vertices.
+	'''
+
+	Cbiot=cfact_biot*gamma
+	R=np.empty((4,3))
+	Runit=np.empty((4,3))
+	Der_runit=np.empty((4,3,3))
+	Dvcross=np.empty((3,3))
+	Ddiff=np.empty((3,3))
+	dQ_dRAB=np.empty((3,3))
+	dQ_dRA=np.empty((3,3))
+	dQ_dRB=np.empty((3,3))
+	RAB=np.empty((3,))
+	Vcr=np.empty((3,))
+	Tv=np.empty((3,))
+
+	for ii in range(4):
+		for cc in range(3):
+			R[ii,cc]=zetaP[cc]-ZetaPanel[ii,cc]
+		r1inv=1./np.sqrt(R[ii,0]**2+R[ii,1]**2+R[ii,2]**2)
+		for cc in range(3):
+			Runit[ii,cc]=R[ii,cc]*r1inv
+		der_runit(Der_runit[ii],R[ii],r1inv,-r1inv**3)
+
+	for ii in range(4):
+		aa,bb=avec[ii],bvec[ii]
+		for cc in range(3):
+			RAB[cc]=ZetaPanel[bb,cc]-ZetaPanel[aa,cc]
+		Vcr[0]=R[aa,1]*R[bb,2]-R[aa,2]*R[bb,1]
+		Vcr[1]=R[aa,2]*R[bb,0]-R[aa,0]*R[bb,2]
+		Vcr[2]=R[aa,0]*R[bb,1]-R[aa,1]*R[bb,0]
+		vcr2=Vcr[0]**2+Vcr[1]**2+Vcr[2]**2
+		if vcr2<VORTEX_RADIUS_SQ*(RAB[0]**2+RAB[1]**2+RAB[2]**2):
+			continue
+		for cc in range(3):
+			Tv[cc]=Runit[aa,cc]-Runit[bb,cc]
+		dotprod=RAB[0]*Tv[0]+RAB[1]*Tv[1]+RAB[2]*Tv[2]
+
+		# cross-product derivatives
+		vcr2inv=1./vcr2
+		vcr4inv=vcr2inv*vcr2inv
+		diag_fact=    Cbiot*vcr2inv*dotprod
+		off_fact =-2.*Cbiot*vcr4inv*dotprod
+		for i1 in range(3):
+			for i2 in range(3):
+				Dvcross[i1,i2]=off_fact*Vcr[i1]*Vcr[i2]
+			Dvcross[i1,i1]+=diag_fact
+
+		# difference and RAB terms derivatives
+		for i1 in range(3):
+			vsc=Vcr[i1]*vcr2inv*Cbiot
+			for i2 in range(3):
+				Ddiff[i1,i2]=vsc*RAB[i2]
+				dQ_dRAB[i1,i2]=vsc*Tv[i2]
+
+		# final assembly
+		dvcross_by_skew3d(dQ_dRA,Dvcross,-R[bb])
+		dvcross_by_skew3d(dQ_dRB,Dvcross,R[aa])
+		dQ_dRA+=np.dot(Ddiff,Der_runit[aa])
+		dQ_dRB-=np.dot(Ddiff,Der_runit[bb])
+
+		DerP+=dQ_dRA+dQ_dRB
+		DerVertices[aa]-=dQ_dRAB+dQ_dRA
+		DerVertices[bb]+=dQ_dRAB-dQ_dRB
+
+
+
+# ----------------------------------------------------------- surface routines
+
+@numba.njit
+def aic3_loop(AIC,zetaP,zeta,Normals,Project):
+	Ntrg=zetaP.shape[1]
+	M,N=zeta.shape[1]-1,zeta.shape[2]-1
+	ZetaPanel=np.empty((4,3))
+	vel=np.empty((3,))
+
+	for mm in range(M):
+		for nn in range(N):
+			get_panel(ZetaPanel,zeta,mm,nn)
+			pp=mm*N+nn
+			for tt in range(Ntrg):
+				vel[:]=0.
+				biot_panel(vel,zetaP[:,tt],ZetaPanel,1.0)
+				if Project:
+					AIC[0,tt,pp]=vel[0]*Normals[0,tt]+vel[1]*Normals[1,tt]+\
+															vel[2]*Normals[2,tt]
+				else:
+					for cc in range(3):
+						AIC[cc,tt,pp]=vel[cc]
+
+
+@numba.njit
+def ind_vel_loop(Uind,zetaP,zeta,gamma):
+	Ntrg=zetaP.shape[1]
+	M,N=gamma.shape
+	ZetaPanel=np.empty((4,3))
+
+	for mm in range(M):
+		for nn in range(N):
+			get_panel(ZetaPanel,zeta,mm,nn)
+			for tt in range(Ntrg):
+				biot_panel(Uind[:,tt],zetaP[:,tt],ZetaPanel,gamma[mm,nn])
+
+
+@numba.njit
+def dvinddzeta_loop(DerC,DerV,zetaC,zeta,gamma,IsBound,M_bound):
+	M,N=gamma.shape
+	Kzeta_bound=(M_bound+1)*(N+1)
+	ZetaPanel=np.empty((4,3))
+	derv=np.empty((4,3,3))
+
+	if IsBound:
+		for mm in range(M):
+			for nn in range(N):
+				get_panel(ZetaPanel,zeta,mm,nn)
+				derv[:,:,:]=0.
+				der_biot_panel(DerC,derv,zetaC,ZetaPanel,gamma[mm,nn])
+				for vv in range(4):
+					jj=(mm+dmver[vv])*(N+1)+nn+dnver[vv]
+					for cc_in in range(3):
+						DerV[:,cc_in*Kzeta_bound+jj]+=derv[vv,:,cc_in]
+	else:
+		# TE row: vertices 0 and 3 are on the bound surface TE
+		for nn in range(N):
+			get_panel(ZetaPanel,zeta,0,nn)
+			derv[:,:,:]=0.
+			der_biot_panel(DerC,derv,zetaC,ZetaPanel,gamma[0,nn])
+			for cc_in in range(3):
+				DerV[:,cc_in*Kzeta_bound+M_bound*(N+1)+nn]+=derv[0,:,cc_in]
+				DerV[:,cc_in*Kzeta_bound+M_bound*(N+1)+nn+1]+=derv[3,:,cc_in]
+		# other rows: collocation contribution only
+		for mm in range(1,M):
+			for nn in range(N):
+				get_panel(ZetaPanel,zeta,mm,nn)
+				der_biot_panel(DerC,derv,zetaC,ZetaPanel,gamma[mm,nn])
+
+
+
+def aic3(zeta_target,zeta,normals=None):
+	'''
+	Same as lib_vbiot.aic3.
+	'''
+
+	zetaP=np.ascontiguousarray(zeta_target.reshape((3,-1)))
+	Ntrg=zetaP.shape[1]
+	K=(zeta.shape[1]-1)*(zeta.shape[2]-1)
+
+	if normals is not None:
+		Normals=np.ascontiguousarray(normals.reshape((3,-1)))
+		AIC=np.empty((1,Ntrg,K))
+		aic3_loop(AIC,zetaP,zeta,Normals,True)
+		return AIC[0]
+	else:
+		AIC=np.empty((3,Ntrg,K))
+		aic3_loop(AIC,zetaP,zeta,zetaP,False)
+		return AIC
+
+
+def ind_vel(zeta_target,zeta,gamma):
+	'''
+	Same as lib_vbiot.ind_vel.
+	'''
+
+	zetaP=np.ascontiguousarray(zeta_target.reshape((3,-1)))
+	Uind=np.zeros(zetaP.shape)
+	ind_vel_loop(Uind,zetaP,zeta,gamma)
+
+	return Uind.reshape(zeta_target.shape)
+
+
+def dvinddzeta(zetac,zeta,gamma,IsBound,M_in_bound=None):
+	'''
+	Same as assembly.dvinddzeta_cpp, but with the surface vertices (zeta) and
+	circulation (gamma) in input.
+	'''
+
+	M_in,N_in=gamma.shape
+	if IsBound: M_in_bound=M_in
+	Dercoll=np.zeros((3,3))
+	Dervert=np.zeros((3,3*(M_in_bound+1)*(N_in+1)))
+	dvinddzeta_loop(Dercoll,Dervert,zetac,zeta,gamma,IsBound,M_in_bound)
+
+	return Dercoll,Dervert
+
+
+def eval_panel(zetaP,ZetaPanel,gamma_pan=1.0):
+	'''
+	Same as lib_dbiot.eval_panel_cpp.
+	'''
+
+	DerP=np.zeros((3,3))
+	DerVertices=np.zeros((4,3,3))
+	der_biot_panel(DerP,DerVertices,zetaP,ZetaPanel,gamma_pan)
+
+	return DerP,DerVertices
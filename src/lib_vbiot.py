@@ -0,0 +1,358 @@
+'''
+Vectorised Biot-Savart law (NumPy)
+
+Induced velocities and influence coefficients of a surface are computed over a
+block of target points at once, without loops over panels and without the
+compiled library (cpp/cpplibs.so).
+
+Each surface is split into its unique segments (edges):
+- chord-wise edges, from vertex (m,n) to (m+1,n), with m<M and n<=N;
+- span-wise edges, from vertex (m,n) to (m,n+1), with m<=M and n<N;
+numbered in this order and in C order over (m,n) (see
+gridmapping.AeroGridMap.map_edges). The contribution of each edge is computed
+only once per target point and shared by the (up to two) panels it belongs to.
+
+To bound memory, target points are processed in chunks such that the number
+of (target,edge) pairs stored at once does not exceed MAX_PAIRS.
+'''
+
+import numpy as np
+import libalg
+import gridmapping
+
+cfact_biot=0.25/np.pi
+VORTEX_RADIUS=1e-2 # numerical radious of vortex
+VORTEX_RADIUS_SQ=VORTEX_RADIUS**2
+
+MAX_PAIRS=2**18 # max. number of (target,edge) pairs per chunk
+
+
+
+def get_edges(zeta):
+	'''
+	Given the vertices coordinates of a surface, zeta.shape=(3,M+1,N+1),
+	returns the coordinates of the first (ZetaA) and second (ZetaB) vertex of
+	each edge. Both arrays have shape (3,Nedges).
+	'''
+
+	_,Mv,Nv=zeta.shape
+	ZetaA=np.concatenate( ( zeta[:,:-1,:].reshape((3,(Mv-1)*Nv)),
+							zeta[:,:,:-1].reshape((3,Mv*(Nv-1))) ),axis=1)
+	ZetaB=np.concatenate( ( zeta[:,1:,:].reshape((3,(Mv-1)*Nv)),
+							zeta[:,:,1:].reshape((3,Mv*(Nv-1))) ),axis=1)
+
+	return ZetaA,ZetaB
+
+
+def get_panel_edges(M,N):
+	'''
+	Returns the (4,K) array of edges indices of each panel segment, and the
+	(4,) array of orientations of each segment w.r.t. the edge. Panels are
+	numbered in C order.
+	'''
+
+	Maps=gridmapping.AeroGridMap(M,N)
+	Maps.map_edges()
+
+	return Maps.Mpe.T,np.array(Maps.Spe,dtype=float)
+
+
+def get_edges_gamma(gamma):
+	'''
+	Given the panels circulation, gamma.shape=(M,N), returns the net
+	circulation of each edge, with shape (Nedges,).
+	'''
+
+	M,N=gamma.shape
+	Gc=np.zeros((M,N+1))
+	Gc[:,:-1]+=gamma
+	Gc[:,1:]-=gamma
+	Gs=np.zeros((M+1,N))
+	Gs[1:,:]+=gamma
+	Gs[:-1,:]-=gamma
+
+	return np.concatenate((Gc.reshape(-1),Gs.reshape(-1)))
+
+
+def get_midsegments(zeta):
+	'''
+	Returns the mid-points of each edge, with shape (3,Nedges).
+	'''
+
+	ZetaA,ZetaB=get_edges(zeta)
+	return 0.5*(ZetaA+ZetaB)
+
+
+def from_edges_to_segments(q_edges,M,N):
+	'''
+	Given a quantity defined at the edges of a surface, with shape
+	q_edges.shape=(...,Nedges), returns the quantity at each panel segment in
+	the redundant format, with shape (...,4,M,N). The orientation of the
+	segments is not accounted for.
+	'''
+
+	Epan,Spans=get_panel_edges(M,N)
+	return q_edges[...,Epan].reshape(q_edges.shape[:-1]+(4,M,N))
+
+
+# ------------------------------------------------------------ Biot-Savart law
+
+def biot_segments(RA,RB,RAB):
+	'''
+	Velocity induced by unit-circulation segments A->B over points P, given
+	the relative positions RA=P-A, RB=P-B and the segments vectors RAB=B-A.
+	All arrays have shape (3,...) and are broadcast against each other.
+	'''
+
+	Vcr=libalg.cross3d(RA,RB)
+	vcr2=libalg.normsq3d(Vcr)
+
+	# numerical radious
+	Iskip=vcr2<VORTEX_RADIUS_SQ*libalg.normsq3d(RAB)
+	vcr2[Iskip]=1.
+
+	Fact=(RAB[0]*RA[0]+RAB[1]*RA[1]+RAB[2]*RA[2])/libalg.norm3d(RA)-\
+						(RAB[0]*RB[0]+RAB[1]*RB[1]+RAB[2]*RB[2])/libalg.norm3d(RB)
+	Fact*=cfact_biot/vcr2
+	Fact[Iskip]=0.
+
+	Vcr*=Fact
+
+	return Vcr
+
+
+def biot_edges(zetaP,ZetaA,ZetaB):
+	'''
+	Velocity induced by unit-circulation segments A->B over points P, where:
+	- zetaP.shape=(3,Ntrg)
+	- ZetaA.shape=ZetaB.shape=(3,Nseg)
+	The output has shape (3,Ntrg,Nseg).
+	'''
+
+	RA=zetaP[:,:,None]-ZetaA[:,None,:]
+	RB=zetaP[:,:,None]-ZetaB[:,None,:]
+	RAB=(ZetaB-ZetaA)[:,None,:]
+
+	return biot_segments(RA,RB,RAB)
+
+
+def get_chunks(Ntrg,Nedges):
+	'''
+	Yields the slices of target points to process at once.
+	'''
+
+	Nchunk=max(1,MAX_PAIRS//max(1,Nedges))
+	for tt in range(0,Ntrg,Nchunk):
+		yield slice(tt,min(tt+Nchunk,Ntrg))
+
+
+def aic3(zeta_target,zeta,normals=None):
+	'''
+	Produces the influence coefficient matrices of the surface of vertices
+	zeta, zeta.shape=(3,M+1,N+1), over the target points zeta_target. These
+	are given in grid format, zeta_target.shape=(3,M_trg,N_trg), or as a
+	(3,K_trg) array.
+
+	If normals (same shape as zeta_target) are given, the induced velocities
+	are projected and the output has shape (K_trg,K), otherwise (3,K_trg,K).
+	'''
+
+	_,Mv,Nv=zeta.shape
+	M,N=Mv-1,Nv-1
+	zetaP=zeta_target.reshape((3,-1))
+	Ntrg=zetaP.shape[1]
+
+	ZetaA,ZetaB=get_edges(zeta)
+	Epan,Spans=get_panel_edges(M,N)
+	Nedges=ZetaA.shape[1]
+
+	if normals is not None:
+		Normals=normals.reshape((3,-1))
+		AIC=np.empty((Ntrg,M*N))
+	else:
+		AIC=np.empty((3,Ntrg,M*N))
+
+	for tt in get_chunks(Ntrg,Nedges):
+		Vedges=biot_edges(zetaP[:,tt],ZetaA,ZetaB)
+
+		if normals is not None:
+			Vedges=Normals[0,tt,None]*Vedges[0]+\
+					Normals[1,tt,None]*Vedges[1]+Normals[2,tt,None]*Vedges[2]
+			AIC[tt,:]=Vedges[:,Epan[0]]+Vedges[:,Epan[1]]\
+									  -Vedges[:,Epan[2]]-Vedges[:,Epan[3]]
+		else:
+			AIC[:,tt,:]=Vedges[:,:,Epan[0]]+Vedges[:,:,Epan[1]]\
+									  -Vedges[:,:,Epan[2]]-Vedges[:,:,Epan[3]]
+
+	return AIC
+
+
+def aic3_panels(zeta_target,ZetaPanels,normals=None):
+	'''
+	Produces the influence coefficient matrices of a set of panels, not
+	necessarily belonging to the same surface, over the target points
+	zeta_target (shape (3,...)). The panels vertices are given as a (K,4,3)
+	array, in the same order as surface.AeroGridGeo.get_panel_vertices.
+
+	As edges are not shared between panels, this is about twice as expensive
+	as aic3 per panel, and is meant to evaluate arbitrary blocks of rows and
+	columns of an AIC matrix (see libhmat).
+
+	If normals (same shape as zeta_target) are given, the induced velocities
+	are projected and the output has shape (K_trg,K), otherwise (3,K_trg,K).
+	'''
+
+	K=ZetaPanels.shape[0]
+	zetaP=zeta_target.reshape((3,-1))
+	Ntrg=zetaP.shape[1]
+
+	# segment ll of each panel, from vertex ll to vertex ll+1
+	ZetaA=ZetaPanels.reshape((4*K,3)).T
+	ZetaB=ZetaPanels[:,[1,2,3,0],:].reshape((4*K,3)).T
+
+	if normals is not None:
+		Normals=normals.reshape((3,-1))
+		AIC=np.empty((Ntrg,K))
+	else:
+		AIC=np.empty((3,Ntrg,K))
+
+	for tt in get_chunks(Ntrg,4*K):
+		Vseg=biot_edges(zetaP[:,tt],ZetaA,ZetaB)
+		if normals is not None:
+			Vseg=Normals[0,tt,None]*Vseg[0]+\
+					Normals[1,tt,None]*Vseg[1]+Normals[2,tt,None]*Vseg[2]
+		AIC[...,tt,:]=np.sum(Vseg.reshape(Vseg.shape[:-1]+(K,4)),axis=-1)
+
+	return AIC
+
+
+def aic3_pairs(zeta_target,ZetaPanels,normals):
+	'''
+	Returns the influence coefficients of each panel of vertices ZetaPanels,
+	ZetaPanels.shape=(Npairs,4,3), over the corresponding target point in
+	zeta_target, zeta_target.shape=(3,Npairs), projected along normals (same
+	shape as zeta_target). The output has shape (Npairs,). This allows to
+	evaluate selected entries of an AIC matrix (e.g. the near-field ones).
+	'''
+
+	Vert=ZetaPanels.transpose((2,0,1))
+	RA=zeta_target[:,:,None]-Vert
+	RB=zeta_target[:,:,None]-Vert[:,:,[1,2,3,0]]
+	Vseg=biot_segments(RA,RB,RA-RB)
+
+	return np.sum(normals[:,:,None]*Vseg,axis=(0,2))
+
+
+def ind_vel(zeta_target,zeta,gamma):
+	'''
+	Computes the velocity induced by the surface of vertices zeta,
+	zeta.shape=(3,M+1,N+1), and circulation gamma, gamma.shape=(M,N), over
+	the target points zeta_target. These are given in grid format,
+	zeta_target.shape=(3,M_trg,N_trg), or as a (3,K_trg) array. The output has
+	the same shape as zeta_target.
+	'''
+
+	zetaP=zeta_target.reshape((3,-1))
+	Ntrg=zetaP.shape[1]
+
+	ZetaA,ZetaB=get_edges(zeta)
+	Gedges=get_edges_gamma(gamma)
+
+	# edges with null net circulation (e.g. inside a steady wake) are skipped
+	iinz=Gedges!=0.
+	ZetaA,ZetaB,Gedges=ZetaA[:,iinz],ZetaB[:,iinz],Gedges[iinz]
+	Nedges=len(Gedges)
+
+	Uind=np.zeros((3,Ntrg))
+	for tt in get_chunks(Ntrg,Nedges):
+		Uind[:,tt]=np.dot(biot_edges(zetaP[:,tt],ZetaA,ZetaB),Gedges)
+
+	return Uind.reshape(zeta_target.shape)
+
+
+# ------------------------------------------------------------- steady wake
+
+def get_strips_edges(zeta,tol=1e-10):
+	'''
+	Returns the edges bounding the span-wise strips of a wake of vertices zeta,
+	zeta.shape=(3,M_star+1,N_star+1), whose circulation is constant along the
+	chord (steady wake). In this case, the edges in the interior of each strip
+	carry no net circulation and only the following are returned:
+	- chord-wise lines, i.e. the edges from vertex (0,n) to (M_star,n). If all
+	the vertices of a line are aligned (within tol, relative to the line
+	length), the line is represented by one edge only;
+	- span-wise edges at the first (m=0) and last (m=M_star) row.
+	Chord-wise edges are ordered by line. The output is:
+	- ZetaA, ZetaB: first and second vertex of each edge, shape (3,Nedges).
+	- Istart: (N_star+1,) array with the index of the first edge of each line.
+	'''
+
+	_,Mv,Nv=zeta.shape
+
+	# check alignment of chord-wise lines
+	D=zeta[:,-1,:]-zeta[:,0,:]
+	R=zeta-zeta[:,:1,:]
+	Dsq=libalg.normsq3d(D)
+	dist2=libalg.normsq3d(libalg.cross3d(R,D[:,None,:]))
+	proj=R[0]*D[0]+R[1]*D[1]+R[2]*D[2]
+	Straight=np.all(dist2<=tol**2*Dsq**2,axis=0) & \
+						 np.all(np.diff(proj,axis=0)>=0.,axis=0) & (Dsq>0.)
+
+	# chord-wise edges, ordered by line
+	Keep=np.ones((Mv-1,Nv),dtype=bool)
+	Keep[1:,Straight]=False
+	ZetaBc=zeta[:,1:,:].copy()
+	ZetaBc[:,0,Straight]=zeta[:,-1,Straight]
+	Keep=Keep.T
+	ZetaAc=zeta[:,:-1,:].transpose((0,2,1))[:,Keep]
+	ZetaBc=ZetaBc.transpose((0,2,1))[:,Keep]
+	Istart=np.concatenate(([0],np.cumsum(np.sum(Keep,axis=1))[:-1]))
+
+	ZetaA=np.concatenate((ZetaAc,zeta[:,0,:-1],zeta[:,-1,:-1]),axis=1)
+	ZetaB=np.concatenate((ZetaBc,zeta[:,0,1:],zeta[:,-1,1:]),axis=1)
+
+	return ZetaA,ZetaB,Istart
+
+
+def aic3_folded(zeta_target,zeta,normals=None):
+	'''
+	Produces the influence coefficient matrices of a steady wake of vertices
+	zeta, zeta.shape=(3,M_star+1,N_star+1), over the target points
+	zeta_target, in the same formats as aic3. The circulation of each
+	span-wise strip of panels is constant, hence the matrices are directly
+	produced in folded format, with shape (K_trg,N_star) or (3,K_trg,N_star).
+	These are equivalent to summing the columns of the full (K_trg,K_star)
+	matrices along the chord, i.e. AIC_fold[:,n]=sum_m AIC[:,m*N_star+n], but
+	the full matrices are never built.
+
+	Only the edges bounding each strip are evaluated (see get_strips_edges):
+	for straight wakes, the cost is O(K_trg*N_star) instead of
+	O(K_trg*K_star).
+	'''
+
+	_,Mv,Nv=zeta.shape
+	N=Nv-1
+	zetaP=zeta_target.reshape((3,-1))
+	Ntrg=zetaP.shape[1]
+
+	ZetaA,ZetaB,Istart=get_strips_edges(zeta)
+	Nedges=ZetaA.shape[1]
+	Nc=Nedges-2*N
+
+	if normals is not None:
+		Normals=normals.reshape((3,-1))
+		AIC=np.empty((Ntrg,N))
+	else:
+		AIC=np.empty((3,Ntrg,N))
+
+	for tt in get_chunks(Ntrg,Nedges):
+		Vedges=biot_edges(zetaP[:,tt],ZetaA,ZetaB)
+		if normals is not None:
+			Vedges=Normals[0,tt,None]*Vedges[0]+\
+					Normals[1,tt,None]*Vedges[1]+Normals[2,tt,None]*Vedges[2]
+
+		Vlines=np.add.reduceat(Vedges[...,:Nc],Istart,axis=-1)
+		AIC[...,tt,:]=Vlines[...,:-1]-Vlines[...,1:]\
+							-Vedges[...,Nc:Nc+N]+Vedges[...,Nc+N:]
+
+	return AIC
@@ -0,0 +1,236 @@
+'''
+Persistent cache of assembled matrices
+Oct 2018
+
+Content-addressed, on-disk store of named arrays. Each entry is identified by
+a key, obtained by hashing all the quantities the arrays depend on (see
+get_key), and is saved as a set of .npy files in a sub-directory of the cache
+root. Entries are loaded as memory-mapped arrays. Sparse matrices (see
+scipy.sparse) are saved as .npz files and loaded in csr format, without
+memory-mapping.
+
+An index file (index.json) records the size and last access time of each
+entry. When the total size of the cache exceeds max_size, the least recently
+used entries are removed.
+
+Usage (see linuvlm.Static):
+	Cache=libcache.Cache('./cache',max_size=2**30)
+	key=libcache.get_key(zeta_list,backend='cpp')
+	Blocks=Cache.load(key)
+	if Blocks is None:
+		Blocks={'AIC':...}
+		Cache.save(key,Blocks)
+'''
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import scipy.sparse as sparse
+
+
+
+def update_hash(H,obj):
+	'''
+	Updates the hash object H with obj, which can be an array, a list/tuple
+	of objects, a dictionary, a scalar or a string.
+	'''
+
+	if isinstance(obj,np.ndarray):
+		H.update(('array%s%s'%(obj.dtype.str,obj.shape)).encode())
+		H.update(np.ascontiguousarray(obj).tobytes())
+	elif isinstance(obj,(list,tuple)):
+		H.update(('list%d'%len(obj)).encode())
+		for oo in obj:
+			update_hash(H,oo)
+	elif isinstance(obj,dict):
+		H.update(('dict%d'%len(obj)).encode())
+		for kk in sorted(obj.keys()):
+			update_hash(H,kk)
+			update_hash(H,obj[kk])
+	elif obj is None or isinstance(obj,(str,bool,int,float,np.number)):
+		H.update(('%s:%r'%(type(obj).__name__,obj)).encode())
+	else:
+		raise NameError('Object of type %s can not be hashed'%type(obj))
+
+
+def get_key(*args,**kwargs):
+	'''
+	Returns the key (sha1 hex digest) of the arguments. These can be arrays,
+	lists/tuples, dictionaries, scalars or strings. Keyword arguments are
+	hashed in alphabetical order.
+	'''
+
+	H=hashlib.sha1()
+	update_hash(H,list(args))
+	update_hash(H,kwargs)
+
+	return H.hexdigest()
+
+
+
+class Cache():
+	'''
+	On-disk cache of named arrays with size-bounded LRU eviction.
+
+	- path: root directory of the cache (created if not existing).
+	- max_size: max. size of the cache in bytes.
+	- mmap_mode: mode used to load the arrays (see numpy.load). By default,
+	the arrays are memory-mapped in copy-on-write mode, such that changes
+	are not written back to disk.
+	'''
+
+	def __init__(self,path,max_size=2**30,mmap_mode='c'):
+
+		self.path=os.path.abspath(path)
+		self.max_size=max_size
+		self.mmap_mode=mmap_mode
+		self.index_file=os.path.join(self.path,'index.json')
+
+		# counters
+		self.hits=0
+		self.misses=0
+
+		os.makedirs(self.path,exist_ok=True)
+		self.read_index()
+
+
+	def read_index(self):
+		''' Loads the index and drops the entries not found on disk '''
+
+		if os.path.isfile(self.index_file):
+			with open(self.index_file,'r') as fid:
+				self.index=json.load(fid)
+		else:
+			self.index={}
+
+		for key in list(self.index.keys()):
+			if not os.path.isdir(self.get_entry_path(key)):
+				del self.index[key]
+
+
+	def write_index(self):
+		tmp_file=self.index_file+'.tmp'
+		with open(tmp_file,'w') as fid:
+			json.dump(self.index,fid)
+		os.replace(tmp_file,self.index_file)
+
+
+	def get_entry_path(self,key):
+		return os.path.join(self.path,key)
+
+
+	@property
+	def size(self):
+		''' Total size of the cache in bytes '''
+		return sum([entry['size'] for entry in self.index.values()])
+
+
+	def __contains__(self,key):
+		return key in self.index
+
+
+	def load(self,key):
+		'''
+		Returns a dictionary with the arrays stored under key, or None if the
+		key is not found.
+		'''
+
+		if key not in self.index:
+			self.misses+=1
+			return None
+
+		entry_path=self.get_entry_path(key)
+		try:
+			Blocks={}
+			for name in self.index[key]['names']:
+				fname=os.path.join(entry_path,name)
+				if os.path.isfile(fname+'.npz'):
+					Blocks[name]=sparse.load_npz(fname+'.npz').tocsr()
+				else:
+					Blocks[name]=np.load(fname+'.npy',mmap_mode=self.mmap_mode)
+		except (IOError,ValueError):
+			# corrupted entry
+			self.remove(key)
+			self.misses+=1
+			return None
+
+		self.index[key]['atime']=time.time()
+		self.write_index()
+		self.hits+=1
+
+		return Blocks
+
+
+	def save(self,key,Blocks):
+		'''
+		Stores the dictionary of arrays Blocks under key and removes the least
+		recently used entries if the max. size of the cache is exceeded.
+		'''
+
+		entry_path=self.get_entry_path(key)
+		tmp_path=entry_path+'.tmp'
+		if os.path.isdir(tmp_path):
+			shutil.rmtree(tmp_path)
+		os.makedirs(tmp_path)
+
+		size=0
+		for name,arr in Blocks.items():
+			if sparse.issparse(arr):
+				arr=arr.tocsr()
+				sparse.save_npz(os.path.join(tmp_path,name+'.npz'),arr,
+															compressed=False)
+				size+=arr.data.nbytes+arr.indices.nbytes+arr.indptr.nbytes
+			else:
+				arr=np.asarray(arr)
+				np.save(os.path.join(tmp_path,name+'.npy'),arr)
+				size+=arr.nbytes
+
+		if os.path.isdir(entry_path):
+			shutil.rmtree(entry_path)
+		os.rename(tmp_path,entry_path)
+
+		self.index[key]={'names':list(Blocks.keys()),
+						 'size':size,
+						 'atime':time.time()}
+		self.evict(keep=key)
+		self.write_index()
+
+
+	def evict(self,keep=None):
+		'''
+		Removes the least recently used entries until the size of the cache is
+		below max_size. The entry keep is never removed.
+		'''
+
+		Keys=sorted(self.index.keys(),key=lambda kk: self.index[kk]['atime'])
+		size=self.size
+		for key in Keys:
+			if size<=self.max_size:
+				break
+			if key==keep:
+				continue
+			size-=self.index[key]['size']
+			self.remove(key,update_index=False)
+
+
+	def remove(self,key,update_index=True):
+		''' Removes an entry '''
+
+		entry_path=self.get_entry_path(key)
+		if os.path.isdir(entry_path):
+			shutil.rmtree(entry_path)
+		if key in self.index:
+			del self.index[key]
+		if update_index:
+			self.write_index()
+
+
+	def clear(self):
+		''' Removes all entries '''
+
+		for key in list(self.index.keys()):
+			self.remove(key,update_index=False)
+		self.write_index()
@@ -0,0 +1,320 @@
+'''
+Hierarchical (H-) matrices of influence coefficients
+Oct 2018
+
+The AIC matrix between a set of target points and a set of panels is stored as
+a collection of blocks, each associated to a cluster of target points and a
+cluster of panels:
+- blocks of well-separated clusters (admissible blocks) are numerically low
+rank and are stored in factorised form, A_block ~= U*V, with U and V obtained
+via adaptive cross approximation (ACA) to a relative tolerance;
+- all other blocks (near-field) are stored as dense matrices.
+
+Clusters are built by recursive bisection of the bounding box of the target
+points/panels (see build_cluster_tree). A pair of clusters X, Y is admissible
+if:
+	min( diam(X), diam(Y) ) <= eta * dist(X,Y)
+where diam and dist are computed over the bounding boxes of the clusters.
+
+Entries are evaluated through lib_vbiot.aic3_panels, which only requires the
+panels vertices, such that blocks of rows/columns can be computed without
+building the full matrix.
+
+Usage (see assembly.AIC_hmatrix):
+	H=libhmat.HMatrix(zeta_target,normals,ZetaPanels,tol=1e-6)
+	y=H.dot(x)		# AIC*x
+	z=H.rdot(y)		# AIC^T*y
+'''
+
+import numpy as np
+import scipy.sparse.linalg as slalg
+import lib_vbiot
+
+
+
+class Cluster():
+	'''
+	Node of a cluster tree. Ind are the indices of the points/panels in the
+	cluster, Lo and Hi the corners of their bounding box.
+	'''
+
+	def __init__(self,Ind,Lo,Hi,children=()):
+
+		self.Ind=Ind
+		self.Lo=Lo
+		self.Hi=Hi
+		self.children=children
+
+	@property
+	def is_leaf(self):
+		return len(self.children)==0
+
+	@property
+	def diam(self):
+		return np.linalg.norm(self.Hi-self.Lo)
+
+	def dist(self,Other):
+		''' Distance between the bounding boxes of self and Other '''
+		Gap=np.maximum(0.,np.maximum(Other.Lo-self.Hi,self.Lo-Other.Hi))
+		return np.linalg.norm(Gap)
+
+
+def build_cluster_tree(Centres,Lo,Hi,leaf_size=32,Ind=None):
+	'''
+	Builds a cluster tree by recursive bisection. Each cluster is split into
+	two halves along the longest edge of the bounding box of the Centres of
+	its elements, until the number of elements is not larger than leaf_size.
+
+	- Centres: (3,n) array with the centres of the elements (points/panels).
+	- Lo, Hi: (3,n) arrays with the corners of the bounding boxes of each
+	element. For points, Lo=Hi=Centres.
+	'''
+
+	if Ind is None:
+		Ind=np.arange(Centres.shape[1])
+
+	Node=Cluster(Ind,np.min(Lo[:,Ind],axis=1),np.max(Hi[:,Ind],axis=1))
+	if len(Ind)<=leaf_size:
+		return Node
+
+	Cen=Centres[:,Ind]
+	dd=np.argmax(np.max(Cen,axis=1)-np.min(Cen,axis=1))
+	Iord=np.argsort(Cen[dd],kind='mergesort')
+	nhalf=len(Ind)//2
+	Node.children=(
+		build_cluster_tree(Centres,Lo,Hi,leaf_size,np.sort(Ind[Iord[:nhalf]])),
+		build_cluster_tree(Centres,Lo,Hi,leaf_size,np.sort(Ind[Iord[nhalf:]])))
+
+	return Node
+
+
+def aca(get_row,get_col,m,n,tol,max_rank):
+	'''
+	Adaptive cross approximation, with partial pivoting, of a (m,n) matrix
+	whose rows and columns are given by the functions get_row(ii) and
+	get_col(jj). Returns the factors U (m,r) and V (r,n) such that the matrix
+	is approximated by U*V, with
+		|| u_r || || v_r || <= tol * || U*V ||_F
+	for the last cross (u_r,v_r) added. If this is not achieved with rank not
+	larger than max_rank (and before all rows are used, in which case the
+	approximation is exact), (None,None) is returned.
+	'''
+
+	if max_rank<1:
+		return None,None
+
+	Ulist,Vlist=[],[]
+	normsq=0.
+	RowsUsed=np.zeros((m,),dtype=bool)
+	ii=0
+
+	while len(Ulist)<max_rank:
+
+		RowsUsed[ii]=True
+		row=get_row(ii)
+		for uu,vv in zip(Ulist,Vlist):
+			row-=uu[ii]*vv
+		jj=np.argmax(np.abs(row))
+
+		if row[jj]==0.:
+			# null residual row: try another one
+			if np.all(RowsUsed):
+				break
+			ii=np.argmin(RowsUsed)
+			continue
+
+		vv=row/row[jj]
+		uu=get_col(jj)
+		for ul,vl in zip(Ulist,Vlist):
+			uu-=vl[jj]*ul
+
+		# update Frobenius norm of approximation
+		nuu,nvv=np.dot(uu,uu),np.dot(vv,vv)
+		for ul,vl in zip(Ulist,Vlist):
+			normsq+=2.*np.dot(ul,uu)*np.dot(vl,vv)
+		normsq+=nuu*nvv
+		Ulist.append(uu)
+		Vlist.append(vv)
+
+		if nuu*nvv<=tol**2*normsq or np.all(RowsUsed):
+			return np.array(Ulist).T,np.array(Vlist)
+
+		# next row: largest entry of uu among those not yet used
+		Abs=np.abs(uu)
+		Abs[RowsUsed]=-1.
+		ii=np.argmax(Abs)
+
+	if len(Ulist)==0:
+		# null matrix
+		return np.zeros((m,0)),np.zeros((0,n))
+
+	return None,None
+
+
+
+class HMatrix():
+	'''
+	Hierarchical matrix of the influence coefficients of the panels of
+	vertices ZetaPanels, ZetaPanels.shape=(K,4,3) (see
+	surface.AeroGridGeo.get_panel_vertices), over the target points
+	zeta_target, zeta_target.shape=(3,K_trg), projected along the normals
+	(same shape as zeta_target).
+
+	- tol: relative tolerance of the ACA of the admissible blocks.
+	- eta: admissibility parameter. Larger values produce more (and larger)
+	low-rank blocks.
+	- leaf_size: max. number of target points/panels of leaf clusters.
+
+	Admissible blocks are only stored in low-rank format if this requires
+	less memory than the dense format. Otherwise these are split further.
+
+	Attributes:
+	- Dense: list of tuples (Itrg,Ipan,A) of dense blocks.
+	- LowRank: list of tuples (Itrg,Ipan,U,V) of low-rank blocks.
+	'''
+
+	def __init__(self,zeta_target,normals,ZetaPanels,
+											tol=1e-6,eta=1.,leaf_size=32):
+
+		self.zeta_target=zeta_target.reshape((3,-1))
+		self.normals=normals.reshape((3,-1))
+		self.ZetaPanels=ZetaPanels
+		self.shape=(self.zeta_target.shape[1],ZetaPanels.shape[0])
+		self.dtype=np.dtype(np.float_)
+		self.tol=tol
+		self.eta=eta
+		self.leaf_size=leaf_size
+
+		self.Dense=[]
+		self.LowRank=[]
+
+		Xtree=build_cluster_tree(self.zeta_target,self.zeta_target,
+										 self.zeta_target,leaf_size)
+		Ytree=build_cluster_tree(np.mean(ZetaPanels,axis=1).T,
+								 np.min(ZetaPanels,axis=1).T,
+								 np.max(ZetaPanels,axis=1).T,leaf_size)
+		self.build(Xtree,Ytree)
+
+		# references to geometry no longer required
+		del self.zeta_target,self.normals,self.ZetaPanels
+
+
+	def get_block(self,Itrg,Ipan):
+		''' Dense block of rows Itrg and columns Ipan '''
+		return lib_vbiot.aic3_panels(self.zeta_target[:,Itrg],
+						self.ZetaPanels[Ipan],self.normals[:,Itrg])
+
+
+	def build(self,X,Y):
+		'''
+		Recursively builds the blocks of the clusters of target points X and
+		panels Y.
+		'''
+
+		m,n=len(X.Ind),len(Y.Ind)
+
+		if min(X.diam,Y.diam)<=self.eta*X.dist(Y):
+			max_rank=(m*n)//(m+n)
+			U,V=aca(lambda ii: self.get_block(X.Ind[ii:ii+1],Y.Ind)[0],
+					lambda jj: self.get_block(X.Ind,Y.Ind[jj:jj+1])[:,0],
+												 m,n,self.tol,max_rank)
+			if U is not None:
+				self.LowRank.append((X.Ind,Y.Ind,U,V))
+				return
+
+		if X.is_leaf and Y.is_leaf:
+			self.Dense.append((X.Ind,Y.Ind,self.get_block(X.Ind,Y.Ind)))
+			return
+
+		for Xc in ((X,) if X.is_leaf else X.children):
+			for Yc in ((Y,) if Y.is_leaf else Y.children):
+				self.build(Xc,Yc)
+
+
+	# ----------------------------------------------------------------- products
+
+	def dot(self,X):
+		'''
+		Product AIC*X, where X has shape (K,) or (K,Nrhs).
+		'''
+
+		X=np.asarray(X)
+		Y=np.zeros((self.shape[0],)+X.shape[1:],dtype=np.result_type(X,1.))
+		for Itrg,Ipan,A in self.Dense:
+			Y[Itrg]+=np.dot(A,X[Ipan])
+		for Itrg,Ipan,U,V in self.LowRank:
+			Y[Itrg]+=np.dot(U,np.dot(V,X[Ipan]))
+
+		return Y
+
+
+	def rdot(self,Z):
+		'''
+		Product AIC^T*Z, where Z has shape (K_trg,) or (K_trg,Nrhs).
+		'''
+
+		Z=np.asarray(Z)
+		Y=np.zeros((self.shape[1],)+Z.shape[1:],dtype=np.result_type(Z,1.))
+		for Itrg,Ipan,A in self.Dense:
+			Y[Ipan]+=np.dot(A.T,Z[Itrg])
+		for Itrg,Ipan,U,V in self.LowRank:
+			Y[Ipan]+=np.dot(V.T,np.dot(U.T,Z[Itrg]))
+
+		return Y
+
+
+	def aslinearoperator(self):
+		''' Returns a scipy.sparse.linalg.LinearOperator instance '''
+		return slalg.LinearOperator(self.shape,matvec=self.dot,
+									rmatvec=self.rdot,matmat=self.dot,
+									dtype=self.dtype)
+
+
+	def todense(self,Itrg=None,Ipan=None):
+		'''
+		Returns the full matrix or, if the indices Itrg and Ipan are given,
+		the block of rows Itrg and columns Ipan.
+		'''
+
+		Itrg=np.arange(self.shape[0]) if Itrg is None else np.asarray(Itrg)
+		Ipan=np.arange(self.shape[1]) if Ipan is None else np.asarray(Ipan)
+
+		# position of global indices in output
+		Prow=-np.ones((self.shape[0],),dtype=int)
+		Prow[Itrg]=np.arange(len(Itrg))
+		Pcol=-np.ones((self.shape[1],),dtype=int)
+		Pcol[Ipan]=np.arange(len(Ipan))
+
+		Out=np.zeros((len(Itrg),len(Ipan)))
+		for Blocks,dense in [(self.Dense,True),(self.LowRank,False)]:
+			for Block in Blocks:
+				Ir,Ic=Prow[Block[0]],Pcol[Block[1]]
+				Ir_in,Ic_in=Ir>=0,Ic>=0
+				if not (np.any(Ir_in) and np.any(Ic_in)):
+					continue
+				if dense:
+					A=Block[2][np.ix_(Ir_in,Ic_in)]
+				else:
+					A=np.dot(Block[2][Ir_in],Block[3][:,Ic_in])
+				Out[np.ix_(Ir[Ir_in],Ic[Ic_in])]=A
+
+		return Out
+
+
+	# -------------------------------------------------------------- statistics
+
+	@property
+	def nbytes(self):
+		''' Memory used by the dense and low-rank blocks, in bytes '''
+		return sum([A.nbytes for _,_,A in self.Dense])+\
+					  sum([U.nbytes+V.nbytes for _,_,U,V in self.LowRank])
+
+	@property
+	def compression(self):
+		''' Ratio between the memory used and that of the full matrix '''
+		return self.nbytes/(8.*self.shape[0]*self.shape[1])
+
+	@property
+	def ranks(self):
+		''' Ranks of the low-rank blocks '''
+		return np.array([U.shape[1] for _,_,U,_ in self.LowRank],dtype=int)
@@ -8,6 +8,7 @@ import numpy as np
 import scipy as sc 
 import scipy.linalg as scalg
 import scipy.signal as scsig
+from scipy.sparse.linalg import LinearOperator
 # from IPython import embed
 
 import libss # only for tune_rom
@@ -461,6 +462,11 @@ def low_rank_smith(A,Q,tol=1e-10,Square=True,tolSVD=1e-12,tolAbs=False,
 	is not checked in this routine for computational performance. The solution X
 	is provided in its factorised form:
 		X=Z Z.T
+	The matrix A can also be a scipy.sparse.linalg.LinearOperator (e.g. from 
+	the matrix-free realisation of linuvlm.Dynamic). In this case, the 
+	squared iteration is replaced by the standard Smith iteration with SVD 
+	truncation, which requires one product with A per iteration but converges
+	linearly, i.e. in about log(tol)/log(rho(A)) iterations.
 	As in the most general case,  a solution X exists only if the eigenvalues of 
 	S are stricktly smaller than one, and the algorithm will not converge 
 	otherwise. The algorithm can not exploits parsity, hence, while convergence 
@@ -486,7 +492,10 @@ def low_rank_smith(A,Q,tol=1e-10,Square=True,tolSVD=1e-12,tolAbs=False,
 
 	N=A.shape[0]
 	ncol=Q.shape[1]
-	AT=A.T
+	if isinstance(A,LinearOperator):
+		AT=A.H # A is real
+	else:
+		AT=A.T
 
 	DeltaNorm=1e6
 	print('Iter\tMaxZhere')
@@ -498,6 +507,7 @@ def low_rank_smith(A,Q,tol=1e-10,Square=True,tolSVD=1e-12,tolAbs=False,
 
 	if Square: # ------------------------------------------------- squared iter
 		Zk=Q
+		Zright=Q
 		while DeltaNorm>tol:
 
 			### compute product Ak^2 * Zk
@@ -507,8 +517,13 @@ def low_rank_smith(A,Q,tol=1e-10,Square=True,tolSVD=1e-12,tolAbs=False,
 			# Zright=Zk
 			# for ii in range(2**kk):
 			# 	Zright=np.dot(AT,Zright)
-			Zright=np.dot(AT,Zk)
-			AT=np.dot(AT,AT)
+			if isinstance(AT,LinearOperator):
+				# A can not be squared: the (non-squared) Smith iteration is
+				# used, applying A once per iteration to the newest block only
+				Zright=AT.matmat(Zright)
+			else:
+				Zright=AT.dot(Zk)
+				AT=AT.dot(AT)
 
 			### enlarge Z matrix
 			Zk=np.concatenate((Zk,Zright),axis=1)
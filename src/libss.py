@@ -7,12 +7,152 @@ Library of methods to manipulate state-space models
 '''
 
 import copy
+import inspect
 import numpy as np
 import scipy.sparse as sparse
+import scipy.sparse.linalg
+from scipy.sparse.linalg import LinearOperator
 import scipy.signal as scsig
 # # from IPython import embed
 
 
+
+class ss():
+	'''
+	Lightweight discrete-time state-space model
+		x_{n+1} = A x_n + B u_n
+		y_n = C x_n + D u_n
+	with time-step dt. As opposed to scipy.signal.dlti, the matrices are
+	stored as they are, hence they can be scipy.sparse matrices or linear
+	operators (scipy.sparse.linalg.LinearOperator).
+	'''
+
+	def __init__(self,A,B,C,D,dt):
+		self.A=A
+		self.B=B
+		self.C=C
+		self.D=D
+		self.dt=dt
+
+	@property
+	def states(self):
+		return self.A.shape[0]
+
+	@property
+	def inputs(self):
+		return self.B.shape[1]
+
+	@property
+	def outputs(self):
+		return self.C.shape[0]
+
+
+
+class SparseDense(LinearOperator):
+	'''
+	Real matrix of the form
+		M = S + E P G
+	where S (Nr x Nc), E (Nr x k) and G (m x Nc) are scipy.sparse matrices and
+	P is a full (k x m) array. S=None and G=None stand for a zero and an
+	identity matrix, respectively.
+
+	This stores matrices that are sparse but for a full block, which is
+	stored once as a full array even if it appears (scaled) in several blocks
+	of rows (through E). E.g. the A and B matrices of linuvlm.Dynamic with
+	UseSparse=True. Products are evaluated without building M, which can be
+	retrieved through tocsr or toarray.
+	'''
+
+	def __init__(self,S,E,P,G=None):
+		self.S,self.E,self.P,self.G=S,E,P,G
+		Nc=P.shape[1] if G is None else G.shape[1]
+		super().__init__(np.result_type(E.dtype,P.dtype),(E.shape[0],Nc))
+
+	def _matmat(self,X):
+		GX=X if self.G is None else self.G.dot(X)
+		Y=self.E.dot(np.dot(self.P,GX))
+		if self.S is not None:
+			Y=Y+self.S.dot(X)
+		return Y
+
+	def _matvec(self,x):
+		return self._matmat(x.reshape((-1,1))).reshape(-1)
+
+	def _adjoint(self):
+		return SparseDense(None if self.S is None else self.S.T.tocsr(),
+						   self.G.T.tocsr() if self.G is not None else
+						   sparse.identity(self.P.shape[1],dtype=self.P.dtype,
+															   format='csr'),
+						   self.P.T,self.E.T.tocsr())
+
+	def _rmatvec(self,x):
+		return self._adjoint()._matvec(x)
+
+	def tocsr(self):
+		''' Returns M in scipy.sparse csr format '''
+		M=sparse.csr_matrix(self.P)
+		if self.G is not None:
+			M=M.dot(self.G)
+		M=self.E.dot(M)
+		if self.S is not None:
+			M=M+self.S
+		return M.tocsr()
+
+	def toarray(self):
+		return self.tocsr().toarray()
+
+	@property
+	def nbytes(self):
+		''' Memory used by the sparse and full matrices '''
+		nbytes=self.P.nbytes
+		for M in [self.S,self.E,self.G]:
+			if M is not None:
+				M=M.tocsr()
+				nbytes+=M.data.nbytes+M.indices.nbytes+M.indptr.nbytes
+		return nbytes
+
+
+
+def dot(A,B):
+	'''
+	Matrix product A*B, where A and/or B can be scipy.sparse matrices or
+	scipy.sparse.linalg.LinearOperator instances. The output is sparse only if
+	both A and B are sparse, and a LinearOperator if both A and B are linear 
+	operators.
+	'''
+
+	if sparse.issparse(A) or isinstance(A,LinearOperator):
+		return A.dot(B)
+	elif sparse.issparse(B):
+		return B.T.dot(A.T).T
+	elif isinstance(B,LinearOperator):
+		return B.H.dot(A.T).T
+	else:
+		return np.dot(A,B)
+
+
+
+def krylov(solver,A,b,tol,**kwargs):
+	'''
+	Solves A x = b with the scipy.sparse.linalg Krylov solver solver (e.g.
+	gmres or bicgstab) to the relative tolerance tol, which is passed as rtol
+	(scipy>=1.12) or tol (older versions). All other keyword arguments are
+	passed to the solver.
+
+	If available, gmres is called with callback_type='pr_norm', i.e. the
+	callback receives the preconditioned relative residual norm at each inner
+	iteration (as in older scipy versions, where this is the only option).
+	'''
+
+	Params=inspect.signature(solver).parameters
+	kwargs['rtol' if 'rtol' in Params else 'tol']=tol
+	if 'callback_type' in Params and 'callback_type' not in kwargs:
+		kwargs['callback_type']='pr_norm'
+
+	return solver(A,b,**kwargs)
+
+
+
 def couple(ss01,ss02,K12,K21):
 	'''
 	Couples 2 dlti systems ss01 and ss02 through the gains K12 and K21, where
@@ -239,8 +379,24 @@ def couple_wrong(ss01,ss02,K12,K21):
 
 
 
-def freqresp(SS,wv,eng=None,method='standard',dlti=True,use_sparse=False):
-	''' In-house frequency response function '''
+def freqresp(SS,wv,eng=None,method='standard',dlti=True,use_sparse=False,
+																	tol=1e-10):
+	''' 
+	In-house frequency response function. 
+
+	If the state matrix is a SparseDense instance, A=S+E*P*G, the sparse part
+	is factorised and the full part is accounted for through the Woodbury
+	identity.
+
+	If the state matrix is a LinearOperator instance (see e.g. the matrix-free
+	realisation of linuvlm.Dynamic), the linear systems are solved with GMRES
+	with relative tolerance tol (see krylov). Note that no preconditioner is
+	used and that one GMRES solution is required per input and per frequency,
+	i.e. Nu*len(wv) solutions overall (the response at the previous frequency
+	is used as initial guess). For the matrix-free UVLM realisation, use
+	linuvlm.Dynamic.freqresp instead, which reuses the LU factors of the bound
+	AIC matrix.
+	'''
 
 	# matlab frequency response
 	if method=='matlab':
@@ -263,14 +419,48 @@ def freqresp(SS,wv,eng=None,method='standard',dlti=True,use_sparse=False):
 		Nw=len(wv)
 		Yfreq=np.empty((Ny,Nu,Nw,),dtype=np.complex_)
 
-		if use_sparse:
+		if isinstance(SS.A,SparseDense):
+			# A=S+E*P*G: the sparse part is factorised and the full part is
+			# accounted for through the Woodbury identity, i.e. solving a
+			# system of size P.shape[0]
+			A=SS.A
+			Eye=sparse.identity(Nx,format='csc')
+			S=sparse.csc_matrix((Nx,Nx)) if A.S is None else A.S.tocsc()
+			G=(lambda X: X) if A.G is None else A.G.dot
+			for ii in range(Nw):
+				LU=scipy.sparse.linalg.splu((zv[ii]*Eye-S).tocsc())
+				X=LU.solve(dot(SS.B,np.eye(Nu)).astype(np.complex_))
+				W=LU.solve(A.E.toarray().astype(np.complex_))
+				Cap=np.eye(A.P.shape[0])-np.dot(A.P,G(W))
+				X+=np.dot(W,np.linalg.solve(Cap,np.dot(A.P,G(X))))
+				Yfreq[:,:,ii]=dot(SS.C,X)+dot(SS.D,np.eye(Nu))
+		elif isinstance(SS.A,LinearOperator):
+			Eye=scipy.sparse.linalg.aslinearoperator(sparse.identity(Nx))
+			Eu=np.zeros((Nu,))
+			Xfreq=np.zeros((Nx,Nu),dtype=np.complex_)
+			for ii in range(Nw):
+				Zop=zv[ii]*Eye-SS.A
+				for jj in range(Nu):
+					Eu[jj]=1.
+					xsol,info=krylov(scipy.sparse.linalg.gmres,Zop,
+								dot(SS.B,Eu).astype(np.complex_),tol,
+								x0=Xfreq[:,jj],atol=0.)
+					Eu[jj]=0.
+					if info!=0:
+						raise NameError('GMRES did not converge at frequency '
+										'%.3e (input %d, info=%d)'%(wv[ii],jj,info))
+					Xfreq[:,jj]=xsol # initial guess for next frequency
+				Yfreq[:,:,ii]=dot(SS.C,Xfreq)+dot(SS.D,np.eye(Nu))
+		elif use_sparse or sparse.issparse(SS.A):
 			# csc format used for efficiency
 			Asparse=sparse.csc_matrix(SS.A)
 			Bsparse=sparse.csc_matrix(SS.B)
 			Eye=sparse.eye(Nx,format='csc')
 			for ii in range(Nw):
 				sol_cplx=sparse.linalg.spsolve(zv[ii]*Eye-Asparse,Bsparse)
-				Yfreq[:,:,ii]=np.dot(SS.C,sol_cplx.todense())+SS.D
+				if sparse.issparse(sol_cplx):
+					sol_cplx=sol_cplx.toarray()
+				Yfreq[:,:,ii]=dot(SS.C,sol_cplx.reshape((Nx,Nu)))+SS.D
 		else:
 			Eye=np.eye(Nx)
 			for ii in range(Nw):
@@ -395,11 +585,8 @@ def SSconv(A,B0,B1,C,D,Bm1=None):
 	'''
 
 	# Account for u^{n+1} terms (prediction)
-	if type(A) is sparse.bsr.bsr_matrix: Bh=B0+A.dot(B1)
-	else: Bh=B0+np.dot(A,B1)
-
-	if type(C) is sparse.bsr.bsr_matrix: Dh=D+C.dot(B1)
-	else: Dh=D+np.dot(C,B1)
+	Bh=B0+dot(A,B1)
+	Dh=D+dot(C,B1)
 
 	# Account for u^{n-1} terms (delay)
 	if Bm1 is None:
@@ -660,22 +847,45 @@ def scale_SS(SSin,input_scal=1.,output_scal=1.,state_scal=1.,byref=True):
 		SS=copy.deepcopy(SSin)
 
 
+	# sparse matrices and linear operators are scaled through diagonal matrices
+	def diag_scale(M,left,right):
+		Left=sparse.diags(np.array(left))
+		Right=sparse.diags(np.array(right))
+		if isinstance(M,SparseDense):
+			return SparseDense(None if M.S is None else Left.dot(M.S).dot(Right),
+							   Left.dot(M.E),M.P,
+							   Right if M.G is None else M.G.dot(Right))
+		if isinstance(M,LinearOperator):
+			aslinop=scipy.sparse.linalg.aslinearoperator
+			return aslinop(Left)*M*aslinop(Right)
+		return Left.dot(M).dot(Right).asformat(M.format)
+
+	SparseB=sparse.issparse(SS.B) or isinstance(SS.B,LinearOperator)
+	SparseC=sparse.issparse(SS.C) or isinstance(SS.C,LinearOperator)
+	SparseD=sparse.issparse(SS.D) or isinstance(SS.D,LinearOperator)
+	if SparseB:
+		SS.B=diag_scale(SS.B,1./np.array(state_scal),input_scal)
+	if SparseC:
+		SS.C=diag_scale(SS.C,1./np.array(output_scal),state_scal)
+	if SparseD:
+		SS.D=diag_scale(SS.D,1./np.array(output_scal),input_scal)
+
 	# update input related matrices
 	for ii in range(Nin):
-		SS.B[:,ii]=SS.B[:,ii]*input_scal[ii]
-		SS.D[:,ii]=SS.D[:,ii]*input_scal[ii]
+		if not SparseB: SS.B[:,ii]=SS.B[:,ii]*input_scal[ii]
+		if not SparseD: SS.D[:,ii]=SS.D[:,ii]*input_scal[ii]
 	# SS.B*=input_scale
 	# SS.D*=input_scale
 
 	# update output related matrices
 	for ii in range(Nout):
-		SS.C[ii,:]=SS.C[ii,:]/output_scal[ii]
-		SS.D[ii,:]=SS.D[ii,:]/output_scal[ii]
+		if not SparseC: SS.C[ii,:]=SS.C[ii,:]/output_scal[ii]
+		if not SparseD: SS.D[ii,:]=SS.D[ii,:]/output_scal[ii]
 
 	# update state related matrices
 	for ii in range(Nstates):
-		SS.B[ii,:]=SS.B[ii,:]/state_scal[ii]
-		SS.C[:,ii]=SS.C[:,ii]*state_scal[ii]
+		if not SparseB: SS.B[ii,:]=SS.B[ii,:]/state_scal[ii]
+		if not SparseC: SS.C[:,ii]=SS.C[:,ii]*state_scal[ii]
 	# SS.B /= state_scal	
 
 	return SS
@@ -702,11 +912,11 @@ def simulate(SShere,U,x0=None):
 	if len(U.shape)==1:
 		U=U.reshape( (NT,1) )
 
-	Y[0]=np.dot(C,X[0])+np.dot(D,U[0])
+	Y[0]=dot(C,X[0])+dot(D,U[0])
 
 	for ii in range(1,NT):
-		X[ii]=np.dot(A,X[ii-1])+np.dot(B,U[ii-1])
-		Y[ii]=np.dot(C,X[ii])+np.dot(D,U[ii])
+		X[ii]=dot(A,X[ii-1])+dot(B,U[ii-1])
+		Y[ii]=dot(C,X[ii])+dot(D,U[ii])
 
 	return Y,X
 
@@ -0,0 +1,104 @@
+'''
+Mirror symmetry about the xz plane
+Oct 2018
+
+For lattices symmetric about the plane y=0, only one half of the lattice is
+stored and the other half is accounted for through the image of each surface.
+The image of a surface of vertices zeta, zeta.shape=(3,M+1,N+1), is obtained
+by reflecting the vertices about y=0 and reversing the span-wise indexing,
+such that the panels normals keep their direction:
+	zeta_img[:,m,n]=R zeta[:,m,N-n],	R=diag(1,-1,1)
+	gamma_img[m,n]=gamma[m,N-1-n]
+(see also the n_surf=2 lattices in test/benchmarks/lattice.py).
+
+The reference state is always symmetric. The perturbations can be either
+symmetric ('sym') or antisymmetric ('anti'), in which case the perturbations
+of circulation and vertices position of the image are:
+	dgamma_img[m,n]=fact*dgamma[m,N-1-n]
+	dzeta_img[:,m,n]=fact*R dzeta[:,m,N-n]
+with fact=+1 and -1, respectively (see FACTOR). Matrices whose columns refer
+to the image panels/vertices are folded onto the half lattice through
+fold_panels and fold_vertices.
+'''
+
+import numpy as np
+
+REFLECT=np.array([1.,-1.,1.]) # reflection about y=0
+FACTOR={'sym':1.,'anti':-1.}  # image perturbation factor
+
+
+
+def get_factor(symmetry):
+	'''
+	Returns the image perturbation factor associated to symmetry (None, 'sym'
+	or 'anti'). This is None if no symmetry is used.
+	'''
+
+	if symmetry is None:
+		return None
+	if symmetry not in FACTOR:
+		raise NameError('symmetry must be None, \'sym\' or \'anti\'')
+
+	return FACTOR[symmetry]
+
+
+def get_image(zeta,gamma=None):
+	'''
+	Returns the vertices, and the circulation if gamma is given, of the image
+	of the surface of vertices zeta, zeta.shape=(3,M+1,N+1), and circulation
+	gamma, gamma.shape=(M,N).
+	'''
+
+	zeta_img=np.ascontiguousarray(REFLECT[:,None,None]*zeta[:,:,::-1])
+	if gamma is None:
+		return zeta_img
+
+	return zeta_img,np.ascontiguousarray(gamma[:,::-1])
+
+
+def map_panels(M,N):
+	'''
+	Returns the 1D index of the panel of the surface associated to each panel
+	of its image, for a (M,N) grid of panels. The mapping is an involution.
+	'''
+
+	return (np.arange(M)[:,None]*N+np.arange(N-1,-1,-1)[None,:]).reshape(-1)
+
+
+def map_vertices_dofs(M,N):
+	'''
+	Returns the 1D index of the degree of freedom of the surface associated to
+	each vertex degree of freedom of its image, for a (M,N) grid of panels,
+	and the sign of the reflection. The dofs are ordered as the vertices
+	vectors of the assembly module, i.e. cc*Kzeta+m*(N+1)+n.
+	'''
+
+	Kzeta=(M+1)*(N+1)
+	Iv=map_panels(M+1,N+1)
+	Idofs=np.concatenate([cc*Kzeta+Iv for cc in range(3)])
+
+	return Idofs,np.repeat(REFLECT,Kzeta)
+
+
+def fold_panels(A,M,N,fact):
+	'''
+	Given the matrix A, whose last axis refers to the (M,N) panels of an
+	image, returns the contribution to the matrix of the surface, under image
+	perturbation factor fact.
+
+	Note: for folded wake matrices (see lib_vbiot.aic3_folded), use M=1.
+	'''
+
+	return fact*A[...,map_panels(M,N)]
+
+
+def fold_vertices(D,M,N,fact):
+	'''
+	Given the matrix D, whose last axis refers to the vertices dofs of the
+	image of a (M,N) grid of panels, returns the contribution to the matrix of
+	the surface, under image perturbation factor fact.
+	'''
+
+	Idofs,Sign=map_vertices_dofs(M,N)
+
+	return (fact*Sign)*D[...,Idofs]
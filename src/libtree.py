@@ -0,0 +1,209 @@
+'''
+Treecode (Barnes-Hut) evaluation of induced velocities
+Oct 2018
+
+The velocity induced by a surface over a set of target points is computed
+with a Barnes-Hut treecode, with cost O(Ntrg log Nedges) instead of
+O(Ntrg Nedges):
+- the unique edges of the surface with non-null net circulation (see
+lib_vbiot.get_edges_gamma) are grouped in a cluster tree
+(libhmat.build_cluster_tree);
+- for each cluster, the moments of the vorticity distribution of its edges,
+up to second order, are computed about the centre c of its bounding box;
+- the velocity induced by a cluster of radius R over a target point at
+distance rho from c is evaluated through the multipole expansion if
+R < THETA*rho (far-field), otherwise the children of the cluster are visited.
+At the leaves, the edges are evaluated directly (lib_vbiot.biot_edges).
+
+For an edge from A to B with circulation G, the vorticity density is G*(B-A)
+along the segment, and the velocity is (Biot-Savart):
+	u(x) = 1/(4 pi) int_0^1 G (B-A) x K(x-y(s)) ds,	K(r)=r/|r|^3
+Expanding K about c, with r=x-c and d=y-c, gives:
+	u(x) ~= 1/(4 pi) [ M0 x K(r) - M1_j x dK(r)/dr_j +
+											0.5 M2_jl x d2K(r)/dr_j dr_l ]
+where the moments M0, M1 and M2 are integrated exactly along each edge.
+The relative error of the far-field terms scales as THETA^3.
+
+The opening angle THETA and the max. number of edges of the leaf clusters,
+LEAF_SIZE, can be tuned at module level.
+'''
+
+import numpy as np
+import lib_vbiot
+import libhmat
+import libcache
+
+cfact_biot=0.25/np.pi
+
+THETA=0.3 # opening angle
+LEAF_SIZE=64 # max. number of edges in leaf clusters
+
+TreeCache=None # last tree built (see get_tree)
+
+
+
+def get_moments(ZetaA,ZetaB,Gedges,c):
+	'''
+	Returns the moments, up to second order, of the vorticity distribution of
+	the edges A->B, of circulation Gedges, about the point c:
+	- M0 (3,): sum of G*(B-A)
+	- M1 (3,3): M1[a,j]=sum G*(B-A)[a] * int d_j ds
+	- M2 (3,3,3): M2[a,j,l]=sum G*(B-A)[a] * int d_j d_l ds
+	where d(s)=A+s(B-A)-c, s in [0,1].
+	'''
+
+	E=ZetaB-ZetaA
+	D=ZetaA-c[:,None]
+	Alpha=Gedges*E
+
+	M0=np.sum(Alpha,axis=1)
+	M1=np.dot(Alpha,(D+0.5*E).T)
+	M2=np.einsum('ai,ji,li->ajl',Alpha,D,D)+np.einsum('ai,ji,li->ajl',
+			   Alpha,0.5*D+E/3.,E)+np.einsum('ai,ji,li->ajl',Alpha,0.5*E,D)
+
+	return M0,M1,M2
+
+
+def eval_moments(M0,M1,M2,r):
+	'''
+	Velocity induced at the points of relative position r, r.shape=(3,Ntrg),
+	w.r.t. the expansion centre by the moments M0, M1, M2 (see get_moments).
+	'''
+
+	irho2=1./(r[0]*r[0]+r[1]*r[1]+r[2]*r[2])
+	irho3=np.sqrt(irho2)*irho2
+	irho5=irho3*irho2
+
+	M1r=np.dot(M1,r)
+	M2r=np.einsum('ajl,lt->ajt',M2,r)
+	rM2r=np.einsum('jt,ajt->at',r,M2r)
+	trM2=np.einsum('ajj->a',M2)
+
+	# u=M_a x S[a,:], with S[a,k]=M0_a K_k - M1_aj dK_k/dr_j +
+	#										0.5 M2_ajl d2K_k/dr_j dr_l
+	Coeff=M0[:,None]*irho3+(3.*M1r-1.5*trM2[:,None])*irho5+\
+												   7.5*rM2r*irho5*irho2
+	S=Coeff[:,None,:]*r[None,:,:]-M1[:,:,None]*irho3-3.*M2r*irho5
+
+	return cfact_biot*np.array([S[1,2]-S[2,1],S[2,0]-S[0,2],S[0,1]-S[1,0]])
+
+
+def shift_moments(M0,M1,M2,s):
+	'''
+	Moments about the point c-s of a distribution whose moments about c are
+	M0, M1, M2 (see get_moments).
+	'''
+
+	M1s=np.outer(M0,s)
+	M2s=M2+M1[:,:,None]*s[None,None,:]+M1[:,None,:]*s[None,:,None]+\
+											  M1s[:,:,None]*s[None,None,:]
+
+	return M0,M1+M1s,M2s
+
+
+def set_moments(Node,ZetaA,ZetaB,Gedges):
+	'''
+	Stores in Node, and in all its descendants, the centre (c) and radius (R)
+	of the cluster bounding box and the moments of the cluster edges about c.
+	The moments of the leaves are computed directly (see get_moments), those
+	of the other clusters by shifting the moments of their children.
+	'''
+
+	Node.c=0.5*(Node.Lo+Node.Hi)
+	Node.R=0.5*Node.diam
+
+	if Node.is_leaf:
+		Node.M0,Node.M1,Node.M2=get_moments(ZetaA[:,Node.Ind],
+								ZetaB[:,Node.Ind],Gedges[Node.Ind],Node.c)
+		return
+
+	Node.M0,Node.M1,Node.M2=np.zeros((3,)),np.zeros((3,3)),np.zeros((3,3,3))
+	for Child in Node.children:
+		set_moments(Child,ZetaA,ZetaB,Gedges)
+		for Mom,Mch in zip([Node.M0,Node.M1,Node.M2],shift_moments(
+						Child.M0,Child.M1,Child.M2,Child.c-Node.c)):
+			Mom+=Mch
+
+
+def build_tree(ZetaA,ZetaB,Gedges):
+	'''
+	Builds the cluster tree of the edges A->B, of circulation Gedges, and
+	computes the moments of each cluster (see set_moments).
+	'''
+
+	Tree=libhmat.build_cluster_tree(0.5*(ZetaA+ZetaB),np.minimum(ZetaA,ZetaB),
+								  np.maximum(ZetaA,ZetaB),leaf_size=LEAF_SIZE)
+	set_moments(Tree,ZetaA,ZetaB,Gedges)
+
+	return Tree
+
+
+def get_tree(zeta,gamma):
+	'''
+	Returns the cluster tree (see build_tree) of the edges with non-null
+	circulation of the surface of vertices zeta and circulation gamma, and
+	the edges vertices and circulation. The tree is None if all the edges
+	have null circulation.
+
+	The last tree built is kept in memory and reused if the surface geometry
+	and circulation, and the tree settings, have not changed (e.g. when the
+	velocities induced by a wake are computed over several surfaces).
+	'''
+
+	global TreeCache
+
+	key=libcache.get_key(zeta,gamma,LEAF_SIZE)
+	if TreeCache is not None and TreeCache[0]==key:
+		return TreeCache[1]
+
+	ZetaA,ZetaB=lib_vbiot.get_edges(zeta)
+	Gedges=lib_vbiot.get_edges_gamma(gamma)
+	iinz=Gedges!=0.
+	ZetaA,ZetaB,Gedges=ZetaA[:,iinz],ZetaB[:,iinz],Gedges[iinz]
+
+	Tree=None
+	if len(Gedges)>0:
+		Tree=build_tree(ZetaA,ZetaB,Gedges)
+	TreeCache=(key,(Tree,ZetaA,ZetaB,Gedges))
+
+	return TreeCache[1]
+
+
+def ind_vel(zeta_target,zeta,gamma):
+	'''
+	Computes the velocity induced by the surface of vertices zeta,
+	zeta.shape=(3,M+1,N+1), and circulation gamma, gamma.shape=(M,N), over
+	the target points zeta_target, as lib_vbiot.ind_vel, using the treecode.
+	The output has the same shape as zeta_target.
+	'''
+
+	zetaP=zeta_target.reshape((3,-1))
+	Ntrg=zetaP.shape[1]
+
+	Tree,ZetaA,ZetaB,Gedges=get_tree(zeta,gamma)
+	Uind=np.zeros((3,Ntrg))
+	if Tree is None:
+		return Uind.reshape(zeta_target.shape)
+
+	# traversal: (cluster,target points) pairs still to be evaluated
+	Stack=[(Tree,np.arange(Ntrg))]
+	while len(Stack)>0:
+		Node,Itrg=Stack.pop()
+
+		r=zetaP[:,Itrg]-Node.c[:,None]
+		Far=Node.R**2<THETA**2*(r[0]*r[0]+r[1]*r[1]+r[2]*r[2])
+		if np.any(Far):
+			Uind[:,Itrg[Far]]+=eval_moments(Node.M0,Node.M1,Node.M2,r[:,Far])
+		Itrg=Itrg[~Far]
+		if len(Itrg)==0:
+			continue
+
+		if Node.is_leaf:
+			Ind=Node.Ind
+			for tt in lib_vbiot.get_chunks(len(Itrg),len(Ind)):
+				Uind[:,Itrg[tt]]+=np.dot(lib_vbiot.biot_edges(
+					 zetaP[:,Itrg[tt]],ZetaA[:,Ind],ZetaB[:,Ind]),Gedges[Ind])
+		else:
+			Stack.extend([(Child,Itrg) for Child in Node.children])
+
+	return Uind.reshape(zeta_target.shape)
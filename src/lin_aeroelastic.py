@@ -7,13 +7,14 @@ import warnings
 # from IPython import embed
 import os
 import sys
-os.environ["DIRuvlm3d"] = "/home/ng213/linuvlm/uvlm3d/src/"
+os.environ.setdefault("DIRuvlm3d", os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.environ["DIRuvlm3d"])
 import numpy as np
 import scipy.signal as scsig
 import linuvlm as linuvlm
 import lingebm as lingebm
 import libss as libss
+import libcache
 
 import sharpy.utils.algebra as algebra
 
@@ -95,11 +96,18 @@ class LinAeroEla():
         self.lingebm_str = lingebm.FlexDynamic(self.tsstr, dt=self.dt)
 
         ### uvlm
+        # optional on-disk cache of assembled matrices
+        cache_dir = settings['LinearUvlm'].get('cache_dir', None)
+        if cache_dir is not None:
+            cache = libcache.Cache(cache_dir)
+        else:
+            cache = None
         self.linuvlm = linuvlm.Dynamic(
             self.tsaero,
             dt=settings['LinearUvlm']['dt'],
             integr_order=settings['LinearUvlm']['integr_order'],
-            ScalingDict=settings['LinearUvlm']['ScalingDict'])
+            ScalingDict=settings['LinearUvlm']['ScalingDict'],
+            cache=cache)
 
 
     def reshape_struct_input(self):
@@ -154,10 +162,6 @@ class LinAeroEla():
         tsaero = self.tsaero
         tsstr = self.tsstr
 
-        ### assemble linear uvlm
-        self.linuvlm.assemble_ss()
-        SSaero = self.linuvlm.SS
-
         ### assemble gains and stiffening term due to non-zero forces
         # only flexible dof accounted for
         self.get_gebm2uvlm_gains()
@@ -186,8 +190,13 @@ class LinAeroEla():
         # aero -> str
         Ksa = self.Kforces[:-10, :]  # aero --> str
 
+        ### assemble linear uvlm
+        # inputs/outputs are projected over the structural dofs
+        self.linuvlm.assemble_ss(Kin=Kas, Kout=Ksa)
+
         ### feedback connection
-        self.SS = libss.couple(ss01=self.linuvlm.SS, ss02=SSstr, K12=Kas, K21=Ksa)
+        self.SS = libss.couple(ss01=self.linuvlm.SS, ss02=SSstr,
+                               K12=np.eye(SSstr.outputs), K21=np.eye(SSstr.inputs))
 
 
     def get_gebm2uvlm_gains(self):
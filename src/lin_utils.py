@@ -24,7 +24,7 @@ import cases.templates.flying_wings as flying_wings
 
 
 # linear uvlm
-os.environ["DIRuvlm3d"] = "/home/ng213/linuvlm/uvlm3d/src/"
+os.environ.setdefault("DIRuvlm3d", os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.environ["DIRuvlm3d"])
 import save, linuvlm, lin_aeroelastic, libss, librom
 import pp_plot as pp
@@ -5,18 +5,25 @@ S. Maraniello, 7 Jun 2018
 
 import numpy as np
 import scipy.linalg as scalg
+import scipy.sparse as sparse
+import scipy.sparse.linalg as slalg
 import scipy.signal as scsig
+from scipy.spatial import cKDTree
 # # from IPython import embed
 import time
 import warnings
 import os
 import sys
-os.environ["DIRuvlm3d"] = "/home/ng213/linuvlm/uvlm3d/src/"
+os.environ.setdefault("DIRuvlm3d", os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.environ["DIRuvlm3d"])
 import interp
 import multisurfaces
 import assembly as ass  # :D
 import libss
+import libcache
+import kernels
+import lib_vbiot
+import libsym
 
 
 sys.path.append("/home/ng213/code/sharpy/")
@@ -26,12 +33,76 @@ import sharpy.utils.algebra as algebra
 class Static():
     """	Static linear solver """
 
-    def __init__(self, tsdata):
+    def __init__(self, tsdata, backend=None, cache=None, compress_tol=None,
+                 solver=None, precond='block_jacobi', aic_matrix_free=False,
+                 precision='double', symmetry=None):
+        """
+        The kernels used to compute induced velocities and their derivatives
+        are set by backend (see kernels module). If None, the process default
+        is used.
+
+        If a ``libcache.Cache`` instance is passed as cache, the assembled
+        matrices are stored on disk and reused by subsequent assemblies on the
+        same lattice (see ``get_blocks``).
+
+        If compress_tol is given, the AIC matrices are stored in hierarchical
+        format, with the blocks of well-separated panels compressed in low-rank
+        form to the relative tolerance compress_tol (see
+        ``assembly.AIC_hmatrix``). In this case, the bound circulation is found
+        iteratively (see ``solve_aic``).
+
+        The linear system for the bound circulation is solved with the method
+        solver:
+            - 'lu': LU factorisation of the full AIC matrix (default).
+            - 'gmres', 'bicgstab': Krylov iterations (see ``solve_aic``),
+            with preconditioner precond ('block_jacobi', 'near_field' or None,
+            see ``assemble_preconditioner``). Convergence is controlled by the
+            attributes ``solver_tol``, ``solver_maxiter`` and ``gmres_restart``.
+        If aic_matrix_free is True, the AIC matrix is not assembled and its
+        products are computed through the induced velocity kernels of the
+        bound surfaces backend (see ``aic_matvec``). Krylov solvers (default
+        'gmres') are required for compressed and matrix-free AIC matrices.
+
+        If precision is 'mixed', the AIC matrix is assembled and factorised in
+        single precision and the bound circulation is recovered to double
+        precision accuracy via iterative refinement (see
+        ``solve_lu_refinement``). The derivatives of the forces (``Dfqs*``)
+        are also stored in single precision. This requires the 'lu' solver.
+
+        If symmetry is 'sym' or 'anti', tsdata only contains one half of a
+        lattice symmetric about the xz plane (with symmetric reference state),
+        and the problem is solved for symmetric or antisymmetric perturbations
+        respectively, with the other half accounted for through the images of
+        the surfaces (see ``libsym``). All the matrices and the inputs/outputs
+        only refer to the half lattice. Not available for compressed AIC
+        matrices.
+        """
+
+        if solver is None:
+            solver = 'lu'
+            if compress_tol is not None or aic_matrix_free:
+                solver = 'gmres'
+        if solver not in ['lu', 'gmres', 'bicgstab']:
+            raise NameError('solver must be \'lu\', \'gmres\' or \'bicgstab\'')
+        if solver == 'lu' and (compress_tol is not None or aic_matrix_free):
+            raise NameError('LU solver requires the full AIC matrix')
+        if compress_tol is not None and aic_matrix_free:
+            raise NameError('Compressed AIC matrix can not be matrix-free')
+        if precond not in [None, 'block_jacobi', 'near_field']:
+            raise NameError('precond must be \'block_jacobi\', \'near_field\' or None')
+        if precision not in ['double', 'mixed']:
+            raise NameError('precision must be \'double\' or \'mixed\'')
+        if precision == 'mixed' and solver != 'lu':
+            raise NameError('Mixed precision only available with LU solver')
+        libsym.get_factor(symmetry)
+        if symmetry is not None and compress_tol is not None:
+            raise NameError('Symmetry not available for compressed AIC matrices')
 
         print('Initialising Static linear UVLM solver class...')
         t0 = time.time()
 
-        MS = multisurfaces.MultiAeroGridSurfaces(tsdata)
+        MS = multisurfaces.MultiAeroGridSurfaces(tsdata, backend=backend,
+                                                 symmetry=symmetry)
         MS.get_ind_velocities_at_collocation_points()
         MS.get_input_velocities_at_collocation_points()
         MS.get_ind_velocities_at_segments()
@@ -51,6 +122,26 @@ class Static():
 
         # profiling output
         self.prof_out = './asbly.prof'
+        self.cache = cache
+
+        # compression of AIC matrices and solver settings
+        self.compress_tol = compress_tol
+        self.aic_matrix_free = aic_matrix_free
+        self.solver = solver
+        self.precond = precond
+        self.solver_tol = 1e-10
+        self.solver_maxiter = 200
+        self.gmres_restart = 20
+        self.precond_radius = None  # near-field radius (None: 2x max. panel diagonal)
+        self.solver_stats = {}
+
+        # storage precision and iterative refinement settings
+        self.precision = precision
+        self.dtype = np.dtype(np.float32 if precision == 'mixed' else np.float_)
+        self.refine_maxiter = 10
+
+        # mirror symmetry (None, 'sym' or 'anti')
+        self.symmetry = symmetry
 
         self.time_init_sta = time.time() - t0
         print('\t\t\t...done in %.2f sec' % self.time_init_sta)
@@ -61,117 +152,686 @@ class Static():
         cProfile.runctx('self.assemble()', globals(), locals(), filename=self.prof_out)
 
 
-    def assemble(self):
+    def get_cache_key(self, group):
         """
-        Assemble global matrices
+        Returns the key of the cached matrices of a group (see ``get_blocks``).
+        Groups whose name ends with 'geometry' only depend on the lattice
+        geometry and dimensions and on the kernels settings. All other groups
+        also depend on the flow (circulation, velocities, density and rotation
+        speed).
         """
-        print('Assembly of static linear UVLM equations started...')
+
         MS = self.MS
-        t0 = time.time()
+        key_geo = libcache.get_key(
+            'geometry',
+            [Surf.zeta for Surf in MS.Surfs + MS.Surfs_star],
+            [(Surf.aM, Surf.aN) for Surf in MS.Surfs],
+            [kernels.get(Surf.backend).name for Surf in MS.Surfs + MS.Surfs_star],
+            vortex_radius=lib_vbiot.VORTEX_RADIUS, precision=self.precision,
+            symmetry=self.symmetry)
+        if group.endswith('geometry'):
+            return libcache.get_key(group, key_geo)
+
+        return libcache.get_key(
+            group, key_geo,
+            [(Surf.gamma, Surf.u_ext, Surf.zeta_dot, Surf.gamma_dot,
+              Surf.omega, Surf.rho) for Surf in MS.Surfs],
+            [(Surf.gamma, Surf.rho) for Surf in MS.Surfs_star])
+
+    def get_blocks(self, group, assemble_fun):
+        """
+        Returns the dictionary of matrices produced by ``assemble_fun``. If a
+        cache is available (``self.cache``, see ``libcache.Cache``), the matrices
+        are loaded from the cache or, if not found, stored after assembly.
+        """
 
-        # ----------------------------------------------------------- state eq.
-        List_uc_dncdzeta = ass.uc_dncdzeta(MS.Surfs)
-        List_nc_dqcdzeta_coll, List_nc_dqcdzeta_vert = \
-                                        ass.nc_dqcdzeta(MS.Surfs, MS.Surfs_star)
-        List_AICs, List_AICs_star = ass.AICs(MS.Surfs, MS.Surfs_star,
-                                             target='collocation', Project=True)
-        List_Wnv = []
-        for ss in range(MS.n_surf):
-            List_Wnv.append(
-                interp.get_Wnv_vector(MS.Surfs[ss],
-                                      MS.Surfs[ss].aM, MS.Surfs[ss].aN))
+        if self.cache is None or \
+                (self.compress_tol is not None and group.endswith('geometry')):
+            # compressed matrices (see libhmat) are not cached
+            return assemble_fun()
 
-        ### zeta derivatives
-        self.Ducdzeta = np.block(List_nc_dqcdzeta_vert)
-        del List_nc_dqcdzeta_vert
-        self.Ducdzeta += scalg.block_diag(*List_nc_dqcdzeta_coll)
-        del List_nc_dqcdzeta_coll
-        self.Ducdzeta += scalg.block_diag(*List_uc_dncdzeta)
-        del List_uc_dncdzeta
-        # omega x zeta terms
-        List_nc_domegazetadzeta_col, List_nc_domegazetadzeta_vert = \
-                                  ass.nc_domegazetadzeta(MS.Surfs,MS.Surfs_star)
-        self.Ducdzeta+=np.block(List_nc_domegazetadzeta_vert)
-        del List_nc_domegazetadzeta_vert
-        self.Ducdzeta+=scalg.block_diag(*List_nc_domegazetadzeta_col)
-        del List_nc_domegazetadzeta_col
+        key = self.get_cache_key(group)
+        Blocks = self.cache.load(key)
+        if Blocks is None:
+            Blocks = assemble_fun()
+            self.cache.save(key, Blocks)
+        else:
+            print('\t\t\t...%s matrices loaded from cache' % group)
 
-        ### input velocity derivatives
-        self.Ducdu_ext = scalg.block_diag(*List_Wnv)
-        del List_Wnv
+        return Blocks
 
+    def assemble_geometry_blocks(self, factorise=True):
+        """
+        Assembles the matrices that only depend on the lattice geometry:
+            - ``AIC``: aerodynamic influence coefficients matrix, including
+            the folded wake contribution.
+            - ``AIC_LU``, ``AIC_piv``: LU factorisation of ``AIC`` (see
+            ``scipy.linalg.lu_factor``). Only computed if factorise is True.
+            - ``Ducdu_ext``: derivative of normal velocities at the collocation
+            points w.r.t. the input velocities.
+        """
+
+        MS = self.MS
+
+        # global matrices are preallocated and filled in-place
+        AIC = np.empty((self.K, self.K))
+        List_AICs, List_AICs_star = ass.AICs(MS.Surfs, MS.Surfs_star,
+                                   target='collocation', Project=True, AIC=AIC,
+                                   fold_wake=True)
+
+        ### input velocity derivatives
+        Ducdu_ext = np.zeros((self.K, 3 * self.Kzeta))
+        ass.add_block_diag(Ducdu_ext, [
+            interp.get_Wnv_vector(Surf, Surf.aM, Surf.aN) for Surf in MS.Surfs])
 
         ### Condense Gammaw terms
+        # the wake AICs are produced in folded format, i.e. summed along the
+        # chord at each span-coordinate (see lib_vbiot.aic3_folded)
+        for ss_out in range(MS.n_surf):
+            for ss_in in range(MS.n_surf):
+                N_star = MS.NN_star[ss_in]
+                aic = List_AICs[ss_out][ss_in]  # bound (view of AIC)
+                aic[:, -N_star:] += List_AICs_star[ss_out][ss_in]
+        del List_AICs, List_AICs_star
+
+        if not factorise:
+            return {'AIC': AIC, 'Ducdu_ext': Ducdu_ext}
+
+        LU, piv = scalg.lu_factor(AIC)
+
+        return {'AIC': AIC, 'AIC_LU': LU, 'AIC_piv': piv, 'Ducdu_ext': Ducdu_ext}
+
+    def assemble_geometry_blocks_mixed(self):
+        """
+        Mixed-precision version of ``assemble_geometry_blocks``. The AIC
+        matrix is assembled in single precision and only its LU factors,
+        ``AIC_LU`` and ``AIC_piv``, are stored. The folded wake AIC matrix,
+        ``AICw_fold``, and the trailing edge panels indices, ``iiTE`` (see
+        ``assemble_folded_wake``), are stored in double precision to evaluate
+        the residuals of the iterative refinement (see ``aic_matvec``).
+        """
+
+        MS = self.MS
+
+        AIC = np.empty((self.K, self.K), dtype=np.float32)
+        List_AICs, List_AICs_star = ass.AICs(MS.Surfs, MS.Surfs_star,
+                                   target='collocation', Project=True, AIC=AIC,
+                                   fold_wake=True)
+
+        AICw_fold = np.empty((self.K, sum(MS.NN_star)))
+        List_AICw = ass.get_block_views(AICw_fold, MS.KK, MS.NN_star)
+        iiTE, K0 = [], 0
         for ss_out in range(MS.n_surf):
-            K = MS.KK[ss_out]
             for ss_in in range(MS.n_surf):
                 N_star = MS.NN_star[ss_in]
-                aic = List_AICs[ss_out][ss_in]  # bound
-                aic_star = List_AICs_star[ss_out][ss_in]  # wake
+                List_AICs[ss_out][ss_in][:, -N_star:] += List_AICs_star[ss_out][ss_in]
+                List_AICw[ss_out][ss_in][:, :] = List_AICs_star[ss_out][ss_in]
+            iiTE.append(K0 + MS.KK[ss_out] - MS.NN[ss_out] + np.arange(MS.NN[ss_out]))
+            K0 += MS.KK[ss_out]
+        del List_AICs, List_AICs_star
+
+        Ducdu_ext = np.zeros((self.K, 3 * self.Kzeta))
+        ass.add_block_diag(Ducdu_ext, [
+            interp.get_Wnv_vector(Surf, Surf.aM, Surf.aN) for Surf in MS.Surfs])
+
+        LU, piv = scalg.lu_factor(AIC, overwrite_a=True)
+        del AIC
+
+        return {'AIC_LU': LU, 'AIC_piv': piv, 'AICw_fold': AICw_fold,
+                'iiTE': np.concatenate(iiTE), 'Ducdu_ext': Ducdu_ext}
+
+    def assemble_folded_wake(self):
+        """
+        Returns the folded wake AIC matrix, of shape (K,sum(N_star)), whose
+        columns multiply the circulation of the trailing edge panels of each
+        surface, and the indices of these panels, ``iiTE``.
+        """
+
+        MS = self.MS
+
+        # folded wake (see lib_vbiot.aic3_folded)
+        AICw_fold = np.empty((self.K, sum(MS.NN_star)))
+        List_AICw = ass.get_block_views(AICw_fold, MS.KK, MS.NN_star)
+        for ss_out in range(MS.n_surf):
+            for ss_in in range(MS.n_surf):
+                List_AICw[ss_out][ss_in][:, :] = MS.Surfs_star[ss_in].\
+                    get_aic_over_surface(MS.Surfs[ss_out], fold=True)
+
+        iiTE, K0 = [], 0
+        for ss in range(MS.n_surf):
+            iiTE.append(K0 + MS.KK[ss] - MS.NN[ss] + np.arange(MS.NN[ss]))
+            K0 += MS.KK[ss]
+
+        return AICw_fold, np.concatenate(iiTE)
+
+    def assemble_geometry_blocks_compressed(self):
+        """
+        Compressed version of ``assemble_geometry_blocks``. The AIC matrix is
+        stored as the sum of:
+            - ``AIC``: bound AIC matrix, as a ``libhmat.HMatrix`` instance
+            (see ``assembly.AIC_hmatrix``).
+            - ``AICw_fold``: folded wake AIC matrix, of shape (K,sum(N_star)),
+            whose columns multiply the circulation of the trailing edge
+            panels of each surface (indices ``iiTE``).
+        """
+
+        MS = self.MS
+
+        AIC = ass.AIC_hmatrix(MS.Surfs, MS.Surfs, tol=self.compress_tol)
+        AICw_fold, iiTE = self.assemble_folded_wake()
+
+        Ducdu_ext = np.zeros((self.K, 3 * self.Kzeta))
+        ass.add_block_diag(Ducdu_ext, [
+            interp.get_Wnv_vector(Surf, Surf.aM, Surf.aN) for Surf in MS.Surfs])
+
+        return {'AIC': AIC, 'AICw_fold': AICw_fold, 'iiTE': iiTE,
+                'Ducdu_ext': Ducdu_ext}
+
+    def assemble_geometry_blocks_matrix_free(self):
+        """
+        Matrix-free version of ``assemble_geometry_blocks``. The bound AIC
+        matrix is not assembled (see ``aic_matvec``) and only the folded wake
+        AIC matrix, ``AICw_fold``, and the trailing edge panels indices,
+        ``iiTE``, are stored (see ``assemble_folded_wake``).
+        """
+
+        MS = self.MS
+
+        AICw_fold, iiTE = self.assemble_folded_wake()
+
+        Ducdu_ext = np.zeros((self.K, 3 * self.Kzeta))
+        ass.add_block_diag(Ducdu_ext, [
+            interp.get_Wnv_vector(Surf, Surf.aM, Surf.aN) for Surf in MS.Surfs])
+
+        return {'AICw_fold': AICw_fold, 'iiTE': iiTE, 'Ducdu_ext': Ducdu_ext}
+
+    def aic_matvec(self, x):
+        """
+        Product between the AIC matrix (including the folded wake) and the
+        vector x, of shape (K,).
+
+        For matrix-free AIC matrices, and in mixed precision (where only the
+        single precision LU factors of the AIC matrix are stored), the bound
+        contribution is the normal velocity induced at the collocation points
+        by the bound surfaces with circulation x, computed in double precision
+        with the induced velocity kernels of their backend (e.g. 'treecode',
+        see kernels module), including their images if any (see ``libsym``).
+        """
+
+        if self.compress_tol is None and not self.aic_matrix_free and \
+                                                self.precision == 'double':
+            return np.dot(self.AIC, x)
+
+        y = np.dot(self.AICw_fold, x[self.iiTE])
+        if self.compress_tol is not None:
+            return y + self.AIC.dot(x)
+
+        MS = self.MS
+        Zc = np.concatenate([Surf.zetac.reshape((3, -1)) for Surf in MS.Surfs], axis=1)
+        Nc = np.concatenate([Surf.normals.reshape((3, -1)) for Surf in MS.Surfs], axis=1)
+        K0 = 0
+        for Surf in MS.Surfs:
+            Kern = kernels.get(Surf.backend)
+            gamma = x[K0:K0 + Surf.maps.K].reshape((Surf.maps.M, Surf.maps.N))
+            Uind = Kern.ind_vel(Zc, Surf.zeta, gamma)
+            if Surf.symmetry is not None:
+                Uind += Surf.symmetry * Kern.ind_vel(
+                                    Zc, *libsym.get_image(Surf.zeta, gamma))
+            y += np.sum(Nc * Uind, axis=0)
+            K0 += Surf.maps.K
+
+        return y
+
+    def assemble_preconditioner(self):
+        """
+        Builds the preconditioner of the Krylov solvers (see ``solve_aic``),
+        according to ``self.precond``:
+            - 'block_jacobi': LU factors of the diagonal blocks of each
+            surface, including the contribution of their own wake.
+            - 'near_field': sparse LU factors (see
+            ``scipy.sparse.linalg.splu``) of the AIC matrix entries associated
+            to collocation points and panels whose centre is within the
+            distance ``self.precond_radius`` (if None, twice the largest
+            panel diagonal).
+        The preconditioner is stored as ``self.AIC_precond`` and is not cached.
+        """
+
+        self.AIC_precond = None
+        if self.solver == 'lu' or self.precond is None:
+            return
+
+        t0 = time.time()
+        MS = self.MS
+        Kdiag = np.cumsum([0] + MS.KK)
+        Kdiag_star = np.cumsum([0] + MS.NN_star)
+        dense = self.compress_tol is None and not self.aic_matrix_free
+
+        if self.precond == 'block_jacobi':
+            Diag_LU = []
+            for ss in range(MS.n_surf):
+                ii = np.arange(Kdiag[ss], Kdiag[ss + 1])
+                if dense:
+                    aic = self.AIC[Kdiag[ss]:Kdiag[ss + 1], Kdiag[ss]:Kdiag[ss + 1]].copy()
+                else:
+                    if self.compress_tol is not None:
+                        aic = self.AIC.todense(ii, ii)
+                    else:
+                        aic = MS.Surfs[ss].get_aic_over_surface(MS.Surfs[ss]).\
+                                                    reshape((len(ii), len(ii)))
+                    aic[:, -MS.NN[ss]:] += self.AICw_fold[
+                                        ii, Kdiag_star[ss]:Kdiag_star[ss + 1]]
+                Diag_LU.append(scalg.lu_factor(aic, overwrite_a=True))
+            self.AIC_precond = Diag_LU
+
+        if self.precond == 'near_field':
+            ZetaPanels = np.concatenate(
+                [Surf.get_panel_vertices() for Surf in MS.Surfs])
+            Zc = np.concatenate([Surf.zetac.reshape((3, -1)) for Surf in MS.Surfs], axis=1)
+            Nc = np.concatenate([Surf.normals.reshape((3, -1)) for Surf in MS.Surfs], axis=1)
+
+            radius = self.precond_radius
+            if radius is None:
+                radius = 2. * max(
+                    np.max(np.linalg.norm(ZetaPanels[:, 2] - ZetaPanels[:, 0], axis=1)),
+                    np.max(np.linalg.norm(ZetaPanels[:, 3] - ZetaPanels[:, 1], axis=1)))
+
+            # pairs of collocation points and panel centres within radius
+            Near = cKDTree(Zc.T).query_ball_tree(
+                                    cKDTree(np.mean(ZetaPanels, axis=1)), radius)
+            Irow = np.repeat(np.arange(self.K), [len(jj) for jj in Near])
+            Icol = np.concatenate([np.array(jj, dtype=int) for jj in Near])
+
+            if dense:
+                Vals = self.AIC[Irow, Icol]
+            else:
+                Vals = lib_vbiot.aic3_pairs(Zc[:, Irow], ZetaPanels[Icol], Nc[:, Irow])
+                # folded wake contribution to trailing edge panels
+                Fcol = -np.ones((self.K,), dtype=int)
+                Fcol[self.iiTE] = np.arange(len(self.iiTE))
+                iite = Fcol[Icol] >= 0
+                Vals[iite] += self.AICw_fold[Irow[iite], Fcol[Icol[iite]]]
+
+            self.AIC_precond = slalg.splu(sparse.csc_matrix(
+                                    (Vals, (Irow, Icol)), shape=(self.K, self.K)))
+
+        self.solver_stats['time_precond'] = time.time() - t0
 
-                # fold aic_star: sum along chord at each span-coordinate
-                aic_star_fold = np.zeros((K, N_star))
-                for jj in range(N_star):
-                    aic_star_fold[:, jj] += np.sum(aic_star[:, jj::N_star], axis=1)
-                aic[:, -N_star:] += aic_star_fold
+    def solve_aic(self, rhs):
+        """
+        Solves the system ``AIC gamma = rhs``, where rhs has shape (K,) or
+        (K,Nrhs).
+
+        If ``self.solver`` is 'lu', the LU factors of the AIC matrix computed
+        in ``assemble_geometry`` are used, with iterative refinement in mixed
+        precision (see ``solve_lu_refinement``). Otherwise, each right-hand side is
+        solved via GMRES or BiCGStab (see ``scipy.sparse.linalg``), with the
+        preconditioner built in ``assemble_preconditioner``, to the relative
+        tolerance ``self.solver_tol`` in at most ``self.solver_maxiter``
+        iterations. The products with the AIC matrix are computed via
+        ``aic_matvec``, such that the full, compressed or matrix-free AIC
+        matrices can be used.
+
+        Telemetry is stored in ``self.solver_stats``:
+            - 'niter': iterations for each right-hand side (for GMRES, inner
+            iterations, see ``libss.krylov``).
+            - 'residuals': for GMRES, history of the (preconditioned) relative
+            residual norms for each right-hand side. For iterative refinement,
+            history of the relative residual norms.
+            - 'rel_residual': final relative residual, ||AIC gamma - rhs||/||rhs||.
+            - 'converged': flags of converged right-hand sides.
+            - 'time_precond', 'time_solve': preconditioner build and solution
+            time.
+        """
+
+        t0 = time.time()
+        Stats = self.solver_stats
+        Stats.update({'method': self.solver, 'precond': self.precond})
+
+        if self.solver == 'lu' and self.precision == 'double':
+            gamma = scalg.lu_solve((self.AIC_LU, self.AIC_piv), rhs)
+            Stats['time_solve'] = time.time() - t0
+            return gamma
 
-        self.AIC = np.block(List_AICs)
+        MS = self.MS
+        Kdiag = np.cumsum([0] + MS.KK)
+
+        def precond(x):
+            if self.precond == 'block_jacobi':
+                return np.concatenate([
+                    scalg.lu_solve(self.AIC_precond[ss], x[Kdiag[ss]:Kdiag[ss + 1]])
+                    for ss in range(MS.n_surf)])
+            return self.AIC_precond.solve(x)
+
+        Aop = slalg.LinearOperator((self.K, self.K), matvec=self.aic_matvec,
+                                   dtype=np.float_)
+        Mop = None
+        if self.precond is not None:
+            Mop = slalg.LinearOperator((self.K, self.K), matvec=precond,
+                                       dtype=np.float_)
+
+        rhs = np.asarray(rhs)
+        gamma = np.empty(rhs.shape)
+        Niter, Residuals, RelRes, Converged = [], [], [], []
+        for cc in np.ndindex(rhs.shape[1:]):
+            ii = (slice(None),) + cc
+            History = []
+            if self.solver == 'gmres':
+                gamma[ii], info = libss.krylov(slalg.gmres, Aop, rhs[ii],
+                                               self.solver_tol,
+                                               restart=self.gmres_restart,
+                                               maxiter=self.solver_maxiter, M=Mop,
+                                               callback=History.append, atol=0.)
+            elif self.solver == 'bicgstab':
+                gamma[ii], info = libss.krylov(slalg.bicgstab, Aop, rhs[ii],
+                                               self.solver_tol,
+                                               maxiter=self.solver_maxiter, M=Mop,
+                                               callback=lambda xk: History.append(None),
+                                               atol=0.)
+            else:
+                gamma[ii], info = self.solve_lu_refinement(rhs[ii],
+                                                           callback=History.append)
+            norm_rhs = np.linalg.norm(rhs[ii])
+            Niter.append(len(History))
+            Residuals.append(None if self.solver == 'bicgstab' else np.array(History))
+            RelRes.append(np.linalg.norm(self.aic_matvec(gamma[ii]) - rhs[ii]) /
+                          (norm_rhs if norm_rhs > 0. else 1.))
+            Converged.append(info == 0)
+
+        Stats.update({'niter': np.array(Niter, dtype=int), 'residuals': Residuals,
+                      'rel_residual': np.array(RelRes),
+                      'converged': np.array(Converged, dtype=bool),
+                      'time_solve': time.time() - t0})
+        method = '%s (%s preconditioner)' % (self.solver, self.precond)
+        if self.solver == 'lu':
+            method = 'mixed precision lu'
+        print('\t\t\t...%s: %d rhs, max. %d iterations, max. residual %.2e'
+              % (method, len(Niter), max(Niter + [0]), max(RelRes + [0.])))
+        if not np.all(Stats['converged']):
+            warnings.warn('%s not converged in %d iterations for %d right-hand sides'
+                          % (method, self.refine_maxiter if self.solver == 'lu'
+                             else self.solver_maxiter,
+                             np.sum(~Stats['converged'])))
+
+        return gamma
+
+    def solve_lu_refinement(self, b, callback=None):
+        """
+        Solves the system ``AIC gamma = b``, with b of shape (K,), using the
+        single precision LU factors of the AIC matrix (see
+        ``assemble_geometry_blocks_mixed``) and iterative refinement. At each
+        step, the residual ``r = b - AIC gamma`` is evaluated in double
+        precision (see ``aic_matvec``) and the correction is found in single
+        precision. The iterations stop when ``||r|| <= solver_tol ||b||`` or
+        after ``self.refine_maxiter`` steps.
+
+        Returns gamma and the number of steps, if not converged, or 0.
+        callback is called at each step with the relative residual norm.
+        """
+
+        LUpiv = (self.AIC_LU, self.AIC_piv)
+        norm_b = np.linalg.norm(b)
+        x = np.zeros((self.K,))
+        if norm_b == 0.:
+            return x, 0
+
+        r = np.array(b, dtype=np.float_)
+        for nn in range(self.refine_maxiter):
+            # residual is scaled to avoid single precision under/overflow
+            norm_r = np.linalg.norm(r)
+            x += norm_r * self.lu_solve(LUpiv, r / norm_r)
+            r = b - self.aic_matvec(x)
+            if callback is not None:
+                callback(np.linalg.norm(r) / norm_b)
+            if np.linalg.norm(r) <= self.solver_tol * norm_b:
+                return x, 0
+
+        return x, self.refine_maxiter
+
+    def lu_solve(self, LUpiv, B, trans=0):
+        """
+        Solves the system of LU factors LUpiv (see ``scipy.linalg.lu_factor``)
+        in the precision of the factors. In mixed precision, B is cast to
+        single precision, as otherwise scipy would promote the factors to
+        double precision at each call.
+        """
+
+        dtype = LUpiv[0].dtype
+        if np.iscomplexobj(B):
+            dtype = np.result_type(dtype, np.complex64)
+
+        return scalg.lu_solve(LUpiv, np.asarray(B, dtype=dtype), trans=trans)
+
+    def assemble_flow_blocks(self):
+        """
+        Assembles the matrices that depend on the flow at the linearisation
+        point (circulation and velocities):
+            - ``Ducdzeta``: derivative of normal velocities at the collocation
+            points w.r.t. the lattice coordinates.
+            - ``Dfqsdzeta``, ``Dfqsdu_ext``, ``Dfqsdgamma``, ``Dfqsdgamma_star``:
+            derivatives of the quasi-steady forces, stored with type
+            ``self.dtype`` (single precision in mixed precision).
+            ``Dfqsdu_ext`` is block-diagonal and stored in sparse csr format.
+        """
+
+        MS = self.MS
+        Blocks = {}
+
+        # Note: each global matrix is preallocated and the assembly routines
+        # sum their blocks in-place into it. The local derivatives (at constant
+        # relative velocity and w.r.t. the input velocities) are assembled in
+        # sparse format and added without building their full block-diagonal.
+
+        # ----------------------------------------------------------- state eq.
+
+        ### zeta derivatives
+        Ducdzeta = np.zeros((self.K, 3 * self.Kzeta))
+        ass.nc_dqcdzeta(MS.Surfs, MS.Surfs_star, Der=Ducdzeta)
+        ass.add_block_diag(Ducdzeta, ass.uc_dncdzeta(MS.Surfs))
+        # omega x zeta terms
+        ass.add_block_diag(Ducdzeta, ass.nc_domegazetadzeta(
+                                MS.Surfs, MS.Surfs_star, sparse_format=True))
+        Blocks['Ducdzeta'] = Ducdzeta
 
         # ---------------------------------------------------------- output eq.
 
         ### Zeta derivatives
-        # ... at constant relative velocity
-        self.Dfqsdzeta = scalg.block_diag(
-            *ass.dfqsdzeta_vrel0(MS.Surfs, MS.Surfs_star))
         # ... induced velocity contrib.
-        List_coll, List_vert = ass.dfqsdvind_zeta(MS.Surfs, MS.Surfs_star)
-        for ss in range(MS.n_surf):
-            List_vert[ss][ss] += List_coll[ss]
-        self.Dfqsdzeta += np.block(List_vert)
-        del List_vert, List_coll
+        Dfqsdzeta = np.zeros((3 * self.Kzeta, 3 * self.Kzeta), dtype=self.dtype)
+        ass.dfqsdvind_zeta(MS.Surfs, MS.Surfs_star, Der=Dfqsdzeta)
+        # ... at constant relative velocity
+        ass.add_block_diag(Dfqsdzeta, ass.dfqsdzeta_vrel0(
+                                MS.Surfs, MS.Surfs_star, sparse_format=True))
+        Blocks['Dfqsdzeta'] = Dfqsdzeta
 
-        ### Input velocities
-        self.Dfqsdu_ext = scalg.block_diag(
-            *ass.dfqsduinput(MS.Surfs, MS.Surfs_star))
+        ### Input velocities (sparse)
+        Blocks['Dfqsdu_ext'] = sparse.block_diag(
+            ass.dfqsduinput(MS.Surfs, MS.Surfs_star, sparse_format=True),
+            format='csr', dtype=self.dtype)
 
         ### Gamma derivatives
+        # ... induced velocity contrib.
+        Dfqsdgamma = np.zeros((3 * self.Kzeta, self.K), dtype=self.dtype)
+        Dfqsdgamma_star = np.zeros((3 * self.Kzeta, self.K_star), dtype=self.dtype)
+        ass.dfqsdvind_gamma(MS.Surfs, MS.Surfs_star,
+                                    Der=Dfqsdgamma, Der_star=Dfqsdgamma_star)
         # ... at constant relative velocity
         List_dfqsdgamma_vrel0, List_dfqsdgamma_star_vrel0 = \
-            ass.dfqsdgamma_vrel0(MS.Surfs, MS.Surfs_star)
-        self.Dfqsdgamma = scalg.block_diag(*List_dfqsdgamma_vrel0)
-        self.Dfqsdgamma_star = scalg.block_diag(*List_dfqsdgamma_star_vrel0)
+            ass.dfqsdgamma_vrel0(MS.Surfs, MS.Surfs_star, sparse_format=True)
+        ass.add_block_diag(Dfqsdgamma, List_dfqsdgamma_vrel0)
+        ass.add_block_diag(Dfqsdgamma_star, List_dfqsdgamma_star_vrel0)
         del List_dfqsdgamma_vrel0, List_dfqsdgamma_star_vrel0
-        # ... induced velocity contrib.
-        List_dfqsdvind_gamma, List_dfqsdvind_gamma_star = \
-            ass.dfqsdvind_gamma(MS.Surfs, MS.Surfs_star)
-        self.Dfqsdgamma += np.block(List_dfqsdvind_gamma)
-        self.Dfqsdgamma_star += np.block(List_dfqsdvind_gamma_star)
-        del List_dfqsdvind_gamma, List_dfqsdvind_gamma_star
+        Blocks['Dfqsdgamma'] = Dfqsdgamma
+        Blocks['Dfqsdgamma_star'] = Dfqsdgamma_star
+
+        return Blocks
+
+    def assemble_geometry(self):
+        """
+        Assembles (or loads from cache) the matrices that only depend on the
+        lattice geometry (see ``assemble_geometry_blocks`` and its compressed
+        and matrix-free versions) and builds the preconditioner of the Krylov
+        solvers (see ``assemble_preconditioner``).
+        """
+
+        if self.compress_tol is not None:
+            Blocks = self.get_blocks(
+                'geometry', self.assemble_geometry_blocks_compressed)
+        elif self.aic_matrix_free:
+            Blocks = self.get_blocks(
+                'mf_geometry', self.assemble_geometry_blocks_matrix_free)
+        elif self.precision == 'mixed':
+            Blocks = self.get_blocks('geometry', self.assemble_geometry_blocks_mixed)
+        elif self.solver == 'lu':
+            Blocks = self.get_blocks('geometry', self.assemble_geometry_blocks)
+        else:
+            # full AIC matrix, not factorised
+            Blocks = self.get_blocks('iter_geometry',
+                        lambda: self.assemble_geometry_blocks(factorise=False))
+        for name in Blocks:
+            setattr(self, name, Blocks[name])
+
+        self.assemble_preconditioner()
+
+    def assemble_flow(self):
+        """
+        Assembles (or loads from cache) the matrices that depend on the flow
+        at the linearisation point (see ``assemble_flow_blocks``).
+        """
+
+        Blocks = self.get_blocks('flow', self.assemble_flow_blocks)
+        for name in Blocks:
+            setattr(self, name, Blocks[name])
+
+    def assemble(self):
+        """
+        Assemble global matrices. If a cache is available (see ``get_blocks``),
+        the matrices are loaded when the geometry (and flow) have not changed.
 
+        To change the linearisation point on the same lattice, use
+        ``update_flow``, which only refreshes the flow-dependent terms.
+        """
+        print('Assembly of static linear UVLM equations started...')
+        t0 = time.time()
+
+        self.assemble_geometry()
+        self.assemble_flow()
 
         self.time_asbly = time.time() - t0
         print('\t\t\t...done in %.2f sec' % self.time_asbly)
 
+    def update_flow(self, u_ext=None, zeta_dot=None, rho=None, gamma=None):
+        """
+        Changes the linearisation point without changing the lattice geometry
+        and refreshes the flow-dependent matrices only (see ``assemble_flow``).
+        The geometry-only matrices, the LU factorisation of ``self.AIC`` and
+        the preconditioner are reused. Requires ``assemble`` (or ``assemble_geometry``) to be called
+        first.
+
+        Args:
+            u_ext (list): external velocities at the lattice vertices of each
+                surface, with shape (3,M+1,N+1). If None, these are not changed.
+            zeta_dot (list): lattice vertices velocities, as ``u_ext``.
+            rho (float): air density. If None, this is not changed.
+            gamma (list): bound circulation of each surface, with shape (M,N).
+                If None, this is computed from the non-penetration condition
+                with steady wake (i.e. a pair of triangular solves). This
+                is required for antisymmetric problems, as the reference state
+                is symmetric (see ``libsym``).
+
+        In all cases, the wake circulation is set equal to the circulation at
+        the trailing edge (steady wake).
+        """
+
+        if not hasattr(self, 'Ducdu_ext'):
+            raise NameError('Geometry matrices not found: call assemble first')
+        if gamma is None and self.symmetry == 'anti':
+            raise NameError('gamma required for antisymmetric problems')
+
+        print('Update of flow-dependent linear UVLM equations started...')
+        t0 = time.time()
+        MS = self.MS
 
-    def solve(self):
+        for ss in range(MS.n_surf):
+            Surf, Surf_star = MS.Surfs[ss], MS.Surfs_star[ss]
+            if u_ext is not None:
+                Surf.u_ext = u_ext[ss]
+            if zeta_dot is not None:
+                Surf.zeta_dot = zeta_dot[ss]
+            if rho is not None:
+                Surf.rho = rho
+                Surf_star.rho = rho
+            Surf.get_input_velocities_at_collocation_points()
+            Surf.get_normal_input_velocities_at_collocation_points()
+
+        # bound and wake circulation
+        if gamma is None:
+            uc_norm = np.concatenate([Surf.u_input_coll_norm.reshape(-1)
+                                      for Surf in MS.Surfs])
+            gamma_vec = self.solve_aic(-uc_norm)
+            gamma, K0 = [], 0
+            for ss in range(MS.n_surf):
+                gamma.append(gamma_vec[K0:K0 + MS.KK[ss]].reshape(
+                                                        (MS.MM[ss], MS.NN[ss])))
+                K0 += MS.KK[ss]
+        for ss in range(MS.n_surf):
+            MS.Surfs[ss].gamma = gamma[ss]
+            MS.Surfs_star[ss].gamma = np.tile(gamma[ss][-1, :],
+                                              (MS.MM_star[ss], 1))
+
+        # velocities
+        MS.get_ind_velocities_at_collocation_points()
+        MS.get_ind_velocities_at_segments(overwrite=True)
+        MS.get_input_velocities_at_segments(overwrite=True)
+
+        self.assemble_flow()
+
+        self.time_update = time.time() - t0
+        print('\t\t\t...done in %.2f sec' % self.time_update)
+
+
+    def solve(self, u_ext=None, zeta=None, zeta_dot=None):
         """
         Solve for bound :math:`\\Gamma` using the equation;
 
         .. math::
                 \\mathcal{A}(\\Gamma^n) = u^n
-		# ... at constant rotation speed
-		self.Dfqsdzeta+=scalg.block_diag(
-								   *ass.dfqsdzeta_omega(MS.Surfs,MS.Surfs_star))
 
+        and compute the quasi-steady forces. The AIC matrix is factorised once
+        in ``assemble_geometry`` and the LU factors are reused at each call or,
+        for Krylov solvers, the system is solved iteratively (see ``solve_aic``).
+
+        The inputs ``u_ext``, ``zeta`` and ``zeta_dot`` (if not given, the
+        attributes of the class are used) can be arrays of shape (3*Kzeta,) or
+        blocks of shape (3*Kzeta,Nrhs), with each column being an independent
+        input perturbation. In the latter case, all the right-hand sides are
+        solved at once and ``self.gamma`` and ``self.fqs`` are stacked in
+        columns, with shape (K,Nrhs) and (3*Kzeta,Nrhs). Arrays and blocks can
+        be mixed, with arrays applied to all the right-hand sides.
         """
 
         MS = self.MS
         t0 = time.time()
 
+        if u_ext is not None:
+            self.u_ext = u_ext
+        if zeta is not None:
+            self.zeta = zeta
+        if zeta_dot is not None:
+            self.zeta_dot = zeta_dot
+
+        # arrays are turned into single columns if any input is a block
+        Inputs = [np.asarray(vv) for vv in [self.u_ext, self.zeta, self.zeta_dot]]
+        NrhsList = [vv.shape[1] for vv in Inputs if vv.ndim == 2]
+        if len(NrhsList) > 0:
+            if min(NrhsList) != max(NrhsList):
+                raise NameError('Input blocks have different number of columns')
+            Inputs = [vv.reshape((-1, 1)) if vv.ndim == 1 else vv for vv in Inputs]
+        u_ext, zeta, zeta_dot = Inputs
+
         ### state
-        bv = np.dot(self.Ducdu_ext, self.u_ext - self.zeta_dot) + \
-             np.dot(self.Ducdzeta, self.zeta)
-        self.gamma = np.linalg.solve(self.AIC, -bv)
+        bv = np.dot(self.Ducdu_ext, u_ext - zeta_dot) + \
+             np.dot(self.Ducdzeta, zeta)
+        self.gamma = self.solve_aic(-bv)
 
         ### retrieve gamma over wake
         gamma_star = []
@@ -184,10 +844,13 @@ class Static():
         gamma_star = np.concatenate(gamma_star)
 
         ### compute steady force
-        self.fqs = np.dot(self.Dfqsdgamma, self.gamma) + \
-                   np.dot(self.Dfqsdgamma_star, gamma_star) + \
-                   np.dot(self.Dfqsdzeta, self.zeta) + \
-                   np.dot(self.Dfqsdu_ext, self.u_ext - self.zeta_dot)
+        # (in the precision of the derivatives, see assemble_flow_blocks)
+        dtype = self.Dfqsdgamma.dtype
+        self.fqs = np.dot(self.Dfqsdgamma, self.gamma.astype(dtype, copy=False)) + \
+                   np.dot(self.Dfqsdgamma_star, gamma_star.astype(dtype, copy=False)) + \
+                   np.dot(self.Dfqsdzeta, zeta.astype(dtype, copy=False)) + \
+                   self.Dfqsdu_ext.dot((u_ext - zeta_dot).astype(dtype, copy=False))
+        self.fqs = self.fqs.astype(np.float_, copy=False)
 
         self.time_sol = time.time() - t0
         print('Solution done in %.2f sec' % self.time_sol)
@@ -201,6 +864,8 @@ class Static():
         MS = self.MS
         if not hasattr(self, 'gamma') or not hasattr(self, 'fqs'):
             raise NameError('State and output not found')
+        if self.gamma.ndim != 1:
+            raise NameError('Reshape not available for multiple right-hand sides')
 
         self.Gamma = []
         self.Fqs = []
@@ -365,9 +1030,13 @@ class Static():
 
 class Dynamic(Static):
 
-    def __init__(self, tsdata, dt, integr_order=2, RemovePredictor=True, ScalingDict=None):
+    def __init__(self, tsdata, dt, integr_order=2, RemovePredictor=True, ScalingDict=None,
+                 backend=None, UseSparse=False, MatrixFree=False, cache=None,
+                 compress_tol=None, precision='double', symmetry=None):
 
-        super().__init__(tsdata)
+        super().__init__(tsdata, backend=backend, cache=cache,
+                         compress_tol=compress_tol, precision=precision,
+                         symmetry=symmetry)
 
         # self.settings_types = dict()
         # self.settings_default = dict()
@@ -398,6 +1067,9 @@ class Dynamic(Static):
 
         self.remove_predictor = RemovePredictor
         self.include_added_mass = True
+        self.use_sparse = UseSparse
+        self.matrix_free = MatrixFree
+        self.Kin, self.Kout = None, None  # input/output bases (see assemble_ss)
 
         # create scaling quantities
         if ScalingDict is None:
@@ -427,6 +1099,9 @@ class Dynamic(Static):
         Scale state-space model based of self.SalingFacts
         """
 
+        if self.Kin is not None or self.Kout is not None:
+            raise NameError('Scaling not available for projected inputs/outputs')
+
         self.state_scal = self.ScalingFacts['circulation']
         self.output_scal = self.ScalingFacts['force']
 
@@ -443,7 +1118,97 @@ class Dynamic(Static):
         pass
 
 
-    def assemble_ss(self):
+    def assemble_ss_geometry_blocks(self):
+        """
+        Assembles the matrices of the state-space model that only depend on
+        the lattice geometry:
+            - ``A0_LU``, ``A0_piv``: LU factorisation of the bound AIC matrix
+            (see ``scipy.linalg.lu_factor``).
+            - ``A0W``: wake AIC matrix.
+            - ``Wnv0``: derivative of normal velocities at the collocation
+            points w.r.t. the input velocities.
+
+        If ``self.compress_tol`` is not None, ``A0W`` is a ``libhmat.HMatrix``
+        instance (see ``assembly.AIC_hmatrix``). All other matrices are stored
+        with type ``self.dtype`` (single precision in mixed precision).
+        """
+
+        MS = self.MS
+
+        # global matrices are preallocated and filled in-place
+        A0 = np.empty((self.K, self.K), dtype=self.dtype)
+        if self.compress_tol is None:
+            A0W = np.empty((self.K, self.K_star), dtype=self.dtype)
+            ass.AICs(MS.Surfs, MS.Surfs_star, target='collocation', Project=True,
+                                                        AIC=A0, AIC_star=A0W)
+        else:
+            ass.AICs(MS.Surfs, None, target='collocation', Project=True, AIC=A0)
+            A0W = ass.AIC_hmatrix(MS.Surfs, MS.Surfs_star, tol=self.compress_tol)
+        LU, P = scalg.lu_factor(A0, overwrite_a=True)
+        del A0
+
+        Wnv0 = np.zeros((self.K, 3 * self.Kzeta), dtype=self.dtype)
+        ass.add_block_diag(Wnv0, [
+            interp.get_Wnv_vector(Surf, Surf.aM, Surf.aN) for Surf in MS.Surfs])
+
+        return {'A0_LU': LU, 'A0_piv': P, 'A0W': A0W, 'Wnv0': Wnv0}
+
+    def assemble_ss_flow_blocks(self):
+        """
+        Assembles the matrices of the state-space model that depend on the
+        flow at the linearisation point. These are the same as in
+        ``Static.assemble_flow_blocks`` (but for the rotation speed effects)
+        and the derivative of the unsteady force w.r.t. the circulation time
+        derivative, ``Dfunstdgamma_dot``. All matrices, including
+        ``Ducdzeta``, are stored with type ``self.dtype``.
+        """
+
+        MS = self.MS
+        Blocks = {}
+
+        # Note: global matrices are preallocated and filled in-place (see
+        # Static.assemble_flow_blocks)
+
+        # zeta derivs
+        Ducdzeta = np.zeros((self.K, 3 * self.Kzeta), dtype=self.dtype)
+        ass.nc_dqcdzeta(MS.Surfs, MS.Surfs_star, Der=Ducdzeta)
+        ass.add_block_diag(Ducdzeta, ass.uc_dncdzeta(MS.Surfs))
+        Blocks['Ducdzeta'] = Ducdzeta
+
+        # gamma (induced velocity contrib.)
+        Dfqsdgamma = np.zeros((3 * self.Kzeta, self.K), dtype=self.dtype)
+        Dfqsdgamma_star = np.zeros((3 * self.Kzeta, self.K_star), dtype=self.dtype)
+        ass.dfqsdvind_gamma(MS.Surfs, MS.Surfs_star,
+                                    Der=Dfqsdgamma, Der_star=Dfqsdgamma_star)
+        # gamma (at constant relative velocity, sparse)
+        List_dfqsdgamma_vrel0, List_dfqsdgamma_star_vrel0 = \
+            ass.dfqsdgamma_vrel0(MS.Surfs, MS.Surfs_star, sparse_format=True)
+        ass.add_block_diag(Dfqsdgamma, List_dfqsdgamma_vrel0)
+        ass.add_block_diag(Dfqsdgamma_star, List_dfqsdgamma_star_vrel0)
+        del List_dfqsdgamma_vrel0, List_dfqsdgamma_star_vrel0
+        Blocks['Dfqsdgamma'] = Dfqsdgamma
+        Blocks['Dfqsdgamma_star'] = Dfqsdgamma_star
+
+        # gamma_dot
+        Blocks['Dfunstdgamma_dot'] = ass.add_block_diag(
+            np.zeros((3 * self.Kzeta, self.K), dtype=self.dtype), ass.dfunstdgamma_dot(MS.Surfs))
+
+        # zeta (induced velocity contrib)
+        Dfqsdzeta = np.zeros((3 * self.Kzeta, 3 * self.Kzeta), dtype=self.dtype)
+        ass.dfqsdvind_zeta(MS.Surfs, MS.Surfs_star, Der=Dfqsdzeta)
+        # zeta (at constant relative velocity, sparse)
+        ass.add_block_diag(Dfqsdzeta, ass.dfqsdzeta_vrel0(
+                                MS.Surfs, MS.Surfs_star, sparse_format=True))
+        Blocks['Dfqsdzeta'] = Dfqsdzeta
+
+        # input velocities (external, sparse csr)
+        Blocks['Dfqsdu_ext'] = sparse.block_diag(
+            ass.dfqsduinput(MS.Surfs, MS.Surfs_star, sparse_format=True),
+            format='csr', dtype=self.dtype)
+
+        return Blocks
+
+    def assemble_ss(self, Kin=None, Kout=None):
         r"""
         Produces state-space model of the form
 
@@ -484,8 +1249,50 @@ class Dynamic(Static):
 
         which only modifies the equivalent :math:`\mathbf{B}` and :math:`\mathbf{D}` matrices.
 
+        If ``self.use_sparse = True``, :math:`\mathbf{A}` and :math:`\mathbf{B}`
+        are ``libss.SparseDense`` instances. In this case, ``self.SS`` is a
+        ``libss.ss`` instance, as ``scipy.signal.dlti`` does not support
+        sparse matrices. The wake propagation, identity and zero blocks are
+        stored in ``scipy.sparse`` csr format, while the coupling block of
+        :math:`\mathbf{A}` (products of :math:`\mathbf{A}_0^{-1}\mathbf{A}_{0,w}`,
+        of size K x (K+K_star)) and the bound circulation rows of
+        :math:`\mathbf{B}` (K x Nu) are full arrays stored once: the rows of
+        the circulation time derivative only reference them through a sparse
+        (scaled) identity. Hence, the saving w.r.t. full storage grows with
+        the wake length K_star; to reduce the memory of the dense blocks, use
+        ``self.matrix_free = True`` and/or project the inputs (Kin).
+
+        If ``self.matrix_free = True``, :math:`\mathbf{A}` and :math:`\mathbf{B}` are
+        never built: these are ``scipy.sparse.linalg.LinearOperator`` instances
+        (see ``assemble_ss_operators``), while :math:`\mathbf{C}` and
+        :math:`\mathbf{D}` are dense matrices wrapped into linear operators.
+
+        If ``self.compress_tol`` is not None, the wake AIC matrix
+        :math:`\mathbf{A}_{0,w}` is built in compressed format (see
+        ``assemble_ss_geometry_blocks``). This only saves memory if
+        ``self.matrix_free = True``, as otherwise the product
+        :math:`\mathbf{A}_0^{-1}\mathbf{A}_{0,w}` is stored in full.
+
+        If ``self.precision = 'mixed'``, the LU factors of
+        :math:`\mathbf{A}_0`, the input and output matrices and the state-space
+        matrices are stored and computed in single precision.
+
+        The inputs and outputs can be projected over the bases Kin, of shape
+        (Nu,Nu_red), and Kout, of shape (Ny_red,Ny), such that
+        :math:`\mathbf{u} = \mathbf{K}_{in}\,\mathbf{u}_{red}` and
+        :math:`\mathbf{y}_{red} = \mathbf{K}_{out}\,\mathbf{y}`, e.g. the
+        structural gains of ``lin_aeroelastic.LinAeroEla`` or the gains of
+        ``get_rigid_motion_gains`` and ``get_total_forces_gain``. The inputs
+        are projected before solving for the bound circulation (see
+        ``project_inputs``), and the outputs before the assembly of the
+        :math:`\mathbf{C}` and :math:`\mathbf{D}` matrices, such that the
+        state-space model only has Nu_red inputs and Ny_red outputs. The bases
+        are stored as ``self.Kin`` and ``self.Kout`` (None if not given).
+
         Warnings:
-            All matrices are allocated as full!
+            Unless ``self.use_sparse = True``, all matrices are allocated as full!
+            Even if ``self.use_sparse = True``, the coupling blocks of
+            :math:`\mathbf{A}` and :math:`\mathbf{B}` are full (see above).
 
         References:
             [1] Franklin, GF and Powell, JD. Digital Control of Dynamic Systems, Addison-Wesley Publishing Company, 1980
@@ -500,9 +1307,15 @@ class Dynamic(Static):
 
         # ------------------------------------------------------ determine size
 
+        if Kin is not None and Kin.shape[0] != self.Nu:
+            raise NameError('Kin must have %d rows' % self.Nu)
+        if Kout is not None and Kout.shape[1] != self.Ny:
+            raise NameError('Kout must have %d columns' % self.Ny)
+        self.Kin, self.Kout = Kin, Kout
+
         Nx = self.Nx
-        Nu = self.Nu
-        Ny = self.Ny
+        Nu = self.Nu if Kin is None else Kin.shape[1]
+        Ny = self.Ny if Kout is None else Kout.shape[0]
         if self.integr_order == 2:
             b0, bm1, bp1 = -2., 0.5, 1.5
 
@@ -510,132 +1323,194 @@ class Dynamic(Static):
 
         ### state terms (A matrix)
 
-        # Aero influence coeffs
-        List_AICs, List_AICs_star = ass.AICs(MS.Surfs, MS.Surfs_star,
-                                             target='collocation', Project=True)
-        A0 = np.block(List_AICs)
-        A0W = np.block(List_AICs_star)
-        del List_AICs, List_AICs_star
-        LU, P = scalg.lu_factor(A0)
-        AinvAW = scalg.lu_solve((LU, P), A0W)
-        del A0, A0W
-
-        # propagation of circ
-        List_C, List_Cstar = ass.wake_prop(MS.Surfs, MS.Surfs_star)
-        Cgamma = scalg.block_diag(*List_C)
-        CgammaW = scalg.block_diag(*List_Cstar)
-        del List_C, List_Cstar
-
-        # A matrix assembly
-        Ass = np.zeros((Nx, Nx))
-        Ass[:K, :K] = -np.dot(AinvAW, Cgamma)
-        Ass[:K, K:K + K_star] = -np.dot(AinvAW, CgammaW)
-        Ass[K:K + K_star, :K] = Cgamma
-        Ass[K:K + K_star, K:K + K_star] = CgammaW
-
-        if self.integr_order == 1:
-            # delta eq.
-            Ass[K + K_star:2 * K + K_star, :K] = Ass[:K, :K] - np.eye(K)
-            Ass[K + K_star:2 * K + K_star, K:K + K_star] = Ass[:K, K:K + K_star]
-        if self.integr_order == 2:
-            # delta eq.
-            Ass[K + K_star:2 * K + K_star, :K] = bp1 * Ass[:K, :K] + b0 * np.eye(K)
-            Ass[K + K_star:2 * K + K_star, K:K + K_star] = bp1 * Ass[:K, K:K + K_star]
-            Ass[K + K_star:2 * K + K_star, K + K_star:2 * K + K_star] = 0.0
-            Ass[K + K_star:2 * K + K_star, 2 * K + K_star:3 * K + K_star] = bm1 * np.eye(K)
-            # identity eq.
-            Ass[2 * K + K_star:3 * K + K_star, :K] = np.eye(K)
+        # Aero influence coeffs (LU factors of A0) and ext velocity derivs
+        Blocks = self.get_blocks('ss_geometry', self.assemble_ss_geometry_blocks)
+        LU, P, A0W, Wnv0 = Blocks['A0_LU'], Blocks['A0_piv'], Blocks['A0W'], Blocks['Wnv0']
+        del Blocks
+        self.A0_LU = (LU, P)
+        if self.matrix_free:
+            self.A0W = A0W
+        else:
+            if self.compress_tol is not None:
+                A0W = A0W.todense()
+            AinvAW = self.lu_solve((LU, P), A0W)
+        del A0W
+
+        if not self.matrix_free:
+            # propagation of circ
+            List_C, List_Cstar = ass.wake_prop(MS.Surfs, MS.Surfs_star,
+                                               sparse_format=self.use_sparse)
+            if self.use_sparse:
+                Cgamma = sparse.block_diag(List_C, format='csc', dtype=self.dtype)
+                CgammaW = sparse.block_diag(List_Cstar, format='csc', dtype=self.dtype)
+            else:
+                Cgamma = scalg.block_diag(*List_C).astype(self.dtype, copy=False)
+                CgammaW = scalg.block_diag(*List_Cstar).astype(self.dtype, copy=False)
+            del List_C, List_Cstar
+
+            # A matrix assembly
+            if self.use_sparse:
+                # A = S + E Pcoup G, where only the AinvAW products,
+                # Pcoup = [Pgamma, PgammaW], are dense. Pcoup is stored once
+                # and scaled by bp1 in the delta rows through E.
+                Pcoup = np.empty((K, K + K_star), dtype=self.dtype)
+                Pcoup[:, :K] = -libss.dot(AinvAW, Cgamma)
+                Pcoup[:, K:] = -libss.dot(AinvAW, CgammaW)
+                Eye = sparse.identity(K, dtype=self.dtype, format='csr')
+                if self.integr_order == 1:
+                    S = sparse.bmat([[None, None, sparse.csr_matrix((K, K), dtype=self.dtype)],
+                                     [Cgamma, CgammaW, None],
+                                     [-Eye, None, None]], format='csr')
+                    E = sparse.bmat([[Eye], [sparse.csr_matrix((K_star, K), dtype=self.dtype)],
+                                     [Eye]], format='csr')
+                if self.integr_order == 2:
+                    S = sparse.bmat([[None, None, sparse.csr_matrix((K, K), dtype=self.dtype), None],
+                                     [Cgamma, CgammaW, None, None],
+                                     [b0 * Eye, None, None, bm1 * Eye],
+                                     [Eye, None, None, None]], format='csr')
+                    E = sparse.bmat([[Eye], [sparse.csr_matrix((K_star, K), dtype=self.dtype)],
+                                     [bp1 * Eye], [sparse.csr_matrix((K, K), dtype=self.dtype)]],
+                                    format='csr')
+                G = sparse.eye(K + K_star, Nx, dtype=self.dtype, format='csr')
+                Ass = libss.SparseDense(S, E, Pcoup, G)
+                del Pcoup, S, G, Eye
+            else:
+                Ass = np.zeros((Nx, Nx), dtype=self.dtype)
+                Ass[:K, :K] = -np.dot(AinvAW, Cgamma)
+                Ass[:K, K:K + K_star] = -np.dot(AinvAW, CgammaW)
+                Ass[K:K + K_star, :K] = Cgamma
+                Ass[K:K + K_star, K:K + K_star] = CgammaW
+
+                if self.integr_order == 1:
+                    # delta eq.
+                    Ass[K + K_star:2 * K + K_star, :K] = Ass[:K, :K] - np.eye(K, dtype=self.dtype)
+                    Ass[K + K_star:2 * K + K_star, K:K + K_star] = Ass[:K, K:K + K_star]
+                if self.integr_order == 2:
+                    # delta eq.
+                    Ass[K + K_star:2 * K + K_star, :K] = bp1 * Ass[:K, :K] + b0 * np.eye(K, dtype=self.dtype)
+                    Ass[K + K_star:2 * K + K_star, K:K + K_star] = bp1 * Ass[:K, K:K + K_star]
+                    Ass[K + K_star:2 * K + K_star, K + K_star:2 * K + K_star] = 0.0
+                    Ass[K + K_star:2 * K + K_star, 2 * K + K_star:3 * K + K_star] = bm1 * np.eye(K, dtype=self.dtype)
+                    # identity eq.
+                    Ass[2 * K + K_star:3 * K + K_star, :K] = np.eye(K, dtype=self.dtype)
+            del Cgamma, CgammaW
 
         ### input terms (B matrix)
 
         # zeta derivs
-        List_uc_dncdzeta = ass.uc_dncdzeta(MS.Surfs)
-        List_nc_dqcdzeta_coll, List_nc_dqcdzeta_vert = \
-            ass.nc_dqcdzeta(MS.Surfs, MS.Surfs_star)
-        Ducdzeta = np.block(List_nc_dqcdzeta_vert)
-        del List_nc_dqcdzeta_vert
-        Ducdzeta += scalg.block_diag(*List_nc_dqcdzeta_coll)
-        del List_nc_dqcdzeta_coll
-        Ducdzeta += scalg.block_diag(*List_uc_dncdzeta)
-        del List_uc_dncdzeta
-
-        # ext velocity derivs (Wnv0)
-        List_Wnv = []
-        for ss in range(MS.n_surf):
-            List_Wnv.append(
-                interp.get_Wnv_vector(MS.Surfs[ss],
-                                      MS.Surfs[ss].aM, MS.Surfs[ss].aN))
-        AinvWnv0 = scalg.lu_solve((LU, P), scalg.block_diag(*List_Wnv))
-        del List_Wnv
+        Blocks = self.get_blocks('ss_flow', self.assemble_ss_flow_blocks)
+        Ducdzeta = Blocks['Ducdzeta']
+
+        if Kin is not None:
+            # inputs projected before the solution
+            Wu = self.project_inputs(Ducdzeta, Wnv0, Kin)
+            if self.matrix_free:
+                self.Wu = Wu
+            else:
+                Bgamma = self.lu_solve((LU, P), Wu)
+            del Wu
+        elif self.matrix_free:
+            self.Wnv0 = Wnv0
+            self.Ducdzeta = Ducdzeta
+        else:
+            AinvWnv0 = self.lu_solve((LU, P), Wnv0)
+        del Wnv0
 
         # B matrix assembly
-        Bss = np.zeros((Nx, Nu))
-        Bss[:K, :3 * Kzeta] = -scalg.lu_solve((LU, P), Ducdzeta)
-        Bss[:K, 3 * Kzeta:6 * Kzeta] = AinvWnv0  # dzeta_dot
-        Bss[:K, 6 * Kzeta:9 * Kzeta] = -AinvWnv0  # du_ext
-        if self.integr_order == 1:
-            Bss[K + K_star:2 * K + K_star, :] = Bss[:K, :]
-        if self.integr_order == 2:
-            Bss[K + K_star:2 * K + K_star, :] = bp1 * Bss[:K, :]
+        if self.matrix_free:
+            pass
+        elif self.use_sparse:
+            # B = E Bgamma, with E as in the A matrix
+            if Kin is None:
+                Bgamma = np.block([-self.lu_solve((LU, P), Ducdzeta),
+                                   AinvWnv0, -AinvWnv0])
+            Bss = libss.SparseDense(None, E, Bgamma)
+            del Bgamma, E
+        else:
+            Bss = np.zeros((Nx, Nu), dtype=self.dtype)
+            if Kin is None:
+                Bss[:K, :3 * Kzeta] = -self.lu_solve((LU, P), Ducdzeta)
+                Bss[:K, 3 * Kzeta:6 * Kzeta] = AinvWnv0  # dzeta_dot
+                Bss[:K, 6 * Kzeta:9 * Kzeta] = -AinvWnv0  # du_ext
+            else:
+                Bss[:K] = Bgamma
+                del Bgamma
+            if self.integr_order == 1:
+                Bss[K + K_star:2 * K + K_star, :] = Bss[:K, :]
+            if self.integr_order == 2:
+                Bss[K + K_star:2 * K + K_star, :] = bp1 * Bss[:K, :]
 
         # ---------------------------------------------------------- output eq.
 
         ### state terms (C matrix)
 
-        # gamma (at constant relative velocity)
-        List_dfqsdgamma_vrel0, List_dfqsdgamma_star_vrel0 = \
-            ass.dfqsdgamma_vrel0(MS.Surfs, MS.Surfs_star)
-        Dfqsdgamma = scalg.block_diag(*List_dfqsdgamma_vrel0)
-        Dfqsdgamma_star = scalg.block_diag(*List_dfqsdgamma_star_vrel0)
-        del List_dfqsdgamma_vrel0, List_dfqsdgamma_star_vrel0
-        # gamma (induced velocity contrib.)
-        List_dfqsdvind_gamma, List_dfqsdvind_gamma_star = \
-            ass.dfqsdvind_gamma(MS.Surfs, MS.Surfs_star)
-        Dfqsdgamma += np.block(List_dfqsdvind_gamma)
-        Dfqsdgamma_star += np.block(List_dfqsdvind_gamma_star)
-        del List_dfqsdvind_gamma, List_dfqsdvind_gamma_star
-
-        # gamma_dot
-        Dfunstdgamma_dot = scalg.block_diag(*ass.dfunstdgamma_dot(MS.Surfs))
+        # outputs projected before assembly
+        if Kout is not None:
+            for name in ['Dfqsdgamma', 'Dfqsdgamma_star', 'Dfunstdgamma_dot',
+                         'Dfqsdzeta', 'Dfqsdu_ext']:
+                Blocks[name] = libss.dot(Kout, Blocks[name]).astype(self.dtype, copy=False)
 
         # C matrix assembly
-        Css = np.zeros((Ny, Nx))
-        Css[:, :K] = Dfqsdgamma
-        Css[:, K:K + K_star] = Dfqsdgamma_star
+        Css = np.zeros((Ny, Nx), dtype=self.dtype)
+        Css[:, :K] = Blocks['Dfqsdgamma']
+        Css[:, K:K + K_star] = Blocks['Dfqsdgamma_star']
         if self.include_added_mass:
-            Css[:, K + K_star:2 * K + K_star] = Dfunstdgamma_dot / self.dt
+            Css[:, K + K_star:2 * K + K_star] = Blocks['Dfunstdgamma_dot'] / self.dt
         # print('dt used: %.3e'%self.dt)
 
         ### input terms (D matrix)
-        Dss = np.zeros((Ny, Nu))
+        if Kin is None:
+            Dss = np.zeros((Ny, Nu), dtype=self.dtype)
 
-        # zeta (at constant relative velocity)
-        Dss[:, :3 * Kzeta] = scalg.block_diag(
-            *ass.dfqsdzeta_vrel0(MS.Surfs, MS.Surfs_star))
-        # zeta (induced velocity contrib)
-        List_coll, List_vert = ass.dfqsdvind_zeta(MS.Surfs, MS.Surfs_star)
-        for ss in range(MS.n_surf):
-            List_vert[ss][ss] += List_coll[ss]
-        Dss[:, :3 * Kzeta] += np.block(List_vert)
-        del List_vert, List_coll
+            # zeta
+            Dss[:, :3 * Kzeta] = Blocks['Dfqsdzeta']
 
-        # input velocities (external)
-        Dss[:, 6 * Kzeta:9 * Kzeta] = scalg.block_diag(
-            *ass.dfqsduinput(MS.Surfs, MS.Surfs_star))
+            # input velocities (external)
+            Dss[:, 6 * Kzeta:9 * Kzeta] = Blocks['Dfqsdu_ext'].toarray()
 
-        # input velocities (body moviment)
-        if self.include_added_mass:
-            Dss[:, 3 * Kzeta:6 * Kzeta] = -Dss[:, 6 * Kzeta:9 * Kzeta]
+            # input velocities (body moviment)
+            if self.include_added_mass:
+                Dss[:, 3 * Kzeta:6 * Kzeta] = -Dss[:, 6 * Kzeta:9 * Kzeta]
+        else:
+            Kin_zeta, Kin_zeta_dot, Kin_u_ext = \
+                Kin[:3 * Kzeta], Kin[3 * Kzeta:6 * Kzeta], Kin[6 * Kzeta:]
+            if self.include_added_mass:
+                Kin_u_ext = Kin_u_ext - Kin_zeta_dot
+            Dss = (libss.dot(Blocks['Dfqsdzeta'], Kin_zeta) +
+                   libss.dot(Blocks['Dfqsdu_ext'], Kin_u_ext)).astype(self.dtype, copy=False)
+        del Blocks
+
+        if self.matrix_free:
+            Ass, Bss = self.assemble_ss_operators()
+            Css = slalg.aslinearoperator(Css)
+            Dss = slalg.aslinearoperator(Dss)
+            SSclass = libss.ss
+        elif self.use_sparse:
+            SSclass = libss.ss
+        else:
+            B0 = np.zeros_like(Bss)
+            SSclass = scsig.dlti
 
         if self.remove_predictor:
-            Ass, Bmod, Css, Dmod = \
-                libss.SSconv(Ass, np.zeros_like(Bss), Bss, Css, Dss, Bm1=None)
-            self.SS = scsig.dlti(Ass, Bmod, Css, Dmod, dt=self.dt)
+            if self.matrix_free:
+                Bmod, Dmod = Ass * Bss, Dss + Css * Bss
+            elif self.use_sparse:
+                # A B = (S + E Pcoup G) E Bgamma = [S E, E] [Bgamma; Pcoup G E Bgamma]
+                E, Bgamma = Bss.E, Bss.P
+                Bmod = libss.SparseDense(
+                    None, sparse.hstack([Ass.S.dot(E), E], format='csr'),
+                    np.concatenate([Bgamma, np.dot(Ass.P, Ass.G.dot(E).dot(Bgamma))]))
+                Dmod = Dss + libss.dot(Css, Bss)
+                del E, Bgamma
+            else:
+                Ass, Bmod, Css, Dmod = \
+                    libss.SSconv(Ass, B0, Bss, Css, Dss, Bm1=None)
+            self.SS = SSclass(Ass, Bmod, Css, Dmod, dt=self.dt)
             print('state-space model produced in form:\n\t' \
                   'h_{n+1} = A h_{n} + B u_{n}\n\t' \
                   'with:\n\tx_n = h_n + Bp u_n')
         else:
-            self.SS = scsig.dlti(Ass, Bss, Css, Dss, dt=self.dt)
+            self.SS = SSclass(Ass, Bss, Css, Dss, dt=self.dt)
             print('state-space model produced in form:\n\t' \
                   'x_{n+1} = A x_{n} + Bp u_{n+1}')
 
@@ -647,6 +1522,465 @@ class Dynamic(Static):
 
 
 
+    def project_inputs(self, Ducdzeta, Wnv0, Kin):
+        """
+        Returns the derivatives of the normal velocities at the collocation
+        points w.r.t. the inputs of the basis Kin (see ``assemble_ss``), i.e.
+        the product between the matrix
+            ``[-Ducdzeta, Wnv0, -Wnv0]``
+        and Kin, computed without assembling the former. Kin can be sparse.
+        """
+
+        Kzeta = self.Kzeta
+        Wu = -libss.dot(Ducdzeta, Kin[:3 * Kzeta]) + \
+            libss.dot(Wnv0, Kin[3 * Kzeta:6 * Kzeta] - Kin[6 * Kzeta:])
+
+        return np.asarray(Wu, dtype=self.dtype)
+
+    def assemble_ss_operators(self):
+        r"""
+        Returns the :math:`\mathbf{A}` and :math:`\mathbf{B}` matrices of the
+        state-space model (see ``assemble_ss``) as
+        ``scipy.sparse.linalg.LinearOperator`` instances. These only require
+        the LU factors of the bound AIC matrix, :math:`\mathbf{A}_0`, the wake
+        AIC matrix, :math:`\mathbf{A}_{0,w}`, and the input matrices
+        ``self.Ducdzeta`` and ``self.Wnv0`` computed in ``assemble_ss`` (or
+        their projection ``self.Wu``, if an input basis is used). If
+        :math:`\mathbf{A}_{0,w}` is compressed (``libhmat.HMatrix``), its
+        products are evaluated block-wise on the compressed format.
+
+        The state update is evaluated as:
+
+            .. math::
+                \mathbf{\Gamma}_{w_{n+1}} &= \mathbf{C}_\Gamma \mathbf{\Gamma}_n +
+                \mathbf{C}_{\Gamma_w} \mathbf{\Gamma}_{w_n} \\
+                \mathbf{\Gamma}_{n+1} &= -\mathbf{A}_0^{-1} \left(
+                \mathbf{A}_{0,w}\,\mathbf{\Gamma}_{w_{n+1}} + \mathbf{W}\,\mathbf{u}_{n+1} \right)
+
+        where the wake propagation is applied by shifting the wake circulation
+        by one row, i.e. without building :math:`\mathbf{C}_\Gamma` and
+        :math:`\mathbf{C}_{\Gamma_w}`. The transpose products (``rmatvec``)
+        are also available.
+        """
+
+        MS = self.MS
+        K, K_star = self.K, self.K_star
+        Kzeta = self.Kzeta
+        Nx, Nu = self.Nx, self.Nu
+        LU = self.A0_LU
+        A0W = self.A0W
+        if self.Kin is None:
+            Ducdzeta, Wnv0 = self.Ducdzeta, self.Wnv0
+        else:
+            Nu, Wu = self.Kin.shape[1], self.Wu
+
+        def dot(A, X):
+            # product in the precision of A (see Static.lu_solve)
+            dtype = A.dtype
+            if np.iscomplexobj(X):
+                dtype = np.result_type(dtype, np.complex64)
+            return np.dot(A, np.asarray(X, dtype=dtype))
+
+        if isinstance(A0W, np.ndarray):
+            A0W_dot, A0W_rdot = lambda X: dot(A0W, X), lambda X: dot(A0W.T, X)
+        else:
+            A0W_dot, A0W_rdot = A0W.dot, A0W.rdot
+
+        if self.integr_order == 1:
+            b0, bm1, bp1 = -1., 0., 1.
+        if self.integr_order == 2:
+            b0, bm1, bp1 = -2., 0.5, 1.5
+
+        # wake shift indices: trailing edge to first wake row (iiTE -> iiW0)
+        # and wake row m-1 to row m (iiWfrom -> iiWto)
+        iiTE, iiW0, iiWfrom, iiWto = [], [], [], []
+        K0, K0star = 0, 0
+        for ss in range(MS.n_surf):
+            M, N = MS.MM[ss], MS.NN[ss]
+            Kstar_ss = MS.KK_star[ss]
+            iiTE.append(K0 + (M - 1) * N + np.arange(N))
+            iiW0.append(K0star + np.arange(N))
+            iiWfrom.append(K0star + np.arange(Kstar_ss - N))
+            iiWto.append(K0star + N + np.arange(Kstar_ss - N))
+            K0 += MS.KK[ss]
+            K0star += Kstar_ss
+        iiTE, iiW0, iiWfrom, iiWto = [np.concatenate(ii) for ii in
+                                      [iiTE, iiW0, iiWfrom, iiWto]]
+
+        def matmat_A(X):
+            X = X.reshape((Nx, -1))
+            Y = np.zeros(X.shape, dtype=np.result_type(X, 1.))
+            Y[K + iiW0] = X[iiTE]
+            Y[K + iiWto] = X[K + iiWfrom]
+            Y[:K] = -self.lu_solve(LU, A0W_dot(Y[K:K + K_star]))
+            Y[K + K_star:2 * K + K_star] = bp1 * Y[:K] + b0 * X[:K]
+            if self.integr_order == 2:
+                Y[K + K_star:2 * K + K_star] += bm1 * X[2 * K + K_star:]
+                Y[2 * K + K_star:] = X[:K]
+            return Y
+
+        def rmatmat_A(Z):
+            Z = Z.reshape((Nx, -1))
+            Y = np.zeros(Z.shape, dtype=np.result_type(Z, 1.))
+            Zdelta = Z[K + K_star:2 * K + K_star]
+            # transpose of solve and wake shift
+            Tw = Z[K:K + K_star] - A0W_rdot(self.lu_solve(
+                LU, Z[:K] + bp1 * Zdelta, trans=1))
+            Y[iiTE] = Tw[iiW0]
+            Y[K + iiWfrom] = Tw[iiWto]
+            Y[:K] += b0 * Zdelta
+            if self.integr_order == 2:
+                Y[:K] += Z[2 * K + K_star:]
+                Y[2 * K + K_star:] = bm1 * Zdelta
+            return Y
+
+        def matmat_B(U):
+            U = U.reshape((Nu, -1))
+            Y = np.zeros((Nx, U.shape[1]), dtype=np.result_type(U, 1.))
+            if self.Kin is None:
+                Y[:K] = self.lu_solve(LU,
+                                       -dot(Ducdzeta, U[:3 * Kzeta]) +
+                                       dot(Wnv0, U[3 * Kzeta:6 * Kzeta] - U[6 * Kzeta:]))
+            else:
+                Y[:K] = self.lu_solve(LU, dot(Wu, U))
+            Y[K + K_star:2 * K + K_star] = bp1 * Y[:K]
+            return Y
+
+        def rmatmat_B(Z):
+            Z = Z.reshape((Nx, -1))
+            V = self.lu_solve(LU, Z[:K] + bp1 * Z[K + K_star:2 * K + K_star], trans=1)
+            if self.Kin is not None:
+                return dot(Wu.T, V)
+            WnvV = dot(Wnv0.T, V)
+            return np.concatenate((-dot(Ducdzeta.T, V), WnvV, -WnvV))
+
+        Aop = slalg.LinearOperator((Nx, Nx),
+                                   matvec=lambda x: matmat_A(x).reshape(-1),
+                                   rmatvec=lambda x: rmatmat_A(x).reshape(-1),
+                                   matmat=matmat_A, dtype=np.float_)
+        Bop = slalg.LinearOperator((Nx, Nu),
+                                   matvec=lambda u: matmat_B(u).reshape(-1),
+                                   rmatvec=lambda x: rmatmat_B(x).reshape(-1),
+                                   matmat=matmat_B, dtype=np.float_)
+
+        return Aop, Bop
+
+    def assemble_march(self):
+        """
+        Assembles the matrices of the time-marching engine (see
+        ``march_step``), stored in the dictionary ``self.march_blocks``:
+            - ``A0_LU``: LU factors of the bound AIC matrix.
+            - ``A0W``: wake AIC matrix (dense or ``libhmat.HMatrix``).
+            - ``Wnv0``, ``Ducdzeta``: derivatives of the normal velocities at
+            the collocation points w.r.t. the input velocities and the
+            lattice vertices.
+            - ``Dfqsdgamma``, ``Dfqsdgamma_star``, ``Dfunstdgamma_dot``,
+            ``Dfqsdzeta``, ``Dfqsdu_ext``: derivatives of the forces.
+        These are the blocks of ``assemble_ss`` (see
+        ``assemble_ss_geometry_blocks`` and ``assemble_ss_flow_blocks``), and
+        are loaded from cache if available. The state-space matrices are not
+        built.
+        """
+
+        print('Assembly of UVLM time-marching engine started...')
+        t0 = time.time()
+
+        Blocks = self.get_blocks('ss_geometry', self.assemble_ss_geometry_blocks)
+        Blocks['A0_LU'] = (Blocks.pop('A0_LU'), Blocks.pop('A0_piv'))
+        Blocks.update(self.get_blocks('ss_flow', self.assemble_ss_flow_blocks))
+        self.march_blocks = Blocks
+
+        self.time_march = time.time() - t0
+        print('\t\t\t...done in %.2f sec' % self.time_march)
+
+    def march_reset(self, x0=None):
+        """
+        Resets the state of the time-marching engine (see ``march_step``). If
+        given, x0 is the state before the first time-step, in the format of
+        ``assemble_ss`` before the change of state that removes the predictor
+        term. Otherwise, the initial state is null.
+
+        The wake circulation of each surface is stored in a ring buffer of
+        shape (M_star,N): wake row m is at row (m+offset)%M_star, where the
+        offset is decreased by one at each time-step and the new wake row
+        overwrites the last one. The wake is thus propagated without moving
+        any data.
+        """
+
+        MS = self.MS
+        K, K_star = self.K, self.K_star
+        if x0 is None:
+            x0 = np.zeros((self.Nx,))
+
+        self.march_gamma = x0[:K].copy()
+        self.march_gamma_dot = x0[K + K_star:2 * K + K_star].copy()
+        self.march_gamma_old = np.zeros((K,))
+        if self.integr_order == 2:
+            self.march_gamma_old[:] = x0[2 * K + K_star:]
+        self.march_wake = []
+        self.march_offset = MS.n_surf * [0]
+        K0star = 0
+        for ss in range(MS.n_surf):
+            Kstar_ss = MS.KK_star[ss]
+            self.march_wake.append(x0[K + K0star:K + K0star + Kstar_ss].
+                                   reshape((MS.MM_star[ss], MS.NN_star[ss])).copy())
+            K0star += Kstar_ss
+
+    def march_wake_dot(self, A):
+        """
+        Returns the product between the matrix A, whose columns refer to the
+        wake panels, and the wake circulation stored in the ring buffers of
+        the time-marching engine (see ``march_reset``). For dense matrices,
+        each buffer is multiplied in two contiguous chunks. Other matrices
+        (e.g. ``libhmat.HMatrix``) are multiplied by the unrolled wake
+        circulation.
+        """
+
+        MS = self.MS
+
+        if not isinstance(A, np.ndarray):
+            return A.dot(np.concatenate([
+                np.roll(ring, -offset, axis=0).reshape(-1)
+                for ring, offset in zip(self.march_wake, self.march_offset)]))
+
+        y = np.zeros((A.shape[0],))
+        K0star = 0
+        for ss in range(MS.n_surf):
+            ring, offset = self.march_wake[ss], self.march_offset[ss]
+            M_star, N = ring.shape
+            # rows offset:M_star and 0:offset of the ring are wake rows
+            # 0:M_star-offset and M_star-offset:M_star
+            jj = K0star + (M_star - offset) * N
+            y += np.dot(A[:, K0star:jj], ring[offset:].reshape(-1))
+            y += np.dot(A[:, jj:K0star + M_star * N], ring[:offset].reshape(-1))
+            K0star += M_star * N
+
+        return y
+
+    def get_march_state(self):
+        """
+        Returns the state of the time-marching engine in the format of
+        ``assemble_ss`` (see ``march_reset``), e.g. to restart a simulation.
+        """
+
+        x = [self.march_gamma,
+             np.concatenate([np.roll(ring, -offset, axis=0).reshape(-1) for
+                             ring, offset in zip(self.march_wake, self.march_offset)]),
+             self.march_gamma_dot]
+        if self.integr_order == 2:
+            x.append(self.march_gamma_old)
+
+        return np.concatenate(x)
+
+    def march_step(self, u):
+        """
+        Advances the time-marching engine by one time-step under the input u,
+        of shape (Nu,) (see ``assemble_ss``), and returns the output (forces
+        at the lattice vertices). The outputs are the same as those of the
+        state-space model ``self.SS`` (with predictor term removed), but:
+            - the wake circulation is propagated in a ring buffer (see
+            ``march_reset``), rather than by the state matrix;
+            - the bound circulation is found through the LU factors of the
+            bound AIC matrix and the product of the wake AIC matrix with the
+            wake circulation.
+        The cost of each time-step is O(K (K + K_star + Nu) + Ny (K + K_star +
+        Nu)), instead of O(Nx^2 + Nx Nu) for the state-space model.
+
+        Requires ``assemble_march`` and ``march_reset`` to be called first.
+        The state can be retrieved through ``get_march_state``.
+        """
+
+        MS = self.MS
+        Blocks = self.march_blocks
+        Kzeta = self.Kzeta
+        zeta, zeta_dot, u_ext = u[:3 * Kzeta], u[3 * Kzeta:6 * Kzeta], u[6 * Kzeta:]
+
+        # wake propagation: trailing edge circulation to first wake row
+        K0 = 0
+        for ss in range(MS.n_surf):
+            M, N = MS.MM[ss], MS.NN[ss]
+            offset = (self.march_offset[ss] - 1) % MS.MM_star[ss]
+            self.march_wake[ss][offset] = self.march_gamma[K0 + (M - 1) * N:K0 + M * N]
+            self.march_offset[ss] = offset
+            K0 += M * N
+
+        # bound circulation
+        gamma = self.lu_solve(Blocks['A0_LU'],
+                              -self.march_wake_dot(Blocks['A0W']) -
+                              np.dot(Blocks['Ducdzeta'], zeta) +
+                              np.dot(Blocks['Wnv0'], zeta_dot - u_ext))
+        if self.integr_order == 1:
+            b0, bm1, bp1 = -1., 0., 1.
+        if self.integr_order == 2:
+            b0, bm1, bp1 = -2., 0.5, 1.5
+        gamma_dot = bp1 * gamma + b0 * self.march_gamma + bm1 * self.march_gamma_old
+        self.march_gamma_old = self.march_gamma
+        self.march_gamma = gamma
+        self.march_gamma_dot = gamma_dot
+
+        # output
+        y = np.dot(Blocks['Dfqsdgamma'], gamma) + \
+            self.march_wake_dot(Blocks['Dfqsdgamma_star']) + \
+            np.dot(Blocks['Dfqsdzeta'], zeta) + \
+            Blocks['Dfqsdu_ext'].dot(u_ext)
+        if self.include_added_mass:
+            y += np.dot(Blocks['Dfunstdgamma_dot'], gamma_dot) / self.dt - \
+                 Blocks['Dfqsdu_ext'].dot(zeta_dot)
+
+        return y
+
+    def march(self, Ustream, x0=None):
+        """
+        Generator of the outputs of the time-marching engine (see
+        ``march_step``) for the inputs of the iterable Ustream, e.g. a list,
+        an array of shape (NT,Nu) or a generator reading a gust record. The
+        engine is reset to the initial state x0 (see ``march_reset``), and is
+        assembled if required (see ``assemble_march``). Only one input and
+        output are held in memory at a time.
+
+        Example:
+            Y = np.array(list(Dyn.march(U)))
+        is equivalent to ``libss.simulate(Dyn.SS, U)[0]`` (with zero initial
+        state).
+        """
+
+        if not hasattr(self, 'march_blocks'):
+            self.assemble_march()
+        self.march_reset(x0)
+        for u in Ustream:
+            yield self.march_step(np.asarray(u))
+
+    def fold_wake(self, A, z):
+        """
+        Returns the matrix A, whose columns refer to the wake panels, folded
+        onto the trailing edge panels of each surface at the frequency z of
+        the z-transform. As the wake circulation obeys a pure delay line, the
+        circulation of wake row m is that of the trailing edge delayed by m+1
+        time-steps, i.e.
+            gamma_w[m] = z^-(m+1) gamma_TE
+        A can be a dense matrix or any instance with a ``dot`` method (e.g.
+        ``libhmat.HMatrix``).
+        """
+
+        MS = self.MS
+        Zpow = [z ** -(np.arange(MS.MM_star[ss]) + 1.) for ss in range(MS.n_surf)]
+
+        if isinstance(A, np.ndarray):
+            Afold, K0star = [], 0
+            for ss in range(MS.n_surf):
+                M_star, N = MS.MM_star[ss], MS.NN_star[ss]
+                Afold.append(np.einsum('kmn,m->kn', A[:, K0star:K0star +
+                             M_star * N].reshape((-1, M_star, N)), Zpow[ss]))
+                K0star += M_star * N
+            return np.concatenate(Afold, axis=1)
+
+        Zfold = np.zeros((self.K_star, sum(MS.NN_star)), dtype=np.complex_)
+        K0star, N0 = 0, 0
+        for ss in range(MS.n_surf):
+            M_star, N = MS.MM_star[ss], MS.NN_star[ss]
+            Zfold[K0star:K0star + M_star * N, N0:N0 + N] = \
+                np.kron(Zpow[ss].reshape((-1, 1)), np.eye(N))
+            K0star += M_star * N
+            N0 += N
+
+        return A.dot(Zfold.real) + 1.j * A.dot(Zfold.imag)
+
+    def freqresp(self, wv):
+        """
+        Frequency response of the UVLM at the frequencies wv [rad/s], with
+        output of shape (Ny,Nu,len(wv)), as ``libss.freqresp`` for the
+        (dimensional) state-space model ``self.SS``.
+
+        The wake circulation is eliminated analytically (see ``fold_wake``),
+        leaving at each frequency the K x K system for the bound circulation:
+
+            .. math::
+                (\\mathbf{A}_0 + \\mathbf{A}_{0,w}(z)\\,\\mathbf{E}^T)\\,\\mathbf{\\Gamma}
+                = -\\mathbf{D}_{uc,\\zeta}\\,\\mathbf{\\zeta} +
+                \\mathbf{W}\\,(\\mathbf{\\zeta}' - \\mathbf{u}_{ext})
+
+        where :math:`\\mathbf{A}_{0,w}(z)` is the folded wake AIC matrix and
+        :math:`\\mathbf{E}` selects the trailing edge panels. As the wake only
+        contributes to the columns of the trailing edge panels, the system is
+        solved through the LU factors of :math:`\\mathbf{A}_0` and a dense
+        system of the size of the trailing edge panels (Woodbury identity).
+        The time derivative of the circulation is obtained from the
+        integration scheme, :math:`\\Delta t\\,\\mathbf{\\Gamma}' =
+        (b_{p1} + b_0 z^{-1} + b_{m1} z^{-2})\\,\\mathbf{\\Gamma}`.
+
+        The matrices are those of the time-marching engine (see
+        ``assemble_march``), which is assembled if required. The state-space
+        matrices are not used, but the input and output bases ``self.Kin`` and
+        ``self.Kout`` of ``assemble_ss`` are applied, if given.
+
+        For the matrix-free realisation (``self.matrix_free = True``), this
+        method should be used instead of ``libss.freqresp``, which would
+        require one unpreconditioned GMRES solution per input and frequency.
+        """
+
+        if not hasattr(self, 'march_blocks'):
+            self.assemble_march()
+        Blocks = self.march_blocks
+        MS = self.MS
+        Kzeta = self.Kzeta
+        Kin, Kout = self.Kin, self.Kout
+
+        if self.integr_order == 1:
+            b0, bm1, bp1 = -1., 0., 1.
+        if self.integr_order == 2:
+            b0, bm1, bp1 = -2., 0.5, 1.5
+
+        iiTE, K0 = [], 0
+        for ss in range(MS.n_surf):
+            iiTE.append(K0 + MS.KK[ss] - MS.NN[ss] + np.arange(MS.NN[ss]))
+            K0 += MS.KK[ss]
+        iiTE = np.concatenate(iiTE)
+        Eye = np.eye(len(iiTE))
+
+        # frequency independent terms
+        LU = Blocks['A0_LU']
+        if Kin is None:
+            AinvWnv0 = self.lu_solve(LU, Blocks['Wnv0'])
+            AinvB = np.block([-self.lu_solve(LU, Blocks['Ducdzeta']), AinvWnv0, -AinvWnv0])
+            del AinvWnv0
+            Dss = np.zeros((self.Ny, self.Nu))
+            Dss[:, :3 * Kzeta] = Blocks['Dfqsdzeta']
+            Dss[:, 6 * Kzeta:] = Blocks['Dfqsdu_ext'].toarray()
+            if self.include_added_mass:
+                Dss[:, 3 * Kzeta:6 * Kzeta] = -Dss[:, 6 * Kzeta:]
+        else:
+            AinvB = self.lu_solve(LU, self.project_inputs(Blocks['Ducdzeta'], Blocks['Wnv0'], Kin))
+            Kin_zeta, Kin_zeta_dot, Kin_u_ext = \
+                Kin[:3 * Kzeta], Kin[3 * Kzeta:6 * Kzeta], Kin[6 * Kzeta:]
+            if self.include_added_mass:
+                Kin_u_ext = Kin_u_ext - Kin_zeta_dot
+            Dss = libss.dot(Blocks['Dfqsdzeta'], Kin_zeta) + \
+                libss.dot(Blocks['Dfqsdu_ext'], Kin_u_ext)
+        Dfqsdgamma, Dfqsdgamma_star, Dfunstdgamma_dot = \
+            Blocks['Dfqsdgamma'], Blocks['Dfqsdgamma_star'], Blocks['Dfunstdgamma_dot']
+        if Kout is not None:
+            Dss = libss.dot(Kout, Dss)
+            Dfqsdgamma, Dfqsdgamma_star, Dfunstdgamma_dot = \
+                [libss.dot(Kout, dd) for dd in (Dfqsdgamma, Dfqsdgamma_star, Dfunstdgamma_dot)]
+
+        zv = np.exp(1.j * self.dt * np.asarray(wv))
+        Yfreq = np.empty((Dss.shape[0], Dss.shape[1], len(zv)), dtype=np.complex_)
+        for ii in range(len(zv)):
+            z = zv[ii]
+            # bound circulation (Woodbury identity)
+            G = self.lu_solve(LU, self.fold_wake(Blocks['A0W'], z))
+            gamma_TE = np.linalg.solve(Eye + G[iiTE], AinvB[iiTE])
+            gamma = AinvB - np.dot(G, gamma_TE)
+
+            Y = np.dot(Dfqsdgamma, gamma) + \
+                np.dot(self.fold_wake(Dfqsdgamma_star, z), gamma_TE)
+            if self.include_added_mass:
+                Y += (bp1 + b0 / z + bm1 / z ** 2) / self.dt * \
+                     np.dot(Dfunstdgamma_dot, gamma)
+            Yfreq[:, :, ii] = Y + Dss
+
+        return Yfreq
+
     def solve_steady(self, usta, method='direct'):
         """
         Steady state solution from state-space model.
@@ -663,6 +1997,11 @@ class Dynamic(Static):
 
         Ass, Bss, Css, Dss = self.SS.A, self.SS.B, self.SS.C, self.SS.D
 
+        if (self.use_sparse or self.matrix_free) and \
+                method in ['minsize', 'subsystem']:
+            raise NameError('Method %s not available for sparse or matrix-free '
+                            'state-space models' % method)
+
         if method == 'minsize':
             # as opposed to linuvlm.Static, this solves for the bound circulation
             # starting from
@@ -737,9 +2076,19 @@ class Dynamic(Static):
 
         elif method == 'direct':
             """ Solves (I - A) x = B u with direct method"""
-            Ass_steady = np.eye(*Ass.shape) - Ass
-            xsta = np.linalg.solve(Ass_steady, np.dot(Bss, usta))
-            ysta = np.dot(Css, xsta) + np.dot(Dss, usta)
+            if self.matrix_free:
+                Ass_steady = slalg.aslinearoperator(sparse.identity(Ass.shape[0])) - Ass
+                xsta, info = libss.krylov(slalg.gmres, Ass_steady,
+                                          libss.dot(Bss, usta), 1e-12, atol=0.)
+                if info != 0:
+                    raise NameError('GMRES did not converge (info=%d)' % info)
+            elif self.use_sparse:
+                Ass_steady = sparse.identity(Ass.shape[0], format='csc') - Ass.tocsr()
+                xsta = sparse.linalg.spsolve(Ass_steady.tocsc(), libss.dot(Bss, usta))
+            else:
+                Ass_steady = np.eye(*Ass.shape) - Ass
+                xsta = np.linalg.solve(Ass_steady, np.dot(Bss, usta))
+            ysta = libss.dot(Css, xsta) + libss.dot(Dss, usta)
 
 
         elif method == 'recursive':
@@ -749,8 +2098,8 @@ class Dynamic(Static):
             nn = 0
             xsta = np.zeros((self.Nx))
             while er > tol and nn < 1000:
-                xsta = np.dot(Ass, xsta) + np.dot(Bss, usta)
-                ysta = np.dot(Css, xsta) + np.dot(Dss, usta)
+                xsta = libss.dot(Ass, xsta) + libss.dot(Bss, usta)
+                ysta = libss.dot(Css, xsta) + libss.dot(Dss, usta)
                 Ftot = np.array(
                     [np.sum(ysta[cc * self.Kzeta:(cc + 1) * self.Kzeta])
                      for cc in range(3)])
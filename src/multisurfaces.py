@@ -6,6 +6,7 @@ S. Maraniello, 25 May 2018
 import numpy as np
 import libuvlm
 import gridmapping, surface
+import libsym
 import assembly
 # from IPython import embed
 
@@ -15,12 +16,26 @@ class MultiAeroGridSurfaces():
 	Creates and assembles multiple aerodynamic surfaces from data
 	'''
 
-	def __init__(self,tsdata,omega=np.zeros((3),)):
+	def __init__(self,tsdata,omega=np.zeros((3),),backend=None,
+											  backend_star=None,symmetry=None):
 		'''
 		Initialise rom data structure at time step.
 		omega: rotation speed of the A FoR [rad/s]
+		backend: kernels backend of all surfaces (see kernels module). If None,
+		the process default is used.
+		backend_star: kernels backend of the wake surfaces, if different from
+		backend (e.g. 'treecode' for long wakes).
+		symmetry: if 'sym' or 'anti', tsdata only contains one half of a
+		lattice symmetric about the xz plane, and the image of each surface is
+		accounted for in the induced velocities, AICs and their derivatives,
+		with symmetric or antisymmetric perturbations (see libsym).
 		'''
 
+		if backend_star is None:
+			backend_star=backend
+		self.symmetry=symmetry
+		fact_img=libsym.get_factor(symmetry)
+
 		self.tsdata0=tsdata
 		self.n_surf=tsdata.n_surf
 		self.dimensions=tsdata.dimensions
@@ -51,6 +66,8 @@ class MultiAeroGridSurfaces():
 					gamma_dot=tsdata.gamma_dot[ss],
 					rho=tsdata.rho,
 					omega=omega)
+			Surf.backend=backend
+			Surf.symmetry=fact_img
 			# generate geometry data
 			Surf.generate_areas()
 			Surf.generate_normals()
@@ -69,6 +86,8 @@ class MultiAeroGridSurfaces():
 			Surf=surface.AeroGridSurface(Map,
 						  zeta=tsdata.zeta_star[ss],gamma=tsdata.gamma_star[ss],
 						  rho=tsdata.rho)
+			Surf.backend=backend_star
+			Surf.symmetry=fact_img
 			self.Surfs_star.append(Surf)
 			# store size
 			self.MM_star.append(M)
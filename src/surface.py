@@ -6,6 +6,10 @@ S. Maraniello, 20 May 2018
 import numpy as np
 import itertools
 import libuvlm
+import libalg
+import lib_vbiot
+import libsym
+import kernels
 # from IPython import embed
 
 dmver=np.array([ 0, 1, 1, 0]) # delta to go from (m,n) panel to (m,n) vertices
@@ -13,9 +17,7 @@ dnver=np.array([ 0, 0, 1, 1])
 
 
 import ctypes as ct
-import os
-lib_path=os.environ["DIRuvlm3d"]+'/../cpp/cpplibs.so'
-libc = ct.CDLL(lib_path)
+from kernels import libc
 
 
 class AeroGridGeo():
@@ -55,9 +57,55 @@ class AeroGridGeo():
 
 	# -------------------------------------------------------------------------
 
+	@property
+	def zeta(self):
+		return self._zeta
+
+	@zeta.setter
+	def zeta(self,zeta):
+		self._zeta=zeta
+		self.reset_panel_vertices()
+
+
+	def reset_panel_vertices(self):
+		'''
+		Drops the cached panel vertices coordinates (see get_panel_vertices).
+		This is done automatically when self.zeta is assigned or modified in
+		place.
+		'''
+		self._zeta_panels=None
+		self._zeta_ref=None
+
+
+	def get_panel_vertices(self):
+		'''
+		Returns the coordinates of the vertices of all panels as a contiguous,
+		read-only, (K,4,3) array, where:
+			[1d index of panel, vertex 0,1,2 or 3, component x,y or z]
+		The array is gathered from self.zeta through the index table
+		self.maps.Mpv1d_vector and cached until self.zeta changes. To detect
+		in-place changes, self.zeta is compared against a copy of the vertices
+		the cache was built from (3*Kzeta values, against the 12*K values
+		gathered).
+		'''
+
+		if self._zeta_panels is None or \
+								not np.array_equal(self.zeta,self._zeta_ref):
+			Ind=self.maps.map_panels_to_vertices_1D_vector()
+			ZetaPanels=np.ascontiguousarray(
+					   self.zeta.reshape((3,-1))[:,Ind[:,:,0]].transpose((1,2,0)))
+			ZetaPanels.flags.writeable=False
+			self._zeta_panels=ZetaPanels
+			self._zeta_ref=np.array(self.zeta)
+
+		return self._zeta_panels
+
+
 	def get_panel_vertices_coords(self,m,n):
 		'''
-		Retrieves coordinates of panel (m,n) vertices.
+		Retrieves coordinates of panel (m,n) vertices. The output is a
+		read-only view of the cached array returned by get_panel_vertices.
+		When looping over the panels, call get_panel_vertices once instead.
 		'''
 
 		###
@@ -75,7 +123,10 @@ class AeroGridGeo():
 		###
 		# return self.zeta[:,dmver+m,dnver+n].T
 
-		return self.zeta[:, [m+0,m+1,m+1,m+0], [n+0,n+0,n+1,n+1]].T
+		###
+		# return self.zeta[:, [m+0,m+1,m+1,m+0], [n+0,n+0,n+1,n+1]].T
+
+		return self.get_panel_vertices()[m*self.maps.N+n]
 
 
 	# ------------------------------------------------------- get panel normals
@@ -85,9 +136,10 @@ class AeroGridGeo():
 		M,N=self.maps.M,self.maps.N
 		self.normals=np.zeros((3,M,N))
 
+		ZetaPanels=self.get_panel_vertices()
 		for mm in range(M):
 			for nn in range(N):
-				zetav_here=self.get_panel_vertices_coords(mm,nn)
+				zetav_here=ZetaPanels[mm*N+nn]
 				self.normals[:,mm,nn]=libuvlm.panel_normal(zetav_here)
 
 
@@ -98,9 +150,10 @@ class AeroGridGeo():
 		M,N=self.maps.M,self.maps.N
 		self.areas=np.zeros((M,N))
 
+		ZetaPanels=self.get_panel_vertices()
 		for mm in range(M):
 			for nn in range(N):
-				zetav_here=self.get_panel_vertices_coords(mm,nn)
+				zetav_here=ZetaPanels[mm*N+nn]
 				self.areas[mm,nn]=libuvlm.panel_area(zetav_here)
 
 
@@ -146,9 +199,10 @@ class AeroGridGeo():
 											   # when passing self.zetac[:,x,x] to
 											   # C written libraries.
 
+		ZetaPanels=self.get_panel_vertices()
 		for mm in range(M):
 			for nn in range(N):
-				zetav_here=self.get_panel_vertices_coords(mm,nn)
+				zetav_here=ZetaPanels[mm*N+nn]
 				self.zetac[:,mm,nn]=self.get_panel_collocation(zetav_here)
 
 
@@ -180,38 +234,45 @@ class AeroGridGeo():
 		'''
 
 		M,N=self.maps.M,self.maps.N
-		#embed()
 		inshape=q_vert.shape
 		assert inshape[-2]==M+1 and inshape[-1]==N+1, 'Unexpected shape of q_vert'
+		if len(inshape) not in [2,3]:
+			raise NameError('Unexpected shape of q_vert')
 
 		# determine weights
 		wcv=self.get_panel_wcv()
 
-		if len(inshape)==2:
-			q_coll=np.zeros((M,N))
-			for mm in range(M):
-				for nn in range(N):
-					# get q_vert at panel corners
-					mpv=self.maps.from_panel_to_vertices(mm,nn)
-					for vv in range(4):
-						q_coll[mm,nn]=q_coll[mm,nn]+\
-										     wcv[vv]*q_vert[mpv[vv,0],mpv[vv,1]]
-
-		elif len(inshape)==3:
-			q_coll=np.zeros((3,M,N))
-			for mm in range(M):
-				for nn in range(N):
-					# get q_vert at panel corners
-					mpv=self.maps.from_panel_to_vertices(mm,nn)
-					for vv in range(4):
-						q_coll[:,mm,nn]=q_coll[:,mm,nn]+\
-										   wcv[vv]*q_vert[:,mpv[vv,0],mpv[vv,1]]
-		else:
-			raise NameError('Unexpected shape of q_vert')
+		# sum over panel corners
+		q_coll=np.zeros(inshape[:-2]+(M,N))
+		for vv in range(4):
+			q_coll+=wcv[vv]*q_vert[...,dmver[vv]:dmver[vv]+M,dnver[vv]:dnver[vv]+N]
 
 		return q_coll
 
 
+	def interp_vertex_to_segments(self,q_vert):
+		'''
+		Interpolates a vector quantity q_vert, defined at the vertices, to the
+		mid-point of each panel segment. The output is in the redundant format
+		(3,4,M,N) (see get_input_velocities_at_segments).
+		'''
+
+		M,N=self.maps.M,self.maps.N
+		assert q_vert.shape==(3,M+1,N+1), 'Unexpected shape of q_vert'
+
+		# chord-wise (m,n)->(m+1,n) and span-wise (m,n)->(m,n+1) edges
+		q_chord=.5*(q_vert[:,:-1,:]+q_vert[:,1:,:])
+		q_span=.5*(q_vert[:,:,:-1]+q_vert[:,:,1:])
+
+		q_seg=np.empty((3,4,M,N))
+		q_seg[:,0,:,:]=q_chord[:,:,:-1]
+		q_seg[:,1,:,:]=q_span[:,1:,:]
+		q_seg[:,2,:,:]=q_chord[:,:,1:]
+		q_seg[:,3,:,:]=q_span[:,:-1,:]
+
+		return q_seg
+
+
 	def project_coll_to_normal(self,q_coll):
 		'''
 		Project a vector quantity q_coll defined at collocation points to normal.
@@ -292,6 +353,8 @@ class AeroGridSurface(AeroGridGeo):
 		self.gamma_dot=gamma_dot
 		self.rho=rho
 		self.omega=omega
+		self.backend=None # kernels backend (None: use process default)
+		self.symmetry=None # image perturbation factor (None: no image, see libsym)
 
 		msg_out='wrong input shape!'
 		assert self.gamma.shape==(self.maps.M,self.maps.N), msg_out
@@ -304,31 +367,37 @@ class AeroGridSurface(AeroGridGeo):
 
 	# -------------------------------------------------------- input velocities
 
-	def get_input_velocities_at_collocation_points(self):
+	def get_input_velocities_at_vertices(self):
 		'''
-		Returns velocities at collocation points from nodal values u_ext and
-		zeta_dot of shape (3,M+1,N+1).
-
-		Remark: u_input_coll=Wcv*(u_ext-zet_dot) does not depend on the
-		coordinates zeta.
-
-        2018/08/24: Include effects due to rotation (omega x zeta). Now it
-        depends on the coordinates zeta
+		Returns the input velocities at the vertices, u_ext-zeta_dot-omega x zeta,
+		with shape (3,M+1,N+1).
 		'''
 
 		# define total velocity
 		if self.zeta_dot is not None:
 			u_tot=self.u_ext-self.zeta_dot
 		else:
-			u_tot=self.u_ext
+			u_tot=self.u_ext.copy()
 
 		# Include rotation
-		for i_m in range(self.maps.M+1):
-			for i_n in range(self.maps.N+1):
-				#print(u_tot[:,i_m,i_n])
-				#print(np.cross(self.omega,self.zeta[:,i_m,i_n]))
-				u_tot[:,i_m,i_n] -= np.cross(self.omega,self.zeta[:,i_m,i_n])
+		u_tot-=np.cross(self.omega,self.zeta,axisb=0,axisc=0)
+
+		return u_tot
+
+
+	def get_input_velocities_at_collocation_points(self):
+		'''
+		Returns velocities at collocation points from nodal values u_ext and
+		zeta_dot of shape (3,M+1,N+1).
 
+		Remark: u_input_coll=Wcv*(u_ext-zet_dot) does not depend on the
+		coordinates zeta.
+
+		2018/08/24: Include effects due to rotation (omega x zeta). Now it
+		depends on the coordinates zeta
+		'''
+
+		u_tot=self.get_input_velocities_at_vertices()
 		self.u_input_coll=self.interp_vertex_to_coll(u_tot)
 
 
@@ -355,76 +424,16 @@ class AeroGridSurface(AeroGridGeo):
 			(3,4,M,N)
 		where the element
 			(:,ss,mm,nn)
-		is the induced velocity over the ss-th segment of panel (mm,nn). A fast
-		looping is implemented to re-use previously computed velocities
+		is the induced velocity over the ss-th segment of panel (mm,nn). The
+		velocity at each chord-wise and span-wise edge is computed once and
+		shared by the panels the edge belongs to.
 
-        2018/08/24: Include effects due to rotation (omega x zeta). Now it
-        depends on the coordinates zeta
+		2018/08/24: Include effects due to rotation (omega x zeta). Now it
+		depends on the coordinates zeta
 		'''
 
-		# define total velocity
-		if self.zeta_dot is not None:
-			u_tot=self.u_ext-self.zeta_dot
-		else:
-			u_tot=self.u_ext
-
-        # Include rotation
-		for i_m in range(self.maps.M+1):
-			for i_n in range(self.maps.N+1):
-				u_tot[:,i_m,i_n] -= np.cross(self.omega,self.zeta[:,i_m,i_n])
-
-		M,N=self.maps.M,self.maps.N
-		self.u_input_seg=np.empty((3,4,M,N))
-
-
-		# indiced as per self.maps
-		dmver=[ 0, 1, 1, 0] # delta to go from (m,n) panel to (m,n) vertices
-		dnver=[ 0, 0, 1, 1]
-		svec =[ 0, 1, 2, 3] # seg. no.
-		avec =[ 0, 1, 2, 3] # 1st vertex no.
-		bvec =[ 1, 2, 3, 0] # 2nd vertex no.
-
-		##### panel (0,0): compute all
-		mm,nn=0,0
-		for ss,aa,bb in zip(svec,avec,bvec):
-			uA=u_tot[:,mm+dmver[aa],nn+dnver[aa]]
-			uB=u_tot[:,mm+dmver[bb],nn+dnver[bb]]
-			self.u_input_seg[:,ss,mm,nn]=.5*(uA+uB)
-
-		##### panels n=0: copy seg.3
-		nn=0
-		svec=[0,1,2] # seg. no.
-		avec=[0,1,2] # 1st vertex no.
-		bvec=[1,2,3] # 2nd vertex no.
-		for mm in range(1,M):
-			for ss,aa,bb in zip(svec,avec,bvec):
-				uA=u_tot[:,mm+dmver[aa],nn+dnver[aa]]
-				uB=u_tot[:,mm+dmver[bb],nn+dnver[bb]]
-				self.u_input_seg[:,ss,mm,nn]=.5*(uA+uB)
-			self.u_input_seg[:,3,mm,nn]=self.u_input_seg[:,1,mm-1,nn]
-		##### panels m=0: copy seg.0
-		mm=0
-		svec=[1,2,3] # seg. number
-		avec=[1,2,3] # 1st vertex of seg.
-		bvec=[2,3,0] # 2nd vertex of seg.
-		for nn in range(1,N):
-			for ss,aa,bb in zip(svec,avec,bvec):
-				uA=u_tot[:,mm+dmver[aa],nn+dnver[aa]]
-				uB=u_tot[:,mm+dmver[bb],nn+dnver[bb]]
-				self.u_input_seg[:,ss,mm,nn]=.5*(uA+uB)
-			self.u_input_seg[:,0,mm,nn]=self.u_input_seg[:,2,mm,nn-1]
-		##### all others: copy seg. 0 and 3
-		svec=[1,2] # seg. number
-		avec=[1,2] # 1st vertex of seg.
-		bvec=[2,3] # 2nd vertex of seg.
-		for pp in itertools.product(range(1,M),range(1,N)):
-			mm,nn=pp
-			for ss,aa,bb in zip(svec,avec,bvec):
-				uA=u_tot[:,mm+dmver[aa],nn+dnver[aa]]
-				uB=u_tot[:,mm+dmver[bb],nn+dnver[bb]]
-				self.u_input_seg[:,ss,mm,nn]=.5*(uA+uB)
-			self.u_input_seg[:,0,mm,nn]=self.u_input_seg[:,2,mm,nn-1]
-			self.u_input_seg[:,3,mm,nn]=self.u_input_seg[:,1,mm-1,nn]
+		u_tot=self.get_input_velocities_at_vertices()
+		self.u_input_seg=self.interp_vertex_to_segments(u_tot)
 
 		return self
 
@@ -441,10 +450,11 @@ class AeroGridSurface(AeroGridGeo):
 		uind_target=np.zeros((3,),order='C')
 		#uind_ref=np.zeros((3,),order='C')
 
+		ZetaPanels=self.get_panel_vertices()
 		for mm in range(M):
 			for nn in range(N):
 				# panel info
-				zetav_here=self.get_panel_vertices_coords(mm,nn)
+				zetav_here=ZetaPanels[mm*N+nn]
 				uind_target+=libuvlm.biot_panel_cpp(zeta_target,
 												   zetav_here,self.gamma[mm,nn])
 
@@ -482,14 +492,11 @@ class AeroGridSurface(AeroGridGeo):
 		K=self.maps.K
 		aic3=np.zeros((3,K))
 
+		ZetaPanels=self.get_panel_vertices()
 		for cc in range(K):
 
-			# define panel
-			mm=self.maps.ind_2d_pan_scal[0][cc]
-			nn=self.maps.ind_2d_pan_scal[1][cc]
-
 			# get panel coordinates
-			zetav_here=self.get_panel_vertices_coords(mm,nn)
+			zetav_here=ZetaPanels[cc]
 			aic3[:,cc]=libuvlm.biot_panel_cpp(zeta_target,zetav_here,gamma=1.0)
 
 		return aic3
@@ -516,9 +523,25 @@ class AeroGridSurface(AeroGridGeo):
 		return aic3
 
 
+	def get_aic_batch_cpp(self,zeta_target,normals=None):
+		'''
+		Produces influence coefficient matrices to calculate the induced
+		velocity at a set of target points in one call. The targets are given
+		in grid format, zeta_target.shape=(3,M_trg,N_trg) (e.g. the zetac array
+		of a surface), or as a (3,K_trg) array. Targets are numbered in C order
+		over the grid, i.e. cc=m*N_trg+n.
+
+		If normals (same format as zeta_target) are given, the induced velocity
+		is projected and the AIC matrix has shape (K_trg,K). Otherwise, the
+		AIC matrix has shape (3,K_trg,K).
+		'''
+
+		return kernels.aic3_cpp(zeta_target,self.zeta,normals)
+
+
 
 	def get_induced_velocity_over_surface(self,Surf_target,
-											target='collocation',Project=False):
+							  target='collocation',Project=False,backend=None):
 		'''
 		Computes induced velocity over an instance of AeroGridSurface, where
 		target specifies the target grid (collocation or segments). If Project
@@ -534,94 +557,55 @@ class AeroGridSurface(AeroGridGeo):
 			(3,4,M,N)
 		where the element
 			(:,ss,mm,nn)
-		is the induced velocity over the ss-th segment of panel (mm,nn). A fast
-		looping is implemented to re-use previously computed velocities
+		is the induced velocity over the ss-th segment of panel (mm,nn). The
+		velocities are computed only once for each segment shared by two panels
+		(see lib_vbiot.get_edges) and then copied. If target=='edges', the
+		velocities at the mid-point of each unique edge are returned instead,
+		with shape (3,Nedges) (see gridmapping.AeroGridMap.map_edges).
+
+		The kernels used are those of the backend of name backend (see kernels
+		module). If None, the backend attribute of the surface is used.
+
+		If the surface has an image (see symmetry attribute and libsym module),
+		the velocity induced by the image is included.
 		'''
 
 		M_trg=Surf_target.maps.M
 		N_trg=Surf_target.maps.N
+		Kern=kernels.get(backend if backend is not None else self.backend)
+
+		def ind_vel(zeta_target):
+			Uind=Kern.ind_vel(zeta_target,self.zeta,self.gamma)
+			if self.symmetry is not None:
+				# reference state is symmetric
+				Uind+=Kern.ind_vel(zeta_target,*libsym.get_image(self.zeta,
+																   self.gamma))
+			return Uind
 
 		if target=='collocation':
 			if not hasattr(Surf_target,'zetac'):
 				Surf_target.generate_collocations()
-			ZetaTarget=Surf_target.zetac
+			Uind=ind_vel(Surf_target.zetac)
 
 			if Project:
 				if not hasattr(Surf_target,'normals'):
 					Surf_target.generate_normals()
-				Uind=np.empty((M_trg,N_trg))
-			else:
-				Uind=np.empty((3,M_trg,N_trg))
-
-			# loop target points
-			for pp in itertools.product(range(M_trg),range(N_trg)):
-				mm,nn=pp
-				uind=self.get_induced_velocity_cpp(ZetaTarget[:,mm,nn])
-				if Project:
-					Uind[mm,nn]=np.dot(uind,Surf_target.normals[:,mm,nn])
-				else:
-					Uind[:,mm,nn]=uind
-
-		if target=='segments':
+				Uind=np.sum(Uind*Surf_target.normals,axis=0)
 
+		if target in ['segments','edges']:
 			if Project:
 				raise NameError('Normal not defined for segment')
 
-			Uind=np.zeros((3,4,M_trg,N_trg))
-
-			##### panel (0,0): compute all
-			mm,nn=0,0
-			svec=[0,1,2,3] # seg. number
-			avec=[0,1,2,3] # 1st vertex of seg.
-			bvec=[1,2,3,0] # 2nd vertex of seg.
-			zetav_here=Surf_target.get_panel_vertices_coords(mm,nn)
-			for ss,aa,bb in zip(svec,avec,bvec):
-				zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-				Uind[:,ss,mm,nn]=self.get_induced_velocity_cpp(zeta_mid)
-
-			##### panels n=0: copy seg.3
-			nn=0
-			svec=[0,1,2] # seg. number
-			avec=[0,1,2] # 1st vertex of seg.
-			bvec=[1,2,3] # 2nd vertex of seg.
-			for mm in range(1,M_trg):
-				zetav_here=Surf_target.get_panel_vertices_coords(mm,nn)
-				for ss,aa,bb in zip(svec,avec,bvec):
-					zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-					Uind[:,ss,mm,nn]=self.get_induced_velocity_cpp(zeta_mid)
-				Uind[:,3,mm,nn]=Uind[:,1,mm-1,nn]
-
-			##### panels m=0: copy seg.0
-			mm=0
-			svec=[1,2,3] # seg. number
-			avec=[1,2,3] # 1st vertex of seg.
-			bvec=[2,3,0] # 2nd vertex of seg.
-			for nn in range(1,N_trg):
-				zetav_here=Surf_target.get_panel_vertices_coords(mm,nn)
-				for ss,aa,bb in zip(svec,avec,bvec):
-					zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-					Uind[:,ss,mm,nn]=self.get_induced_velocity_cpp(zeta_mid)
-				Uind[:,0,mm,nn]=Uind[:,2,mm,nn-1]
-
-			##### all others: copy seg. 0 and 3
-			svec=[1,2] # seg. number
-			avec=[1,2] # 1st vertex of seg.
-			bvec=[2,3] # 2nd vertex of seg.
-			for pp in itertools.product(range(1,M_trg),range(1,N_trg)):
-				mm,nn=pp
-				zetav_here=Surf_target.get_panel_vertices_coords(*pp)
-				for ss,aa,bb in zip(svec,avec,bvec):
-					zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-					Uind[:,ss,mm,nn]=self.get_induced_velocity_cpp(zeta_mid)
-				Uind[:,0,mm,nn]=Uind[:,2,mm,nn-1]
-				Uind[:,3,mm,nn]=Uind[:,1,mm-1,nn]
+			Uind=ind_vel(lib_vbiot.get_midsegments(Surf_target.zeta))
+			if target=='segments':
+				Uind=lib_vbiot.from_edges_to_segments(Uind,M_trg,N_trg)
 
 		return Uind
 
 
 
 	def get_aic_over_surface(self,Surf_target,
-											 target='collocation',Project=True):
+				   target='collocation',Project=True,backend=None,fold=False):
 		'''
 		Produces influence coefficient matrices such that the velocity induced
 		over the Surface_target is given by the product:
@@ -639,93 +623,70 @@ class AeroGridSurface(AeroGridGeo):
 				AIC[:,:,ss,mm,nn]
 			is the influence coefficient matrix associated to the induced
 			velocity at segment ss of panel (mm,nn)
+
+		if target=='edges':
+			- AIC has shape (3,Nedges_out,self.maps.K), such that
+				AIC[:,ee,:]
+			is the influence coefficient matrix associated to the induced
+			velocity at the mid-point of the ee-th unique edge of Surf_target
+			(see gridmapping.AeroGridMap.map_edges). This requires about half
+			the memory of the 'segments' format.
+
+		All target points are evaluated in one call. The kernels used are those
+		of the backend of name backend (see kernels module). If None, the
+		backend attribute of the surface is used.
+
+		If fold is True, the surface is a steady wake and the AIC is produced in
+		folded format, i.e. with one column per span-wise strip of panels (see
+		lib_vbiot.aic3_folded). This is only available for target='collocation'
+		and always uses the vectorised NumPy routines.
+
+		If the surface has an image (see symmetry attribute and libsym module),
+		the AIC of the image is folded onto the columns of the surface panels.
 		'''
 
-		K_in=self.maps.K
+		Kern=kernels.get(backend if backend is not None else self.backend)
+		M,N=self.maps.M,self.maps.N
+		if self.symmetry is not None:
+			zeta_img=libsym.get_image(self.zeta)
 
 		if target=='collocation':
 
-			K_out=Surf_target.maps.K
 			if not hasattr(Surf_target,'zetac'):
 				Surf_target.generate_collocations()
-			ZetaTarget=Surf_target.zetac
 
+			Normals=None
 			if Project:
 				if not hasattr(Surf_target,'normals'):
 					Surf_target.generate_normals()
-				AIC=np.empty((K_out,K_in))
-			else:
-				AIC=np.empty((3,K_out,K_in))
-
-			# loop target points
-			for cc in range(K_out):
-				# retrieve panel coords
-				mm=Surf_target.maps.ind_2d_pan_scal[0][cc]
-				nn=Surf_target.maps.ind_2d_pan_scal[1][cc]
-				# retrieve influence coefficients
-				#ref_aic3=self.get_aic3(ZetaTarget[:,mm,nn])
-				aic3=self.get_aic3_cpp(ZetaTarget[:,mm,nn])
-				#assert np.max(np.abs(aic3-ref_aic3))<1e-13, embed()
-
-				if Project:
-					AIC[cc,:]=np.dot(Surf_target.normals[:,mm,nn],aic3)
-				else:
-					AIC[:,cc,:]=aic3
+				Normals=Surf_target.normals
 
+			if fold:
+				AIC=lib_vbiot.aic3_folded(Surf_target.zetac,self.zeta,Normals)
+				if self.symmetry is not None:
+					AIC+=libsym.fold_panels(lib_vbiot.aic3_folded(
+						Surf_target.zetac,zeta_img,Normals),1,N,self.symmetry)
+			else:
+				AIC=Kern.aic3(Surf_target.zetac,self.zeta,Normals)
+				if self.symmetry is not None:
+					AIC+=libsym.fold_panels(Kern.aic3(
+						Surf_target.zetac,zeta_img,Normals),M,N,self.symmetry)
 
-		if target=='segments':
+		if target in ['segments','edges']:
 			if Project:
 				raise NameError('Normal not defined at collocation points')
+			if fold:
+				raise NameError('Folded AIC only available at collocation points')
 
 			M_trg,N_trg=Surf_target.maps.M,Surf_target.maps.N
-			AIC=np.zeros((3,K_in,4,M_trg,N_trg))
-
-			##### panel (0,0): compute all
-			mm,nn=0,0
-			svec=[0,1,2,3] # seg. number
-			avec=[0,1,2,3] # 1st vertex of seg.
-			bvec=[1,2,3,0] # 2nd vertex of seg.
-			zetav_here=Surf_target.get_panel_vertices_coords(mm,nn)
-			for ss,aa,bb in zip(svec,avec,bvec):
-				zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-				AIC[:,:,ss,mm,nn]=self.get_aic3_cpp(zeta_mid)
-
-			##### panels n=0: copy seg.3
-			nn=0
-			svec=[0,1,2] # seg. number
-			avec=[0,1,2] # 1st vertex of seg.
-			bvec=[1,2,3] # 2nd vertex of seg.
-			for mm in range(1,M_trg):
-				zetav_here=Surf_target.get_panel_vertices_coords(mm,nn)
-				for ss,aa,bb in zip(svec,avec,bvec):
-					zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-					AIC[:,:,ss,mm,nn]=self.get_aic3_cpp(zeta_mid)
-				AIC[:,:,3,mm,nn]=AIC[:,:,1,mm-1,nn]
-
-			##### panels m=0: copy seg.0
-			mm=0
-			svec=[1,2,3] # seg. number
-			avec=[1,2,3] # 1st vertex of seg.
-			bvec=[2,3,0] # 2nd vertex of seg.
-			for nn in range(1,N_trg):
-				zetav_here=Surf_target.get_panel_vertices_coords(mm,nn)
-				for ss,aa,bb in zip(svec,avec,bvec):
-					zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-					AIC[:,:,ss,mm,nn]=self.get_aic3_cpp(zeta_mid)
-				AIC[:,:,0,mm,nn]=AIC[:,:,2,mm,nn-1]
-
-			##### all others: copy seg. 0 and 3
-			svec=[1,2] # seg. number
-			avec=[1,2] # 1st vertex of seg.
-			bvec=[2,3] # 2nd vertex of seg.
-			for pp in itertools.product(range(1,M_trg),range(1,N_trg)):
-				mm,nn=pp
-				zetav_here=Surf_target.get_panel_vertices_coords(*pp)
-				for ss,aa,bb in zip(svec,avec,bvec):
-					zeta_mid=0.5*(zetav_here[aa,:]+zetav_here[bb,:])
-					AIC[:,:,ss,mm,nn]=self.get_aic3_cpp(zeta_mid)
-				AIC[:,:,3,mm,nn]=AIC[:,:,1,mm-1,nn]
-				AIC[:,:,0,mm,nn]=AIC[:,:,2,mm,nn-1]
+			zeta_mid=lib_vbiot.get_midsegments(Surf_target.zeta)
+			AIC=Kern.aic3(zeta_mid,self.zeta)
+			if self.symmetry is not None:
+				AIC+=libsym.fold_panels(Kern.aic3(zeta_mid,zeta_img),M,N,
+																 self.symmetry)
+			if target=='segments':
+				AIC=lib_vbiot.from_edges_to_segments(
+											AIC.transpose((0,2,1)),M_trg,N_trg)
 
 		return AIC
 
@@ -756,29 +717,23 @@ class AeroGridSurface(AeroGridGeo):
 			raise NameError('u_ind_seg not available!')
 
 		M,N=self.maps.M,self.maps.N
-		self.fqs_seg_unit=np.zeros((3,4,M,N))
-		self.fqs=np.zeros((3,M+1,N+1))
-
-		# indiced as per self.maps
-		dmver=[ 0, 1, 1, 0] # delta to go from (m,n) panel to (m,n) vertices
-		dnver=[ 0, 0, 1, 1]
-		svec =[ 0, 1, 2, 3] # seg. no.
-		avec =[ 0, 1, 2, 3] # 1st vertex no.
-		bvec =[ 1, 2, 3, 0] # 2nd vertex no.
 
 		### force produced by BOUND panels
-		for pp in itertools.product(range(0,M),range(0,N)):
-			mm,nn=pp
-			zetav_here=self.get_panel_vertices_coords(mm,nn)
-			for ss,aa,bb in zip(svec,avec,bvec):
-				df=libuvlm.joukovski_qs_segment(
-					zetaA=zetav_here[aa,:],zetaB=zetav_here[bb,:],
-					v_mid=self.u_ind_seg[:,ss,mm,nn]+self.u_input_seg[:,ss,mm,nn],
-					gamma=1.0,fact=self.rho)
-				self.fqs_seg_unit[:,ss,mm,nn]=df
-				# project on vertices
-				self.fqs[:,mm+dmver[aa],nn+dnver[aa]]+=0.5*self.gamma[mm,nn]*df
-				self.fqs[:,mm+dmver[bb],nn+dnver[bb]]+=0.5*self.gamma[mm,nn]*df
+		# segment ss of each panel goes from vertex avec[ss] to bvec[ss]
+		avec=[ 0, 1, 2, 3] # 1st vertex no.
+		bvec=[ 1, 2, 3, 0] # 2nd vertex no.
+		ZetaV=self.get_panel_vertices().transpose((2,1,0)).reshape((3,4,M,N))
+		self.fqs_seg_unit=self.rho*libalg.cross3d(
+								   self.u_ind_seg+self.u_input_seg,
+											   ZetaV[:,bvec]-ZetaV[:,avec])
+
+		# project on vertices: vertex vv is the 1st vertex of segment vv and
+		# the 2nd of segment vv-1
+		Fseg=0.5*self.gamma*self.fqs_seg_unit
+		Fvert=(Fseg+Fseg[:,[3,0,1,2]]).reshape((3,4,M*N)).transpose((2,1,0))
+		Ind=self.maps.map_panels_to_vertices_1D_vector()
+		self.fqs=np.bincount(Ind.reshape(-1),weights=Fvert.reshape(-1),
+							 minlength=3*self.maps.Kzeta).reshape((3,M+1,N+1))
 
 		### force produced by wake T.E. segments
 		# Note:
@@ -789,19 +744,14 @@ class AeroGridSurface(AeroGridGeo):
 			raise NameError('Enter gammaw_TE - option disabled for debugging')
 			gammaw_TE=self.gamma[M-1,:]
 
-		self.fqs_wTE_unit=np.zeros((3,N))
-
-		for nn in range(N):
-			df=libuvlm.joukovski_qs_segment(
-					zetaA=self.zeta[:,M,nn+1],
-					zetaB=self.zeta[:,M,nn],
-					v_mid=self.u_input_seg[:,1,M-1,nn]+self.u_ind_seg[:,1,M-1,nn],
-					gamma=1.0,
-					fact=self.rho)
-			# record force on TE due to wake and project
-			self.fqs_wTE_unit[:,nn]=df
-			self.fqs[:,M,nn+1]+=0.5*gammaw_TE[nn]*df
-			self.fqs[:,M,nn]+=0.5*gammaw_TE[nn]*df
+		self.fqs_wTE_unit=self.rho*libalg.cross3d(
+						self.u_input_seg[:,1,M-1,:]+self.u_ind_seg[:,1,M-1,:],
+									   self.zeta[:,M,:-1]-self.zeta[:,M,1:])
+
+		# record force on TE due to wake and project
+		Fte=0.5*gammaw_TE*self.fqs_wTE_unit
+		self.fqs[:,M,1:]+=Fte
+		self.fqs[:,M,:-1]+=Fte
 
 		return self
 
@@ -0,0 +1,101 @@
+'''
+Benchmark: compressed (ACA/H-matrix) AIC matrices
+Oct 2018
+
+For each case and compression tolerance, reports:
+- the memory of the bound (K x K) and wake (K x K_star) AIC matrices in
+compressed format (assembly.AIC_hmatrix) relative to the full matrices;
+- the assembly time of the compressed and full (assembly.AICs) matrices;
+- the relative error of the bound circulation and quasi-steady forces of
+linuvlm.Static (with GMRES solution, see Static.solve_aic) and of the products
+of the matrix-free state-space matrix A of linuvlm.Dynamic.
+
+The cases are the Goland wing in test/h5input and a two-surface flat wing
+(lattice.flat_wing).
+
+Usage:
+	python bench_aca.py
+'''
+
+import time
+import warnings
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import read, linuvlm, multisurfaces
+import assembly as ass
+import lattice
+
+
+def relerr(out,ref):
+	return np.max(np.abs(out-ref))/np.max(np.abs(ref))
+
+
+def run_solvers(tsdata,compress_tol):
+	'''
+	Returns gamma and forces of the static solver and the products A*x and
+	A^T*x of the matrix-free dynamic solver.
+	'''
+
+	Sta=linuvlm.Static(tsdata,compress_tol=compress_tol)
+	Sta.assemble()
+	np.random.seed(1)
+	Sta.solve(u_ext=np.random.rand(3*Sta.Kzeta))
+	Dyn=linuvlm.Dynamic(tsdata,dt=0.05,MatrixFree=True,
+											compress_tol=compress_tol)
+	Dyn.assemble_ss()
+	X=np.random.rand(Dyn.Nx,2)
+
+	return [Sta.gamma,Sta.fqs,Dyn.SS.A.dot(X),Dyn.SS.A.H.dot(X)]
+
+
+
+if __name__=='__main__':
+
+	warnings.simplefilter('ignore')
+	path=os.path.abspath(os.path.join(os.path.dirname(__file__),'../h5input'))
+	Cases=[('goland_Nsurf01',read.h5file(path+
+		'/goland_mod_Nsurf01_M003_N004_a040.aero_state.h5').ts00000),
+		   ('goland_Nsurf02',read.h5file(path+
+		'/goland_mod_Nsurf02_M003_N004_a040.aero_state.h5').ts00000),
+		   ('flat_wing_8x32x80',lattice.flat_wing(8,32,80,n_surf=2))]
+	TolList=[1e-4,1e-6,1e-8]
+
+	stdout=sys.stdout
+	Rows=[]
+	for name,tsdata in Cases:
+
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+		K,K_star=sum(MS.KK),sum(MS.KK_star)
+		t0=time.time()
+		ass.AICs(MS.Surfs,MS.Surfs_star)
+		t_full=time.time()-t0
+
+		sys.stdout=open(os.devnull,'w')
+		Ref=run_solvers(tsdata,None)
+		sys.stdout=stdout
+
+		for tol in TolList:
+			t0=time.time()
+			H=ass.AIC_hmatrix(MS.Surfs,MS.Surfs,tol=tol)
+			Hw=ass.AIC_hmatrix(MS.Surfs,MS.Surfs_star,tol=tol)
+			t_hmat=time.time()-t0
+
+			sys.stdout=open(os.devnull,'w')
+			Out=run_solvers(tsdata,tol)
+			sys.stdout=stdout
+			Er=[relerr(out,ref) for out,ref in zip(Out,Ref)]
+
+			Rows.append((name,K,K_star,tol,H.compression,Hw.compression,
+											   t_full,t_hmat,Er[0],Er[1],
+											   max(Er[2],Er[3])))
+
+	print('case\t\t\tK\tK*\ttol\tmem AIC\tmem AICw\tt full [s]'+\
+			 '\tt comp [s]\terr gamma\terr fqs\terr A')
+	for row in Rows:
+		print('%-16s\t%d\t%d\t%.0e\t%.3f\t%.3f\t\t%.2e\t%.2e\t%.1e\t\t%.1e\t%.1e'\
+																		 %row)
@@ -0,0 +1,79 @@
+'''
+Benchmark: batched vs per-point AIC assembly
+Oct 2018
+
+Compares the time required to build the collocation points AIC matrices of a
+bound surface and its wake when:
+- each target point is evaluated through a separate call to the C++ library
+(surface.AeroGridSurface.get_aic3_cpp);
+- all target points are evaluated in one call
+(surface.AeroGridSurface.get_aic_batch_cpp), as done in assembly.AICs;
+- the numpy vectorised kernels are used (lib_vbiot.aic3), as done in
+assembly.AICs when the C++ library is not available.
+
+Usage:
+	python bench_aic.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces, lib_vbiot
+import lattice
+
+
+def aic_per_point(Surf_in,Surf_out):
+	'''
+	Reference implementation, with one library call per target point.
+	'''
+	K_out=Surf_out.maps.K
+	AIC=np.empty((K_out,Surf_in.maps.K))
+	for cc in range(K_out):
+		mm=Surf_out.maps.ind_2d_pan_scal[0][cc]
+		nn=Surf_out.maps.ind_2d_pan_scal[1][cc]
+		aic3=Surf_in.get_aic3_cpp(Surf_out.zetac[:,mm,nn])
+		AIC[cc,:]=np.dot(Surf_out.normals[:,mm,nn],aic3)
+	return AIC
+
+
+def timeit(fun,*args,Nrep=3):
+	tv=[]
+	for nn in range(Nrep):
+		t0=time.time()
+		out=fun(*args)
+		tv.append(time.time()-t0)
+	return min(tv),out
+
+
+
+if __name__=='__main__':
+
+	Cases=[(4,16,40),(8,32,80),(12,48,120),(16,64,160)]
+
+	print('M\tN\tM*\tK\tK*\tper-point [s]\tbatch [s]\tspeed-up'+\
+										  '\tnumpy [s]\tspeed-up\tmax err')
+	for M,N,M_star in Cases:
+
+		tsdata=lattice.flat_wing(M,N,M_star,solve=False)
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+		Surf,Surf_star=MS.Surfs[0],MS.Surfs_star[0]
+
+		t_ref,t_new,t_np,er=0.,0.,0.,0.
+		for Surf_in in [Surf,Surf_star]:
+			tt,AIC_ref=timeit(aic_per_point,Surf_in,Surf)
+			t_ref+=tt
+			tt,AIC=timeit(Surf_in.get_aic_batch_cpp,Surf.zetac,Surf.normals)
+			t_new+=tt
+			er=max(er,np.max(np.abs(AIC-AIC_ref)))
+			tt,AIC=timeit(lib_vbiot.aic3,Surf.zetac,Surf_in.zeta,Surf.normals)
+			t_np+=tt
+			er=max(er,np.max(np.abs(AIC-AIC_ref)))
+
+		print('%d\t%d\t%d\t%d\t%d\t%.3e\t%.3e\t%.1f\t\t%.3e\t%.1f\t\t%.1e'\
+				%(M,N,M_star,Surf.maps.K,Surf_star.maps.K,t_ref,t_new,
+									  t_ref/t_new,t_np,t_ref/t_np,er))
@@ -0,0 +1,128 @@
+'''
+Benchmark: peak memory of global matrices assembly
+Oct 2018
+
+Compares the peak resident memory (RSS) of the assembly of the static linear
+UVLM matrices (linuvlm.Static.assemble_geometry_blocks and
+assemble_flow_blocks) against that of an assembly in which the global
+matrices are obtained from lists of per-surface blocks through np.block and
+scipy.linalg.block_diag (as done before the in-place assembly). Each mode is
+run in a separate process, such that the peak RSS (resource.getrusage) is
+not affected by the other.
+
+Usage:
+	python bench_assembly_memory.py [M N M_star]
+'''
+
+import time
+import resource
+import subprocess
+import numpy as np
+import scipy.linalg as scalg
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm, interp
+import assembly as ass
+import lattice
+
+
+def assemble_blocks(Sta):
+	'''
+	Assembles the same matrices as Static.assemble_geometry_blocks and
+	Static.assemble_flow_blocks from lists of blocks.
+	'''
+
+	MS=Sta.MS
+
+	List_AICs,List_AICs_star=ass.AICs(MS.Surfs,MS.Surfs_star)
+	for ss_out in range(MS.n_surf):
+		for ss_in in range(MS.n_surf):
+			N_star=MS.NN_star[ss_in]
+			aic_star=List_AICs_star[ss_out][ss_in]
+			for jj in range(N_star):
+				List_AICs[ss_out][ss_in][:,-N_star+jj]+=\
+										np.sum(aic_star[:,jj::N_star],axis=1)
+	AIC=np.block(List_AICs)
+	del List_AICs,List_AICs_star
+	LU,piv=scalg.lu_factor(AIC)
+	Ducdu_ext=scalg.block_diag(*[interp.get_Wnv_vector(Surf,Surf.aM,Surf.aN)
+												   for Surf in MS.Surfs])
+
+	List_coll,List_vert=ass.nc_dqcdzeta(MS.Surfs,MS.Surfs_star)
+	Ducdzeta=np.block(List_vert)
+	del List_vert
+	Ducdzeta+=scalg.block_diag(*List_coll)
+	del List_coll
+	Ducdzeta+=scalg.block_diag(*ass.uc_dncdzeta(MS.Surfs))
+	Ducdzeta+=scalg.block_diag(*ass.nc_domegazetadzeta(MS.Surfs,MS.Surfs_star))
+
+	Dfqsdzeta=scalg.block_diag(*ass.dfqsdzeta_vrel0(MS.Surfs,MS.Surfs_star))
+	List_coll,List_vert=ass.dfqsdvind_zeta(MS.Surfs,MS.Surfs_star)
+	for ss in range(MS.n_surf):
+		List_vert[ss][ss]+=List_coll[ss]
+	Dfqsdzeta+=np.block(List_vert)
+	del List_vert,List_coll
+
+	Dfqsdu_ext=scalg.block_diag(*ass.dfqsduinput(MS.Surfs,MS.Surfs_star))
+
+	List_vrel0,List_star_vrel0=ass.dfqsdgamma_vrel0(MS.Surfs,MS.Surfs_star)
+	Dfqsdgamma=scalg.block_diag(*List_vrel0)
+	Dfqsdgamma_star=scalg.block_diag(*List_star_vrel0)
+	del List_vrel0,List_star_vrel0
+	List_vind,List_star_vind=ass.dfqsdvind_gamma(MS.Surfs,MS.Surfs_star)
+	Dfqsdgamma+=np.block(List_vind)
+	Dfqsdgamma_star+=np.block(List_star_vind)
+
+	return {'AIC':AIC,'AIC_LU':LU,'AIC_piv':piv,'Ducdu_ext':Ducdu_ext,
+			'Ducdzeta':Ducdzeta,'Dfqsdzeta':Dfqsdzeta,'Dfqsdu_ext':Dfqsdu_ext,
+			'Dfqsdgamma':Dfqsdgamma,'Dfqsdgamma_star':Dfqsdgamma_star}
+
+
+def assemble_inplace(Sta):
+	''' Static assembly, with in-place filling of the global matrices '''
+	Blocks=Sta.assemble_geometry_blocks()
+	Blocks.update(Sta.assemble_flow_blocks())
+	return Blocks
+
+
+def run(mode,M,N,M_star):
+	'''
+	Runs the assembly and prints the peak RSS increase [MB], the assembly time
+	[s] and the storage of the assembled matrices [MB].
+	'''
+
+	tsdata=lattice.flat_wing(M,N,M_star,n_surf=2)
+	Sta=linuvlm.Static(tsdata)
+	rss0=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	t0=time.time()
+	Blocks={'blocks':assemble_blocks,'inplace':assemble_inplace}[mode](Sta)
+	tass=time.time()-t0
+
+	rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	nbytes=sum([Blocks[name].nbytes for name in Blocks])
+	print('%.2f %.2f %.2f'%((rss-rss0)/1024.,tass,nbytes/1024.**2))
+
+
+
+if __name__=='__main__':
+
+	if len(sys.argv)==6 and sys.argv[1]=='--run':
+		run(sys.argv[2],*[int(aa) for aa in sys.argv[3:]])
+		sys.exit(0)
+
+	M,N,M_star=[int(aa) for aa in sys.argv[1:4]] if len(sys.argv)==4 \
+															   else (6,30,30)
+	print('Lattice: M=%d, N=%d, M_star=%d, 2 surfaces'%(M,N,M_star))
+	print('mode\t\tpeak RSS increase [MB]\ttime [s]\tmatrices [MB]')
+	for mode in ['blocks','inplace']:
+		# the last line of the output contains the results
+		out=subprocess.run([sys.executable,__file__,'--run',mode,
+							str(M),str(N),str(M_star)],stdout=subprocess.PIPE,
+							universal_newlines=True,check=True).stdout
+		rss,tass,nbytes=out.strip().split('\n')[-1].split()
+		print('%s\t\t%s\t\t\t%s\t\t%s'%(mode,rss,tass,nbytes))
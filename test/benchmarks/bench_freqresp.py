@@ -0,0 +1,58 @@
+'''
+Benchmark: frequency response of the linear UVLM on the bound circulation
+Oct 2018
+
+For flat wings (lattice.flat_wing) of increasing size, compares the frequency
+response of linuvlm.Dynamic obtained via:
+- the dense state-space model (libss.freqresp), with one Nx x Nx complex
+system per frequency;
+- the bound-only system (linuvlm.Dynamic.freqresp), where the wake
+circulation is eliminated analytically.
+The assembly time, the time per frequency and the relative error are
+reported.
+
+Usage:
+	python bench_freqresp.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm, libss
+import lattice
+
+
+
+if __name__=='__main__':
+
+	Nw=10
+	print('case\t\tK\tNx\tt asbly SS [s]\tt asbly bound [s]\t'
+					   't freq SS [s]\tt freq bound [s]\terr Yfreq')
+	for M,N,M_star in [(4,12,40),(4,16,80),(6,24,120)]:
+		tsdata=lattice.flat_wing(M,N,M_star)
+		wv=np.linspace(0.,np.pi*M_star,Nw)
+
+		Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star)
+		t0=time.time()
+		Dyn.assemble_ss()
+		t_ss=time.time()-t0
+		t0=time.time()
+		Yref=libss.freqresp(Dyn.SS,wv)
+		t_freq_ss=(time.time()-t0)/Nw
+
+		Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star)
+		t0=time.time()
+		Dyn.assemble_march()
+		t_bound=time.time()-t0
+		t0=time.time()
+		Y=Dyn.freqresp(wv)
+		t_freq_bound=(time.time()-t0)/Nw
+
+		er=np.max(np.abs(Y-Yref))/np.max(np.abs(Yref))
+		print('%.2dx%.2dx%.3d\t%d\t%d\t%.2e\t%.2e\t\t%.2e\t%.2e\t%.1e'%(
+			M,N,M_star,Dyn.K,Dyn.Nx,t_ss,t_bound,t_freq_ss,t_freq_bound,er))
@@ -0,0 +1,79 @@
+'''
+Benchmark: input velocities at collocation points and segments
+Oct 2018
+
+Times the computation of the input velocities (u_ext-zeta_dot-omega x zeta)
+at the collocation points and at the segments mid-points of a rotating
+surface, and compares against a reference implementation looping over the
+vertices and panels. The outputs are checked to be identical.
+
+Usage:
+	python bench_input_velocities.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces
+import lattice
+
+
+def input_velocities_loop(Surf):
+	'''
+	Reference implementation: loops over vertices and panels.
+	'''
+
+	M,N=Surf.maps.M,Surf.maps.N
+	u_tot=Surf.u_ext-Surf.zeta_dot
+	for mm in range(M+1):
+		for nn in range(N+1):
+			u_tot[:,mm,nn]-=np.cross(Surf.omega,Surf.zeta[:,mm,nn])
+
+	wcv=Surf.get_panel_wcv()
+	dmver=[0,1,1,0]
+	dnver=[0,0,1,1]
+	u_coll=np.zeros((3,M,N))
+	u_seg=np.empty((3,4,M,N))
+	for mm in range(M):
+		for nn in range(N):
+			for vv in range(4):
+				u_coll[:,mm,nn]+=wcv[vv]*u_tot[:,mm+dmver[vv],nn+dnver[vv]]
+				aa,bb=vv,(vv+1)%4
+				u_seg[:,vv,mm,nn]=.5*(u_tot[:,mm+dmver[aa],nn+dnver[aa]]+
+									  u_tot[:,mm+dmver[bb],nn+dnver[bb]])
+
+	return u_coll,u_seg
+
+
+
+if __name__=='__main__':
+
+	Nrep=5
+	print('M\tN\tloop [s]\tvectorised [s]\tspeed-up')
+
+	for M,N in [(4,12),(16,48),(32,128),(64,256)]:
+		tsdata=lattice.flat_wing(M,N,1,solve=False)
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+		Surf=MS.Surfs[0]
+		Surf.omega=np.array([0.,0.,10.])
+		Surf.zeta_dot=np.random.rand(3,M+1,N+1)
+
+		t0=time.time()
+		for rr in range(Nrep):
+			u_coll,u_seg=input_velocities_loop(Surf)
+		tloop=(time.time()-t0)/Nrep
+
+		t0=time.time()
+		for rr in range(Nrep):
+			Surf.get_input_velocities_at_collocation_points()
+			Surf.get_input_velocities_at_segments()
+		tvec=(time.time()-t0)/Nrep
+
+		assert np.array_equal(u_coll,Surf.u_input_coll) and \
+			   np.array_equal(u_seg,Surf.u_input_seg), 'Outputs not identical'
+		print('%d\t%d\t%.3e\t%.3e\t%.1f' %(M,N,tloop,tvec,tloop/tvec))
@@ -0,0 +1,57 @@
+'''
+Benchmark: kernels backends
+Oct 2018
+
+Times the assembly of the AIC matrices at the collocation points and
+segments, and the derivatives of the induced velocities at the collocation 
+points (assembly.nc_dqcdzeta) with each of the available backends (see 
+kernels module).
+
+Usage:
+	python bench_kernels.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces, assembly, kernels
+import lattice
+
+
+
+if __name__=='__main__':
+
+	M,N,M_star=4,12,20
+	tsdata=lattice.flat_wing(M,N,M_star,n_surf=2)
+
+	print('Lattice: M=%d, N=%d, M*=%d, 2 surfaces'%(M,N,M_star))
+	print('backend\tAIC coll [s]\tAIC seg [s]\tnc_dqcdzeta [s]')
+
+	for name in kernels.available():
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata,backend=name)
+
+		# warm up (e.g. numba compilation)
+		Surf=MS.Surfs[0]
+		Surf.get_aic_over_surface(Surf)
+		kernels.get(name).dvinddzeta(
+						Surf.zetac[:,0,0].copy(),Surf.zeta,Surf.gamma,True)
+
+		tv=[]
+		t0=time.time()
+		assembly.AICs(MS.Surfs,MS.Surfs_star,target='collocation')
+		tv.append(time.time()-t0)
+
+		t0=time.time()
+		assembly.AICs(MS.Surfs,MS.Surfs_star,target='segments',Project=False)
+		tv.append(time.time()-t0)
+
+		t0=time.time()
+		assembly.nc_dqcdzeta(MS.Surfs,MS.Surfs_star)
+		tv.append(time.time()-t0)
+
+		print('%s\t%.3e\t%.3e\t%.3e' %((name,)+tuple(tv)))
@@ -0,0 +1,72 @@
+'''
+Benchmark: Krylov solution of the static non-penetration condition
+Oct 2018
+
+For a two-surface flat wing (lattice.flat_wing) of increasing size, compares
+the solution of the bound circulation via LU factorisation of the AIC matrix
+against GMRES/BiCGStab iterations (see linuvlm.Static.solve_aic) with
+block-Jacobi and near-field preconditioners, using:
+- the full AIC matrix;
+- the matrix-free AIC operator (see linuvlm.Static.aic_matvec), with numpy
+and treecode kernels.
+For each case, the assembly time of the geometry matrices and preconditioner
+(see linuvlm.Static.assemble_geometry), the solution time, the number of
+iterations and the relative error w.r.t. the LU solution are reported.
+
+Usage:
+	python bench_krylov.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm, libtree
+import lattice
+
+
+
+if __name__=='__main__':
+
+	Cases=[ # (solver,precond,matrix-free,backend)
+		('lu',None,False,None),
+		('gmres','block_jacobi',False,None),
+		('gmres','near_field',False,None),
+		('bicgstab','near_field',False,None),
+		('gmres','block_jacobi',True,None),
+		('gmres','near_field',True,None),
+		('gmres','near_field',True,'treecode')]
+
+	print('K\tsolver\t\tprecond\t\tmatrix-free\tt asbly [s]\tt solve [s]'
+													 '\titer\trel err')
+	for M,N in [(8,32),(16,64),(24,96)]:
+
+		tsdata=lattice.flat_wing(M,N,10*M,n_surf=2,solve=False)
+		np.random.seed(3)
+		gamma_ref=None
+
+		for solver,precond,mf,backend in Cases:
+			Sta=linuvlm.Static(tsdata,solver=solver,precond=precond,
+									   aic_matrix_free=mf,backend=backend)
+			libtree.TreeCache=None
+			t0=time.time()
+			Sta.assemble_geometry()
+			t_asbly=time.time()-t0
+
+			np.random.seed(3)
+			rhs=-np.dot(Sta.Ducdu_ext,np.random.rand(3*Sta.Kzeta))
+			t0=time.time()
+			gamma=Sta.solve_aic(rhs)
+			t_solve=time.time()-t0
+
+			if gamma_ref is None:
+				gamma_ref=gamma
+			er=np.max(np.abs(gamma-gamma_ref))/np.max(np.abs(gamma_ref))
+			niter=Sta.solver_stats['niter'][0] if solver!='lu' else 0
+			label='%s%s'%(backend+' ' if backend else '',mf)
+			print('%d\t%-8s\t%-12s\t%-8s\t%.2e\t%.2e\t%d\t%.1e'%(Sta.K,solver,
+						precond,label,t_asbly,t_solve,niter,er))
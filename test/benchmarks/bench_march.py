@@ -0,0 +1,77 @@
+'''
+Benchmark: time marching of the linear UVLM with wake ring buffer
+Oct 2018
+
+For a flat wing (lattice.flat_wing) with wakes of increasing length,
+compares the time response of linuvlm.Dynamic obtained via:
+- the dense state-space model (libss.simulate);
+- the time-marching engine (linuvlm.Dynamic.march), with inputs streamed
+from a generator.
+For each case, the memory of the stored matrices, the assembly time, the
+time per step and the relative error of the outputs are reported.
+
+Usage:
+	python bench_march.py
+'''
+
+import time
+import numpy as np
+import scipy.sparse as sparse
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm, libss
+import lattice
+
+
+def nbytes(*Arrays):
+	return sum([aa.data.nbytes+aa.indices.nbytes+aa.indptr.nbytes
+				if sparse.issparse(aa) else getattr(aa,'nbytes',0)
+														 for aa in Arrays])
+
+
+def gust(NT,Nu,seed=1):
+	''' Generator of random inputs '''
+	np.random.seed(seed)
+	for tt in range(NT):
+		yield np.random.rand(Nu)-.5
+
+
+
+if __name__=='__main__':
+
+	M,N=4,16
+	NT=200
+	print('case\t\tNx\tK*\tmem SS [MB]\tmem march [MB]\tt asbly SS [s]\t'
+		  't asbly march [s]\tt step SS [ms]\tt step march [ms]\terr Y')
+	for M_star in [40,80,160,320]:
+		tsdata=lattice.flat_wing(M,N,M_star)
+
+		Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star)
+		t0=time.time()
+		Dyn.assemble_ss()
+		t_ss=time.time()-t0
+		SS=Dyn.SS
+		mem_ss=nbytes(SS.A,SS.B,SS.C,SS.D)/2.**20
+		t0=time.time()
+		Yref=libss.simulate(SS,np.array(list(gust(NT,Dyn.Nu))))[0]
+		t_step_ss=(time.time()-t0)/NT
+
+		Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star)
+		t0=time.time()
+		Dyn.assemble_march()
+		t_march=time.time()-t0
+		mem_march=nbytes(*[bb if sparse.issparse(bb) else np.asarray(bb)
+			for bb in Dyn.march_blocks.values() if not isinstance(bb,tuple)])/2.**20
+		mem_march+=nbytes(*Dyn.march_blocks['A0_LU'])/2.**20
+		t0=time.time()
+		Y=np.array(list(Dyn.march(gust(NT,Dyn.Nu))))
+		t_step_march=(time.time()-t0)/NT
+
+		er=np.max(np.abs(Y-Yref))/np.max(np.abs(Yref))
+		print('%.2dx%.2dx%.3d\t%d\t%d\t%.1f\t\t%.1f\t\t%.2e\t%.2e\t\t%.2e\t%.2e\t%.1e'
+			  %(M,N,M_star,Dyn.Nx,Dyn.K_star,mem_ss,mem_march,t_ss,t_march,
+							   1e3*t_step_ss,1e3*t_step_march,er))
@@ -0,0 +1,77 @@
+'''
+Benchmark: mixed-precision storage of the linear UVLM matrices
+Oct 2018
+
+For the cases in test/h5input and a flat wing (lattice.flat_wing), compares
+the double and mixed precision (single precision storage with iterative
+refinement) versions of:
+- linuvlm.Static: memory of the stored AIC matrix and LU factors, number of
+refinement steps and relative error of bound circulation and quasi-steady
+forces for random input velocities;
+- linuvlm.Dynamic: memory of the state-space matrices and relative error of
+the time response (libss.simulate) and frequency response (libss.freqresp).
+
+Usage:
+	python bench_mixed_precision.py
+'''
+
+import glob
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import read, linuvlm, libss
+import lattice
+
+
+def relerr(out,ref):
+	return np.max(np.abs(out-ref))/np.max(np.abs(ref))
+
+
+def nbytes(*Arrays):
+	return sum([getattr(aa,'nbytes',0) for aa in Arrays])
+
+
+
+if __name__=='__main__':
+
+	Cases=[(os.path.basename(fname).split('.')[0],read.h5file(fname).ts00000)
+			for fname in sorted(glob.glob('../h5input/*.aero_state.h5'))]
+	Cases.append(('flat_wing_8x32x40',lattice.flat_wing(8,32,40,n_surf=2)))
+
+	print('case\t\t\t\tK\tmem AIC\titer\terr gamma\terr fqs\t\t'
+									 'mem SS\terr time\terr freq\tt asbly')
+	for name,tsdata in Cases:
+
+		Out={}
+		for precision in ['double','mixed']:
+
+			Sta=linuvlm.Static(tsdata,precision=precision)
+			Sta.assemble()
+			np.random.seed(1)
+			Sta.solve(u_ext=np.random.rand(3*Sta.Kzeta,4))
+			mem_aic=nbytes(getattr(Sta,'AIC',None),Sta.AIC_LU)
+			niter=max(Sta.solver_stats.get('niter',[0]))
+
+			Dyn=linuvlm.Dynamic(tsdata,dt=0.05,precision=precision)
+			t0=time.time()
+			Dyn.assemble_ss()
+			t_asbly=time.time()-t0
+			SS=Dyn.SS
+			np.random.seed(2)
+			Y,X=libss.simulate(SS,np.random.rand(20,Dyn.Nu))
+			Yfreq=libss.freqresp(SS,np.array([0.,0.5,1.]))
+
+			Out[precision]=(Sta.gamma,Sta.fqs,Y,Yfreq,mem_aic,niter,
+								  nbytes(SS.A,SS.B,SS.C,SS.D),t_asbly)
+			del Sta,Dyn,SS
+
+		ref,mix=Out['double'],Out['mixed']
+		print('%-30s\t%d\t%.3f\t%d\t%.1e\t\t%.1e\t\t%.3f\t%.1e\t\t%.1e\t\t%.2f'%(
+			name,len(ref[0]),mix[4]/ref[4],mix[5],relerr(mix[0],ref[0]),
+			relerr(mix[1],ref[1]),mix[6]/ref[6],relerr(mix[2],ref[2]),
+			relerr(mix[3],ref[3]),mix[7]/ref[7]))
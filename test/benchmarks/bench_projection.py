@@ -0,0 +1,67 @@
+'''
+Benchmark: input/output projection of the linear UVLM state-space model
+Oct 2018
+
+For flat wings (lattice.flat_wing) of increasing size, compares the
+state-space realisation of linuvlm.Dynamic with full inputs/outputs
+against that with inputs projected over the rigid-body motion gains
+(get_rigid_motion_gains) and outputs projected over the total forces and
+moments gains (get_total_forces_gain). The assembly time, the memory of the
+B, C and D matrices and the relative error of the time response of the
+projected system are reported.
+
+Usage:
+	python bench_projection.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm, libss
+import lattice
+
+
+def nbytes(*Arrays):
+	return sum([getattr(aa,'nbytes',0) for aa in Arrays])
+
+
+
+if __name__=='__main__':
+
+	print('case\t\tNu\tNy\tt asbly full [s]\tt asbly proj [s]\t'
+							  'mem BCD full [MB]\tmem BCD proj [MB]\terr Y')
+	for M,N,M_star in [(4,16,40),(8,32,80),(12,48,120)]:
+		tsdata=lattice.flat_wing(M,N,M_star)
+
+		Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star,UseSparse=True)
+		t0=time.time()
+		Dyn.assemble_ss()
+		t_full=time.time()-t0
+		mem_full=nbytes(Dyn.SS.C,Dyn.SS.D)+Dyn.SS.B.nbytes
+
+		# bases
+		Dyn.get_total_forces_gain()
+		Dyn.get_rigid_motion_gains()
+		Zero=np.zeros_like(Dyn.Ktra)
+		Kin=np.block([[Dyn.Ktra,Zero],[Zero,Dyn.Ktra_dot],[Zero,Zero]])
+		Kout=np.concatenate([Dyn.Kftot,Dyn.Kmtot])
+		np.random.seed(1)
+		U=np.random.rand(50,Kin.shape[1])
+		Yref=np.dot(libss.simulate(Dyn.SS,np.dot(U,Kin.T))[0],Kout.T)
+
+		Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star,UseSparse=True)
+		t0=time.time()
+		Dyn.assemble_ss(Kin=Kin,Kout=Kout)
+		t_proj=time.time()-t0
+		mem_proj=nbytes(Dyn.SS.C,Dyn.SS.D)+Dyn.SS.B.nbytes
+		Y=libss.simulate(Dyn.SS,U)[0]
+
+		er=np.max(np.abs(Y-Yref))/np.max(np.abs(Yref))
+		print('%.2dx%.2dx%.3d\t%d\t%d\t%.2e\t\t%.2e\t\t%.1f\t\t\t%.3f\t\t\t%.1e'%(
+			M,N,M_star,Dyn.Nu,Dyn.Ny,t_full,t_proj,
+						mem_full/2.**20,mem_proj/2.**20,er))
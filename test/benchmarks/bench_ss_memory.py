@@ -0,0 +1,67 @@
+'''
+Benchmark: memory of state-space realisations
+Oct 2018
+
+Compares the memory required by the dense and sparse (UseSparse=True)
+state-space realisations of linuvlm.Dynamic for wakes of increasing length.
+For each case, the report lists:
+- the storage of the A, B, C, D matrices;
+- the peak memory allocated during linuvlm.Dynamic.assemble_ss (tracemalloc);
+- the assembly time.
+
+Usage:
+	python bench_ss_memory.py
+'''
+
+import time
+import tracemalloc
+import numpy as np
+import scipy.sparse as sparse
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm
+import lattice
+
+
+def get_nbytes(mat):
+	''' Storage of dense, sparse or libss.SparseDense matrices '''
+	if sparse.issparse(mat):
+		mat=mat.tocsr()
+		return mat.data.nbytes+mat.indices.nbytes+mat.indptr.nbytes
+	return mat.nbytes
+
+
+
+if __name__=='__main__':
+
+	M,N=4,10
+	MB=1024.**2
+
+	print('Lattice: M=%d, N=%d, 2 surfaces'%(M,N))
+	print('M*\tNx\tmode\tA [MB]\tB [MB]\tC [MB]\tD [MB]\tpeak [MB]\ttime [s]')
+
+	for M_star in [10,40,160]:
+		tsdata=lattice.flat_wing(M,N,M_star,n_surf=2)
+
+		for UseSparse in [False,True]:
+			Dyn=linuvlm.Dynamic(tsdata,dt=1./M_star,integr_order=2,
+									RemovePredictor=True,UseSparse=UseSparse)
+
+			tracemalloc.start()
+			t0=time.time()
+			Dyn.assemble_ss()
+			tass=time.time()-t0
+			_,peak=tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+
+			mode={False:'dense',True:'sparse'}[UseSparse]
+			print('%d\t%d\t%s\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f\t\t%.2f'\
+					%( M_star,Dyn.Nx,mode,
+					   get_nbytes(Dyn.SS.A)/MB,get_nbytes(Dyn.SS.B)/MB,
+					   get_nbytes(Dyn.SS.C)/MB,get_nbytes(Dyn.SS.D)/MB,
+					   peak/MB,tass ))
+			del Dyn
@@ -0,0 +1,123 @@
+'''
+Benchmark: mirror-symmetry solver for half-span models
+Oct 2018
+
+For flat wings (lattice.flat_wing) of increasing size, compares the full
+lattice (two mirrored surfaces) with the half lattice solved with symmetry
+'sym' and 'anti' (see libsym):
+- linuvlm.Static: assembly and solution time, and relative error of bound
+circulation and quasi-steady forces for random input velocities;
+- linuvlm.Dynamic: state-space assembly time and relative error of the time
+response (libss.simulate).
+
+Usage:
+	python bench_symmetry.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import linuvlm, libss, libsym
+import lattice
+
+
+def relerr(out,ref):
+	return np.max(np.abs(out-ref))/np.max(np.abs(ref))
+
+
+def get_half(tsfull):
+	''' First surface of tsfull, with symmetric reference circulation '''
+
+	M,N=tsfull.dimensions[0]
+	M_star=tsfull.dimensions_star[0][0]
+	tsdata=lattice.flat_wing(M,N,M_star,n_surf=1,solve=False)
+	tsdata.gamma=[tsfull.gamma[0]]
+	tsdata.gamma_star=[tsfull.gamma_star[0]]
+
+	return tsdata
+
+
+def to_full(Uhalf,fact,M,N):
+	''' Maps vertices inputs of the half lattice, shape (...,3*Kzeta), to the
+	full lattice '''
+
+	Idofs,Sign=libsym.map_vertices_dofs(M,N)
+	return np.concatenate([Uhalf,fact*Sign*Uhalf[...,Idofs]],axis=-1)
+
+
+
+if __name__=='__main__':
+
+	Cases=[(4,16,40),(8,32,80),(12,48,120)]
+	Cases_dyn=[(4,16,40),(8,24,48)]
+
+	print('Static')
+	print('case\t\tK full\tproblem\tt asbly [s]\tt solve [s]\terr gamma\terr fqs')
+	for M,N,M_star in Cases:
+		tsfull=lattice.flat_wing(M,N,M_star,n_surf=2)
+		tsdata=get_half(tsfull)
+		np.random.seed(1)
+		Uhalf=np.random.rand(3*(M+1)*(N+1),3)-.5
+
+		for symmetry in [None,'sym','anti']:
+			if symmetry is None:
+				Sta=linuvlm.Static(tsfull)
+				Uin=to_full(Uhalf.T,1.,M,N).T
+			else:
+				Sta=linuvlm.Static(tsdata,symmetry=symmetry)
+				Uin=Uhalf
+			t0=time.time()
+			Sta.assemble()
+			t_asbly=time.time()-t0
+			t0=time.time()
+			Sta.solve(u_ext=Uin)
+			t_solve=time.time()-t0
+
+			if symmetry is None:
+				gamma_ref,fqs_ref=Sta.gamma[:M*N],Sta.fqs[:Uhalf.shape[0]]
+				K_full=Sta.K
+				er_gamma,er_fqs=0.,0.
+			elif symmetry=='sym':
+				er_gamma=relerr(Sta.gamma,gamma_ref)
+				er_fqs=relerr(Sta.fqs,fqs_ref)
+			else:
+				# reference antisymmetric response
+				Sref=linuvlm.Static(tsfull)
+				Sref.assemble()
+				Sref.solve(u_ext=to_full(Uhalf.T,-1.,M,N).T)
+				er_gamma=relerr(Sta.gamma,Sref.gamma[:M*N])
+				er_fqs=relerr(Sta.fqs,Sref.fqs[:Uhalf.shape[0]])
+			print('%.2dx%.3dx%.3d\t%d\t%s\t%.2e\t%.2e\t%.1e\t\t%.1e'%(
+						M,N,M_star,K_full,symmetry,t_asbly,t_solve,
+														  er_gamma,er_fqs))
+
+	print('\nDynamic')
+	print('case\t\tNx full\tproblem\tNx\tt asbly [s]\terr Y')
+	for M,N,M_star in Cases_dyn:
+		tsfull=lattice.flat_wing(M,N,M_star,n_surf=2)
+		tsdata=get_half(tsfull)
+		Ny=3*(M+1)*(N+1)
+		np.random.seed(2)
+		Uhalf=np.random.rand(10,3,Ny)-.5
+
+		for symmetry in ['sym','anti']:
+			fact=libsym.FACTOR[symmetry]
+			Out,Times,Nx=[],[],[]
+			for ts,Uin,kwargs in [(tsfull,to_full(Uhalf,fact,M,N),{}),
+								  (tsdata,Uhalf,{'symmetry':symmetry})]:
+				Dyn=linuvlm.Dynamic(ts,dt=0.05,**kwargs)
+				t0=time.time()
+				Dyn.assemble_ss()
+				Times.append(time.time()-t0)
+				Nx.append(Dyn.Nx)
+				Out.append(libss.simulate(Dyn.SS,Uin.reshape((10,-1)))[0])
+			print('%.2dx%.3dx%.3d\t%d\t%s\t%d\t%.2e\t%.1e'%(
+				M,N,M_star,Nx[0],symmetry,Nx[1],Times[1],
+										   relerr(Out[1],Out[0][:,:Ny])))
+			print('%.2dx%.3dx%.3d\t%d\tfull\t%d\t%.2e'%(
+							   M,N,M_star,Nx[0],Nx[0],Times[0]))
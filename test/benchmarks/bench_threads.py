@@ -0,0 +1,69 @@
+'''
+Benchmark: OpenMP scaling of the cpp backend
+Oct 2018
+
+Times the assembly of the AIC matrices at the collocation points 
+(assembly.AICs) and of the derivatives of the induced velocities at the 
+collocation points (assembly.nc_dqcdzeta) with the cpp backend, for an 
+increasing number of OpenMP threads (see kernels.set_num_threads). The
+best time over 3 repetitions is reported.
+
+By default, the number of threads is increased up to the number of available
+cores. Pass the max. number of threads as argument to override this.
+
+Usage:
+	python bench_threads.py [max_threads]
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces, assembly, kernels
+import lattice
+
+
+def timeit(fun,*args,Nrep=3):
+	tv=[]
+	for nn in range(Nrep):
+		t0=time.time()
+		out=fun(*args)
+		tv.append(time.time()-t0)
+	return min(tv),out
+
+
+
+if __name__=='__main__':
+
+	if len(sys.argv)>1:
+		max_threads=int(sys.argv[1])
+	else:
+		max_threads=os.cpu_count()
+	ThreadsList=[nn for nn in [1,2,4,8,16,32] if nn<=max_threads]
+
+	M,N,M_star=8,32,40
+	tsdata=lattice.flat_wing(M,N,M_star,n_surf=2)
+	MS=multisurfaces.MultiAeroGridSurfaces(tsdata,backend='cpp')
+
+	print('Lattice: M=%d, N=%d, M*=%d, 2 surfaces'%(M,N,M_star))
+	print('Available cores: %d'%os.cpu_count())
+	print('threads\tAICs [s]\tspeed-up\tnc_dqcdzeta [s]\tspeed-up')
+
+	num_threads=kernels.get_num_threads()
+	tref=None
+	for nn in ThreadsList:
+		kernels.set_num_threads(nn)
+
+		tv=[timeit(assembly.AICs,MS.Surfs,MS.Surfs_star)[0],
+			timeit(assembly.nc_dqcdzeta,MS.Surfs,MS.Surfs_star)[0]]
+
+		if tref is None:
+			tref=tv
+		print('%d\t%.3e\t%.2f\t\t%.3e\t%.2f'\
+					   %(nn,tv[0],tref[0]/tv[0],tv[1],tref[1]/tv[1]))
+
+	kernels.set_num_threads(num_threads)
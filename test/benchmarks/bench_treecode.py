@@ -0,0 +1,63 @@
+'''
+Benchmark: treecode vs direct evaluation of wake induced velocities
+Oct 2018
+
+Compares the time and accuracy of the velocities induced by the wake of a
+flat wing (lattice.flat_wing) over the collocation points and mid-segment
+points of the bound surface, when computed:
+- directly (numpy backend, lib_vbiot.ind_vel);
+- with the treecode (treecode backend, libtree.ind_vel) for different opening
+angles THETA.
+The wake circulation is randomly perturbed, such that all the wake edges have
+non-null circulation (as in an unsteady wake). The treecode times include the
+tree build.
+
+Usage:
+	python bench_treecode.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces, lib_vbiot, libtree
+import lattice
+
+
+
+if __name__=='__main__':
+
+	M,N=8,32
+	Mstar_list=[160,640,2560]
+	ThetaList=[0.2,0.3,0.5]
+
+	print('K\tK*\ttarget\t\tdirect [s]\ttheta\ttree [s]\tspeed-up\tmax rel err')
+	for M_star in Mstar_list:
+
+		tsdata=lattice.flat_wing(M,N,M_star,solve=False)
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+		Surf,Surf_star=MS.Surfs[0],MS.Surfs_star[0]
+		np.random.seed(2)
+		gamma=np.random.rand(M_star,N)
+
+		for target,zeta_target in [('collocation',Surf.zetac),
+							('segments',lib_vbiot.get_midsegments(Surf.zeta))]:
+			t0=time.time()
+			Uref=lib_vbiot.ind_vel(zeta_target,Surf_star.zeta,gamma)
+			t_ref=time.time()-t0
+
+			for theta in ThetaList:
+				libtree.THETA=theta
+				libtree.TreeCache=None # include tree build
+				t0=time.time()
+				Uind=libtree.ind_vel(zeta_target,Surf_star.zeta,gamma)
+				t_tree=time.time()-t0
+				er=np.max(np.abs(Uind-Uref))/np.max(np.abs(Uref))
+
+				print('%d\t%d\t%-12s\t%.3e\t%.1f\t%.3e\t%.1f\t\t%.1e'\
+						%(Surf.maps.K,Surf_star.maps.K,target,t_ref,theta,
+											   t_tree,t_ref/t_tree,er))
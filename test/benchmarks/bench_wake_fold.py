@@ -0,0 +1,70 @@
+'''
+Benchmark: folded steady-wake AIC
+Oct 2018
+
+Compares the time required to build the folded wake AIC matrix used in
+linuvlm.Static, of shape (K,N_star), when:
+- the full wake AIC, of shape (K,K_star), is built (lib_vbiot.aic3) and summed
+along the chord;
+- the folded AIC is built directly from the edges bounding each span-wise
+wake strip (lib_vbiot.aic3_folded).
+The wake of lattice.flat_wing is straight, hence each strip is represented by
+four edges only.
+
+Usage:
+	python bench_wake_fold.py
+'''
+
+import time
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces, lib_vbiot
+import lattice
+
+
+def aic_full_fold(zeta_target,zeta,normals):
+	N_star=zeta.shape[2]-1
+	AIC=lib_vbiot.aic3(zeta_target,zeta,normals)
+	AICfold=np.zeros((AIC.shape[0],N_star))
+	for jj in range(N_star):
+		AICfold[:,jj]=np.sum(AIC[:,jj::N_star],axis=1)
+	return AICfold
+
+
+def timeit(fun,*args,Nrep=3):
+	tv=[]
+	for nn in range(Nrep):
+		t0=time.time()
+		out=fun(*args)
+		tv.append(time.time()-t0)
+	return min(tv),out
+
+
+
+if __name__=='__main__':
+
+	Cases=[(4,16,40),(8,32,80),(12,48,120),(16,64,160)]
+
+	print('M\tN\tM*\tK\tK*\tfull+fold [s]\tfolded [s]\tspeed-up\tmax err')
+	for M,N,M_star in Cases:
+
+		tsdata=lattice.flat_wing(M,N,M_star,solve=False)
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+		Surf,Surf_star=MS.Surfs[0],MS.Surfs_star[0]
+		Surf.generate_collocations()
+		Surf.generate_normals()
+
+		t_ref,AIC_ref=timeit(aic_full_fold,
+									Surf.zetac,Surf_star.zeta,Surf.normals)
+		t_new,AIC=timeit(lib_vbiot.aic3_folded,
+									Surf.zetac,Surf_star.zeta,Surf.normals)
+		er=np.max(np.abs(AIC-AIC_ref))
+
+		print('%d\t%d\t%d\t%d\t%d\t%.3e\t%.3e\t%.1f\t\t%.1e'\
+				%(M,N,M_star,Surf.maps.K,Surf_star.maps.K,t_ref,t_new,
+														 t_ref/t_new,er))
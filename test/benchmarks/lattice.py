@@ -0,0 +1,139 @@
+'''
+Synthetic lattices for benchmarking
+Oct 2018
+
+Generates tsdata-like structures for a flat rectangular wing with a flat,
+straight wake. The output can be used in place of the tsdata read from the
+h5 files in test/h5input (e.g. to build a multisurfaces.MultiAeroGridSurfaces
+or a linuvlm.Static instance) to assess how the code scales with the number
+of panels.
+'''
+
+import numpy as np
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../../src/'))
+import multisurfaces, assembly
+
+
+class TimeStepLattice():
+	'''
+	Minimal replica of the time-step data read from SHARPy output files.
+	'''
+
+	def __init__(self):
+		pass
+
+
+
+def flat_wing(M,N,M_star,n_surf=1,chord=1.,semispan=4.,wake_length=None,
+								  alpha_deg=2.,u_inf=10.,rho=1.225,solve=True):
+	'''
+	Produces a tsdata-like structure for a flat rectangular wing with a flat
+	wake aligned with the x axis. 
+
+	- If n_surf=1, only the half-wing at y>=0 is generated.
+	- If n_surf=2, the half-wing at y<=0 is also added. This is the mirror
+	image of the first surface w.r.t. the xz plane. The spanwise indexing is 
+	reversed, such that the panels normals point in the same direction.
+
+	If solve is True, the circulation is computed from the steady 
+	non-penetration condition (wake circulation equal to the trailing edge 
+	one).
+	'''
+
+	assert n_surf in [1,2], 'n_surf must be 1 or 2'
+	if wake_length is None:
+		wake_length=10.*chord
+
+	alpha=np.pi/180.*alpha_deg
+	uvec=u_inf*np.array([np.cos(alpha),0.,np.sin(alpha)])
+
+	# bound and wake grids
+	xv=np.linspace(0.,chord,M+1)
+	xv_star=np.linspace(chord,chord+wake_length,M_star+1)
+	yv=np.linspace(0.,semispan,N+1)
+
+	tsdata=TimeStepLattice()
+	tsdata.n_surf=n_surf
+	tsdata.dimensions=np.array(n_surf*[[M,N]])
+	tsdata.dimensions_star=np.array(n_surf*[[M_star,N]])
+	tsdata.rho=rho
+
+	for attr in ['zeta','zeta_star','u_ext','zeta_dot','gamma','gamma_star',
+																 'gamma_dot']:
+		setattr(tsdata,attr,[])
+
+	for ss in range(n_surf):
+
+		zeta=np.zeros((3,M+1,N+1))
+		zeta_star=np.zeros((3,M_star+1,N+1))
+		zeta[0]=xv[:,None]
+		zeta_star[0]=xv_star[:,None]
+		if ss==0:
+			zeta[1]=yv[None,:]
+			zeta_star[1]=yv[None,:]
+		else:
+			zeta[1]=-yv[None,::-1]
+			zeta_star[1]=-yv[None,::-1]
+
+		tsdata.zeta.append(zeta)
+		tsdata.zeta_star.append(zeta_star)
+		tsdata.u_ext.append(np.zeros((3,M+1,N+1))+uvec[:,None,None])
+		tsdata.zeta_dot.append(np.zeros((3,M+1,N+1)))
+		tsdata.gamma.append(np.zeros((M,N)))
+		tsdata.gamma_star.append(np.zeros((M_star,N)))
+		tsdata.gamma_dot.append(np.zeros((M,N)))
+
+	if solve:
+		solve_steady(tsdata)
+
+	return tsdata
+
+
+
+def solve_steady(tsdata):
+	'''
+	Updates the bound and wake circulation of tsdata such that the 
+	non-penetration condition is satisfied at the collocation points and the
+	wake is steady.
+	'''
+
+	MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+	for Surf in MS.Surfs:
+		Surf.get_normal_input_velocities_at_collocation_points()
+	AIC_list,AIC_star_list=assembly.AICs(MS.Surfs,MS.Surfs_star)
+
+	K=sum(MS.KK)
+	AIC=np.zeros((K,K))
+	unorm=np.zeros((K,))
+
+	ii0=0
+	for ss_out in range(MS.n_surf):
+		iivec=range(ii0,ii0+MS.KK[ss_out])
+		unorm[iivec]=MS.Surfs[ss_out].u_input_coll_norm.reshape(-1)
+		jj0=0
+		for ss_in in range(MS.n_surf):
+			jjvec=range(jj0,jj0+MS.KK[ss_in])
+			AIC[ii0:ii0+MS.KK[ss_out],jjvec]=AIC_list[ss_out][ss_in]
+			# fold wake
+			M_in,N_in=MS.MM[ss_in],MS.NN[ss_in]
+			AIC[ii0:ii0+MS.KK[ss_out],jj0+(M_in-1)*N_in:jj0+M_in*N_in]+=\
+			   AIC_star_list[ss_out][ss_in].reshape(
+								   (MS.KK[ss_out],MS.MM_star[ss_in],N_in)).sum(1)
+			jj0+=MS.KK[ss_in]
+		ii0+=MS.KK[ss_out]
+
+	gamma=np.linalg.solve(AIC,-unorm)
+
+	jj0=0
+	for ss in range(MS.n_surf):
+		M,N=MS.MM[ss],MS.NN[ss]
+		tsdata.gamma[ss][:,:]=gamma[jj0:jj0+M*N].reshape((M,N))
+		tsdata.gamma_star[ss][:,:]=tsdata.gamma[ss][-1,:]
+		jj0+=M*N
+
+	return tsdata
@@ -4,6 +4,8 @@ S. Maraniello, 29 May 2018
 '''
 
 import numpy as np 
+import scipy.linalg as scalg
+import scipy.sparse as sparse
 import warnings
 import unittest
 import itertools
@@ -900,6 +902,236 @@ class Test_assembly(unittest.TestCase):
 
 
 
+	def test_inplace(self):
+		'''
+		Checks the in-place assembly of global matrices against the blocks
+		returned by the assembly routines, on a multi-surface case.
+		'''
+
+		haero=read.h5file('./h5input/goland_mod_Nsurf02_M003_N004_a040.aero_state.h5')
+		MS=multisurfaces.MultiAeroGridSurfaces(haero.ts00000)
+		MS.get_ind_velocities_at_collocation_points()
+		MS.get_ind_velocities_at_segments()
+		MS.get_input_velocities_at_segments()
+		K,K_star,Kzeta=sum(MS.KK),sum(MS.KK_star),sum(MS.KKzeta)
+
+		List,List_star=assembly.AICs(MS.Surfs,MS.Surfs_star)
+		AIC,AIC_star=np.empty((K,K)),np.empty((K,K_star))
+		assembly.AICs(MS.Surfs,MS.Surfs_star,AIC=AIC,AIC_star=AIC_star)
+		assert np.array_equal(AIC,np.block(List)), 'AIC not matching'
+		assert np.array_equal(AIC_star,np.block(List_star)),\
+												   'AIC_star not matching'
+
+		List_coll,List_vert=assembly.nc_dqcdzeta(MS.Surfs,MS.Surfs_star)
+		Der=np.zeros((K,3*Kzeta))
+		assembly.nc_dqcdzeta(MS.Surfs,MS.Surfs_star,Der=Der)
+		Der_ref=np.block(List_vert)+scalg.block_diag(*List_coll)
+		assert np.max(np.abs(Der-Der_ref))<1e-12*np.max(np.abs(Der_ref)),\
+												'nc_dqcdzeta not matching'
+
+		List_coll,List_vert=assembly.dfqsdvind_zeta(MS.Surfs,MS.Surfs_star)
+		Der=np.zeros((3*Kzeta,3*Kzeta))
+		assembly.dfqsdvind_zeta(MS.Surfs,MS.Surfs_star,Der=Der)
+		Der_ref=np.block(List_vert)+scalg.block_diag(*List_coll)
+		assert np.max(np.abs(Der-Der_ref))<1e-12*np.max(np.abs(Der_ref)),\
+												'dfqsdvind_zeta not matching'
+
+		List,List_star=assembly.dfqsdvind_gamma(MS.Surfs,MS.Surfs_star)
+		Der,Der_star=np.zeros((3*Kzeta,K)),np.zeros((3*Kzeta,K_star))
+		assembly.dfqsdvind_gamma(MS.Surfs,MS.Surfs_star,Der=Der,Der_star=Der_star)
+		assert np.array_equal(Der,np.block(List)), 'dfqsdvind_gamma not matching'
+		assert np.array_equal(Der_star,np.block(List_star)),\
+										   'dfqsdvind_gamma (wake) not matching'
+
+
+
+	def test_sparse_format(self):
+		'''
+		Checks the sparse output of the local derivatives against the full
+		one and add_block_diag against scipy.linalg.block_diag.
+		'''
+
+		MS=self.MS
+		for Surf in MS.Surfs:
+			Surf.omega=np.array([0.3,-0.2,0.5])
+
+		for fun in [assembly.dfqsdgamma_vrel0,assembly.dfqsdzeta_vrel0,
+					assembly.dfqsduinput,assembly.dfqsdzeta_omega,
+												assembly.nc_domegazetadzeta]:
+			Out=fun(MS.Surfs,MS.Surfs_star)
+			Out_sp=fun(MS.Surfs,MS.Surfs_star,sparse_format=True)
+			if fun is assembly.dfqsdgamma_vrel0:
+				Out,Out_sp=Out[0]+Out[1],Out_sp[0]+Out_sp[1]
+			for der,der_sp in zip(Out,Out_sp):
+				assert sparse.isspmatrix_csr(der_sp), 'Not in csr format'
+				assert np.array_equal(der,der_sp.toarray()),\
+									  '%s: sparse output not matching'%fun.__name__
+				assert der_sp.nnz<=0.5*np.prod(der.shape), 'Not sparse'
+
+			Der_ref=scalg.block_diag(*Out)
+			Der=assembly.add_block_diag(np.zeros(Der_ref.shape),Out_sp)
+			assert np.array_equal(Der,Der_ref), 'add_block_diag not matching'
+
+
+
+	def test_input_velocities(self):
+		'''
+		Compares the input velocities at collocation points and segments against
+		those computed vertex by vertex and panel by panel, on a rotating surface
+		with and without zeta_dot.
+		'''
+
+		MS=self.MS
+		for ss in range(MS.n_surf):
+			Surf=MS.Surfs[ss]
+			M,N=Surf.maps.M,Surf.maps.N
+			Surf.omega=np.array([.3,-.2,10.])
+			for zeta_dot in [None,np.random.rand(3,M+1,N+1)]:
+				Surf.zeta_dot=zeta_dot
+				u_ext=Surf.u_ext.copy()
+				Surf.get_input_velocities_at_collocation_points()
+				Surf.get_input_velocities_at_segments()
+				assert np.array_equal(Surf.u_ext,u_ext), 'u_ext modified'
+
+				# reference
+				if zeta_dot is None:
+					u_tot=Surf.u_ext.copy()
+				else:
+					u_tot=Surf.u_ext-zeta_dot
+				for mm,nn in itertools.product(range(M+1),range(N+1)):
+					u_tot[:,mm,nn]-=np.cross(Surf.omega,Surf.zeta[:,mm,nn])
+				wcv=Surf.get_panel_wcv()
+				u_coll=np.zeros((3,M,N))
+				u_seg=np.empty((3,4,M,N))
+				for mm,nn in itertools.product(range(M),range(N)):
+					mpv=Surf.maps.from_panel_to_vertices(mm,nn)
+					for vv in range(4):
+						u_coll[:,mm,nn]+=wcv[vv]*u_tot[:,mpv[vv,0],mpv[vv,1]]
+						aa,bb=mpv[vv],mpv[(vv+1)%4]
+						u_seg[:,vv,mm,nn]=.5*(u_tot[:,aa[0],aa[1]]+
+											  u_tot[:,bb[0],bb[1]])
+
+				assert np.array_equal(Surf.u_input_coll,u_coll),\
+								'Input velocities at collocation points not matching'
+				assert np.array_equal(Surf.u_input_seg,u_seg),\
+									  'Input velocities at segments not matching'
+
+
+
+	def test_joukovski_qs(self):
+		'''
+		Compares the quasi-steady forces of get_joukovski_qs against those
+		computed segment by segment.
+		'''
+
+		MS=self.MS
+		for ss in range(MS.n_surf):
+			Surf=MS.Surfs[ss]
+			gammaw_TE=MS.Surfs_star[ss].gamma[0,:]
+			M,N=Surf.maps.M,Surf.maps.N
+			Surf.get_joukovski_qs(gammaw_TE=gammaw_TE)
+
+			fqs=np.zeros((3,M+1,N+1))
+			for mm,nn in itertools.product(range(M),range(N)):
+				zetav_here=Surf.get_panel_vertices_coords(mm,nn)
+				for ll,aa,bb in zip(range(4),[0,1,2,3],[1,2,3,0]):
+					df=libuvlm.joukovski_qs_segment(
+						zetaA=zetav_here[aa,:],zetaB=zetav_here[bb,:],
+						v_mid=Surf.u_ind_seg[:,ll,mm,nn]+Surf.u_input_seg[:,ll,mm,nn],
+						gamma=1.0,fact=Surf.rho)
+					assert np.array_equal(Surf.fqs_seg_unit[:,ll,mm,nn],df),\
+												'Segment forces not matching'
+					for vv in [aa,bb]:
+						fqs[:,mm+[0,1,1,0][vv],nn+[0,0,1,1][vv]]+=\
+												 0.5*Surf.gamma[mm,nn]*df
+			for nn in range(N):
+				df=libuvlm.joukovski_qs_segment(
+					zetaA=Surf.zeta[:,M,nn+1],zetaB=Surf.zeta[:,M,nn],
+					v_mid=Surf.u_input_seg[:,1,M-1,nn]+Surf.u_ind_seg[:,1,M-1,nn],
+					gamma=1.0,fact=Surf.rho)
+				assert np.array_equal(Surf.fqs_wTE_unit[:,nn],df),\
+											   'TE segment forces not matching'
+				fqs[:,M,nn+1]+=0.5*gammaw_TE[nn]*df
+				fqs[:,M,nn]+=0.5*gammaw_TE[nn]*df
+
+			assert np.max(np.abs(Surf.fqs-fqs))<1e-12*np.max(np.abs(fqs)),\
+												  'Vertex forces not matching'
+
+
+
+	def test_hmatrix(self):
+		'''
+		Checks the compressed (hierarchical) AIC matrices against the full ones,
+		on a multi-surface case with surfaces far apart.
+		'''
+
+		haero=read.h5file('./h5input/goland_mod_Nsurf02_M003_N004_a040.aero_state.h5')
+		tsdata=haero.ts00000
+		for zeta in [tsdata.zeta,tsdata.zeta_star]:
+			zeta[1]=zeta[1]+np.array([0.,0.,100.])[:,None,None]
+		MS=multisurfaces.MultiAeroGridSurfaces(tsdata)
+
+		tol=1e-4
+		List,List_star=assembly.AICs(MS.Surfs,MS.Surfs_star)
+		for Surfs_in,AIC in [(MS.Surfs,np.block(List)),
+							 (MS.Surfs_star,np.block(List_star))]:
+			H=assembly.AIC_hmatrix(MS.Surfs,Surfs_in,tol=tol,leaf_size=8)
+			assert len(H.LowRank)>0 and H.compression<1., 'No compression'
+
+			# low-rank blocks accuracy
+			for Itrg,Ipan,U,V in H.LowRank:
+				Aref=AIC[np.ix_(Itrg,Ipan)]
+				assert np.linalg.norm(np.dot(U,V)-Aref)<\
+								  10.*tol*np.linalg.norm(Aref),'ACA not accurate'
+			for Itrg,Ipan,A in H.Dense:
+				assert np.max(np.abs(A-AIC[np.ix_(Itrg,Ipan)]))<\
+						1e-14*np.max(np.abs(AIC)),'Dense block not matching'
+
+			# products and full/sub-blocks
+			Hfull=H.todense()
+			X=np.random.rand(H.shape[1],3)
+			Z=np.random.rand(H.shape[0],3)
+			assert np.max(np.abs(H.dot(X)-np.dot(Hfull,X)))<1e-14,\
+													   'Product not matching'
+			assert np.max(np.abs(H.rdot(Z)-np.dot(Hfull.T,Z)))<1e-14,\
+											 'Transpose product not matching'
+			Itrg,Ipan=np.arange(3,17),np.arange(5,24)
+			assert np.array_equal(H.todense(Itrg,Ipan),Hfull[np.ix_(Itrg,Ipan)]),\
+													 'Sub-block not matching'
+
+
+	def test_aic_batch(self):
+		'''
+		Compares the AIC matrices obtained with one call per target point and
+		with one call per surface.
+		'''
+
+		MS=self.MS
+		AIC_list,AIC_star_list=assembly.AICs(MS.Surfs,MS.Surfs_star,
+											   target='collocation',Project=True)
+		AIC3_list,AIC3_star_list=assembly.AICs(MS.Surfs,MS.Surfs_star,
+											  target='collocation',Project=False)
+
+		for ss_out in range(MS.n_surf):
+			Surf_out=MS.Surfs[ss_out]
+			for ss_in in range(MS.n_surf):
+				for Surf_in,AIC,AIC3 in zip(
+						[MS.Surfs[ss_in],MS.Surfs_star[ss_in]],
+						[AIC_list[ss_out][ss_in],AIC_star_list[ss_out][ss_in]],
+						[AIC3_list[ss_out][ss_in],AIC3_star_list[ss_out][ss_in]]):
+
+					for cc in range(Surf_out.maps.K):
+						mm=Surf_out.maps.ind_2d_pan_scal[0][cc]
+						nn=Surf_out.maps.ind_2d_pan_scal[1][cc]
+						aic3=Surf_in.get_aic3_cpp(Surf_out.zetac[:,mm,nn])
+						ermax=np.max(np.abs(AIC3[:,cc,:]-aic3))
+						assert ermax<1e-14, 'Batched AIC3 not matching!'
+						ermax=np.max(np.abs(AIC[cc,:]-
+									 np.dot(Surf_out.normals[:,mm,nn],aic3)))
+						assert ermax<1e-14, 'Batched AIC not matching!'
+
+
+
 	def test_wake_prop(self):
 
 		MS=self.MS
@@ -928,6 +1160,15 @@ class Test_assembly(unittest.TestCase):
 			assert np.max(np.abs(gvec-gvec_ref))<1e-15,\
 										  'Prop. from trailing edge not correct'
 
+		# sparse format
+		C_sp_list,Cstar_sp_list=assembly.wake_prop(
+									MS.Surfs,MS.Surfs_star,sparse_format=True)
+		for ss in range(n_surf):
+			assert np.max(np.abs(C_sp_list[ss].toarray()-C_list[ss]))<1e-15,\
+							'Sparse prop. from trailing edge not matching'
+			assert np.max(np.abs(Cstar_sp_list[ss].toarray()-Cstar_list[ss]))\
+							<1e-15, 'Sparse wake propagation not matching'
+
 
 
 
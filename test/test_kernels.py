@@ -0,0 +1,389 @@
+'''
+Test consistency of induced velocity kernels
+Oct 2018
+'''
+
+import numpy as np
+import unittest
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../src/'))
+import read, multisurfaces, kernels, lib_vbiot, libtree, assembly
+
+
+class Test_kernels(unittest.TestCase):
+	'''
+	Compares induced velocities and AICs computed with different backends over
+	the test/h5input cases.
+	'''
+
+	FileList=['./h5input/goland_mod_Nsurf01_M003_N004_a040.aero_state.h5',
+			  './h5input/goland_mod_Nsurf02_M003_N004_a040.aero_state.h5']
+
+	def setUp(self):
+
+		self.MSlist=[]
+		for fname in self.FileList:
+			haero=read.h5file(fname)
+			self.MSlist.append(multisurfaces.MultiAeroGridSurfaces(haero.ts00000))
+
+
+	def compare_backends(self,name_ref,name):
+		'''
+		Compares induced velocities, AICs and their derivatives computed with
+		the backends name and name_ref.
+		'''
+
+		print('----------------------- Testing backends %s vs %s'%(name,name_ref))
+		for nn in [name,name_ref]:
+			if nn not in kernels.available():
+				self.skipTest('Backend %s not available'%nn)
+		Kref=kernels.get(name_ref)
+		Kern=kernels.get(name)
+
+		for MS in self.MSlist:
+			for Surf_out in MS.Surfs:
+				for Surf_in in MS.Surfs+MS.Surfs_star:
+
+					for target,Project in [('collocation',True),
+										   ('collocation',False),
+										   ('segments',False)]:
+						Uref=Surf_in.get_induced_velocity_over_surface(Surf_out,
+							  target=target,Project=Project,backend=name_ref)
+						Uind=Surf_in.get_induced_velocity_over_surface(Surf_out,
+							  target=target,Project=Project,backend=name)
+						ermax=np.max(np.abs(Uind-Uref))
+						assert ermax<1e-12*max(1.,np.max(np.abs(Uref))),\
+							'Induced velocities (%s, Project=%s) not matching'\
+														 %(target,Project)
+
+						AICref=Surf_in.get_aic_over_surface(Surf_out,
+							  target=target,Project=Project,backend=name_ref)
+						AIC=Surf_in.get_aic_over_surface(Surf_out,
+							  target=target,Project=Project,backend=name)
+						ermax=np.max(np.abs(AIC-AICref))
+						assert ermax<1e-13*max(1.,np.max(np.abs(AICref))),\
+							'AIC (%s, Project=%s) not matching'%(target,Project)
+
+				# derivatives at collocation points
+				for ss_in in range(MS.n_surf):
+					M_in_bound=MS.Surfs[ss_in].maps.M
+					for Surf_in,IsBound in [(MS.Surfs[ss_in],True),
+											(MS.Surfs_star[ss_in],False)]:
+						for mm,nn in [(0,0),
+									  (Surf_out.maps.M-1,Surf_out.maps.N-1)]:
+							zetac=Surf_out.zetac[:,mm,nn].copy()
+							Dref=Kref.dvinddzeta(zetac,Surf_in.zeta,
+									   Surf_in.gamma,IsBound,M_in_bound)
+							Der=Kern.dvinddzeta(zetac,Surf_in.zeta,
+									   Surf_in.gamma,IsBound,M_in_bound)
+							for dref,der in zip(Dref,Der):
+								ermax=np.max(np.abs(der-dref))
+								assert ermax<1e-12*max(1.,np.max(np.abs(dref))),\
+									   'Induced velocity derivatives not matching'
+
+							zeta_panel=np.ascontiguousarray(
+										  Surf_in.zeta[:,[0,1,1,0],[0,0,1,1]].T)
+							Dref=Kref.eval_panel(zetac,zeta_panel,2.)
+							Der=Kern.eval_panel(zetac,zeta_panel,2.)
+							for dref,der in zip(Dref,Der):
+								ermax=np.max(np.abs(der-dref))
+								assert ermax<1e-12*max(1.,np.max(np.abs(dref))),\
+												  'Panel derivatives not matching'
+
+
+	def test_numpy_vs_cpp(self):
+		self.compare_backends('cpp','numpy')
+
+
+	def test_numba_vs_cpp(self):
+		self.compare_backends('cpp','numba')
+
+
+	def test_numba_vs_numpy(self):
+		self.compare_backends('numpy','numba')
+
+
+	def test_default(self):
+		'''
+		Checks that the process default backend is used, unless a backend is
+		specified for a surface.
+		'''
+
+		MS=self.MSlist[0]
+		Surf_out,Surf_in=MS.Surfs[0],MS.Surfs_star[0]
+		default=kernels.DEFAULT
+		try:
+			kernels.set_backend('numpy')
+			assert kernels.get().name=='numpy', 'Default backend not set'
+			Uref=Surf_in.get_induced_velocity_over_surface(Surf_out,
+													target='collocation')
+			Surf_in.backend=default
+			Uind=Surf_in.get_induced_velocity_over_surface(Surf_out,
+													target='collocation')
+		finally:
+			Surf_in.backend=None
+			kernels.set_backend(default)
+		assert np.max(np.abs(Uind-Uref))<1e-12, 'Backends not matching'
+		with self.assertRaises(NameError):
+			kernels.set_backend('unknown')
+
+
+	def test_index_tables(self):
+		'''
+		Checks the panel to vertices index tables and the derivatives of
+		assembly.dvinddzeta, which uses them, against the cpp routine.
+		'''
+
+		MS=self.MSlist[-1]
+		for ss in range(MS.n_surf):
+			Surf,Surf_star=MS.Surfs[ss],MS.Surfs_star[ss]
+			M,N=Surf.maps.M,Surf.maps.N
+
+			Ind=Surf.maps.map_panels_to_vertices_1D_vector()
+			IndTE=Surf_star.maps.map_te_panels_to_bound_vertices_1D_vector(M)
+			for mm in range(M):
+				for nn in range(N):
+					for vv,dm,dn in zip(range(4),[0,1,1,0],[0,0,1,1]):
+						for cc in range(3):
+							assert Ind[mm*N+nn,vv,cc]==np.ravel_multi_index(
+									(cc,mm+dm,nn+dn),(3,M+1,N+1)),'Wrong index'
+			for nn in range(N):
+				for vv,dn in zip(range(2),[0,1]):
+					for cc in range(3):
+						assert IndTE[nn,vv,cc]==np.ravel_multi_index(
+									(cc,M,nn+dn),(3,M+1,N+1)),'Wrong TE index'
+
+			if 'cpp' not in kernels.available():
+				continue
+			zetac=Surf.zetac[:,1,1].copy()
+			for Surf_in,IsBound in [(Surf,True),(Surf_star,False)]:
+				Dref=assembly.dvinddzeta_cpp(zetac,Surf_in,IsBound,M_in_bound=M)
+				Der=assembly.dvinddzeta(zetac,Surf_in,IsBound,M_in_bound=M)
+				for dref,der in zip(Dref,Der):
+					assert np.max(np.abs(der-dref))<1e-12*np.max(np.abs(dref)),\
+										   'Induced velocity derivatives not matching'
+
+
+	def test_panel_vertices(self):
+		'''
+		Checks the cached panel vertices against the surface vertices and that
+		the cache is dropped when the vertices are reassigned or modified in
+		place.
+		'''
+
+		MS=self.MSlist[-1]
+		Surf=MS.Surfs[0]
+		M,N=Surf.maps.M,Surf.maps.N
+		zeta0=Surf.zeta.copy()
+
+		for zeta in [zeta0,zeta0+1.]:
+			Surf.zeta=zeta.copy()
+			ZetaPanels=Surf.get_panel_vertices()
+			assert ZetaPanels.shape==(M*N,4,3), 'Wrong shape'
+			assert ZetaPanels.flags['C_CONTIGUOUS'], 'Not C contiguous'
+			assert ZetaPanels is Surf.get_panel_vertices(), 'Not cached'
+			for mm in range(M):
+				for nn in range(N):
+					zeta_panel=zeta[:,[mm,mm+1,mm+1,mm],[nn,nn,nn+1,nn+1]].T
+					assert np.array_equal(ZetaPanels[mm*N+nn],zeta_panel),\
+												   'Wrong panel vertices'
+					assert np.array_equal(
+						Surf.get_panel_vertices_coords(mm,nn),zeta_panel),\
+												   'Wrong panel vertices'
+		with self.assertRaises(ValueError):
+			ZetaPanels[0,0,0]=0.
+
+		# in-place changes drop the cache
+		Surf.zeta[0,0,0]+=1.
+		assert Surf.get_panel_vertices()[0,0,0]==Surf.zeta[0,0,0],\
+												   'Cache not dropped'
+		assert np.array_equal(Surf.get_panel_vertices_coords(0,0)[0],
+								   Surf.zeta[:,0,0]), 'Cache not dropped'
+		ZetaPanels=Surf.get_panel_vertices()
+		assert ZetaPanels is Surf.get_panel_vertices(), 'Not cached'
+		Surf.zeta=zeta0
+
+
+	def test_edges(self):
+		'''
+		Checks the unique edges mapping and the induced velocities and AICs at
+		the edges against those at the panel segments.
+		'''
+
+		MS=self.MSlist[-1]
+		Surf_out=MS.Surfs[0]
+		M,N=Surf_out.maps.M,Surf_out.maps.N
+		Surf_out.maps.map_edges()
+		Mev,Mpe,Spe=Surf_out.maps.Mev,Surf_out.maps.Mpe,Surf_out.maps.Spe
+		assert Surf_out.maps.Nedges==M*(N+1)+(M+1)*N, 'Wrong number of edges'
+
+		# segment vertices (local numbering) vs edge vertices
+		Zeta1d=Surf_out.zeta.reshape((3,-1))
+		for mm in range(M):
+			for nn in range(N):
+				zeta_panel=Surf_out.zeta[:,[mm,mm+1,mm+1,mm],[nn,nn,nn+1,nn+1]]
+				for ll,aa,bb in zip(range(4),[0,1,2,3],[1,2,3,0]):
+					ee=Mpe[mm*N+nn,ll]
+					lv=Spe[ll]*(Zeta1d[:,Mev[ee,1]]-Zeta1d[:,Mev[ee,0]])
+					assert np.max(np.abs(lv-zeta_panel[:,bb]+zeta_panel[:,aa]))\
+											<1e-15, 'Wrong panel to edge mapping'
+
+		for Surf_in in [MS.Surfs[1],MS.Surfs_star[1]]:
+			Useg=Surf_in.get_induced_velocity_over_surface(Surf_out,
+													target='segments')
+			Uedg=Surf_in.get_induced_velocity_over_surface(Surf_out,
+													target='edges')
+			AICseg=Surf_in.get_aic_over_surface(Surf_out,
+									  target='segments',Project=False)
+			AICedg=Surf_in.get_aic_over_surface(Surf_out,
+									  target='edges',Project=False)
+			assert AICedg.size<0.7*AICseg.size, 'Edges AIC not compact'
+			for ll in range(4):
+				Ind=Mpe[:,ll]
+				assert np.array_equal(Useg[:,ll].reshape((3,-1)),Uedg[:,Ind]),\
+											   'Velocities at edges not matching'
+				assert np.array_equal(AICseg[:,:,ll].reshape((3,-1,M*N)),
+									  AICedg[:,Ind,:].transpose((0,2,1))),\
+													  'AICs at edges not matching'
+
+
+	def test_num_threads(self):
+		'''
+		Checks that the output of the cpp backend does not depend on the number
+		of threads.
+		'''
+
+		if 'cpp' not in kernels.available():
+			self.skipTest('Backend cpp not available')
+		Kern=kernels.get('cpp')
+		MS=self.MSlist[-1]
+		Surf_out,Surf_in=MS.Surfs[0],MS.Surfs[1]
+
+		num_threads=kernels.get_num_threads()
+		Out=[]
+		try:
+			for nn in [1,3]:
+				kernels.set_num_threads(nn)
+				assert kernels.get_num_threads()==nn, 'Number of threads not set'
+				Out.append(
+					[Kern.aic3(Surf_out.zetac,Surf_in.zeta,Surf_out.normals),
+					 Kern.ind_vel(Surf_out.zetac,Surf_in.zeta,Surf_in.gamma)]+
+					 list(Kern.nc_dvinddzeta(Surf_out.zetac,Surf_out.normals,
+									 Surf_in.zeta,Surf_in.gamma,True)) )
+		finally:
+			kernels.set_num_threads(num_threads)
+
+		for out_ref,out in zip(*Out):
+			assert np.array_equal(out_ref,out), 'Output depends on threads'
+
+
+	def test_numpy_chunks(self):
+		'''
+		Checks that the output of the numpy kernels does not depend on the
+		chunking of target points.
+		'''
+
+		MS=self.MSlist[-1]
+		Surf_out,Surf_in=MS.Surfs[0],MS.Surfs_star[1]
+
+		AICref=lib_vbiot.aic3(Surf_out.zetac,Surf_in.zeta,Surf_out.normals)
+		Uref=lib_vbiot.ind_vel(Surf_out.zetac,Surf_in.zeta,Surf_in.gamma)
+
+		MAX_PAIRS=lib_vbiot.MAX_PAIRS
+		try:
+			lib_vbiot.MAX_PAIRS=1
+			AIC=lib_vbiot.aic3(Surf_out.zetac,Surf_in.zeta,Surf_out.normals)
+			Uind=lib_vbiot.ind_vel(Surf_out.zetac,Surf_in.zeta,Surf_in.gamma)
+		finally:
+			lib_vbiot.MAX_PAIRS=MAX_PAIRS
+
+		assert np.max(np.abs(AIC-AICref))<1e-15, 'Chunking changes AIC'
+		assert np.max(np.abs(Uind-Uref))<1e-13, 'Chunking changes velocities'
+
+
+	def test_folded_wake(self):
+		'''
+		Checks the folded AICs of a steady wake against the full wake AICs
+		summed along the chord, for a curved and a straight wake.
+		'''
+
+		MS=self.MSlist[-1]
+		Surf_out,Surf_in=MS.Surfs[0],MS.Surfs_star[1]
+		_,Mv,Nv=Surf_in.zeta.shape
+
+		# straight wake: same first and last row
+		Alpha=np.linspace(0.,1.,Mv)[None,:,None]
+		zeta_straight=(1.-Alpha)*Surf_in.zeta[:,:1,:]+\
+											Alpha*Surf_in.zeta[:,-1:,:]
+
+		for zeta,Nlines in [(Surf_in.zeta,Mv-1),(zeta_straight,1)]:
+			ZetaA,ZetaB,Istart=lib_vbiot.get_strips_edges(zeta)
+			assert np.array_equal(np.diff(Istart),Nlines*np.ones((Nv-1,))),\
+										 'Wrong number of chord-wise edges'
+
+			for Normals in [Surf_out.normals,None]:
+				AIC=lib_vbiot.aic3(Surf_out.zetac,zeta,Normals)
+				AICfold=lib_vbiot.aic3_folded(Surf_out.zetac,zeta,Normals)
+				AICref=np.zeros(AICfold.shape)
+				for jj in range(Nv-1):
+					AICref[...,jj]=np.sum(AIC[...,jj::Nv-1],axis=-1)
+				ermax=np.max(np.abs(AICfold-AICref))
+				assert ermax<1e-12*np.max(np.abs(AICref)),\
+								   'Folded AIC not matching (error %.2e)'%ermax
+
+	def test_treecode(self):
+		'''
+		Checks the multipole expansion of the treecode and the induced
+		velocities over collocation points and segments against the numpy
+		backend, for decreasing opening angles.
+		'''
+
+		MS=self.MSlist[-1]
+		Surf_out,Surf_in=MS.Surfs[0],MS.Surfs_star[1]
+		gamma=Surf_in.gamma*(1.+np.linspace(0.,1.,Surf_in.maps.K).reshape(
+												  Surf_in.gamma.shape))
+
+		# far-field expansion: error must decrease as 1/dist^5
+		ZetaA,ZetaB=lib_vbiot.get_edges(Surf_in.zeta)
+		Gedges=lib_vbiot.get_edges_gamma(gamma)
+		c=np.mean(Surf_in.zeta.reshape((3,-1)),axis=1)
+		Moments=libtree.get_moments(ZetaA,ZetaB,Gedges,c)
+		Er=[]
+		for dist in [1e2,1e3]:
+			r=dist*np.array([[1.,0.3,-0.2],[-0.1,1.,0.5]]).T
+			Uref=np.dot(lib_vbiot.biot_edges(c[:,None]+r,ZetaA,ZetaB),Gedges)
+			Uind=libtree.eval_moments(*Moments,r)
+			Er.append(np.max(np.abs(Uind-Uref)))
+		assert Er[1]<2e-5*Er[0], 'Wrong order of multipole expansion'
+
+		THETA,LEAF_SIZE=libtree.THETA,libtree.LEAF_SIZE
+		try:
+			libtree.LEAF_SIZE=4
+			for zeta_target in [Surf_out.zetac,
+								lib_vbiot.get_midsegments(Surf_out.zeta)]:
+				Uref=lib_vbiot.ind_vel(zeta_target,Surf_in.zeta,gamma)
+				Er=[]
+				for theta in [0.,0.2,0.4]:
+					libtree.THETA=theta
+					Uind=libtree.ind_vel(zeta_target,Surf_in.zeta,gamma)
+					Er.append(np.max(np.abs(Uind-Uref))/np.max(np.abs(Uref)))
+				assert Er[0]<1e-14, 'Treecode with direct evaluation not exact'
+				assert Er[1]<1e-3 and Er[2]<5e-2, 'Treecode not accurate'
+		finally:
+			libtree.THETA,libtree.LEAF_SIZE=THETA,LEAF_SIZE
+
+		Uref=Surf_in.get_induced_velocity_over_surface(Surf_out,
+									   target='segments',backend='numpy')
+		Uind=Surf_in.get_induced_velocity_over_surface(Surf_out,
+									   target='segments',backend='treecode')
+		assert np.max(np.abs(Uind-Uref))<1e-2*np.max(np.abs(Uref)),\
+								 'Treecode backend not matching'
+
+
+if __name__=='__main__':
+
+	unittest.main()
@@ -0,0 +1,495 @@
+'''
+Test linearised UVLM solvers
+Oct 2018
+'''
+
+import copy
+import shutil
+import tempfile
+import numpy as np
+import unittest
+import scipy.sparse as sparse
+
+import sys, os
+try:
+	sys.path.append(os.environ['DIRuvlm3d'])
+except KeyError:
+	sys.path.append(os.path.abspath('../src/'))
+import read, linuvlm, libss, libcache, libsym
+
+
+class Test_linuvlm(unittest.TestCase):
+	'''
+	Tests the state-space realisations of linuvlm.Dynamic
+	'''
+
+	fname='./h5input/goland_mod_Nsurf02_M003_N004_a040.aero_state.h5'
+
+	def setUp(self):
+		haero=read.h5file(self.fname)
+		self.tsdata=haero.ts00000
+
+
+	def test_update_flow(self):
+		'''
+		Checks the update of the flow-dependent terms of the static solver
+		against a new assembly at the scaled linearisation point.
+		'''
+
+		names=['Ducdzeta','Dfqsdzeta','Dfqsdu_ext','Dfqsdgamma','Dfqsdgamma_star']
+		Sta=linuvlm.Static(self.tsdata)
+		Sta.assemble()
+
+		# same linearisation point: circulation from non-penetration
+		Ref={}
+		for name in names:
+			Ref[name]=getattr(Sta,name).copy()
+		Sta.update_flow()
+		for name in names:
+			ermax=np.max(np.abs(getattr(Sta,name)-Ref[name]))
+			assert ermax<1e-12*np.max(np.abs(Ref[name])),\
+										  '%s not matching after update'%name
+
+		# scaled external velocities
+		fact=1.7
+		tsdata=copy.deepcopy(self.tsdata)
+		for ss in range(tsdata.n_surf):
+			tsdata.u_ext[ss]=fact*tsdata.u_ext[ss]
+			tsdata.gamma[ss]=fact*tsdata.gamma[ss]
+			tsdata.gamma_star[ss]=fact*tsdata.gamma_star[ss]
+		Sref=linuvlm.Static(tsdata)
+		Sref.assemble()
+		Sta.update_flow(u_ext=tsdata.u_ext)
+		for name in names:
+			ermax=np.max(np.abs(getattr(Sta,name)-getattr(Sref,name)))
+			assert ermax<1e-12*np.max(np.abs(Ref[name])),\
+								'%s not matching at new linearisation point'%name
+
+		Sta.u_ext=np.random.rand(3*Sta.Kzeta)
+		Sref.u_ext=Sta.u_ext
+		Sta.solve()
+		Sref.solve()
+		assert np.max(np.abs(Sta.fqs-Sref.fqs))<1e-12*np.max(np.abs(Sref.fqs)),\
+													  'Solutions not matching'
+
+
+	def test_multi_rhs(self):
+		'''
+		Compares the solution of a block of inputs against the solution of each
+		input in turn.
+		'''
+
+		Sta=linuvlm.Static(self.tsdata)
+		Sta.assemble()
+		Nrhs=4
+		Uext=np.random.rand(3*Sta.Kzeta,Nrhs)
+		Zeta=np.random.rand(3*Sta.Kzeta,Nrhs)
+		zeta_dot=np.random.rand(3*Sta.Kzeta)
+
+		Sta.solve(u_ext=Uext,zeta=Zeta,zeta_dot=zeta_dot)
+		Gamma,Fqs=Sta.gamma,Sta.fqs
+		assert Gamma.shape==(Sta.K,Nrhs) and Fqs.shape==(3*Sta.Kzeta,Nrhs),\
+													  'Wrong output shape'
+
+		for rr in range(Nrhs):
+			Sta.solve(u_ext=Uext[:,rr],zeta=Zeta[:,rr],zeta_dot=zeta_dot)
+			assert np.max(np.abs(Gamma[:,rr]-Sta.gamma))<\
+						1e-12*np.max(np.abs(Sta.gamma)), 'Circulation not matching'
+			assert np.max(np.abs(Fqs[:,rr]-Sta.fqs))<\
+							1e-12*np.max(np.abs(Sta.fqs)), 'Forces not matching'
+
+		with self.assertRaises(NameError):
+			Sta.solve(u_ext=Uext,zeta=Zeta[:,:2])
+
+
+	def test_sparse_ss(self):
+		'''
+		Compares the dense and sparse state-space realisations.
+		'''
+
+		for integr_order in [1,2]:
+			for RemovePredictor in [True,False]:
+
+				SSlist=[]
+				for UseSparse in [False,True]:
+					Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,
+							integr_order=integr_order,
+							RemovePredictor=RemovePredictor,UseSparse=UseSparse)
+					Dyn.assemble_ss()
+					SSlist.append(Dyn.SS)
+				SSref,SSsp=SSlist
+
+				assert isinstance(SSsp.A,libss.SparseDense) and \
+					   isinstance(SSsp.B,libss.SparseDense),\
+									   'Sparse state-space matrices not sparse'
+				assert SSsp.A.P.shape==(Dyn.K,Dyn.K+Dyn.K_star),\
+									   'Full block of A not stored once'
+				for mat in ['A','B','C','D']:
+					Mref=getattr(SSref,mat)
+					Msp=getattr(SSsp,mat)
+					if isinstance(Msp,libss.SparseDense):
+						Nrows,Ncols=Mref.shape
+						ermax=max(
+							np.max(np.abs(Msp.dot(np.eye(Ncols))-Mref)),
+							np.max(np.abs(Msp.H.dot(np.eye(Nrows))-Mref.T)))
+						assert ermax<1e-12*max(1.,np.max(np.abs(Mref))),\
+							'Sparse %s matrix products not matching'%mat
+						Msp=Msp.toarray()
+					ermax=np.max(np.abs(Msp-Mref))
+					assert ermax<1e-12*max(1.,np.max(np.abs(Mref))),\
+							'Sparse and dense %s matrices not matching'%mat
+
+				# time and frequency response
+				U=np.random.rand(4,Dyn.Nu)
+				Yref,Xref=libss.simulate(SSref,U)
+				Ysp,Xsp=libss.simulate(SSsp,U)
+				assert np.max(np.abs(Ysp-Yref))<1e-10*np.max(np.abs(Yref)),\
+											  'Time responses not matching'
+
+				wv=np.array([0.,1.])
+				Yfreq_ref=libss.freqresp(SSref,wv)
+				Yfreq=libss.freqresp(SSsp,wv)
+				assert np.max(np.abs(Yfreq-Yfreq_ref))<\
+									1e-10*np.max(np.abs(Yfreq_ref)),\
+											'Frequency responses not matching'
+
+
+
+	def test_matrix_free_ss(self):
+		'''
+		Compares the dense and matrix-free state-space realisations.
+		'''
+
+		for integr_order in [1,2]:
+			for RemovePredictor in [True,False]:
+
+				SSlist=[]
+				for MatrixFree in [False,True]:
+					Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,
+							integr_order=integr_order,
+							RemovePredictor=RemovePredictor,MatrixFree=MatrixFree)
+					Dyn.assemble_ss()
+					SSlist.append(Dyn.SS)
+				SSref,SSop=SSlist
+
+				for mat in ['A','B','C','D']:
+					Mref=getattr(SSref,mat)
+					Mop=getattr(SSop,mat)
+					Nrows,Ncols=Mref.shape
+					ermax=max(np.max(np.abs(Mop.dot(np.eye(Ncols))-Mref)),
+							  np.max(np.abs(Mop.H.dot(np.eye(Nrows))-Mref.T)))
+					assert ermax<1e-12*max(1.,np.max(np.abs(Mref))),\
+							'Matrix-free %s operator not matching'%mat
+
+				# time and frequency response
+				U=np.random.rand(4,Dyn.Nu)
+				Yref,Xref=libss.simulate(SSref,U)
+				Yop,Xop=libss.simulate(SSop,U)
+				assert np.max(np.abs(Yop-Yref))<1e-10*np.max(np.abs(Yref)),\
+											  'Time responses not matching'
+
+				wv=np.array([0.,1.])
+				Yfreq_ref=libss.freqresp(SSref,wv)
+				Yfreq=libss.freqresp(SSop,wv)
+				assert np.max(np.abs(Yfreq-Yfreq_ref))<\
+									1e-8*np.max(np.abs(Yfreq_ref)),\
+											'Frequency responses not matching'
+				if RemovePredictor:
+					Yfreq=Dyn.freqresp(wv)
+					assert np.max(np.abs(Yfreq-Yfreq_ref))<\
+									1e-12*np.max(np.abs(Yfreq_ref)),\
+							'Frequency responses (Dynamic.freqresp) not matching'
+
+
+
+	def test_compressed(self):
+		'''
+		Compares the solutions of the static and matrix-free dynamic solvers
+		with and without compression of the AIC matrices.
+		'''
+
+		Out=[]
+		for compress_tol in [None,1e-10]:
+			Sta=linuvlm.Static(self.tsdata,compress_tol=compress_tol)
+			Sta.assemble()
+			Sta.solve(u_ext=np.ones((3*Sta.Kzeta,2)))
+			Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,MatrixFree=True,
+												compress_tol=compress_tol)
+			Dyn.assemble_ss()
+			Eye=np.eye(Dyn.Nx)
+			Out.append([Sta.gamma,Sta.fqs,Dyn.SS.A.dot(Eye),Dyn.SS.A.H.dot(Eye)])
+
+		for name,ref,out in zip(['gamma','fqs','A','A^T'],*Out):
+			assert np.max(np.abs(out-ref))<1e-8*np.max(np.abs(ref)),\
+									 'Compressed %s not matching'%name
+
+
+	def test_krylov(self):
+		'''
+		Compares the solutions of the static solver obtained via LU and via
+		Krylov iterations, with all the preconditioners, for full, compressed
+		and matrix-free AIC matrices.
+		'''
+
+		Sref=linuvlm.Static(self.tsdata)
+		Sref.assemble()
+		u_ext=np.outer(np.ones((3*Sref.Kzeta,)),[0.5,1.,1.5])
+		Sref.solve(u_ext=u_ext)
+
+		for kwargs in [{},{'compress_tol':1e-12},{'aic_matrix_free':True}]:
+			for solver in ['gmres','bicgstab']:
+				for precond in ['block_jacobi','near_field',None]:
+					Sta=linuvlm.Static(self.tsdata,solver=solver,
+											  precond=precond,**kwargs)
+					Sta.assemble()
+					Sta.solve(u_ext=u_ext)
+					case='%s %s %s'%(kwargs,solver,precond)
+					assert np.all(Sta.solver_stats['converged']),\
+												'%s not converged'%case
+					assert np.max(Sta.solver_stats['rel_residual'])<1e-9,\
+											   '%s residual too large'%case
+					assert np.max(np.abs(Sta.gamma-Sref.gamma))<\
+						   1e-8*np.max(np.abs(Sref.gamma)),'%s not matching'%case
+
+		with self.assertRaises(NameError):
+			linuvlm.Static(self.tsdata,solver='lu',aic_matrix_free=True)
+
+
+	def test_mixed_precision(self):
+		'''
+		Compares the double and mixed precision solutions of the static solver
+		and the time responses of the dense, sparse and matrix-free dynamic
+		solvers. The bound circulation is recovered to double precision
+		accuracy via iterative refinement, while all other outputs have single
+		precision accuracy.
+		'''
+
+		Out=[]
+		for precision in ['double','mixed']:
+			Sta=linuvlm.Static(self.tsdata,precision=precision)
+			Sta.assemble()
+			np.random.seed(1)
+			Sta.solve(u_ext=1.+np.random.rand(3*Sta.Kzeta,3))
+			Ylist=[]
+			for kwargs in [{},{'UseSparse':True},{'MatrixFree':True}]:
+				Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,precision=precision,
+																	**kwargs)
+				Dyn.assemble_ss()
+				np.random.seed(2)
+				Ylist.append(libss.simulate(Dyn.SS,np.random.rand(4,Dyn.Nu))[0])
+			Out.append([Sta.gamma,Sta.fqs]+Ylist)
+
+		assert Sta.AIC_LU.dtype==np.float32 and not hasattr(Sta,'AIC'),\
+								 'AIC matrix not stored in single precision'
+		assert np.all(Sta.solver_stats['converged']),'Refinement not converged'
+		for name,tol,ref,out in zip(['gamma','fqs','Y dense','Y sparse','Y op'],
+									[1e-12,1e-5,1e-5,1e-5,1e-5],*Out):
+			assert np.max(np.abs(out-ref))<tol*np.max(np.abs(ref)),\
+								 'Mixed precision %s not matching'%name
+
+
+	def test_symmetry(self):
+		'''
+		Compares the static and dynamic solutions of the half lattice with
+		mirror symmetry against those of the full lattice, made of the first
+		surface and its image, under symmetric and antisymmetric inputs.
+		'''
+
+		tsdata=copy.deepcopy(self.tsdata)
+		tsdata.n_surf=1
+		tsdata.dimensions=tsdata.dimensions[:1]
+		tsdata.dimensions_star=tsdata.dimensions_star[:1]
+		tsfull=copy.deepcopy(tsdata)
+		tsfull.n_surf=2
+		tsfull.dimensions=np.concatenate(2*[tsdata.dimensions])
+		tsfull.dimensions_star=np.concatenate(2*[tsdata.dimensions_star])
+		for attr in ['zeta','zeta_star','u_ext','zeta_dot']:
+			vv=getattr(tsdata,attr)[0]
+			setattr(tsdata,attr,[vv])
+			setattr(tsfull,attr,[vv,libsym.get_image(vv)])
+		for attr in ['gamma','gamma_star','gamma_dot']:
+			vv=getattr(tsdata,attr)[0]
+			setattr(tsdata,attr,[vv])
+			setattr(tsfull,attr,[vv,libsym.get_image(tsdata.zeta[0],vv)[1]])
+
+		M,N=tsdata.dimensions[0]
+		Idofs,Sign=libsym.map_vertices_dofs(M,N)
+		for symmetry in ['sym','anti']:
+			fact=libsym.FACTOR[symmetry]
+
+			# static
+			Out=[]
+			np.random.seed(1)
+			Uhalf=np.random.rand(3,len(Idofs))-.5
+			for ts,Uin,kwargs in [(tsdata,Uhalf,{'symmetry':symmetry}),
+					(tsfull,np.concatenate([Uhalf,fact*Sign*Uhalf[:,Idofs]],
+																 axis=1),{})]:
+				Sta=linuvlm.Static(ts,**kwargs)
+				Sta.assemble()
+				Sta.solve(*Uin)
+				Out.append([Sta.gamma,Sta.fqs])
+			Ny=Out[0][1].shape[0]
+			for name,ref,out in zip(['gamma','fqs'],Out[1],Out[0]):
+				assert np.max(np.abs(out-ref[:len(out)]))<1e-12*np.max(np.abs(ref)),\
+						  'Static %s not matching (%s)'%(name,symmetry)
+
+			# dynamic: inputs are [zeta,zeta_dot,u_ext]
+			Out=[]
+			np.random.seed(2)
+			Uhalf=np.random.rand(4,3,Ny)-.5
+			for ts,Uin,kwargs in [(tsdata,Uhalf,{'symmetry':symmetry}),
+					(tsfull,np.concatenate([Uhalf,fact*Sign*Uhalf[:,:,Idofs]],
+																 axis=2),{})]:
+				Dyn=linuvlm.Dynamic(ts,dt=0.05,**kwargs)
+				Dyn.assemble_ss()
+				Out.append(libss.simulate(Dyn.SS,Uin.reshape((4,-1)))[0])
+			assert np.max(np.abs(Out[0]-Out[1][:,:Ny]))<1e-12*np.max(
+						np.abs(Out[1])),'Dynamic output not matching (%s)'%symmetry
+
+		with self.assertRaises(NameError):
+			linuvlm.Static(tsdata,symmetry='half')
+
+
+	def test_march(self):
+		'''
+		Compares the outputs of the time-marching engine, with inputs from a
+		generator, against the time response of the state-space model, for
+		both integration orders.
+		'''
+
+		for integr_order in [1,2]:
+			Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,integr_order=integr_order)
+			Dyn.assemble_ss()
+			np.random.seed(1)
+			U=np.random.rand(20,Dyn.Nu)
+			Yref=libss.simulate(Dyn.SS,U)[0]
+			Y=np.array(list(Dyn.march(uu for uu in U)))
+			assert np.max(np.abs(Y-Yref))<1e-12*np.max(np.abs(Yref)),\
+						'Time-marching output not matching (order %d)'%integr_order
+
+			# restart from an intermediate state
+			for yy in Dyn.march(U[:10]):
+				pass
+			Y=np.array(list(Dyn.march(U[10:],x0=Dyn.get_march_state())))
+			assert np.max(np.abs(Y-Yref[10:]))<1e-12*np.max(np.abs(Yref)),\
+				   'Time-marching restart not matching (order %d)'%integr_order
+
+
+	def test_freqresp(self):
+		'''
+		Compares the frequency response of the bound-only system, with the
+		wake eliminated analytically, against that of the state-space model,
+		for both integration orders.
+		'''
+
+		wv=np.array([0.,0.5,2.,10.,50.])
+		for integr_order in [1,2]:
+			Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,integr_order=integr_order)
+			Dyn.assemble_ss()
+			Yfreq_ref=libss.freqresp(Dyn.SS,wv)
+			Yfreq=Dyn.freqresp(wv)
+			assert np.max(np.abs(Yfreq-Yfreq_ref))<1e-12*np.max(np.abs(Yfreq_ref)),\
+					'Frequency response not matching (order %d)'%integr_order
+
+		# projected inputs/outputs
+		Dyn.get_total_forces_gain()
+		Dyn.get_rigid_motion_gains()
+		Zero=np.zeros_like(Dyn.Ktra)
+		Kin=np.block([[Dyn.Ktra,Zero],[Zero,Dyn.Ktra_dot],[Zero,Zero]])
+		Kout=np.concatenate([Dyn.Kftot,Dyn.Kmtot])
+		Yfreq_ref=np.einsum('ij,jkw,kl->ilw',Kout,Yfreq_ref,Kin)
+		Dyn.assemble_ss(Kin=sparse.csc_matrix(Kin),Kout=Kout)
+		Yfreq=Dyn.freqresp(wv)
+		assert np.max(np.abs(Yfreq-Yfreq_ref))<1e-12*np.max(np.abs(Yfreq_ref)),\
+								'Projected frequency response not matching'
+
+
+	def test_projection(self):
+		'''
+		Compares the state-space models with inputs projected over the
+		rigid-body translation gains and outputs projected over the total
+		forces and moments gains against the projection of the full
+		state-space models, for the dense, sparse and matrix-free realisations.
+		'''
+
+		for kwargs in [{},{'UseSparse':True},{'MatrixFree':True}]:
+			Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,**kwargs)
+			Dyn.assemble_ss()
+			Dyn.get_total_forces_gain()
+			Dyn.get_rigid_motion_gains()
+			Zero=np.zeros_like(Dyn.Ktra)
+			Kin=np.block([[Dyn.Ktra,Zero],[Zero,Dyn.Ktra_dot],[Zero,Zero]])
+			Kout=np.concatenate([Dyn.Kftot,Dyn.Kmtot])
+
+			np.random.seed(1)
+			U=np.random.rand(20,Kin.shape[1])
+			Yref=np.dot(libss.simulate(Dyn.SS,np.dot(U,Kin.T))[0],Kout.T)
+
+			Dyn.assemble_ss(Kin=sparse.csc_matrix(Kin),Kout=Kout)
+			assert Dyn.SS.B.shape[1]==Kin.shape[1] and \
+						  Dyn.SS.C.shape[0]==Kout.shape[0],'Wrong projected size'
+			Y=libss.simulate(Dyn.SS,U)[0]
+			assert np.max(np.abs(Y-Yref))<1e-12*np.max(np.abs(Yref)),\
+								 'Projected state-space model not matching'
+
+
+	def test_cache(self):
+		'''
+		Checks that the matrices loaded from cache match those assembled and
+		that only the flow-dependent matrices are recomputed if the density
+		changes.
+		'''
+
+		tmpdir=tempfile.mkdtemp()
+		try:
+			Cache=libcache.Cache(tmpdir)
+
+			# static
+			Sref=linuvlm.Static(self.tsdata)
+			Sref.assemble()
+			for nn in range(2):
+				S=linuvlm.Static(self.tsdata,cache=Cache)
+				S.assemble()
+				for name in ['AIC','Ducdu_ext','Ducdzeta','Dfqsdzeta',
+									'Dfqsdu_ext','Dfqsdgamma','Dfqsdgamma_star']:
+					assert np.max(np.abs(getattr(S,name)-getattr(Sref,name)))\
+								<1e-15, 'Cached matrix %s not matching'%name
+				assert sparse.isspmatrix_csr(S.Dfqsdu_ext),\
+										'Cached Dfqsdu_ext not in csr format'
+			assert Cache.hits==2 and Cache.misses==2, 'Cache not used'
+
+			tsdata=copy.deepcopy(self.tsdata)
+			tsdata.rho=2.*tsdata.rho
+			S=linuvlm.Static(tsdata,cache=Cache)
+			S.assemble()
+			assert Cache.hits==3 and Cache.misses==3,\
+								 'Geometry matrices not loaded from cache'
+			assert np.max(np.abs(S.Dfqsdgamma-2.*Sref.Dfqsdgamma))<1e-10,\
+									 'Flow-dependent matrices not updated'
+
+			# dynamic
+			SSlist=[]
+			for nn in range(2):
+				Dyn=linuvlm.Dynamic(self.tsdata,dt=0.05,cache=Cache)
+				Dyn.assemble_ss()
+				SSlist.append(Dyn.SS)
+			assert Cache.hits==5, 'Cache not used'
+			for mat in ['A','B','C','D']:
+				assert np.max(np.abs(getattr(SSlist[0],mat)-
+									 getattr(SSlist[1],mat)))<1e-15,\
+							  'Cached state-space %s matrix not matching'%mat
+
+			# LRU eviction: only the most recent entry fits
+			key=Dyn.get_cache_key('ss_flow')
+			Cache.max_size=Cache.index[key]['size']
+			Cache.evict()
+			assert len(Cache.index)==1 and key in Cache,\
+											'Least recently used entries kept'
+		finally:
+			shutil.rmtree(tmpdir)
+
+
+
+if __name__=='__main__':
+
+	unittest.main()